@@ -9,18 +9,23 @@ from zoneinfo import ZoneInfo
 
 from telegram import Bot
 from telegram.constants import ParseMode
+from helpers.run_log import run_log_for
+from helpers.telegram_runtime import get_shared_bot
 from helpers.runtime_paths import (
     STATUS_MESSAGE_ID_FILE,
     LAST_RUNS_JSON_FILE,
     MARKET_OLX_RUN_STATUS_FILE,
     MARKET_SHAFA_RUN_STATUS_FILE,
     LYST_RUN_STATUS_FILE,
+    SCRAPER_RUNS_JSONL_FILE,
     service_health_file as runtime_service_health_file,
 )
 
 KYIV_TZ = ZoneInfo("Europe/Kyiv")
 STATUS_MSG_FILE = STATUS_MESSAGE_ID_FILE
 LAST_RUNS_FILE = LAST_RUNS_JSON_FILE
+SCRAPER_RUNS_LEDGER = SCRAPER_RUNS_JSONL_FILE
+RUN_DURATION_WINDOW = 50
 
 STATUS_FILES = {
     "olx": MARKET_OLX_RUN_STATUS_FILE,
@@ -400,6 +405,34 @@ async def _ensure_status_message(bot: Bot, chat_id: int) -> int:
     return msg.message_id
 
 
+def _format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {(seconds % 3600) // 60:02d}m"
+
+
+def _run_duration_line() -> str:
+    # p95 run duration per scraper from the run log index; nothing until it exists.
+    if not SCRAPER_RUNS_LEDGER.with_suffix(".db").exists():
+        return ""
+    try:
+        store = run_log_for(SCRAPER_RUNS_LEDGER)
+        parts = []
+        for scraper in ("olx", "shafa", "lyst"):
+            stats = store.duration_stats(scraper, limit=RUN_DURATION_WINDOW)
+            if stats["runs"]:
+                parts.append(f"{scraper.upper()} {_format_duration(stats['p95_duration_seconds'])}")
+    except Exception:
+        LOGGER.exception("Failed to read run durations for the status message")
+        return ""
+    if not parts:
+        return ""
+    return f"\n⏲ p95 of last {RUN_DURATION_WINDOW} runs: " + " · ".join(parts)
+
+
 def _format_status_text(start_ts: float, *, lyst_stale_after_sec: int | None = None) -> str:
     statuses = read_all_service_statuses()
     now = datetime.now(KYIV_TZ)
@@ -458,13 +491,14 @@ def _format_status_text(start_ts: float, *, lyst_stale_after_sec: int | None = N
         f"🧾 Last OLX run: {olx_str}{olx_note}\n"
         f"🧾 Last SHAFA run: {shafa_str}{shafa_note}\n"
         f"{lyst_icon} Last LYST run: {lyst_time}{lyst_note}"
+        f"{_run_duration_line()}"
     )
 
 
 async def status_heartbeat(bot_token: str, chat_id: int, interval_s: int = 600, *, lyst_stale_after_sec: int | None = None):
     if not bot_token or not chat_id:
         return
-    bot = Bot(token=bot_token)
+    bot = get_shared_bot(bot_token)
     start_ts = time.time()
     message_id = await _ensure_status_message(bot, chat_id)
     while True:
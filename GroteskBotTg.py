@@ -1,4 +1,4 @@
-import json, time, asyncio, logging, colorama, subprocess, shutil, traceback, urllib.parse, re, html, io, threading, hashlib, os, random
+import json, time, asyncio, logging, colorama, subprocess, shutil, traceback, urllib.parse, re, html, io, hashlib, os, random
 from pathlib import Path
 from telegram.constants import ParseMode
 from collections import defaultdict, deque
@@ -45,7 +45,7 @@ from helpers.lyst.browser import (
 from helpers.lyst.resume import LystResumeController
 from helpers.lyst.service import LystCycleHooks, LystCycleRunner, LystRuntimeState
 from helpers.lyst.storage import LystStorage
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, DANYLO_DEFAULT_CHAT_ID, EXCHANGERATE_API_KEY, IS_RUNNING_LYST, CHECK_INTERVAL_SEC, CHECK_JITTER_SEC, MAINTENANCE_INTERVAL_SEC, DB_VACUUM, OLX_RETENTION_DAYS, SHAFA_RETENTION_DAYS, LYST_MAX_BROWSERS, LYST_SHOE_CONCURRENCY, LYST_COUNTRY_CONCURRENCY, UPSCALE_IMAGES, UPSCALE_METHOD, LYST_HTTP_ONLY, LYST_HTTP_TIMEOUT_SEC, LYST_HTTP_CONCURRENCY, LYST_HTTP_REQUEST_JITTER_SEC, LYST_CLOUDFLARE_RETRY_COUNT, LYST_CLOUDFLARE_RETRY_DELAY_SEC, LYST_CLOUDFLARE_BASE_COOLDOWN_SEC, LYST_CLOUDFLARE_MAX_COOLDOWN_SEC
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, DANYLO_DEFAULT_CHAT_ID, EXCHANGERATE_API_KEY, IS_RUNNING_LYST, CHECK_INTERVAL_SEC, CHECK_JITTER_SEC, MAINTENANCE_INTERVAL_SEC, DB_VACUUM, DB_MAINTENANCE_STEP_BUDGET_SEC, DB_RETENTION_BATCH_ROWS, DB_CHECKPOINT_WAL_BYTES, DB_INCREMENTAL_VACUUM_PAGES, DB_OPTIMIZE_ANALYSIS_LIMIT, OLX_RETENTION_DAYS, SHAFA_RETENTION_DAYS, LYST_MAX_BROWSERS, LYST_SHOE_CONCURRENCY, LYST_COUNTRY_CONCURRENCY, UPSCALE_IMAGES, UPSCALE_METHOD, LYST_HTTP_ONLY, LYST_HTTP_TIMEOUT_SEC, LYST_HTTP_CONCURRENCY, LYST_HTTP_REQUEST_JITTER_SEC, LYST_CLOUDFLARE_RETRY_COUNT, LYST_CLOUDFLARE_RETRY_DELAY_SEC, LYST_CLOUDFLARE_BASE_COOLDOWN_SEC, LYST_CLOUDFLARE_MAX_COOLDOWN_SEC, TELEGRAM_GLOBAL_SENDS_PER_SEC, TELEGRAM_CHAT_SENDS_PER_SEC, TELEGRAM_GROUP_SENDS_PER_MIN, TELEGRAM_MAX_PARALLEL_SENDS
 from config_lyst import (
     BASE_URLS,
     LYST_COUNTRIES,
@@ -64,7 +64,10 @@ from helpers.lyst_debug import (
 )
 from helpers.logging_utils import configure_third_party_loggers, install_secret_redaction
 from helpers.scheduler import run_lyst_scheduler
-from helpers.analytics_events import AnalyticsSink
+from helpers.analytics_events import AggregatingAnalyticsSink
+from helpers.edsr_worker import report_edsr_stats
+from helpers.image_cache import report_image_cache_stats, shared_image_cache, shared_rendered_card_cache
+from helpers.image_stream import ImageSizePolicy, report_download_savings
 from colorama import Fore, Back, Style
 from PIL import Image, ImageDraw, ImageFont
 from asyncio import Semaphore
@@ -80,7 +83,7 @@ from helpers.runtime_paths import (
     EXCHANGE_RATES_JSON_FILE,
 )
 from helpers.scraper_stats import RunStatsCollector
-from helpers.sqlite_runtime import run_runtime_db_maintenance
+from helpers.sqlite_runtime import DirectSQLiteAccess, RetentionRule, close_connection_managers, run_incremental_db_maintenance
 try:
     import cv2
 except Exception:
@@ -117,7 +120,12 @@ PAGE_SCRAPE = LYST_PAGE_SCRAPE
 SHOE_DATA_FILE = SHOE_DATA_JSON_FILE
 EXCHANGE_RATES_FILE = EXCHANGE_RATES_JSON_FILE
 BOT_LOG_FILE = PYTHON_LOG_FILE
-LYST_ANALYTICS_SINK = AnalyticsSink()
+LYST_ANALYTICS_SINK = AggregatingAnalyticsSink()
+LYST_IMAGE_CACHE = shared_image_cache("lyst")
+LYST_CARD_CACHE = shared_rendered_card_cache("lyst")
+# Upgraded Lyst image URLs can be huge originals; oversized ones are abandoned after the
+# header and the next (non-upgraded) candidate is used instead.
+LYST_IMAGE_SIZE_POLICY = ImageSizePolicy("lyst")
 SHOES_DB_FILE = RUNTIME_SHOES_DB_FILE
 OLX_DB_FILE = RUNTIME_OLX_DB_FILE
 SHAFA_DB_FILE = RUNTIME_SHAFA_DB_FILE
@@ -142,8 +150,6 @@ LYST_IMAGE_SETTLE_PASSES = 2
 
 EDSR_MODEL_URL = "https://github.com/Saafke/EDSR_Tensorflow/raw/master/models/EDSR_x2.pb"
 EDSR_MODEL_PATH = Path(__file__).with_name("upscale_weights") / "EDSR_x2.pb"
-_EDSR_LOCK = threading.Lock()
-_EDSR_SUPERRES = None
 
 class LystCloudflareChallenge(Exception):
     pass
@@ -266,7 +272,18 @@ class ColoredFormatter(logging.Formatter):
 class TelegramMessageQueue(telegram_runtime_helpers.TelegramMessageQueue):
     # Thin compatibility layer so existing call sites keep the same constructor/signature.
     def __init__(self, bot_token):
-        super().__init__(bot_token, send_func=send_telegram_message)
+        super().__init__(
+            bot_token,
+            send_func=send_telegram_message,
+            scheduler=telegram_runtime_helpers.TelegramSendScheduler(
+                global_rate=TELEGRAM_GLOBAL_SENDS_PER_SEC,
+                chat_rate=TELEGRAM_CHAT_SENDS_PER_SEC,
+                group_rate_per_min=TELEGRAM_GROUP_SENDS_PER_MIN,
+                max_parallel=TELEGRAM_MAX_PARALLEL_SENDS,
+                logger=logger,
+            ),
+            logger=logger,
+        )
 
 # Configure logging
 logger = logging.getLogger()
@@ -435,6 +452,9 @@ def process_image(image_url, uah_price, sale_percentage):
         np_module=np,
         edsr_model_path=EDSR_MODEL_PATH,
         edsr_model_url=EDSR_MODEL_URL,
+        image_cache=LYST_IMAGE_CACHE,
+        render_cache=LYST_CARD_CACHE,
+        size_policy=LYST_IMAGE_SIZE_POLICY,
     )
 
 # Database functions now live in helpers/lyst/storage.py so the service lifecycle
@@ -1634,29 +1654,35 @@ async def run_lyst_cycle_impl(message_queue, *, status_manager: LystStatusManage
     runner = LystCycleRunner(_build_lyst_cycle_hooks())
     await runner.run(message_queue, status_manager=status_manager)
 
-def _run_db_retention_cleanup(conn, db_path):
-    if db_path == OLX_DB_FILE and OLX_RETENTION_DAYS > 0:
-        conn.execute(
-            "DELETE FROM olx_items WHERE updated_at < datetime('now', ?)",
-            (f"-{OLX_RETENTION_DAYS} days",),
-        )
-        conn.commit()
-    if db_path == SHAFA_DB_FILE and SHAFA_RETENTION_DAYS > 0:
-        conn.execute(
-            "DELETE FROM shafa_items WHERE updated_at < datetime('now', ?)",
-            (f"-{SHAFA_RETENTION_DAYS} days",),
-        )
-        conn.commit()
+def _retention_rules(db_path):
+    if db_path == OLX_DB_FILE:
+        return (RetentionRule("olx_items", "updated_at", OLX_RETENTION_DAYS),)
+    if db_path == SHAFA_DB_FILE:
+        return (RetentionRule("shafa_items", "updated_at", SHAFA_RETENTION_DAYS),)
+    return ()
 
 def _db_maintenance_sync(db_files=None):
-    try:
-        run_runtime_db_maintenance(
-            db_files=db_files or [SHOES_DB_FILE, OLX_DB_FILE, SHAFA_DB_FILE],
-            vacuum=DB_VACUUM,
-            retention_callback=_run_db_retention_cleanup,
-        )
-    except Exception as exc:
-        logger.warning(f"DB maintenance failed: {exc}")
+    for db_path in db_files or [SHOES_DB_FILE, OLX_DB_FILE, SHAFA_DB_FILE]:
+        # shoes.db is written through LystStorage and the marketplace DBs by the market
+        # service, so this process must not start a connection-manager writer for any of
+        # them: each pass uses one short-lived connection (under db_semaphore for shoes.db).
+        db = DirectSQLiteAccess(db_path)
+        try:
+            run_incremental_db_maintenance(
+                db_path,
+                db=db,
+                retention=_retention_rules(db_path),
+                migrate_auto_vacuum=DB_VACUUM,
+                step_budget_sec=DB_MAINTENANCE_STEP_BUDGET_SEC,
+                batch_rows=DB_RETENTION_BATCH_ROWS,
+                checkpoint_wal_bytes=DB_CHECKPOINT_WAL_BYTES,
+                vacuum_pages=DB_INCREMENTAL_VACUUM_PAGES,
+                analysis_limit=DB_OPTIMIZE_ANALYSIS_LIMIT,
+            )
+        except Exception as exc:
+            logger.warning(f"DB maintenance failed for {db_path.name}: {exc}")
+        finally:
+            db.close()
 
 async def maintenance_loop(interval_s: int, *, service_health=None):
     if interval_s <= 0:
@@ -1715,7 +1741,10 @@ async def main(service_health=None):
 
     if service_health is not None:
         _start_background_task(service_health.heartbeat_loop(note="lyst service running"), "lyst_health_heartbeat")
+        _start_background_task(service_health.profile_event_loop(), "lyst_loop_profiler")
 
+    # Sends, the command listener and the status heartbeat share one Bot per token.
+    await telegram_runtime_helpers.initialize_shared_bots(TELEGRAM_BOT_TOKEN, logger=logger)
     # Initialize and start message queue
     message_queue = TelegramMessageQueue(TELEGRAM_BOT_TOKEN)
     _start_background_task(message_queue.process_queue(), "tg_message_queue")
@@ -1738,6 +1767,19 @@ async def main(service_health=None):
             ),
             "status_heartbeat",
         )
+    if UPSCALE_IMAGES and UPSCALE_METHOD == "edsr":
+        # Spawn the EDSR worker and load the model now, so the first Lyst card does not
+        # spend its upscale deadline on process start-up.
+        _start_background_task(
+            asyncio.to_thread(
+                lyst_media_helpers.warm_up_edsr,
+                cv2_module=cv2,
+                model_path=EDSR_MODEL_PATH,
+                model_url=EDSR_MODEL_URL,
+                logger=logger,
+            ),
+            "edsr_warm_up",
+        )
     if MAINTENANCE_INTERVAL_SEC > 0:
         _start_background_task(
             maintenance_loop(MAINTENANCE_INTERVAL_SEC, service_health=service_health),
@@ -1810,7 +1852,14 @@ async def main(service_health=None):
                 service_health.record_failure("lyst_run", "stalled_after_finalize")
 
         async def _run_lyst_and_track():
-            return await run_lyst_cycle_impl(message_queue, status_manager=_get_lyst_status_manager())
+            try:
+                return await run_lyst_cycle_impl(message_queue, status_manager=_get_lyst_status_manager())
+            finally:
+                if service_health is not None:
+                    report_image_cache_stats(service_health)
+                    report_edsr_stats(service_health)
+                    report_download_savings(service_health)
+                    service_health.set_state_fields(telegram_queue=message_queue.stats())
 
         await run_lyst_scheduler(
             run_lyst=_run_lyst_and_track,
@@ -1830,6 +1879,9 @@ async def main(service_health=None):
             LYST_HTTP_CLIENT = None
         LYST_STATUS_MANAGER = None
         await _shutdown_background_tasks(background_tasks)
+        await telegram_runtime_helpers.shutdown_shared_bots(logger=logger)
+        # Flushes any per-file SQLite writers helpers started in this process.
+        await asyncio.to_thread(close_connection_managers)
 
 if __name__ == "__main__":
     if IS_RUNNING_LYST:
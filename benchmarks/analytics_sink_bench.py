@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Events/sec of the per-item analytics pattern: AnalyticsSink vs AggregatingAnalyticsSink.
+
+Usage: python benchmarks/analytics_sink_bench.py [--events 5000] [--sources 40]
+
+Each event does what marketplace_pipeline._record_item_analytics does: one
+append_event("marketplace_item") and one add_daily_counters("marketplace_items") spread
+over --sources source names. The aggregating sink's time includes its final flush.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers.analytics_events import AggregatingAnalyticsSink, AnalyticsSink  # noqa: E402
+
+
+def record_items(sink: AnalyticsSink, events: int, sources: int) -> None:
+    for n in range(events):
+        source_name = f"source-{n % sources}"
+        sink.append_event(
+            "marketplace_item",
+            {
+                "event": "sent",
+                "source_kind": "olx",
+                "source_name": source_name,
+                "item_id_hash": f"sha256:{n:016x}",
+                "price_int": 1000 + n,
+                "url_host": "www.olx.ua",
+            },
+        )
+        sink.add_daily_counters(
+            "marketplace_items",
+            dimensions={"source_kind": "olx", "source_name": source_name, "event": "sent"},
+            counters={"items": 1},
+        )
+
+
+def run(kind: str, events: int, sources: int) -> float:
+    now = lambda: "2026-05-04T12:00:00Z"  # noqa: E731
+    with tempfile.TemporaryDirectory() as tmp:
+        if kind == "old":
+            sink = AnalyticsSink(Path(tmp), now_func=now)
+        else:
+            sink = AggregatingAnalyticsSink(Path(tmp), now_func=now, flush_interval_sec=0, flush_on_exit=False)
+        started = time.perf_counter()
+        record_items(sink, events, sources)
+        if isinstance(sink, AggregatingAnalyticsSink):
+            sink.flush()
+        return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--sources", type=int, default=40)
+    args = parser.parse_args()
+    print(f"events={args.events} sources={args.sources}")
+    for kind in ("old", "aggregating"):
+        elapsed = run(kind, args.events, args.sources)
+        print(f"{kind:>12}: {args.events / elapsed:>10.0f} events/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Encode count and wall time: shrink-and-retry JPEG loop vs fit_jpeg_for_telegram.
+
+Usage: python benchmarks/jpeg_fit_bench.py [--limit-mb 10] [--seed 7]
+
+The corpus is synthetic large images with very different detail densities: noise,
+blurred noise, gradients with texture, and flat colour. "legacy" is the previous
+encode_jpeg_for_telegram + up-to-6 x0.9 shrink loop. Both keep quality 98.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from PIL import Image, ImageFilter  # noqa: E402
+
+from helpers import image_pipeline  # noqa: E402
+
+
+def _noise(size: tuple[int, int], rng: random.Random) -> Image.Image:
+    return Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3))
+
+
+def build_corpus(rng: random.Random) -> list[tuple[str, Image.Image]]:
+    corpus = []
+    for size in ((3000, 3000), (4000, 3000), (5000, 2500)):
+        corpus.append((f"noise {size}", _noise(size, rng)))
+        corpus.append((f"soft-noise {size}", _noise(size, rng).filter(ImageFilter.GaussianBlur(1.5))))
+        gradient = Image.linear_gradient("L").resize(size).convert("RGB")
+        texture = _noise((size[0] // 4, size[1] // 4), rng).resize(size, Image.Resampling.BICUBIC)
+        corpus.append((f"textured {size}", Image.blend(gradient, texture, 0.35)))
+        corpus.append((f"flat {size}", Image.new("RGB", size, (120, 130, 140))))
+    return corpus
+
+
+def legacy_fit(image: Image.Image, max_bytes: int) -> tuple[bytes | None, int]:
+    encodes = 1
+    data = image_pipeline._encode_jpeg_q98(image)
+    if len(data) <= max_bytes:
+        return data, encodes
+    trial = image
+    for _ in range(6):
+        size = (max(1, int(trial.width * 0.9)), max(1, int(trial.height * 0.9)))
+        trial = trial.resize(size, resample=Image.Resampling.LANCZOS)
+        data = image_pipeline._encode_jpeg_q98(trial)
+        encodes += 1
+        if len(data) <= max_bytes:
+            return data, encodes
+    return None, encodes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit-mb", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    max_bytes = int(args.limit_mb * 1024 * 1024)
+    corpus = build_corpus(random.Random(args.seed or os.getpid()))
+
+    totals = {"legacy": [0.0, 0, 0], "fit": [0.0, 0, 0]}
+    print(f"{'image':<26}{'legacy enc':>11}{'legacy s':>10}{'fit enc':>9}{'fit s':>8}  fit size")
+    for label, image in corpus:
+        started = time.perf_counter()
+        legacy_data, legacy_encodes = legacy_fit(image, max_bytes)
+        legacy_s = time.perf_counter() - started
+        started = time.perf_counter()
+        fitted = image_pipeline.fit_jpeg_for_telegram(image, max_bytes=max_bytes)
+        fit_s = time.perf_counter() - started
+        fit_encodes = fitted.encodes if fitted else 2
+        for key, seconds, encodes, ok in (
+            ("legacy", legacy_s, legacy_encodes, legacy_data is not None),
+            ("fit", fit_s, fit_encodes, fitted is not None),
+        ):
+            totals[key][0] += seconds
+            totals[key][1] += encodes
+            totals[key][2] += int(ok)
+        size_text = f"{fitted.size} {len(fitted.data) / 1e6:.1f}MB" if fitted else "no fit"
+        print(f"{label:<26}{legacy_encodes:>11}{legacy_s:>10.2f}{fit_encodes:>9}{fit_s:>8.2f}  {size_text}")
+    for key, (seconds, encodes, fitted_count) in totals.items():
+        print(f"{key:<7} total={seconds:.2f}s encodes={encodes} fitted={fitted_count}/{len(corpus)}")
+
+
+if __name__ == "__main__":
+    main()
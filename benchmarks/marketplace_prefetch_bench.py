@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Compare per-source pre-processing latency: three lookups vs one prefetch_state call.
+
+Usage: python benchmarks/marketplace_prefetch_bench.py [--stored 20000] [--sources 200] [--per-source 40]
+
+Both OLX and SHAFA repositories are seeded with stored items, pending notifications and
+unsubscribes, then every synthetic source page is looked up the old way
+(fetch_existing + fetch_duplicate_keys + fetch_unsubscribed_ids) and the new way
+(prefetch_state). Latencies are per source, in milliseconds.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import olx_scraper  # noqa: E402
+import shafa_scraper  # noqa: E402
+from helpers import scraper_unsubscribes  # noqa: E402
+from helpers.marketplace_pipeline import ItemUpdate  # noqa: E402
+
+
+def build_item(module, index: int):
+    item_cls = olx_scraper.OlxItem if module is olx_scraper else shafa_scraper.ShafaItem
+    price = 100 + index % 5000
+    return item_cls(
+        id=str(1_000_000 + index),
+        name=f"Synthetic item {index % 7000}",
+        link=f"https://example.com/{1_000_000 + index}",
+        price_text=f"{price} грн",
+        price_int=price,
+    )
+
+
+async def seed(module, repository, stored: int, source_kind: str) -> None:
+    items = [build_item(module, index) for index in range(stored)]
+    for start in range(0, len(items), 500):
+        chunk = items[start : start + 500]
+        await repository.persist_items([ItemUpdate(item=item, touch_last_sent=False) for item in chunk], "BENCH")
+    await repository.claim_notification_keys(items[: stored // 10], "BENCH")
+    scraper_unsubscribes._init_sync()
+    conn = scraper_unsubscribes._connect()
+    try:
+        conn.executemany(
+            "INSERT OR IGNORE INTO unsubscribed_items (source, item_id, link, name) VALUES (?, ?, '', '')",
+            [(source_kind, item.id) for item in items[::50]],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def separate_lookups(repository, items, source_kind: str) -> None:
+    item_ids = [item.id for item in items]
+    await repository.fetch_existing(item_ids)
+    await repository.fetch_duplicate_keys(items)
+    await scraper_unsubscribes.fetch_unsubscribed_ids(source_kind, item_ids)
+
+
+def _summary(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"p50={statistics.median(ordered) * 1000:.2f}ms p95={p95 * 1000:.2f}ms total={sum(ordered):.2f}s"
+
+
+async def bench(label: str, module, repository, source_kind: str, args) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_db = module.DB_FILE
+        original_unsubscribe_db = scraper_unsubscribes.UNSUBSCRIBE_DB_FILE
+        module.DB_FILE = Path(tmp_dir) / "items.db"
+        scraper_unsubscribes.UNSUBSCRIBE_DB_FILE = Path(tmp_dir) / "unsubscribes.db"
+        try:
+            module._db_init_sync()
+            await seed(module, repository, args.stored, source_kind)
+            pages = [
+                [build_item(module, (page * args.per_source + offset) * 3) for offset in range(args.per_source)]
+                for page in range(args.sources)
+            ]
+            legacy: list[float] = []
+            prefetched: list[float] = []
+            for page in pages:
+                started = time.perf_counter()
+                await separate_lookups(repository, page, source_kind)
+                legacy.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                await repository.prefetch_state(page)
+                prefetched.append(time.perf_counter() - started)
+        finally:
+            module.DB_FILE = original_db
+            scraper_unsubscribes.UNSUBSCRIBE_DB_FILE = original_unsubscribe_db
+    print(f"{label:<6} separate  {_summary(legacy)}")
+    print(f"{label:<6} prefetch  {_summary(prefetched)}  speedup={sum(legacy) / max(sum(prefetched), 1e-9):.1f}x")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stored", type=int, default=20_000)
+    parser.add_argument("--sources", type=int, default=200)
+    parser.add_argument("--per-source", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"stored={args.stored} sources={args.sources} per_source={args.per_source}")
+    await bench("olx", olx_scraper, olx_scraper.OlxRepository(), "olx", args)
+    await bench("shafa", shafa_scraper, shafa_scraper.ShafaRepository(), "shafa", args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
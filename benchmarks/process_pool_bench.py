@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Per-image overhead of process-pool image jobs: one submission per image vs batches.
+
+Usage: python benchmarks/process_pool_bench.py [--image-kb 1500] [--rounds 3]
+
+Each job receives a JPEG-sized byte buffer and returns a buffer of the same size, so
+IPC is paid both ways like a real upscale/re-encode. The job itself does almost no work;
+the reported time per image is therefore overhead. Modes:
+  legacy  previous run_cpu_bound: pickle-check the whole call, then submit it
+  single  current run_cpu_bound: cached pickle check, shared memory for large buffers
+  batch   run_cpu_bound_batch: one submission per worker-sized batch
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pickle
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import process_pool  # noqa: E402
+from helpers.process_pool import CpuJob  # noqa: E402
+
+
+def echo_transform(raw: bytes, *, quality: int = 98) -> bytes:
+    # Stand-in for an image transform: touch the input, return a same-sized output.
+    return raw[-1:] + raw[:-1]
+
+
+async def legacy_run_cpu_bound(func, /, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    call = partial(func, *args, **kwargs)
+    try:
+        pickle.dumps(call)
+    except Exception:
+        return await asyncio.to_thread(call)
+    return await loop.run_in_executor(process_pool.get_process_pool(), call)
+
+
+async def run_mode(mode: str, images: list[bytes]) -> float:
+    started = time.perf_counter()
+    if mode == "legacy":
+        await asyncio.gather(*(legacy_run_cpu_bound(echo_transform, raw, quality=98) for raw in images))
+    elif mode == "single":
+        await asyncio.gather(*(process_pool.run_cpu_bound(echo_transform, raw, quality=98) for raw in images))
+    else:
+        await process_pool.run_cpu_bound_batch(echo_transform, [CpuJob((raw,), {"quality": 98}) for raw in images])
+    return time.perf_counter() - started
+
+
+async def main_async(image_kb: int, rounds: int) -> None:
+    await process_pool.run_cpu_bound(echo_transform, b"warm-up")
+    print(f"workers={process_pool.recommended_process_workers()} image={image_kb}KB rounds={rounds}")
+    print(f"{'images':>6}{'legacy ms/img':>15}{'single ms/img':>15}{'batch ms/img':>14}")
+    for count in (1, 10, 50):
+        images = [os.urandom(image_kb * 1024) for _ in range(count)]
+        best = {}
+        for mode in ("legacy", "single", "batch"):
+            best[mode] = min([await run_mode(mode, images) for _ in range(rounds)])
+        print(
+            f"{count:>6}"
+            f"{best['legacy'] / count * 1000:>15.2f}"
+            f"{best['single'] / count * 1000:>15.2f}"
+            f"{best['batch'] / count * 1000:>14.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image-kb", type=int, default=1500)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.image_kb, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Renders per second for every PIL renderer, with cold and warm font caches.
+
+Usage: python benchmarks/renderer_bench.py [--renders 30]
+
+"cold" clears helpers.font_registry before every render, which is what each render paid
+before fonts and text measurements were shared; "warm" is the steady state of a running
+service. Renderers: Lyst price card (process_image), exchange-rate card, tsek schedule.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from PIL import Image  # noqa: E402
+
+from helpers import font_registry, image_pipeline  # noqa: E402
+from helpers.image_cache import ImageDownloadCache  # noqa: E402
+from tsek_bot.image_renderer import render_schedule_image  # noqa: E402
+from useful_bot.exchange_rate_image import render_exchange_rate_card  # noqa: E402
+
+SOURCE_URL = "https://bench.invalid/source.jpg"
+
+
+def _source_cache(directory: Path) -> ImageDownloadCache:
+    buffer = io.BytesIO()
+    Image.new("RGB", (900, 1200), (180, 170, 160)).save(buffer, format="JPEG", quality=90)
+    cache = ImageDownloadCache(directory, fresh_for_s=10**9)
+    cache.store(SOURCE_URL, buffer.getvalue())
+    return cache
+
+
+def render_lyst_card(cache: ImageDownloadCache, index: int) -> None:
+    image_pipeline.process_image(
+        SOURCE_URL,
+        1000 + index,
+        30,
+        upscale_images=False,
+        upscale_method="lanczos",
+        image_url_candidates_fn=lambda url: [url],
+        logger=None,
+        fonts_dir=PROJECT_ROOT / "fonts",
+        image_cache=cache,
+    )
+
+
+def render_exchange_card(index: int) -> None:
+    render_exchange_rate_card(
+        usd_buy=41.1 + index / 100,
+        usd_sell=41.8,
+        eur_buy=44.5,
+        eur_sell=45.3,
+        prev_usd_buy=41.0,
+        prev_usd_sell=41.7,
+        prev_eur_buy=44.4,
+        prev_eur_sell=45.2,
+        usd_spread=0.7,
+        eur_sell_minus_usd_buy=4.2,
+    )
+
+
+def render_tsek_schedule(index: int) -> None:
+    groups = [f"{queue}.{sub}" for queue in range(1, 7) for sub in (1, 2)]
+    intervals = {
+        group: [("light", 0, 240), ("dark", 240, 480 + index % 60), ("light", 480 + index % 60, 1440)]
+        for group in groups
+    }
+    render_schedule_image(intervals, groups)
+
+
+def bench(label: str, render, renders: int) -> None:
+    results = {}
+    for mode in ("cold", "warm"):
+        font_registry.clear_font_caches()
+        render(0)
+        started = time.perf_counter()
+        for index in range(renders):
+            if mode == "cold":
+                font_registry.clear_font_caches()
+            render(index)
+        elapsed = time.perf_counter() - started
+        results[mode] = renders / elapsed if elapsed else float("inf")
+    print(
+        f"{label:<10} cold={results['cold']:.1f}/s warm={results['warm']:.1f}/s "
+        f"speedup={results['warm'] / max(results['cold'], 1e-9):.2f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = _source_cache(Path(tmp_dir))
+        try:
+            bench("lyst", lambda index: render_lyst_card(cache, index), args.renders)
+        finally:
+            cache.close()
+    bench("exchange", render_exchange_card, args.renders)
+    bench("tsek", render_tsek_schedule, args.renders)
+
+
+if __name__ == "__main__":
+    main()
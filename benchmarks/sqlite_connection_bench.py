@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Compare connect-per-call SQLite access with the shared connection manager.
+
+Usage: python benchmarks/sqlite_connection_bench.py [--ops 5000] [--threads 8]
+
+Worker threads replay the mix a scraper run issues through asyncio.to_thread: mostly
+point reads with a write every few operations. The baseline opens a connection,
+applies the runtime pragmas and commits per call; the manager reuses one reader per
+thread and funnels writes through the single writer.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers.sqlite_runtime import SQLiteConnectionManager, apply_runtime_pragmas  # noqa: E402
+
+WRITE_EVERY = 5
+
+
+def _create(db_path: Path) -> None:
+    conn = sqlite3.connect(db_path)
+    try:
+        apply_runtime_pragmas(conn)
+        conn.execute("CREATE TABLE items (id TEXT PRIMARY KEY, seen INTEGER NOT NULL)")
+        conn.executemany("INSERT INTO items (id, seen) VALUES (?, 0)", ((str(i),) for i in range(1000)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _read(conn: sqlite3.Connection, item_id: str):
+    return conn.execute("SELECT seen FROM items WHERE id = ?", (item_id,)).fetchone()
+
+
+def _write(conn: sqlite3.Connection, item_id: str) -> None:
+    conn.execute("UPDATE items SET seen = seen + 1 WHERE id = ?", (item_id,))
+
+
+def _per_call(db_path: Path, op: int) -> None:
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        apply_runtime_pragmas(conn)
+        if op % WRITE_EVERY == 0:
+            _write(conn, str(op % 1000))
+            conn.commit()
+        else:
+            _read(conn, str(op % 1000))
+    finally:
+        conn.close()
+
+
+def _managed(manager: SQLiteConnectionManager, op: int) -> None:
+    if op % WRITE_EVERY == 0:
+        manager.write_sync(_write, str(op % 1000))
+    else:
+        manager.read_sync(_read, str(op % 1000))
+
+
+def run_threads(worker, ops: int, threads: int) -> float:
+    def loop(offset: int) -> None:
+        for op in range(offset, ops, threads):
+            worker(op)
+
+    pool = [threading.Thread(target=loop, args=(offset,)) for offset in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        per_call_db = Path(tmp_dir) / "per_call.db"
+        managed_db = Path(tmp_dir) / "managed.db"
+        _create(per_call_db)
+        _create(managed_db)
+
+        per_call = run_threads(lambda op: _per_call(per_call_db, op), args.ops, args.threads)
+        manager = SQLiteConnectionManager(managed_db)
+        try:
+            managed = run_threads(lambda op: _managed(manager, op), args.ops, args.threads)
+            stats = manager.stats()
+        finally:
+            manager.close_sync()
+
+    print(f"ops={args.ops} threads={args.threads} (one write per {WRITE_EVERY} ops)")
+    print(f"per-call  {per_call:.3f}s  {args.ops / per_call:.0f} ops/s")
+    print(f"managed   {managed:.3f}s  {args.ops / managed:.0f} ops/s")
+    print(
+        "manager: "
+        f"readers={stats['reader_connections']} write_transactions={stats['write_transactions']} "
+        f"max_lock_wait={stats['max_lock_wait_seconds']:.4f}s"
+    )
+    print(f"speedup: {per_call / max(managed, 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
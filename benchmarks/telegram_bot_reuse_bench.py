@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""TLS handshakes and latency per Telegram send: a new Bot per message vs a shared Bot.
+
+Usage: python benchmarks/telegram_bot_reuse_bench.py [--messages 100] [--pool-size 8]
+
+A local HTTPS stub (self-signed certificate made with the openssl CLI) answers the Bot
+API's sendMessage and counts accepted TLS connections. Modes:
+  per-send  previous send_telegram_message: Bot(token) built for every message
+  shared    one Bot per token with a pooled HTTPX client, as get_shared_bot keeps it
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+TOKEN = "123456:bench"
+MESSAGE_BODY = json.dumps(
+    {"ok": True, "result": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "x"}}
+).encode()
+GET_ME_BODY = json.dumps({"ok": True, "result": {"id": 123456, "first_name": "bench", "is_bot": True, "username": "bench_bot"}}).encode()
+
+
+class HttpsStub:
+    def __init__(self, cert: Path, key: Path) -> None:
+        self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl_context.load_cert_chain(cert, key)
+        self.handshakes = 0
+        self.requests = 0
+        self.server = None
+        self.handlers: set[asyncio.Task] = set()
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl_context)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.handshakes += 1
+        self.handlers.add(asyncio.current_task())
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                self.requests += 1
+                body = GET_ME_BODY if b"/getMe" in head.split(b"\r\n", 1)[0] else MESSAGE_BODY
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Cancelled by close(); returning normally keeps asyncio from logging it.
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        # Per-send bots are never shut down (as before), so their connections are still
+        # open here; drop them so the handlers finish before the loop stops.
+        self.server.close()
+        for task in self.handlers:
+            task.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+
+def make_certificate(directory: Path) -> tuple[Path, Path]:
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+            "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def make_bot(port: int, cert: Path, pool_size: int) -> Bot:
+    request = HTTPXRequest(
+        connection_pool_size=pool_size,
+        httpx_kwargs={"verify": ssl.create_default_context(cafile=str(cert))},
+    )
+    return Bot(token=TOKEN, base_url=f"https://127.0.0.1:{port}/bot", request=request)
+
+
+async def run_mode(mode: str, stub: HttpsStub, port: int, cert: Path, messages: int, pool_size: int) -> tuple[int, float]:
+    stub.handshakes = 0
+    started = time.perf_counter()
+    if mode == "per-send":
+        for n in range(messages):
+            bot = make_bot(port, cert, pool_size)
+            await bot.send_message(chat_id=1, text=f"m{n}")
+    else:
+        bot = make_bot(port, cert, pool_size)
+        await bot.initialize()
+        try:
+            for n in range(messages):
+                await bot.send_message(chat_id=1, text=f"m{n}")
+        finally:
+            await bot.shutdown()
+    return stub.handshakes, time.perf_counter() - started
+
+
+async def main_async(messages: int, pool_size: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_certificate(Path(tmp))
+        stub = HttpsStub(cert, key)
+        port = await stub.start()
+        print(f"messages={messages} pool_size={pool_size}")
+        print(f"{'mode':>9}{'handshakes/100 msgs':>21}{'ms/msg':>9}")
+        for mode in ("per-send", "shared"):
+            handshakes, elapsed = await run_mode(mode, stub, port, cert, messages, pool_size)
+            print(f"{mode:>9}{handshakes * 100 / messages:>21.1f}{elapsed / messages * 1000:>9.2f}")
+        await stub.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.messages, args.pool_size))
+
+
+if __name__ == "__main__":
+    main()
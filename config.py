@@ -47,9 +47,21 @@ MARKET_OLX_MAX_SEC = int(os.getenv('MARKET_OLX_MAX_SEC', '1800'))
 MARKET_SHAFA_MIN_SEC = int(os.getenv('MARKET_SHAFA_MIN_SEC', '900'))
 MARKET_SHAFA_MAX_SEC = int(os.getenv('MARKET_SHAFA_MAX_SEC', '1800'))
 MAINTENANCE_INTERVAL_SEC = int(os.getenv('MAINTENANCE_INTERVAL_SEC', '21600'))
+# DB maintenance is incremental (helpers/sqlite_runtime.run_incremental_db_maintenance).
+# DB_VACUUM opts a file into the one-time VACUUM that switches it to
+# auto_vacuum=INCREMENTAL; after that, free pages are released in small chunks.
 DB_VACUUM = os.getenv('DB_VACUUM', 'false').strip().lower() in ('1', 'true', 'yes', 'y', 'on')
 OLX_RETENTION_DAYS = int(os.getenv('OLX_RETENTION_DAYS', '0'))
 SHAFA_RETENTION_DAYS = int(os.getenv('SHAFA_RETENTION_DAYS', '0'))
+# Each maintenance step (retention deletes per table, incremental vacuum) stops after
+# this much wall time; leftover work is picked up by the next pass.
+DB_MAINTENANCE_STEP_BUDGET_SEC = float(os.getenv('DB_MAINTENANCE_STEP_BUDGET_SEC', '0.5'))
+# Rows per retention DELETE; each batch is one short write job on the shared writer.
+DB_RETENTION_BATCH_ROWS = int(os.getenv('DB_RETENTION_BATCH_ROWS', '500'))
+# A PASSIVE WAL checkpoint runs only once the -wal file reaches this size.
+DB_CHECKPOINT_WAL_BYTES = int(os.getenv('DB_CHECKPOINT_WAL_BYTES', str(16 * 1024 * 1024)))
+DB_INCREMENTAL_VACUUM_PAGES = int(os.getenv('DB_INCREMENTAL_VACUUM_PAGES', '256'))
+DB_OPTIMIZE_ANALYSIS_LIMIT = int(os.getenv('DB_OPTIMIZE_ANALYSIS_LIMIT', '400'))
 UPSCALE_IMAGES = os.getenv('UPSCALE_IMAGES', 'false').strip().lower() in ('1', 'true', 'yes', 'y', 'on')
 UPSCALE_METHOD = os.getenv('UPSCALE_METHOD', 'lanczos').strip().lower()
 MARKET_IMAGE_UPSCALE_MIN_DIM = int(os.getenv('MARKET_IMAGE_UPSCALE_MIN_DIM', '1500'))
@@ -57,6 +69,16 @@ MARKET_IMAGE_UPSCALE_MAX_DIM = int(os.getenv('MARKET_IMAGE_UPSCALE_MAX_DIM', '50
 # Try larger Lanczos outputs first, but keep this configurable because Telegram's
 # accepted geometry and source image sizes vary by marketplace.
 MARKET_IMAGE_UPSCALE_FACTORS = _float_tuple_env('MARKET_IMAGE_UPSCALE_FACTORS', (2.0,))
+# Telegram bots are shared per token across the process; this is the HTTPX connection
+# pool size of bots that do not bring their own request settings.
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '8'))
+# Lyst notifications go through a rate-aware send scheduler: one global token bucket
+# for the bot (Telegram allows about 30 msg/s) and one per chat (about 1 msg/s in
+# private chats, 20 msg/min in groups), with sends to different chats in parallel.
+TELEGRAM_GLOBAL_SENDS_PER_SEC = float(os.getenv('TELEGRAM_GLOBAL_SENDS_PER_SEC', '25'))
+TELEGRAM_CHAT_SENDS_PER_SEC = float(os.getenv('TELEGRAM_CHAT_SENDS_PER_SEC', '1'))
+TELEGRAM_GROUP_SENDS_PER_MIN = float(os.getenv('TELEGRAM_GROUP_SENDS_PER_MIN', '20'))
+TELEGRAM_MAX_PARALLEL_SENDS = int(os.getenv('TELEGRAM_MAX_PARALLEL_SENDS', '4'))
 # Marketplace Telegram sends upload images, so use a real connection pool and
 # longer media timeouts instead of the tiny Bot defaults that caused false sent
 # states during bursty OLX/SHAFA notifications.
@@ -71,6 +93,65 @@ MARKET_TELEGRAM_MEDIA_WRITE_TIMEOUT = float(os.getenv('MARKET_TELEGRAM_MEDIA_WRI
 # pile up, time out ambiguously, and poison the "already sent" ledger.
 MARKET_TELEGRAM_SEND_GAP_MIN_SEC = float(os.getenv('MARKET_TELEGRAM_SEND_GAP_MIN_SEC', '4'))
 MARKET_TELEGRAM_SEND_GAP_MAX_SEC = float(os.getenv('MARKET_TELEGRAM_SEND_GAP_MAX_SEC', '10'))
+# Staged marketplace delivery: bounded hand-off queues between download, image
+# transform and Telegram send, and how many delivered items share one DB persist.
+MARKET_PIPELINE_QUEUE_SIZE = int(os.getenv('MARKET_PIPELINE_QUEUE_SIZE', '8'))
+MARKET_PIPELINE_PERSIST_BATCH_SIZE = int(os.getenv('MARKET_PIPELINE_PERSIST_BATCH_SIZE', '20'))
+# Downloaded photos already waiting for the transform stage go to the process pool
+# together, up to this many per submission. 1 keeps one submission per photo.
+MARKET_PIPELINE_TRANSFORM_BATCH_SIZE = int(os.getenv('MARKET_PIPELINE_TRANSFORM_BATCH_SIZE', '4'))
+# Expected distinct duplicate keys per marketplace for the persisted cross-run Bloom
+# filter (about 240 KB at 200k keys / 1% false positives). 0 disables the index.
+MARKET_DUPLICATE_INDEX_CAPACITY = int(os.getenv('MARKET_DUPLICATE_INDEX_CAPACITY', '200000'))
+# Scrapers buffer analytics events and daily counters in memory and write them out
+# at most every ANALYTICS_FLUSH_INTERVAL_SEC, or sooner once this many events wait.
+ANALYTICS_FLUSH_INTERVAL_SEC = float(os.getenv('ANALYTICS_FLUSH_INTERVAL_SEC', '30'))
+ANALYTICS_MAX_BUFFERED_EVENTS = int(os.getenv('ANALYTICS_MAX_BUFFERED_EVENTS', '1000'))
+# Service health snapshots are rewritten (tmp file + fsync + rename) at most once per
+# this many seconds; status changes and shutdown still write immediately.
+SERVICE_HEALTH_WRITE_INTERVAL_SEC = float(os.getenv('SERVICE_HEALTH_WRITE_INTERVAL_SEC', '5'))
+# Event-loop profiler in long-running services: a sampler measures how late a
+# scheduled callback runs every LOOP_LAG_SAMPLE_INTERVAL_SEC (0 disables it), the
+# stack of a callback blocking the loop longer than LOOP_SLOW_CALLBACK_SEC is captured,
+# and live tasks are counted by coroutine every LOOP_TASK_CENSUS_INTERVAL_SEC.
+LOOP_LAG_SAMPLE_INTERVAL_SEC = float(os.getenv('LOOP_LAG_SAMPLE_INTERVAL_SEC', '0.5'))
+LOOP_SLOW_CALLBACK_SEC = float(os.getenv('LOOP_SLOW_CALLBACK_SEC', '1.0'))
+LOOP_TASK_CENSUS_INTERVAL_SEC = float(os.getenv('LOOP_TASK_CENSUS_INTERVAL_SEC', '30'))
+# Scraper runs to CPU-profile: comma-separated scraper names (lyst, olx, shafa) or
+# "all". The /profile bot command arms a single run instead. Profiled runs sample the
+# main thread every SCRAPER_PROFILE_INTERVAL_SEC of CPU time.
+SCRAPER_PROFILE_RUNS = os.getenv('SCRAPER_PROFILE_RUNS', '')
+SCRAPER_PROFILE_INTERVAL_SEC = float(os.getenv('SCRAPER_PROFILE_INTERVAL_SEC', '0.005'))
+# Scraper run ledger (runtime_data/json/scraper_runs.jsonl): the live file rotates to
+# .1, .2, ... at SCRAPER_RUNS_JSONL_MAX_MB, keeping SCRAPER_RUNS_JSONL_SEGMENTS old
+# segments. Its SQLite index keeps raw runs for SCRAPER_RUNS_RETENTION_DAYS and per-day
+# rollups forever.
+SCRAPER_RUNS_JSONL_MAX_MB = float(os.getenv('SCRAPER_RUNS_JSONL_MAX_MB', '20'))
+SCRAPER_RUNS_JSONL_SEGMENTS = int(os.getenv('SCRAPER_RUNS_JSONL_SEGMENTS', '5'))
+SCRAPER_RUNS_RETENTION_DAYS = int(os.getenv('SCRAPER_RUNS_RETENTION_DAYS', '90'))
+# Disk cache for downloaded source images (Lyst renderer and marketplace sends).
+# Entries younger than IMAGE_CACHE_FRESH_SEC skip the network; older ones are
+# revalidated with ETag/Last-Modified. IMAGE_CACHE_MAX_MB=0 disables the cache.
+IMAGE_CACHE_MAX_MB = int(os.getenv('IMAGE_CACHE_MAX_MB', '256'))
+IMAGE_CACHE_FRESH_SEC = float(os.getenv('IMAGE_CACHE_FRESH_SEC', '900'))
+# Finished Lyst price cards, keyed by source image hash and overlay parameters, so
+# re-announcements and retried sends reuse the earlier render. 0 MB disables.
+RENDER_CACHE_MAX_MB = int(os.getenv('RENDER_CACHE_MAX_MB', '128'))
+RENDER_CACHE_TTL_SEC = float(os.getenv('RENDER_CACHE_TTL_SEC', str(7 * 86400)))
+# EDSR x2 upscaling runs in one long-lived worker process per service. Large images
+# are split into tiles of EDSR_TILE_SIZE source pixels (0 disables tiling), and a
+# request not finished within EDSR_DEADLINE_SEC falls back to LANCZOS.
+EDSR_WORKER_THREADS = int(os.getenv('EDSR_WORKER_THREADS', str(max(1, (os.cpu_count() or 2) // 2))))
+EDSR_TILE_SIZE = int(os.getenv('EDSR_TILE_SIZE', '256'))
+EDSR_BATCH_SIZE = int(os.getenv('EDSR_BATCH_SIZE', '4'))
+EDSR_DEADLINE_SEC = float(os.getenv('EDSR_DEADLINE_SEC', '20'))
+# Process spawn and model load happen once per worker and are not part of any
+# request's deadline; a worker not ready within this long is treated as unavailable.
+EDSR_STARTUP_TIMEOUT_SEC = float(os.getenv('EDSR_STARTUP_TIMEOUT_SEC', '120'))
+# Source-image downloads stream through a header sniffer: anything above these caps
+# is abandoned (or swapped for a smaller CDN variant) before the full body arrives.
+IMAGE_DOWNLOAD_MAX_BYTES = int(os.getenv('IMAGE_DOWNLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_DOWNLOAD_MAX_PIXELS = int(os.getenv('IMAGE_DOWNLOAD_MAX_PIXELS', str(5000 * 5000)))
 BLOCK_RESOURCES = os.getenv('BLOCK_RESOURCES', 'true' if IS_INSTANCE else 'false').strip().lower() in ('1', 'true', 'yes', 'y', 'on')
 # Lyst now prefers the HTTP parser first. It is cheaper, returns images via LD-JSON,
 # and only falls back to Playwright when HTTP truly fails.
@@ -116,6 +197,16 @@ SHAFA_SEND_CONCURRENCY = int(os.getenv('SHAFA_SEND_CONCURRENCY', '1'))
 SHAFA_UPSCALE_CONCURRENCY = int(os.getenv('SHAFA_UPSCALE_CONCURRENCY', '1' if IS_INSTANCE else '2'))
 SHAFA_PLAYWRIGHT_CONCURRENCY = int(os.getenv('SHAFA_PLAYWRIGHT_CONCURRENCY', '2' if IS_INSTANCE else '2'))
 SHAFA_HTTP_CONNECTOR_LIMIT = int(os.getenv('SHAFA_HTTP_CONNECTOR_LIMIT', '16' if IS_INSTANCE else '20'))
+# Budgets shared by OLX and SHAFA in the market service, on top of the per-scraper
+# limits above, so overlapping runs split the host instead of doubling the load.
+# Network covers page and image requests; CPU covers process-pool image transforms
+# (0 = the pool's worker count); Telegram covers sends, which go through one bot token.
+MARKET_NETWORK_BUDGET = int(os.getenv('MARKET_NETWORK_BUDGET', '10' if IS_INSTANCE else '16'))
+MARKET_CPU_BUDGET = int(os.getenv('MARKET_CPU_BUDGET', '0'))
+MARKET_TELEGRAM_SEND_BUDGET = int(os.getenv('MARKET_TELEGRAM_SEND_BUDGET', '1'))
+# OLX and SHAFA runs allowed at once. With the budgets above they can overlap; 1
+# restores strictly serialized runs.
+MARKET_MAX_CONCURRENT_RUNS = int(os.getenv('MARKET_MAX_CONCURRENT_RUNS', '2'))
 
 # Lightweight per-run header rotation (kept consistent during a single process run)
 HEADER_PROFILES = [
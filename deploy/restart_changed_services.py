@@ -25,13 +25,27 @@ SERVICE_RULES = {
         "grotesk-market.service",
         "olx_scraper.py",
         "shafa_scraper.py",
+        "helpers/analytics_events.py",
+        "helpers/analytics_store.py",
+        "helpers/duplicate_index.py",
         "helpers/dynamic_sources.py",
+        "helpers/edsr_worker.py",
+        "helpers/font_registry.py",
+        "helpers/image_cache.py",
+        "helpers/image_stream.py",
+        "helpers/image_pipeline.py",
+        "helpers/marketplace_",
         "helpers/process_pool.py",
+        "helpers/resource_governor.py",
+        "helpers/run_log.py",
+        "helpers/sampling_profiler.py",
+        "helpers/scraper_stats.py",
         "helpers/scraper_unsubscribes.py",
         "helpers/service_health.py",
         "helpers/telegram_runtime.py",
         "helpers/scheduler.py",
         "helpers/runtime_paths.py",
+        "helpers/sqlite_runtime.py",
         "GroteskBotStatus.py",
         "config.py",
         "config_olx_urls.py",
@@ -41,6 +55,16 @@ SERVICE_RULES = {
         "grotesk_lyst_service.py",
         "grotesk-lyst.service",
         "GroteskBotTg.py",
+        "helpers/analytics_events.py",
+        "helpers/analytics_store.py",
+        "helpers/edsr_worker.py",
+        "helpers/font_registry.py",
+        "helpers/image_cache.py",
+        "helpers/image_stream.py",
+        "helpers/image_pipeline.py",
+        "helpers/run_log.py",
+        "helpers/sampling_profiler.py",
+        "helpers/scraper_stats.py",
         "helpers/service_health.py",
         "helpers/telegram_runtime.py",
         "helpers/scheduler.py",
@@ -60,12 +84,21 @@ SERVICE_RULES = {
     ),
     "tsekbot.service": (
         "tsek_bot/",
+        "helpers/font_registry.py",
         "helpers/service_health.py",
         "config.py",
     ),
     "usefulbot.service": (
         "useful_bot/",
         "usefulbot.service",
+        "helpers/analytics_store.py",
+        "helpers/analytics_summary.py",
+        "helpers/edsr_worker.py",
+        "helpers/run_log.py",
+        "helpers/font_registry.py",
+        "helpers/image_cache.py",
+        "helpers/image_stream.py",
+        "helpers/image_pipeline.py",
         "helpers/process_pool.py",
         "helpers/runtime_paths.py",
         "helpers/service_health.py",
@@ -78,6 +111,7 @@ SERVICE_RULES = {
         "helpers/sqlite_runtime.py",
         "helpers/service_health.py",
         "helpers/analytics_events.py",
+        "helpers/analytics_store.py",
         "config.py",
     ),
     "auto-ria-bot.service": (
@@ -87,7 +121,12 @@ SERVICE_RULES = {
         "helpers/auto_ria/",
         "helpers/process_pool.py",
         "helpers/runtime_paths.py",
+        "helpers/run_log.py",
+        "helpers/sampling_profiler.py",
+        "helpers/scraper_stats.py",
         "helpers/service_health.py",
+        "helpers/sqlite_runtime.py",
+        "helpers/telegram_runtime.py",
         "config.py",
     ),
 }
@@ -17,18 +17,33 @@ from config import (
     DANYLO_DEFAULT_CHAT_ID,
     MAINTENANCE_INTERVAL_SEC,
     DB_VACUUM,
+    DB_MAINTENANCE_STEP_BUDGET_SEC,
+    DB_RETENTION_BATCH_ROWS,
+    DB_CHECKPOINT_WAL_BYTES,
+    DB_INCREMENTAL_VACUUM_PAGES,
+    DB_OPTIMIZE_ANALYSIS_LIMIT,
     OLX_RETENTION_DAYS,
     SHAFA_RETENTION_DAYS,
     MARKET_OLX_MIN_SEC,
     MARKET_OLX_MAX_SEC,
     MARKET_SHAFA_MIN_SEC,
     MARKET_SHAFA_MAX_SEC,
+    MARKET_MAX_CONCURRENT_RUNS,
 )
 from helpers.dynamic_sources import add_dynamic_url
 from helpers import scraper_unsubscribes as scraper_unsubscribes_helpers
 from helpers.logging_utils import configure_third_party_loggers, install_secret_redaction
+from helpers.image_cache import report_image_cache_stats
+from helpers.image_stream import report_download_savings
+from helpers.marketplace_sender import build_marketplace_bot
+from helpers.resource_governor import report_resource_budget_stats
 from helpers.service_health import build_service_health
-from helpers.sqlite_runtime import run_runtime_db_maintenance
+from helpers.sqlite_runtime import (
+    RetentionRule,
+    close_connection_managers,
+    report_sqlite_stats,
+    run_incremental_db_maintenance,
+)
 from helpers import telegram_runtime as telegram_runtime_helpers
 from helpers.scheduler import run_market_scheduler
 from helpers.runtime_paths import OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE
@@ -48,30 +63,51 @@ def get_allowed_chat_ids():
     return telegram_runtime_helpers.get_allowed_chat_ids(DANYLO_DEFAULT_CHAT_ID, TELEGRAM_CHAT_ID)
 
 
-def _run_db_retention_cleanup(conn, db_path):
-    if db_path == OLX_ITEMS_DB_FILE and OLX_RETENTION_DAYS > 0:
-        conn.execute(
-            "DELETE FROM olx_items WHERE updated_at < datetime('now', ?)",
-            (f"-{OLX_RETENTION_DAYS} days",),
-        )
-        conn.commit()
-    if db_path == SHAFA_ITEMS_DB_FILE and SHAFA_RETENTION_DAYS > 0:
-        conn.execute(
-            "DELETE FROM shafa_items WHERE updated_at < datetime('now', ?)",
-            (f"-{SHAFA_RETENTION_DAYS} days",),
-        )
-        conn.commit()
+def _retention_rules(db_path):
+    if db_path == OLX_ITEMS_DB_FILE:
+        return (RetentionRule("olx_items", "updated_at", OLX_RETENTION_DAYS),)
+    if db_path == SHAFA_ITEMS_DB_FILE:
+        return (RetentionRule("shafa_items", "updated_at", SHAFA_RETENTION_DAYS),)
+    return ()
 
 
 def _db_maintenance_sync(db_files=None):
-    try:
-        run_runtime_db_maintenance(
-            db_files=db_files or [OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE],
-            vacuum=DB_VACUUM,
-            retention_callback=_run_db_retention_cleanup,
-        )
-    except Exception as exc:
-        logger.warning(f"DB maintenance failed: {exc}")
+    reports = {}
+    for db_path in db_files or [OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE]:
+        try:
+            report = run_incremental_db_maintenance(
+                db_path,
+                retention=_retention_rules(db_path),
+                migrate_auto_vacuum=DB_VACUUM,
+                step_budget_sec=DB_MAINTENANCE_STEP_BUDGET_SEC,
+                batch_rows=DB_RETENTION_BATCH_ROWS,
+                checkpoint_wal_bytes=DB_CHECKPOINT_WAL_BYTES,
+                vacuum_pages=DB_INCREMENTAL_VACUUM_PAGES,
+                analysis_limit=DB_OPTIMIZE_ANALYSIS_LIMIT,
+            )
+        except Exception as exc:
+            logger.warning(f"DB maintenance failed for {db_path.name}: {exc}")
+            continue
+        if report is not None:
+            reports[db_path.name] = report
+    return reports
+
+
+# Latest pass per file; after-run passes cover one file, the loop covers both.
+_DB_MAINTENANCE_REPORTS = {}
+
+
+def _publish_db_maintenance(service_health, reports):
+    _DB_MAINTENANCE_REPORTS.update(reports)
+    if service_health is not None and reports:
+        service_health.set_state_fields(db_maintenance=dict(_DB_MAINTENANCE_REPORTS))
+
+
+async def _maintain_after_run(db_path):
+    # A short budgeted pass on the file the run just wrote, so retention deletes and
+    # vacuum chunks are spread between runs instead of piling up for maintenance_loop.
+    reports = await asyncio.to_thread(_db_maintenance_sync, [db_path])
+    _publish_db_maintenance(SERVICE_HEALTH, reports)
 
 
 async def maintenance_loop(interval_s: int, *, service_health=None):
@@ -80,12 +116,13 @@ async def maintenance_loop(interval_s: int, *, service_health=None):
     while True:
         started = time.perf_counter()
         try:
-            await asyncio.to_thread(_db_maintenance_sync, [OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE])
+            reports = await asyncio.to_thread(_db_maintenance_sync, [OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE])
         except Exception as exc:
             if service_health is not None:
                 service_health.record_failure("db_maintenance", exc, duration_seconds=time.perf_counter() - started)
             logger.warning("DB maintenance iteration failed: %s", exc)
         else:
+            _publish_db_maintenance(service_health, reports)
             if service_health is not None:
                 service_health.record_success(
                     "db_maintenance",
@@ -119,6 +156,11 @@ async def _run_olx_and_mark():
     else:
         SERVICE_HEALTH.record_success("olx_run", duration_seconds=time.perf_counter() - started)
     mark_olx_run(err if err else None)
+    await _maintain_after_run(OLX_ITEMS_DB_FILE)
+    report_image_cache_stats(SERVICE_HEALTH)
+    report_download_savings(SERVICE_HEALTH)
+    report_resource_budget_stats(SERVICE_HEALTH)
+    report_sqlite_stats(SERVICE_HEALTH)
 
 
 async def _run_shafa_and_mark():
@@ -130,6 +172,11 @@ async def _run_shafa_and_mark():
     else:
         SERVICE_HEALTH.record_success("shafa_run", duration_seconds=time.perf_counter() - started)
     mark_shafa_run(err if err else None)
+    await _maintain_after_run(SHAFA_ITEMS_DB_FILE)
+    report_image_cache_stats(SERVICE_HEALTH)
+    report_download_savings(SERVICE_HEALTH)
+    report_resource_budget_stats(SERVICE_HEALTH)
+    report_sqlite_stats(SERVICE_HEALTH)
 
 
 async def _shutdown_background_tasks(tasks):
@@ -151,6 +198,12 @@ async def main():
         return task
 
     _start_background_task(SERVICE_HEALTH.heartbeat_loop(note="market service running"), "market_health_heartbeat")
+    _start_background_task(SERVICE_HEALTH.profile_event_loop(), "market_loop_profiler")
+    # OLX and SHAFA send through the OLX bot token; registering it with the marketplace
+    # request settings first means the command listener shares that same client.
+    for token in telegram_runtime_helpers.unique_bot_tokens(TELEGRAM_OLX_BOT_TOKEN):
+        build_marketplace_bot(token)
+    await telegram_runtime_helpers.initialize_shared_bots(TELEGRAM_OLX_BOT_TOKEN, logger=logger)
     _start_background_task(
         command_listener(TELEGRAM_OLX_BOT_TOKEN, get_allowed_chat_ids()),
         "market_command_listener",
@@ -173,10 +226,15 @@ async def main():
             olx_max_sec=MARKET_OLX_MAX_SEC,
             shafa_min_sec=MARKET_SHAFA_MIN_SEC,
             shafa_max_sec=MARKET_SHAFA_MAX_SEC,
+            # Overlapping runs share the market resource budgets (helpers/resource_governor.py).
+            max_concurrent_runs=MARKET_MAX_CONCURRENT_RUNS,
         )
     finally:
         SERVICE_HEALTH.mark_stopping("market service stopping")
         await _shutdown_background_tasks(background_tasks)
+        await telegram_runtime_helpers.shutdown_shared_bots(logger=logger)
+        # Flushes the per-file SQLite writers before the process exits.
+        await asyncio.to_thread(close_connection_managers)
 
 
 if __name__ == "__main__":
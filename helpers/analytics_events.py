@@ -1,18 +1,23 @@
 from __future__ import annotations
 
+import atexit
 import hashlib
 import json
 import os
 import re
+import signal
 import threading
+import weakref
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Callable, Mapping
 from urllib.parse import urlparse
 
+from config import ANALYTICS_FLUSH_INTERVAL_SEC, ANALYTICS_MAX_BUFFERED_EVENTS
+from helpers.analytics_store import AnalyticsStore, analytics_store_for
 from helpers.runtime_paths import RUNTIME_ANALYTICS_DIR
 
-_LOCK = threading.Lock()
+_LOCK = threading.RLock()
 _SECRET_KEY_RE = re.compile(r"(token|secret|password|authorization|api[_-]?key)", re.IGNORECASE)
 _CHAT_ID_KEY_RE = re.compile(r"(^|_)chat(_id)?$", re.IGNORECASE)
 
@@ -92,7 +97,19 @@ class AnalyticsSink:
         self.root_dir = Path(root_dir)
         self._now_func = now_func
 
-    def append_event(self, stream: str, payload: Mapping[str, Any] | None = None) -> Path:
+    @property
+    def store(self) -> AnalyticsStore:
+        return analytics_store_for(self.root_dir)
+
+    def _record_in_store(self, **records: Any) -> None:
+        # The SQLite store is written before the JSON ledger (see AnalyticsStore's
+        # history import) and must never fail the caller's flow.
+        try:
+            self.store.record(**records)
+        except Exception:
+            return
+
+    def _build_event(self, stream: str, payload: Mapping[str, Any] | None) -> tuple[Path, dict[str, Any]]:
         ts_utc = self._now_func()
         stream_name = sanitize_name(stream)
         date_key = _date_key_from_iso(ts_utc)
@@ -103,12 +120,24 @@ class AnalyticsSink:
             "stream": stream_name,
         }
         event.update(sanitize_payload(payload))
+        return path, event
+
+    def _daily_target(
+        self, domain: str, dimensions: Mapping[str, Any] | None, date_key: str | None
+    ) -> tuple[Path, str, str, dict[str, Any], str]:
+        domain_name = sanitize_name(domain)
+        date_key = date_key or _date_key_from_iso(self._now_func())
+        path = self.root_dir / "daily" / f"{date_key}.{domain_name}.json"
+        safe_dimensions = sanitize_payload(dimensions)
+        return path, date_key, domain_name, safe_dimensions, _group_key(safe_dimensions)
+
+    def append_event(self, stream: str, payload: Mapping[str, Any] | None = None) -> Path:
+        path, event = self._build_event(stream, payload)
         # Analytics are append-only and machine-readable so production debugging can rely on
         # stable facts instead of parsing noisy human logs after the issue already happened.
         with _LOCK:
-            path.parent.mkdir(parents=True, exist_ok=True)
-            with path.open("a", encoding="utf-8") as handle:
-                handle.write(json.dumps(event, ensure_ascii=False, sort_keys=True) + "\n")
+            self._record_in_store(events=[event])
+            _append_events_locked(path, [event])
         return path
 
     def add_daily_counters(
@@ -119,33 +148,190 @@ class AnalyticsSink:
         counters: Mapping[str, int | float] | None = None,
         date_key: str | None = None,
     ) -> Path:
-        domain_name = sanitize_name(domain)
-        date_key = date_key or _date_key_from_iso(self._now_func())
-        path = self.root_dir / "daily" / f"{date_key}.{domain_name}.json"
-        safe_dimensions = sanitize_payload(dimensions)
-        group_key = _group_key(safe_dimensions)
+        path, date_key, domain_name, safe_dimensions, group_key = self._daily_target(domain, dimensions, date_key)
+        group = {"dimensions": safe_dimensions, "counters": {}}
+        _add_counters(group["counters"], counters)
         with _LOCK:
-            if path.exists():
-                try:
-                    payload = json.loads(path.read_text(encoding="utf-8"))
-                except Exception:
-                    payload = {}
-            else:
-                payload = {}
-            payload.setdefault("schema_version", 1)
-            payload["date"] = date_key
-            payload["domain"] = domain_name
-            groups = payload.setdefault("groups", {})
+            self._record_in_store(daily=[(date_key, domain_name, {group_key: group})])
+            _merge_daily_locked(path, date_key, domain_name, {group_key: group})
+        return path
+
+
+class AggregatingAnalyticsSink(AnalyticsSink):
+    # Writes the same files as AnalyticsSink, but per-item callers (marketplace items,
+    # image pipeline, Lyst pages) no longer pay a file rewrite per call: events are
+    # buffered and counters summed in memory, then one flush appends each stream file
+    # once and merges each daily file once. Flushes happen every flush_interval_sec,
+    # when max_buffered_events are waiting, and at interpreter exit or SIGTERM.
+    def __init__(
+        self,
+        root_dir: Path = RUNTIME_ANALYTICS_DIR,
+        *,
+        now_func: Callable[[], str] = utc_now_iso,
+        flush_interval_sec: float = ANALYTICS_FLUSH_INTERVAL_SEC,
+        max_buffered_events: int = ANALYTICS_MAX_BUFFERED_EVENTS,
+        flush_on_exit: bool = True,
+    ) -> None:
+        super().__init__(root_dir, now_func=now_func)
+        self._flush_interval_sec = flush_interval_sec
+        self._max_buffered_events = max(1, int(max_buffered_events))
+        # Re-entrant so nested calls on one thread cannot deadlock; the SIGTERM hook
+        # flushes from its own thread, never from signal context.
+        self._buffer_lock = threading.RLock()
+        self._flush_lock = threading.RLock()
+        self._events: dict[Path, list[dict[str, Any]]] = {}
+        self._buffered_events = 0
+        self._daily: dict[Path, tuple[str, str, dict[str, dict[str, Any]]]] = {}
+        self._timer: threading.Thread | None = None
+        self._closed = threading.Event()
+        self.flushes = 0
+        if flush_on_exit:
+            _register_exit_flush(self)
+
+    def append_event(self, stream: str, payload: Mapping[str, Any] | None = None) -> Path:
+        path, event = self._build_event(stream, payload)
+        with self._buffer_lock:
+            self._events.setdefault(path, []).append(event)
+            self._buffered_events += 1
+            full = self._buffered_events >= self._max_buffered_events
+        self._ensure_timer()
+        if full:
+            self.flush()
+        return path
+
+    def add_daily_counters(
+        self,
+        domain: str,
+        *,
+        dimensions: Mapping[str, Any] | None = None,
+        counters: Mapping[str, int | float] | None = None,
+        date_key: str | None = None,
+    ) -> Path:
+        path, date_key, domain_name, safe_dimensions, group_key = self._daily_target(domain, dimensions, date_key)
+        with self._buffer_lock:
+            groups = self._daily.setdefault(path, (date_key, domain_name, {}))[2]
             group = groups.setdefault(group_key, {"dimensions": safe_dimensions, "counters": {}})
-            group["dimensions"] = safe_dimensions
-            group_counters = group.setdefault("counters", {})
-            for key, value in (counters or {}).items():
-                if not isinstance(value, (int, float)):
-                    continue
-                group_counters[str(key)] = group_counters.get(str(key), 0) + value
-            _write_json_atomic(path, payload)
+            _add_counters(group["counters"], counters)
+        self._ensure_timer()
         return path
 
+    def flush(self) -> None:
+        # The flush lock keeps two flushes from writing their batches out of order.
+        with self._flush_lock:
+            with self._buffer_lock:
+                events, self._events = self._events, {}
+                daily, self._daily = self._daily, {}
+                self._buffered_events = 0
+            if not events and not daily:
+                return
+            with _LOCK:
+                self._record_in_store(
+                    events=[event for batch in events.values() for event in batch],
+                    daily=list(daily.values()),
+                )
+                for path, batch in events.items():
+                    _append_events_locked(path, batch)
+                for path, (date_key, domain_name, groups) in daily.items():
+                    _merge_daily_locked(path, date_key, domain_name, groups)
+            self.flushes += 1
+
+    def close(self) -> None:
+        self._closed.set()
+        self.flush()
+
+    def _ensure_timer(self) -> None:
+        if self._timer is not None or self._flush_interval_sec <= 0:
+            return
+        with self._buffer_lock:
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._flush_periodically, name="analytics_flush", daemon=True)
+                self._timer.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self._flush_interval_sec):
+            try:
+                self.flush()
+            except Exception:
+                # A full disk must not kill the timer; the buffer is retried next tick.
+                continue
+
+
+_EXIT_FLUSH_SINKS: "weakref.WeakSet[AggregatingAnalyticsSink]" = weakref.WeakSet()
+_EXIT_HOOKS_INSTALLED = False
+
+
+def flush_analytics_sinks() -> None:
+    for sink in list(_EXIT_FLUSH_SINKS):
+        try:
+            sink.flush()
+        except Exception:
+            continue
+
+
+# How long SIGTERM waits for the final flush before the default action runs anyway.
+_SIGNAL_FLUSH_TIMEOUT_SEC = 5.0
+
+
+def _flush_then_reraise(signum: int) -> None:
+    flusher = threading.Thread(target=flush_analytics_sinks, name="analytics_signal_flush", daemon=True)
+    flusher.start()
+    flusher.join(_SIGNAL_FLUSH_TIMEOUT_SEC)
+    os.kill(os.getpid(), signum)
+
+
+def _flush_and_reraise_signal(signum, _frame) -> None:
+    # The handler runs on the main thread between bytecodes, possibly while that thread
+    # holds the store lock mid-flush; flushing here would wait on it forever. The flush
+    # runs on its own thread instead, once the main thread has moved on and released it,
+    # then the signal is re-raised with its default action.
+    signal.signal(signum, signal.SIG_DFL)
+    threading.Thread(target=_flush_then_reraise, args=(signum,), name="analytics_signal_exit", daemon=True).start()
+
+
+def _register_exit_flush(sink: AggregatingAnalyticsSink) -> None:
+    global _EXIT_HOOKS_INSTALLED
+    _EXIT_FLUSH_SINKS.add(sink)
+    if _EXIT_HOOKS_INSTALLED:
+        return
+    _EXIT_HOOKS_INSTALLED = True
+    atexit.register(flush_analytics_sinks)
+    # systemd stops services with SIGTERM, whose default action skips atexit. Only take
+    # over the default handler; services that install their own keep it.
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _flush_and_reraise_signal)
+
+
+def _append_events_locked(path: Path, events: list[dict[str, Any]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as handle:
+        handle.write("".join(json.dumps(event, ensure_ascii=False, sort_keys=True) + "\n" for event in events))
+
+
+def _add_counters(target: dict[str, int | float], counters: Mapping[str, int | float] | None) -> None:
+    for key, value in (counters or {}).items():
+        if not isinstance(value, (int, float)):
+            continue
+        target[str(key)] = target.get(str(key), 0) + value
+
+
+def _merge_daily_locked(path: Path, date_key: str, domain_name: str, groups: Mapping[str, dict[str, Any]]) -> None:
+    if path.exists():
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            payload = {}
+    else:
+        payload = {}
+    payload.setdefault("schema_version", 1)
+    payload["date"] = date_key
+    payload["domain"] = domain_name
+    stored_groups = payload.setdefault("groups", {})
+    for group_key, update in groups.items():
+        group = stored_groups.setdefault(group_key, {"dimensions": update["dimensions"], "counters": {}})
+        group["dimensions"] = update["dimensions"]
+        _add_counters(group.setdefault("counters", {}), update["counters"])
+    _write_json_atomic(path, payload)
+
 
 def append_analytics_event(stream: str, payload: Mapping[str, Any] | None = None) -> Path:
     return AnalyticsSink().append_event(stream, payload)
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Iterable, Mapping
+
+from helpers.sqlite_runtime import apply_runtime_pragmas
+
+ANALYTICS_DB_FILENAME = "analytics.db"
+
+# Events are append-only rows; every write also bumps pre-aggregated per-day rollups
+# (events per stream/source, summed counters per domain group), so 1/7/30-day
+# summaries are range scans over date-keyed primary keys instead of re-reading every
+# daily JSON and event JSONL file.
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS analytics_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_events (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        ts_utc TEXT NOT NULL,
+        stream TEXT NOT NULL,
+        source_kind TEXT NOT NULL DEFAULT '',
+        source_name TEXT NOT NULL DEFAULT '',
+        payload TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_analytics_events_stream_date ON analytics_events(stream, date)",
+    """
+    CREATE TABLE IF NOT EXISTS analytics_event_rollups (
+        date TEXT NOT NULL,
+        stream TEXT NOT NULL,
+        source_kind TEXT NOT NULL,
+        source_name TEXT NOT NULL,
+        events INTEGER NOT NULL,
+        PRIMARY KEY (date, stream, source_kind, source_name)
+    ) WITHOUT ROWID
+    """,
+    # `value` is untyped on purpose so integer counters stay integers through SUM().
+    """
+    CREATE TABLE IF NOT EXISTS analytics_daily_counters (
+        date TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        group_key TEXT NOT NULL,
+        counter TEXT NOT NULL,
+        value NOT NULL,
+        PRIMARY KEY (date, domain, group_key, counter)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_daily_domains (
+        date TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        PRIMARY KEY (date, domain)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analytics_groups (
+        domain TEXT NOT NULL,
+        group_key TEXT NOT NULL,
+        dimensions TEXT NOT NULL,
+        source_kind TEXT NOT NULL DEFAULT '',
+        source_name TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (domain, group_key)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_analytics_groups_source ON analytics_groups(source_kind, source_name)",
+)
+
+_HISTORY_IMPORTED_KEY = "json_history_imported_at"
+
+
+def _source_of(fields: Mapping[str, Any]) -> tuple[str, str]:
+    kind = fields.get("source_kind") or fields.get("scraper") or fields.get("service") or ""
+    return str(kind), str(fields.get("source_name") or "")
+
+
+class AnalyticsStore:
+    # One connection per database file and process, shared by every sink writing to it.
+    # Writes go through one transaction per record() call.
+    def __init__(self, db_path: Path, *, history_dir: Path | None = None) -> None:
+        self.db_path = Path(db_path)
+        self._history_dir = Path(history_dir) if history_dir is not None else self.db_path.parent
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            apply_runtime_pragmas(conn)
+            try:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                self._import_json_history(conn)
+            except BaseException:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record(
+        self,
+        *,
+        events: Iterable[Mapping[str, Any]] = (),
+        daily: Iterable[tuple[str, str, Mapping[str, Mapping[str, Any]]]] = (),
+    ) -> None:
+        # events are the dicts written to the JSONL streams; daily holds
+        # (date, domain, {group_key: {"dimensions": ..., "counters": ...}}) updates.
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._insert_events(conn, events)
+                for date_key, domain, groups in daily:
+                    self._add_daily(conn, date_key, domain, groups)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _insert_events(self, conn: sqlite3.Connection, events: Iterable[Mapping[str, Any]]) -> None:
+        rows = []
+        rollups: dict[tuple[str, str, str, str], int] = {}
+        for event in events:
+            ts_utc = str(event.get("ts_utc") or "")
+            date_key = ts_utc[:10]
+            stream = str(event.get("stream") or "")
+            source_kind, source_name = _source_of(event)
+            rows.append(
+                (date_key, ts_utc, stream, source_kind, source_name, json.dumps(event, ensure_ascii=False, sort_keys=True))
+            )
+            key = (date_key, stream, source_kind, source_name)
+            rollups[key] = rollups.get(key, 0) + 1
+        conn.executemany(
+            "INSERT INTO analytics_events (date, ts_utc, stream, source_kind, source_name, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany(
+            """
+            INSERT INTO analytics_event_rollups (date, stream, source_kind, source_name, events) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(date, stream, source_kind, source_name) DO UPDATE SET events = events + excluded.events
+            """,
+            [(*key, count) for key, count in rollups.items()],
+        )
+
+    def _add_daily(self, conn: sqlite3.Connection, date_key: str, domain: str, groups: Mapping[str, Mapping[str, Any]]) -> None:
+        conn.execute("INSERT OR IGNORE INTO analytics_daily_domains (date, domain) VALUES (?, ?)", (date_key, domain))
+        for group_key, group in groups.items():
+            dimensions = dict(group.get("dimensions") or {})
+            source_kind, source_name = _source_of(dimensions)
+            conn.execute(
+                """
+                INSERT INTO analytics_groups (domain, group_key, dimensions, source_kind, source_name) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(domain, group_key) DO UPDATE SET dimensions = excluded.dimensions
+                """,
+                (domain, group_key, json.dumps(dimensions, ensure_ascii=False, sort_keys=True), source_kind, source_name),
+            )
+            conn.executemany(
+                """
+                INSERT INTO analytics_daily_counters (date, domain, group_key, counter, value) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(date, domain, group_key, counter) DO UPDATE SET value = value + excluded.value
+                """,
+                [
+                    (date_key, domain, group_key, str(counter), value)
+                    for counter, value in (group.get("counters") or {}).items()
+                    if isinstance(value, (int, float))
+                ],
+            )
+
+    def _import_json_history(self, conn: sqlite3.Connection) -> None:
+        # One-time migration of the JSON ledger that predates the store. It runs inside
+        # the write lock, and sinks write the store before the JSON files, so a file
+        # written concurrently by another process is never counted twice.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM analytics_meta WHERE key = ?", (_HISTORY_IMPORTED_KEY,)).fetchone():
+                conn.execute("COMMIT")
+                return
+            for path in sorted((self._history_dir / "daily").glob("????-??-??.*.json")):
+                try:
+                    payload = json.loads(path.read_text(encoding="utf-8"))
+                except Exception:
+                    continue
+                domain = str(payload.get("domain") or path.stem.split(".", 1)[-1])
+                self._add_daily(conn, path.name[:10], domain, payload.get("groups") or {})
+            for path in sorted((self._history_dir / "events").glob("????-??-??.*.jsonl")):
+                self._insert_events(conn, _read_jsonl(path))
+            conn.execute(
+                "INSERT INTO analytics_meta (key, value) VALUES (?, datetime('now'))", (_HISTORY_IMPORTED_KEY,)
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def latest_date(self) -> str:
+        with self._lock:
+            row = self._connection().execute("SELECT MAX(date) FROM analytics_daily_domains").fetchone()
+        return str(row[0] or "") if row else ""
+
+    def summarize(self, days: int = 1, *, end_date: str | None = None) -> dict[str, Any]:
+        end_date = end_date or self.latest_date()
+        summary: dict[str, Any] = {"days": days, "start_date": "", "end_date": end_date, "domains": {}, "events": {}}
+        if not end_date:
+            return summary
+        start_date = (date.fromisoformat(end_date) - timedelta(days=max(1, days) - 1)).isoformat()
+        summary["start_date"] = start_date
+        with self._lock:
+            conn = self._connection()
+            domain_rows = conn.execute(
+                "SELECT DISTINCT domain FROM analytics_daily_domains WHERE date BETWEEN ? AND ?",
+                (start_date, end_date),
+            ).fetchall()
+            counter_rows = conn.execute(
+                """
+                SELECT c.domain, c.group_key, g.dimensions, c.counter, SUM(c.value)
+                FROM analytics_daily_counters AS c
+                LEFT JOIN analytics_groups AS g ON g.domain = c.domain AND g.group_key = c.group_key
+                WHERE c.date BETWEEN ? AND ?
+                GROUP BY c.domain, c.group_key, c.counter
+                """,
+                (start_date, end_date),
+            ).fetchall()
+            event_rows = conn.execute(
+                """
+                SELECT stream, source_kind, source_name, SUM(events)
+                FROM analytics_event_rollups
+                WHERE date BETWEEN ? AND ?
+                GROUP BY stream, source_kind, source_name
+                """,
+                (start_date, end_date),
+            ).fetchall()
+        for (domain,) in domain_rows:
+            summary["domains"][domain] = {"groups": {}}
+        for domain, group_key, dimensions, counter, value in counter_rows:
+            groups = summary["domains"].setdefault(domain, {"groups": {}})["groups"]
+            group = groups.setdefault(group_key, {"dimensions": json.loads(dimensions or "{}"), "counters": {}})
+            group["counters"][counter] = value
+        for stream, source_kind, source_name, count in event_rows:
+            stream_summary = summary["events"].setdefault(stream, {"total": 0, "by_source": {}})
+            stream_summary["total"] += count
+            source_key = "|".join(part for part in (source_kind, source_name) if part) or "total"
+            stream_summary["by_source"][source_key] = stream_summary["by_source"].get(source_key, 0) + count
+        return summary
+
+
+def _read_jsonl(path: Path) -> Iterable[dict[str, Any]]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    yield event
+    except OSError:
+        return
+
+
+_STORES: dict[Path, AnalyticsStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def analytics_store_for(analytics_dir: Path) -> AnalyticsStore:
+    db_path = Path(analytics_dir) / ANALYTICS_DB_FILENAME
+    with _STORES_LOCK:
+        store = _STORES.get(db_path)
+        if store is None:
+            store = _STORES[db_path] = AnalyticsStore(db_path, history_dir=Path(analytics_dir))
+        return store
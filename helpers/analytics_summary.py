@@ -6,55 +6,66 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
+from helpers.analytics_store import analytics_store_for
 from helpers.runtime_paths import RUNTIME_ANALYTICS_DIR
 
+SUMMARY_RANGE_DAYS = (1, 7, 30)
+
 
 def build_analytics_daily_summary(
     analytics_dir: Path = RUNTIME_ANALYTICS_DIR,
     *,
     date_key: str | None = None,
 ) -> dict[str, Any]:
-    root = Path(analytics_dir)
-    daily_dir = root / "daily"
+    # Served from the analytics store's daily rollups; the first call on an existing
+    # analytics directory imports its JSON history into the store.
+    store = analytics_store_for(Path(analytics_dir))
     if date_key is None:
-        date_key = _latest_daily_date(daily_dir)
+        date_key = store.latest_date()
     payload = {
         "schema_version": 1,
-        "generated_at_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "generated_at_utc": _iso_now(),
         "date": date_key,
         "domains": {},
     }
     if not date_key:
         return payload
-
-    for path in sorted(daily_dir.glob(f"{date_key}.*.json")):
-        try:
-            domain_payload = json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
-            continue
-        domain = str(domain_payload.get("domain") or path.stem.split(".", 1)[-1])
-        payload["domains"][domain] = {
-            "groups": domain_payload.get("groups") or {},
-        }
+    payload["domains"] = store.summarize(1, end_date=date_key)["domains"]
     return payload
 
 
+def build_analytics_range_summary(
+    analytics_dir: Path = RUNTIME_ANALYTICS_DIR,
+    *,
+    end_date: str | None = None,
+    days: tuple[int, ...] = SUMMARY_RANGE_DAYS,
+) -> dict[str, Any]:
+    store = analytics_store_for(Path(analytics_dir))
+    end_date = end_date or store.latest_date()
+    return {
+        "schema_version": 1,
+        "generated_at_utc": _iso_now(),
+        "end_date": end_date,
+        "ranges": {f"{count}d": store.summarize(count, end_date=end_date) for count in days},
+    }
+
+
 def write_analytics_summary(analytics_dir: Path = RUNTIME_ANALYTICS_DIR, *, date_key: str | None = None) -> Path:
     root = Path(analytics_dir)
-    summary = build_analytics_daily_summary(root, date_key=date_key)
     path = root / "summary" / "latest.json"
+    _write_json_atomic(path, build_analytics_daily_summary(root, date_key=date_key))
+    _write_json_atomic(root / "summary" / "ranges.json", build_analytics_range_summary(root, end_date=date_key))
+    return path
+
+
+def _write_json_atomic(path: Path, payload: dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
     with tmp_path.open("w", encoding="utf-8") as handle:
-        json.dump(summary, handle, ensure_ascii=False, indent=2, sort_keys=True)
+        json.dump(payload, handle, ensure_ascii=False, indent=2, sort_keys=True)
         handle.write("\n")
     os.replace(tmp_path, path)
-    return path
 
 
-def _latest_daily_date(daily_dir: Path) -> str:
-    dates = []
-    if daily_dir.exists():
-        for path in daily_dir.glob("????-??-??.*.json"):
-            dates.append(path.name[:10])
-    return max(dates) if dates else ""
+def _iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
@@ -11,7 +11,6 @@ from dataclasses import dataclass
 from typing import Iterable, Optional
 
 import requests
-from telegram import Bot
 from telegram.constants import ParseMode
 
 from config import RUN_ACCEPT_LANGUAGE, RUN_USER_AGENT
@@ -35,6 +34,7 @@ from helpers.process_pool import run_cpu_bound
 from helpers.runtime_paths import AUTO_RIA_ITEMS_DB_FILE, SCRAPER_RUNS_JSONL_FILE
 from helpers.scraper_stats import RunStatsCollector, utc_now_iso
 from helpers.service_health import build_service_health
+from helpers.telegram_runtime import get_shared_bot
 
 
 @dataclass(frozen=True)
@@ -68,7 +68,7 @@ class AutoRiaBotRuntime:
         analytics_sink: AnalyticsSink | None = None,
         logger=None,
     ) -> None:
-        self._bot = Bot(token=bot_token)
+        self._bot = get_shared_bot(bot_token)
         self._chat_id = str(chat_id)
         self._sources = [
             # Auto RIA supports page size through URL parameters, so normalize once at
@@ -4,6 +4,8 @@ import sqlite3
 from dataclasses import dataclass
 from pathlib import Path
 
+from helpers.sqlite_runtime import SQLiteConnectionManager, connection_manager_for
+
 
 @dataclass(frozen=True)
 class AutoRiaSentItem:
@@ -20,6 +22,10 @@ class AutoRiaStorage:
     def __init__(self, db_path: Path) -> None:
         self._db_path = Path(db_path)
 
+    @property
+    def _db(self) -> SQLiteConnectionManager:
+        return connection_manager_for(self._db_path)
+
     def create_tables(self) -> None:
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
         with sqlite3.connect(self._db_path) as conn:
@@ -53,11 +59,12 @@ class AutoRiaStorage:
         if not car_ids:
             return set()
         placeholders = ",".join("?" for _ in car_ids)
-        with sqlite3.connect(self._db_path) as conn:
-            rows = conn.execute(
+        rows = self._db.read_sync(
+            lambda conn: conn.execute(
                 f"SELECT car_id FROM auto_ria_items WHERE car_id IN ({placeholders})",
                 car_ids,
             ).fetchall()
+        )
         return {row[0] for row in rows}
 
     def mark_sent(
@@ -73,8 +80,8 @@ class AutoRiaStorage:
     ) -> None:
         # The bot only sends first-seen cars for now, so persisting the sent car id is the
         # minimal state needed to prevent repeats while message_id/caption enable sold edits.
-        with sqlite3.connect(self._db_path) as conn:
-            conn.execute(
+        self._db.write_sync(
+            lambda conn: conn.execute(
                 """
                 INSERT OR REPLACE INTO auto_ria_items
                     (car_id, title, url, price_usd, message_id, message_kind, caption, sold_at, sent_at)
@@ -82,17 +89,18 @@ class AutoRiaStorage:
                 """,
                 (car_id, title, url, price_usd, message_id, message_kind or "photo", caption or ""),
             )
-            conn.commit()
+        )
 
     def fetch_active_sent_items(self) -> list[AutoRiaSentItem]:
-        with sqlite3.connect(self._db_path) as conn:
-            rows = conn.execute(
+        rows = self._db.read_sync(
+            lambda conn: conn.execute(
                 """
                 SELECT car_id, title, url, price_usd, message_id, message_kind, caption
                 FROM auto_ria_items
                 WHERE sold_at IS NULL
                 """
             ).fetchall()
+        )
         return [
             AutoRiaSentItem(
                 car_id=row[0],
@@ -107,9 +115,9 @@ class AutoRiaStorage:
         ]
 
     def mark_sold(self, *, car_id: str) -> None:
-        with sqlite3.connect(self._db_path) as conn:
-            conn.execute(
+        self._db.write_sync(
+            lambda conn: conn.execute(
                 "UPDATE auto_ria_items SET sold_at = CURRENT_TIMESTAMP WHERE car_id = ?",
                 (car_id,),
             )
-            conn.commit()
+        )
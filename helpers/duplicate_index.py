@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+DuplicateKey = Tuple[str, int]
+
+_HEADER = struct.Struct("<4sIIQd")
+_MAGIC = b"DKI1"
+# Rows written shortly before the last save may not have made it into the saved
+# filter (crash mid-run); the catch-up scan re-reads this much history on load.
+_CATCH_UP_MARGIN_S = 3600.0
+
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[bytes] = None, count: int = 0) -> None:
+        self.num_bits = max(8, int(num_bits))
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = int(count)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> "BloomFilter":
+        capacity = max(1, int(capacity))
+        rate = min(max(float(false_positive_rate), 1e-6), 0.5)
+        num_bits = int(math.ceil(-capacity * math.log(rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, token: bytes) -> Iterable[int]:
+        digest = hashlib.blake2b(token, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.num_hashes):
+            yield (first + index * second) % self.num_bits
+
+    def add(self, token: bytes) -> None:
+        changed = False
+        for position in self._positions(token):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                changed = True
+        # Re-adding a known key does not count, so `count` approximates distinct keys.
+        if changed:
+            self.count += 1
+
+    def __contains__(self, token: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(token))
+
+
+@dataclass
+class DuplicateIndexStats:
+    filter_negatives: int = 0
+    recent_hits: int = 0
+    db_checks: int = 0
+    db_confirmed: int = 0
+    db_key_absent: int = 0
+    loaded_keys: int = 0
+    rebuilt: bool = False
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        # A checked key the DB does not hold at all is a false positive. Keys held only by
+        # the candidate item itself (re-seen items) are true filter hits, not duplicates.
+        data["false_positives"] = self.db_key_absent
+        return data
+
+
+def _token(key: DuplicateKey) -> bytes:
+    return f"{key[0]}\x1f{int(key[1])}".encode("utf-8")
+
+
+def _sqlite_utc(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class DuplicateKeyIndex:
+    # Cross-run memory of duplicate keys already stored by a marketplace scraper. The
+    # Bloom filter answers "definitely never seen" without touching SQLite; the exact LRU
+    # of recently persisted items answers "seen under another id" the same way. Every
+    # other filter hit still goes to the DB, so a false positive can only cost a query,
+    # never a suppressed notification.
+    def __init__(
+        self,
+        path: Path,
+        *,
+        capacity: int = 200_000,
+        false_positive_rate: float = 0.01,
+        recent_size: int = 5_000,
+        recent_ttl_s: float = 3600.0,
+    ) -> None:
+        self.path = Path(path)
+        self.capacity = max(1, int(capacity))
+        self.false_positive_rate = false_positive_rate
+        self.recent_size = max(0, int(recent_size))
+        self.recent_ttl_s = float(recent_ttl_s)
+        self.stats = DuplicateIndexStats()
+        self._filter = BloomFilter.for_capacity(self.capacity, false_positive_rate)
+        self._recent: OrderedDict[DuplicateKey, dict[str, float]] = OrderedDict()
+        self._recent_key_by_id: dict[str, DuplicateKey] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, keys_since: Callable[[Optional[str]], Iterable[DuplicateKey]]) -> None:
+        # keys_since(None) must yield every stored key; keys_since(ts) only keys written
+        # at or after that SQLite UTC timestamp.
+        saved = self._read_file()
+        with self._lock:
+            if saved is None:
+                self._filter = BloomFilter.for_capacity(self.capacity, self.false_positive_rate)
+                self.stats.rebuilt = True
+                since = None
+            else:
+                self._filter, saved_at = saved
+                since = _sqlite_utc(saved_at - _CATCH_UP_MARGIN_S)
+        loaded = 0
+        for key in keys_since(since):
+            self.add(key)
+            loaded += 1
+        with self._lock:
+            self.stats.loaded_keys = loaded
+            self._loaded = True
+
+    def _read_file(self) -> Optional[tuple[BloomFilter, float]]:
+        try:
+            payload = self.path.read_bytes()
+        except OSError:
+            return None
+        if len(payload) < _HEADER.size:
+            return None
+        magic, num_bits, num_hashes, count, saved_at = _HEADER.unpack_from(payload)
+        expected = BloomFilter.for_capacity(self.capacity, self.false_positive_rate)
+        bits = payload[_HEADER.size :]
+        # A resized config or an overfull filter is rebuilt from the DB instead of
+        # silently running at a worse false-positive rate.
+        if (
+            magic != _MAGIC
+            or num_bits != expected.num_bits
+            or num_hashes != expected.num_hashes
+            or len(bits) != len(expected.bits)
+            or count > self.capacity
+        ):
+            return None
+        return BloomFilter(num_bits, num_hashes, bits, count), saved_at
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                return
+            payload = _HEADER.pack(
+                _MAGIC,
+                self._filter.num_bits,
+                self._filter.num_hashes,
+                self._filter.count,
+                time.time(),
+            ) + bytes(self._filter.bits)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, self.path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def add(self, key: Optional[DuplicateKey], item_id: Optional[str] = None) -> None:
+        if key is None:
+            return
+        with self._lock:
+            self._filter.add(_token(key))
+            if item_id is None or self.recent_size <= 0:
+                return
+            previous_key = self._recent_key_by_id.get(item_id)
+            if previous_key is not None and previous_key != key:
+                holders = self._recent.get(previous_key)
+                if holders is not None:
+                    holders.pop(item_id, None)
+            self._recent.setdefault(key, {})[item_id] = time.monotonic()
+            self._recent.move_to_end(key)
+            self._recent_key_by_id[item_id] = key
+            while len(self._recent) > self.recent_size:
+                evicted_key, evicted = self._recent.popitem(last=False)
+                for evicted_id in evicted:
+                    if self._recent_key_by_id.get(evicted_id) == evicted_key:
+                        del self._recent_key_by_id[evicted_id]
+
+    def might_contain(self, key: DuplicateKey) -> bool:
+        with self._lock:
+            return _token(key) in self._filter
+
+    def split_candidates(
+        self,
+        candidate_map: dict[DuplicateKey, set[str]],
+    ) -> tuple[set[DuplicateKey], dict[DuplicateKey, set[str]]]:
+        # Returns (keys known to be duplicates, keys that still need a DB check). Keys the
+        # filter has never seen are dropped: they cannot be duplicates.
+        confirmed: set[DuplicateKey] = set()
+        to_check: dict[DuplicateKey, set[str]] = {}
+        now = time.monotonic()
+        with self._lock:
+            for key, item_ids in candidate_map.items():
+                if _token(key) not in self._filter:
+                    self.stats.filter_negatives += 1
+                    continue
+                holders = self._recent.get(key) or {}
+                if any(
+                    holder not in item_ids and now - seen_at <= self.recent_ttl_s
+                    for holder, seen_at in holders.items()
+                ):
+                    self.stats.recent_hits += 1
+                    confirmed.add(key)
+                    continue
+                to_check[key] = item_ids
+        return confirmed, to_check
+
+    def record_db_check(self, checked: int, confirmed: int, *, absent: int = 0) -> None:
+        with self._lock:
+            self.stats.db_checks += checked
+            self.stats.db_confirmed += confirmed
+            self.stats.db_key_absent += absent
+
+
+async def load_duplicate_index(
+    index: Optional[DuplicateKeyIndex],
+    keys_since: Callable[[Optional[str]], Iterable[DuplicateKey]],
+    *,
+    logger=None,
+) -> Optional[DuplicateKeyIndex]:
+    # Loads once per process; on failure the caller runs without the index (plain DB
+    # duplicate checks) rather than failing the scraper run.
+    if index is None:
+        return None
+    if not index.loaded:
+        try:
+            await asyncio.to_thread(index.load, keys_since)
+        except Exception as exc:
+            if logger is not None:
+                logger.warning("Duplicate key index unavailable, using DB checks only: %s", exc)
+            return None
+    return index
+
+
+async def save_duplicate_index(index: Optional[DuplicateKeyIndex], *, logger=None) -> None:
+    if index is None:
+        return
+    try:
+        await asyncio.to_thread(index.save)
+    except Exception as exc:
+        if logger is not None:
+            logger.warning("Failed to save duplicate key index: %s", exc)
@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import atexit
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from PIL import Image
+
+from config import EDSR_BATCH_SIZE, EDSR_DEADLINE_SEC, EDSR_STARTUP_TIMEOUT_SEC, EDSR_TILE_SIZE, EDSR_WORKER_THREADS
+
+_SCALE = 2
+# Neighbouring tiles overlap by this many source pixels so the seams EDSR produces at
+# tile borders fall outside the pasted region.
+_TILE_OVERLAP = 16
+
+
+class EdsrUnavailable(RuntimeError):
+    pass
+
+
+def _load_backend(backend: str, model_path: Optional[str], threads: int):
+    if backend == "lanczos":
+        # Model-free stand-in with the same interface (tests, hosts without opencv-contrib).
+        def _upsample_lanczos(image: Image.Image) -> Image.Image:
+            return image.resize((image.width * _SCALE, image.height * _SCALE), Image.LANCZOS)
+
+        return _upsample_lanczos
+
+    import cv2
+    import numpy as np
+
+    cv2.setNumThreads(max(1, int(threads)))
+    sr = cv2.dnn_superres.DnnSuperResImpl_create()
+    sr.readModel(str(model_path))
+    sr.setModel("edsr", _SCALE)
+
+    def _upsample_edsr(image: Image.Image) -> Image.Image:
+        img_bgr = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        return Image.fromarray(cv2.cvtColor(sr.upsample(img_bgr), cv2.COLOR_BGR2RGB))
+
+    return _upsample_edsr
+
+
+def _upsample_tiled(image: Image.Image, upsample, tile_size: int) -> tuple[Image.Image, int]:
+    width, height = image.size
+    if tile_size <= 0 or (width <= tile_size and height <= tile_size):
+        return upsample(image), 1
+    output = Image.new("RGB", (width * _SCALE, height * _SCALE))
+    tiles = 0
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            right, bottom = min(width, left + tile_size), min(height, top + tile_size)
+            box = (
+                max(0, left - _TILE_OVERLAP),
+                max(0, top - _TILE_OVERLAP),
+                min(width, right + _TILE_OVERLAP),
+                min(height, bottom + _TILE_OVERLAP),
+            )
+            upscaled = upsample(image.crop(box))
+            crop_left = (left - box[0]) * _SCALE
+            crop_top = (top - box[1]) * _SCALE
+            core = upscaled.crop(
+                (
+                    crop_left,
+                    crop_top,
+                    crop_left + (right - left) * _SCALE,
+                    crop_top + (bottom - top) * _SCALE,
+                )
+            )
+            output.paste(core, (left * _SCALE, top * _SCALE))
+            tiles += 1
+    return output, tiles
+
+
+def _worker_main(requests_queue, responses_queue, backend: str, model_path, threads: int, tile_size: int, batch_size: int):
+    load_error = None
+    try:
+        upsample = _load_backend(backend, model_path, threads)
+    except Exception as exc:
+        upsample = None
+        load_error = f"{type(exc).__name__}: {exc}"
+    responses_queue.put((None, "ready", load_error, 0, 0.0))
+    while True:
+        request = requests_queue.get()
+        if request is None:
+            return
+        batch = [request]
+        # Drain whatever else is already waiting so one wake-up serves a whole burst.
+        while len(batch) < batch_size:
+            try:
+                extra = requests_queue.get_nowait()
+            except queue.Empty:
+                break
+            if extra is None:
+                requests_queue.put(None)
+                break
+            batch.append(extra)
+        responses_queue.put((None, "batch", None, 0, 0.0))
+        for request_id, size, payload, deadline in batch:
+            if upsample is None:
+                responses_queue.put((request_id, "error", load_error, 0, 0.0))
+                continue
+            if time.time() > deadline:
+                responses_queue.put((request_id, "expired", None, 0, 0.0))
+                continue
+            started = time.perf_counter()
+            try:
+                image = Image.frombytes("RGB", size, payload)
+                result, tiles = _upsample_tiled(image, upsample, tile_size)
+                out = (result.size, result.tobytes())
+                responses_queue.put((request_id, "ok", out, tiles, time.perf_counter() - started))
+            except Exception as exc:
+                responses_queue.put(
+                    (request_id, "error", f"{type(exc).__name__}: {exc}", 0, time.perf_counter() - started)
+                )
+
+
+@dataclass
+class EdsrCallerStats:
+    requests: int = 0
+    completed: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    total_latency_s: float = 0.0
+    max_latency_s: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["avg_latency_ms"] = round(self.total_latency_s / self.completed * 1000, 1) if self.completed else 0.0
+        data["total_latency_s"] = round(self.total_latency_s, 3)
+        data["max_latency_s"] = round(self.max_latency_s, 3)
+        return data
+
+
+@dataclass
+class EdsrWorkerStats:
+    batches: int = 0
+    images: int = 0
+    tiles: int = 0
+    expired_in_worker: int = 0
+    busy_s: float = 0.0
+    restarts: int = 0
+    callers: dict[str, EdsrCallerStats] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "images": self.images,
+            "tiles": self.tiles,
+            "expired_in_worker": self.expired_in_worker,
+            "busy_s": round(self.busy_s, 3),
+            "restarts": self.restarts,
+            "throughput_images_per_s": round(self.images / self.busy_s, 3) if self.busy_s else 0.0,
+            "callers": {name: stats.to_dict() for name, stats in self.callers.items()},
+        }
+
+
+class EdsrWorker:
+    # One long-lived process owns the EDSR model (loaded once) and serves x2 upscales
+    # for every caller in the service. Requests carry an absolute deadline: a request
+    # that is still queued when it expires is skipped by the worker, and the caller
+    # gets EdsrUnavailable/TimeoutError in time to fall back to LANCZOS.
+    def __init__(
+        self,
+        model_path: Optional[Path],
+        *,
+        backend: str = "edsr",
+        threads: int = EDSR_WORKER_THREADS,
+        tile_size: int = EDSR_TILE_SIZE,
+        batch_size: int = EDSR_BATCH_SIZE,
+        startup_timeout_s: float = EDSR_STARTUP_TIMEOUT_SEC,
+    ) -> None:
+        self.model_path = str(model_path) if model_path is not None else None
+        self.backend = backend
+        self.threads = threads
+        self.tile_size = tile_size
+        self.batch_size = max(1, int(batch_size))
+        self.startup_timeout_s = float(startup_timeout_s)
+        self.stats = EdsrWorkerStats()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: dict[int, Future] = {}
+        self._process = None
+        self._requests = None
+        self._responses = None
+        self._reader: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    def _ensure_started_locked(self) -> None:
+        if self._process is not None and self._process.is_alive():
+            return
+        if self._process is not None:
+            self.stats.restarts += 1
+            self._fail_pending_locked("EDSR worker exited")
+            self._responses.put(None)
+        self._requests = self._ctx.Queue()
+        self._responses = self._ctx.Queue()
+        self._ready = threading.Event()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                self._requests,
+                self._responses,
+                self.backend,
+                self.model_path,
+                self.threads,
+                self.tile_size,
+                self.batch_size,
+            ),
+            name="edsr-worker",
+            daemon=True,
+        )
+        self._process.start()
+        self._reader = threading.Thread(
+            target=self._read_responses,
+            args=(self._responses, self._ready),
+            name="edsr-worker-responses",
+            daemon=True,
+        )
+        self._reader.start()
+
+    def _fail_pending_locked(self, reason: str) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(EdsrUnavailable(reason))
+        self._pending.clear()
+
+    def _read_responses(self, responses, ready: threading.Event) -> None:
+        while True:
+            try:
+                message = responses.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            request_id, status, payload, tiles, busy_s = message
+            if status == "ready":
+                ready.set()
+                continue
+            with self._lock:
+                if status == "batch":
+                    self.stats.batches += 1
+                    continue
+                entry = self._pending.pop(request_id, None)
+                self.stats.busy_s += busy_s
+                if status == "ok":
+                    self.stats.images += 1
+                    self.stats.tiles += tiles
+                elif status == "expired":
+                    self.stats.expired_in_worker += 1
+            if entry is None:
+                continue
+            future = entry
+            if future.done():
+                continue
+            if status == "ok":
+                size, data = payload
+                future.set_result(Image.frombytes("RGB", size, data))
+            elif status == "expired":
+                future.set_exception(FutureTimeoutError("EDSR request expired in queue"))
+            else:
+                future.set_exception(EdsrUnavailable(str(payload)))
+
+    def start(self) -> None:
+        # Optional warm-up so the first request does not pay for process spawn and
+        # model load inside its deadline.
+        with self._lock:
+            self._ensure_started_locked()
+
+    def submit(self, image: Image.Image, *, deadline_s: float) -> Future:
+        rgb = image.convert("RGB")
+        future: Future = Future()
+        with self._lock:
+            self._ensure_started_locked()
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self._requests.put((request_id, rgb.size, rgb.tobytes(), time.time() + deadline_s))
+        return future
+
+    def upscale(self, image: Image.Image, *, caller: str, deadline_s: float = EDSR_DEADLINE_SEC) -> Image.Image:
+        with self._lock:
+            caller_stats = self.stats.callers.setdefault(caller, EdsrCallerStats())
+            caller_stats.requests += 1
+            self._ensure_started_locked()
+            ready = self._ready
+        # A cold worker is waited for separately: spawn and model load are paid once per
+        # process and must not eat the request's own deadline.
+        if not ready.wait(self.startup_timeout_s):
+            with self._lock:
+                caller_stats.timeouts += 1
+            raise TimeoutError(f"EDSR worker not ready after {self.startup_timeout_s:.1f}s")
+        started = time.monotonic()
+        try:
+            result = self.submit(image, deadline_s=deadline_s).result(timeout=deadline_s)
+        except FutureTimeoutError:
+            with self._lock:
+                caller_stats.timeouts += 1
+            raise TimeoutError(f"EDSR upscale exceeded {deadline_s:.1f}s deadline")
+        except Exception:
+            with self._lock:
+                caller_stats.errors += 1
+            raise
+        latency = time.monotonic() - started
+        with self._lock:
+            caller_stats.completed += 1
+            caller_stats.total_latency_s += latency
+            caller_stats.max_latency_s = max(caller_stats.max_latency_s, latency)
+        return result
+
+    def close(self, timeout_s: float = 5.0) -> None:
+        with self._lock:
+            process, requests_queue, responses = self._process, self._requests, self._responses
+            self._process = None
+            self._fail_pending_locked("EDSR worker stopped")
+        if process is None:
+            return
+        requests_queue.put(None)
+        process.join(timeout_s)
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout_s)
+        responses.put(None)
+        if self._reader is not None:
+            self._reader.join(timeout_s)
+
+
+_WORKERS: dict[str, EdsrWorker] = {}
+_WORKERS_LOCK = threading.Lock()
+
+
+def get_edsr_worker(model_path: Path) -> EdsrWorker:
+    key = str(Path(model_path).resolve())
+    with _WORKERS_LOCK:
+        worker = _WORKERS.get(key)
+        if worker is None:
+            worker = EdsrWorker(Path(key))
+            _WORKERS[key] = worker
+        return worker
+
+
+def edsr_worker_stats() -> dict[str, Any]:
+    with _WORKERS_LOCK:
+        workers = list(_WORKERS.values())
+    if not workers:
+        return {}
+    if len(workers) == 1:
+        return workers[0].stats.to_dict()
+    return {worker.model_path: worker.stats.to_dict() for worker in workers}
+
+
+def report_edsr_stats(service_health) -> None:
+    stats = edsr_worker_stats()
+    if stats:
+        service_health.set_state_fields(edsr_worker=stats)
+
+
+@atexit.register
+def _close_workers() -> None:
+    with _WORKERS_LOCK:
+        workers = list(_WORKERS.values())
+        _WORKERS.clear()
+    for worker in workers:
+        worker.close(timeout_s=2.0)
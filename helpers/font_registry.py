@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Union
+
+from PIL import ImageFont
+
+FontType = Union[ImageFont.FreeTypeFont, ImageFont.ImageFont]
+FontSource = Union[str, Path]
+
+# Shared by every PIL renderer (Lyst cards, exchange-rate card, tsek schedule). Opening a
+# TTF parses the whole file, and the renderers used to do it for every font on every
+# render and on every step of their size searches.
+_MISSING_LOCK = threading.Lock()
+_MISSING_FONT_FILES: set[str] = set()
+
+
+@lru_cache(maxsize=256)
+def _truetype(path: str, size: int) -> Optional[ImageFont.FreeTypeFont]:
+    with _MISSING_LOCK:
+        if path in _MISSING_FONT_FILES:
+            return None
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        with _MISSING_LOCK:
+            _MISSING_FONT_FILES.add(path)
+        return None
+
+
+@lru_cache(maxsize=256)
+def _resolve(candidates: tuple[str, ...], size: int) -> FontType:
+    for candidate in candidates:
+        font = _truetype(candidate, size)
+        if font is not None:
+            return font
+    return ImageFont.load_default()
+
+
+def get_font(candidates: Iterable[FontSource], size: int) -> FontType:
+    # The first candidate that loads wins; PIL's bitmap default is the last resort.
+    # Returned fonts are shared and must be treated as read-only.
+    return _resolve(tuple(str(candidate) for candidate in candidates), int(size))
+
+
+@lru_cache(maxsize=8192)
+def _bbox(font: FontType, text: str, anchor: Optional[str]) -> tuple[int, int, int, int]:
+    if isinstance(font, ImageFont.FreeTypeFont):
+        return tuple(int(value) for value in font.getbbox(text, anchor=anchor))
+    return tuple(int(value) for value in font.getbbox(text))
+
+
+def text_bbox(
+    font: FontType,
+    text: str,
+    *,
+    anchor: Optional[str] = None,
+    xy: tuple[float, float] = (0, 0),
+) -> tuple[float, float, float, float]:
+    # Same box as ImageDraw.textbbox(xy, text, font=font, anchor=anchor) for
+    # single-line text, memoised per (font, text, anchor).
+    left, top, right, bottom = _bbox(font, text, anchor)
+    return left + xy[0], top + xy[1], right + xy[0], bottom + xy[1]
+
+
+def text_width(font: FontType, text: str) -> int:
+    left, _, right, _ = _bbox(font, text, None)
+    return right - left
+
+
+def fit_font(
+    candidates: Iterable[FontSource],
+    texts: Sequence[str],
+    max_width: float,
+    *,
+    max_size: int,
+    min_size: int,
+    step: int = 1,
+) -> FontType:
+    # Largest size on the max_size, max_size - step, ... grid (above min_size) at which
+    # every text fits in max_width, found by binary search instead of a linear walk.
+    # When nothing fits, the first grid size at or below min_size is used.
+    sources = tuple(str(candidate) for candidate in candidates)
+    step = max(1, int(step))
+    sizes = list(range(int(max_size), int(min_size), -step))
+    fallback = sizes[-1] - step if sizes else int(max_size)
+
+    def _fits(size: int) -> bool:
+        font = _resolve(sources, size)
+        return max((text_width(font, text) for text in texts), default=0) <= max_width
+
+    low, high = 0, len(sizes)
+    while low < high:
+        middle = (low + high) // 2
+        if _fits(sizes[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return _resolve(sources, sizes[low] if low < len(sizes) else fallback)
+
+
+def clear_font_caches() -> None:
+    _bbox.cache_clear()
+    _resolve.cache_clear()
+    _truetype.cache_clear()
+    with _MISSING_LOCK:
+        _MISSING_FONT_FILES.clear()
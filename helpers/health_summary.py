@@ -5,13 +5,15 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
-from helpers.analytics_summary import build_analytics_daily_summary, write_analytics_summary
+from helpers.analytics_summary import build_analytics_daily_summary, build_analytics_range_summary, write_analytics_summary
+from helpers.run_log import summarize_runs
 from helpers.runtime_paths import (
     LAST_RUNS_JSON_FILE,
     MARKET_OLX_RUN_STATUS_FILE,
     MARKET_SHAFA_RUN_STATUS_FILE,
     RUNTIME_HEALTH_DIR,
     RUNTIME_STATUS_DIR,
+    SCRAPER_RUNS_JSONL_FILE,
     runtime_file,
     service_health_file,
 )
@@ -52,6 +54,8 @@ def build_health_summary_payload() -> dict[str, Any]:
         "generated_at_utc": _iso_now(),
         "services": services,
         "analytics": build_analytics_daily_summary(),
+        "analytics_ranges": build_analytics_range_summary(),
+        "scraper_runs": summarize_runs(SCRAPER_RUNS_JSONL_FILE),
         "lyst": _read_json(LAST_RUNS_JSON_FILE) or {},
         "market": {
             "olx": _read_json(MARKET_OLX_RUN_STATUS_FILE) or {},
@@ -88,6 +92,15 @@ def render_health_summary_text(payload: dict[str, Any]) -> str:
             f"{source_name}: last={source.get('last_run_end_utc', 'never')} | "
             f"ok={source.get('last_run_ok', 'unknown')} | note={source.get('last_run_note', '')}"
         )
+
+    runs = payload.get("scraper_runs") or {}
+    for scraper, stats in (runs.get("scrapers") or {}).items():
+        if not stats.get("runs"):
+            continue
+        lines.append(
+            f"{scraper} runs: last {stats['runs']} | p50={stats['p50_duration_seconds']}s | "
+            f"p95={stats['p95_duration_seconds']}s | failures={stats['failures']}"
+        )
     return "\n".join(lines) + "\n"
 
 
@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from PIL import Image
+
+from config import IMAGE_CACHE_FRESH_SEC, IMAGE_CACHE_MAX_MB, RENDER_CACHE_MAX_MB, RENDER_CACHE_TTL_SEC
+from helpers.image_stream import ImageSizePolicy, read_streamed_body
+from helpers.runtime_paths import IMAGE_CACHE_DIR
+
+
+def normalize_image_url(url: str) -> str:
+    # Same image, same key: scheme/host case, fragments and query-parameter order do not
+    # change what a CDN returns.
+    parts = urlsplit((url or "").strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, ""))
+
+
+def _write_blob_atomic(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+@dataclass
+class ImageCacheStats:
+    requests: int = 0
+    hits: int = 0
+    revalidated: int = 0
+    misses: int = 0
+    stale_served: int = 0
+    decoded_hits: int = 0
+    evictions: int = 0
+    bytes_downloaded: int = 0
+    bytes_served_from_cache: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        served = self.hits + self.revalidated + self.stale_served
+        data["hit_rate"] = round(served / self.requests, 4) if self.requests else 0.0
+        return data
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    url_key: str
+    content_hash: str
+    content: bytes
+    etag: str
+    last_modified: str
+    fresh: bool
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers: dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ImageDownloadCache:
+    # Disk-backed source-image cache shared by the Lyst renderer and the marketplace
+    # downloaders. Blobs are stored once per content hash, the URL index lives in SQLite,
+    # and the least recently used entries are evicted once the blob total passes
+    # `max_bytes`. Entries younger than `fresh_for_s` are served without any request;
+    # older ones are revalidated with ETag / Last-Modified.
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        max_bytes: int = 256 * 1024 * 1024,
+        fresh_for_s: float = 900.0,
+        decoded_capacity: int = 16,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max(1, int(max_bytes))
+        self.fresh_for_s = float(fresh_for_s)
+        self.decoded_capacity = max(0, int(decoded_capacity))
+        self.stats = ImageCacheStats()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._decoded: OrderedDict[str, Image.Image] = OrderedDict()
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.directory / "index.db", check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS image_cache (
+                    url_key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT NOT NULL DEFAULT '',
+                    last_modified TEXT NOT NULL DEFAULT '',
+                    validated_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_last_access ON image_cache(last_access);")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_hash ON image_cache(content_hash);")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.directory / "blobs" / content_hash[:2] / f"{content_hash}.bin"
+
+    def lookup(self, url: str) -> Optional[CachedImage]:
+        url_key = normalize_image_url(url)
+        now = time.time()
+        with self._lock:
+            self.stats.requests += 1
+            conn = self._db()
+            row = conn.execute("SELECT * FROM image_cache WHERE url_key = ?", (url_key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE image_cache SET last_access = ? WHERE url_key = ?", (now, url_key))
+            conn.commit()
+        # The blob is read outside the lock so concurrent lookups do not queue on disk I/O.
+        try:
+            content = self._blob_path(row["content_hash"]).read_bytes()
+        except OSError:
+            with self._lock:
+                conn = self._db()
+                conn.execute(
+                    "DELETE FROM image_cache WHERE url_key = ? AND content_hash = ?",
+                    (url_key, row["content_hash"]),
+                )
+                conn.commit()
+            return None
+        fresh = now - float(row["validated_at"]) <= self.fresh_for_s
+        if fresh:
+            with self._lock:
+                self.stats.hits += 1
+                self.stats.bytes_served_from_cache += len(content)
+        return CachedImage(
+            url_key=url_key,
+            content_hash=str(row["content_hash"]),
+            content=content,
+            etag=str(row["etag"] or ""),
+            last_modified=str(row["last_modified"] or ""),
+            fresh=fresh,
+        )
+
+    def mark_revalidated(self, cached: CachedImage) -> bytes:
+        # The origin answered 304 Not Modified: restart the freshness window.
+        with self._lock:
+            conn = self._db()
+            conn.execute("UPDATE image_cache SET validated_at = ? WHERE url_key = ?", (time.time(), cached.url_key))
+            conn.commit()
+            self.stats.revalidated += 1
+            self.stats.bytes_served_from_cache += len(cached.content)
+        return cached.content
+
+    def serve_stale(self, cached: CachedImage) -> bytes:
+        with self._lock:
+            self.stats.stale_served += 1
+            self.stats.bytes_served_from_cache += len(cached.content)
+        return cached.content
+
+    def store(self, url: str, content: bytes, *, etag: str = "", last_modified: str = "") -> str:
+        url_key = normalize_image_url(url)
+        content_hash = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        now = time.time()
+        with self._lock:
+            self.stats.misses += 1
+            self.stats.bytes_downloaded += len(content)
+            if not blob_path.exists():
+                _write_blob_atomic(blob_path, content)
+            conn = self._db()
+            conn.execute(
+                """
+                INSERT INTO image_cache (url_key, content_hash, size, etag, last_modified, validated_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url_key) DO UPDATE SET
+                    content_hash=excluded.content_hash,
+                    size=excluded.size,
+                    etag=excluded.etag,
+                    last_modified=excluded.last_modified,
+                    validated_at=excluded.validated_at,
+                    last_access=excluded.last_access
+                """,
+                (url_key, content_hash, len(content), etag or "", last_modified or "", now, now),
+            )
+            self._evict_locked(conn)
+            conn.commit()
+        return content_hash
+
+    def _evict_locked(self, conn: sqlite3.Connection) -> None:
+        total = int(
+            conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM image_cache GROUP BY content_hash)"
+            ).fetchone()[0]
+        )
+        while total > self.max_bytes:
+            # Evict whole blobs: a blob is as recent as the most recently used URL that
+            # points at it, and dropping one of several URLs would free nothing.
+            row = conn.execute(
+                "SELECT content_hash, MAX(size) AS size, MAX(last_access) AS last_used FROM image_cache "
+                "GROUP BY content_hash ORDER BY last_used ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM image_cache WHERE content_hash = ?", (row["content_hash"],))
+            self.stats.evictions += 1
+            total -= int(row["size"])
+            try:
+                self._blob_path(row["content_hash"]).unlink()
+            except OSError:
+                pass
+
+    def _session(self) -> requests.Session:
+        # One keep-alive session per worker thread; requests.Session is not thread-safe.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def fetch(self, url: str, *, timeout: float = 30, size_policy: Optional[ImageSizePolicy] = None) -> bytes:
+        cached = self.lookup(url)
+        if cached is not None and cached.fresh:
+            return cached.content
+        headers = cached.conditional_headers() if cached is not None else {}
+        try:
+            resp = self._session().get(url, headers=headers, timeout=timeout, stream=size_policy is not None)
+        except Exception:
+            if cached is not None:
+                return self.serve_stale(cached)
+            raise
+        with resp:
+            if resp.status_code == 304 and cached is not None:
+                return self.mark_revalidated(cached)
+            if resp.status_code >= 500 and cached is not None:
+                # Origin error: the stale copy beats no image. 4xx still raises so a
+                # removed image (404/410) reaches the caller's retry-later handling.
+                return self.serve_stale(cached)
+            if not resp.ok:
+                raise RuntimeError(f"Image HTTP {resp.status_code} for {url}")
+            content = read_streamed_body(resp, url, size_policy)
+        if not content:
+            raise RuntimeError(f"Image HTTP {resp.status_code} for {url}")
+        self.store(
+            url,
+            content,
+            etag=resp.headers.get("ETag", ""),
+            last_modified=resp.headers.get("Last-Modified", ""),
+        )
+        return content
+
+    def open_image(self, content: bytes) -> Image.Image:
+        # Decoded images are reused by content hash (the same product photo is often
+        # rendered more than once per run); callers get a copy they may mutate.
+        if self.decoded_capacity <= 0:
+            return Image.open(io.BytesIO(content))
+        content_hash = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            decoded = self._decoded.get(content_hash)
+            if decoded is not None:
+                self._decoded.move_to_end(content_hash)
+                self.stats.decoded_hits += 1
+                return decoded.copy()
+        decoded = Image.open(io.BytesIO(content))
+        decoded.load()
+        with self._lock:
+            self._decoded[content_hash] = decoded
+            while len(self._decoded) > self.decoded_capacity:
+                self._decoded.popitem(last=False)
+        return decoded.copy()
+
+    def clear_decoded(self) -> None:
+        with self._lock:
+            self._decoded.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+@dataclass
+class RenderedCardStats:
+    requests: int = 0
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+    bytes_stored: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["hit_rate"] = round(self.hits / self.requests, 4) if self.requests else 0.0
+        return data
+
+
+def rendered_card_key(source_bytes: bytes, *parts: Any) -> str:
+    # The source image is identified by content, not URL, so a re-hosted photo with the
+    # same pixels and the same overlay parameters reuses the rendered card.
+    digest = hashlib.sha256(source_bytes)
+    for part in parts:
+        digest.update(b"\x1f")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderedCardCache:
+    # Finished price/sale cards, keyed by rendered_card_key. Re-announced items and
+    # retried sends get the exact bytes of the earlier render. Entries expire after
+    # `ttl_s` and the least recently used go first once `max_bytes` is exceeded.
+    def __init__(self, directory: Path, *, max_bytes: int = 128 * 1024 * 1024, ttl_s: float = 7 * 86400.0) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_s = float(ttl_s)
+        self.stats = RenderedCardStats()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.directory / "index.db", check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rendered_cards (
+                    render_key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rendered_cards_last_access ON rendered_cards(last_access);")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rendered_cards_created_at ON rendered_cards(created_at);")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _blob_path(self, render_key: str) -> Path:
+        return self.directory / "cards" / render_key[:2] / f"{render_key}.bin"
+
+    def _drop_locked(self, conn: sqlite3.Connection, render_key: str) -> None:
+        conn.execute("DELETE FROM rendered_cards WHERE render_key = ?", (render_key,))
+        try:
+            self._blob_path(render_key).unlink()
+        except OSError:
+            pass
+
+    def get(self, render_key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            self.stats.requests += 1
+            conn = self._db()
+            row = conn.execute("SELECT created_at FROM rendered_cards WHERE render_key = ?", (render_key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            if now - float(row["created_at"]) > self.ttl_s:
+                self._drop_locked(conn, render_key)
+                conn.commit()
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            try:
+                content = self._blob_path(render_key).read_bytes()
+            except OSError:
+                self._drop_locked(conn, render_key)
+                conn.commit()
+                self.stats.misses += 1
+                return None
+            conn.execute("UPDATE rendered_cards SET last_access = ? WHERE render_key = ?", (now, render_key))
+            conn.commit()
+            self.stats.hits += 1
+        return content
+
+    def put(self, render_key: str, content: bytes) -> None:
+        now = time.time()
+        blob_path = self._blob_path(render_key)
+        with self._lock:
+            _write_blob_atomic(blob_path, content)
+            conn = self._db()
+            conn.execute(
+                """
+                INSERT INTO rendered_cards (render_key, size, created_at, last_access) VALUES (?, ?, ?, ?)
+                ON CONFLICT(render_key) DO UPDATE SET
+                    size=excluded.size,
+                    created_at=excluded.created_at,
+                    last_access=excluded.last_access
+                """,
+                (render_key, len(content), now, now),
+            )
+            self.stats.bytes_stored += len(content)
+            for row in conn.execute(
+                "SELECT render_key FROM rendered_cards WHERE created_at < ?", (now - self.ttl_s,)
+            ).fetchall():
+                self._drop_locked(conn, row["render_key"])
+                self.stats.expired += 1
+            total = int(conn.execute("SELECT COALESCE(SUM(size), 0) FROM rendered_cards").fetchone()[0])
+            while total > self.max_bytes:
+                row = conn.execute(
+                    "SELECT render_key, size FROM rendered_cards ORDER BY last_access ASC LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._drop_locked(conn, row["render_key"])
+                self.stats.evictions += 1
+                total -= int(row["size"])
+            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_SHARED_CACHES: dict[str, Any] = {}
+_SHARED_CACHES_LOCK = threading.Lock()
+
+
+def shared_image_cache(name: str) -> Optional[ImageDownloadCache]:
+    # One cache per name per process, so OLX and SHAFA (or repeated Lyst cycles) share
+    # the same index and hit-rate counters. None when IMAGE_CACHE_MAX_MB disables it.
+    if IMAGE_CACHE_MAX_MB <= 0:
+        return None
+    with _SHARED_CACHES_LOCK:
+        cache = _SHARED_CACHES.get(name)
+        if cache is None:
+            cache = ImageDownloadCache(
+                IMAGE_CACHE_DIR / name,
+                max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024,
+                fresh_for_s=IMAGE_CACHE_FRESH_SEC,
+            )
+            _SHARED_CACHES[name] = cache
+        return cache
+
+
+def shared_rendered_card_cache(name: str) -> Optional[RenderedCardCache]:
+    if RENDER_CACHE_MAX_MB <= 0:
+        return None
+    key = f"{name}_cards"
+    with _SHARED_CACHES_LOCK:
+        cache = _SHARED_CACHES.get(key)
+        if cache is None:
+            cache = RenderedCardCache(
+                IMAGE_CACHE_DIR / key,
+                max_bytes=RENDER_CACHE_MAX_MB * 1024 * 1024,
+                ttl_s=RENDER_CACHE_TTL_SEC,
+            )
+            _SHARED_CACHES[key] = cache
+        return cache
+
+
+def image_cache_stats() -> dict[str, dict[str, Any]]:
+    with _SHARED_CACHES_LOCK:
+        caches = dict(_SHARED_CACHES)
+    return {name: cache.stats.to_dict() for name, cache in caches.items()}
+
+
+def report_image_cache_stats(service_health) -> None:
+    for name, stats in image_cache_stats().items():
+        service_health.record_cache_stats(f"images_{name}", stats)
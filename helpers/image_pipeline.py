@@ -1,22 +1,28 @@
 from __future__ import annotations
 
 import io
-import threading
+import math
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Awaitable, Callable, Iterable, Optional
 
 import requests
-from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
 
 from helpers.analytics_events import AnalyticsSink, fingerprint_url
+from helpers.edsr_worker import get_edsr_worker
+from helpers.font_registry import fit_font, get_font
+from helpers.image_cache import ImageDownloadCache, RenderedCardCache, rendered_card_key
+from helpers.image_stream import ImageSizePolicy, ImageTooLarge, read_streamed_body
 from helpers.marketplace_core import DeliveryResult
+from helpers.process_pool import CpuJob
 
-_EDSR_LOCK = threading.Lock()
-_EDSR_SUPERRES = None
-_EDSR_MODEL_PATH_LOADED: Optional[str] = None
+# Part of every rendered-card cache key; bump it whenever the card layout or encoding
+# changes so cached cards from the old renderer are never served.
+_CARD_RENDER_VERSION = 1
 
 
-def load_font(font_size: int, *, fonts_dir: Optional[Path] = None, prefer_heavy: bool = False):
+def _font_candidates(fonts_dir: Optional[Path], prefer_heavy: bool) -> list:
     font_dir = fonts_dir
     if prefer_heavy:
         font_candidates = [
@@ -34,12 +40,11 @@ def load_font(font_size: int, *, fonts_dir: Optional[Path] = None, prefer_heavy:
         "arialbd.ttf",
         "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
     ]
-    for font_file in font_candidates:
-        try:
-            return ImageFont.truetype(str(font_file), font_size)
-        except IOError:
-            continue
-    return ImageFont.load_default()
+    return font_candidates
+
+
+def load_font(font_size: int, *, fonts_dir: Optional[Path] = None, prefer_heavy: bool = False):
+    return get_font(_font_candidates(fonts_dir, prefer_heavy), font_size)
 
 
 def _ensure_edsr_weights(*, model_path: Path, model_url: str, logger) -> bool:
@@ -61,23 +66,6 @@ def _ensure_edsr_weights(*, model_path: Path, model_url: str, logger) -> bool:
         return False
 
 
-def _get_edsr_superres(*, cv2_module, model_path: Path, model_url: str, logger):
-    global _EDSR_SUPERRES, _EDSR_MODEL_PATH_LOADED
-    model_path_str = str(model_path.resolve())
-    if _EDSR_SUPERRES is not None and _EDSR_MODEL_PATH_LOADED == model_path_str:
-        return _EDSR_SUPERRES
-    if cv2_module is None or not hasattr(cv2_module, "dnn_superres"):
-        raise RuntimeError("opencv-contrib (dnn_superres) not available")
-    if not _ensure_edsr_weights(model_path=model_path, model_url=model_url, logger=logger):
-        raise RuntimeError("EDSR weights unavailable")
-    sr = cv2_module.dnn_superres.DnnSuperResImpl_create()
-    sr.readModel(model_path_str)
-    sr.setModel("edsr", 2)
-    _EDSR_SUPERRES = sr
-    _EDSR_MODEL_PATH_LOADED = model_path_str
-    return _EDSR_SUPERRES
-
-
 def _upscale_with_edsr(
     pil_img: Image.Image,
     *,
@@ -86,36 +74,60 @@ def _upscale_with_edsr(
     model_path: Path,
     model_url: str,
     logger,
+    caller: str = "lyst",
 ) -> Image.Image:
     if cv2_module is None or np_module is None:
         raise RuntimeError("opencv/numpy not available for EDSR")
-    sr = _get_edsr_superres(
-        cv2_module=cv2_module,
-        model_path=model_path,
-        model_url=model_url,
-        logger=logger,
-    )
-    img_rgb = np_module.array(pil_img.convert("RGB"))
-    img_bgr = cv2_module.cvtColor(img_rgb, cv2_module.COLOR_RGB2BGR)
-    with _EDSR_LOCK:
-        up_bgr = sr.upsample(img_bgr)
-    up_rgb = cv2_module.cvtColor(up_bgr, cv2_module.COLOR_BGR2RGB)
-    return Image.fromarray(up_rgb)
+    if not hasattr(cv2_module, "dnn_superres"):
+        raise RuntimeError("opencv-contrib (dnn_superres) not available")
+    if not _ensure_edsr_weights(model_path=model_path, model_url=model_url, logger=logger):
+        raise RuntimeError("EDSR weights unavailable")
+    # The model lives in one shared worker process per service instead of in whichever
+    # module imported it; a missed deadline raises so the caller falls back to LANCZOS.
+    return get_edsr_worker(model_path).upscale(pil_img, caller=caller)
+
+
+def warm_up_edsr(*, cv2_module, model_path: Path, model_url: str, logger) -> bool:
+    # Service start-up hook: fetch the weights and start the worker (process spawn plus
+    # model load) before the first card needs it.
+    if cv2_module is None or not hasattr(cv2_module, "dnn_superres"):
+        return False
+    if not _ensure_edsr_weights(model_path=model_path, model_url=model_url, logger=logger):
+        return False
+    get_edsr_worker(model_path).start()
+    return True
 
 
 def _fetch_image_bytes(
     image_url: str,
     *,
     image_url_candidates_fn: Callable[[str | None], Iterable[str]],
+    image_cache: Optional[ImageDownloadCache] = None,
+    size_policy: Optional[ImageSizePolicy] = None,
 ) -> bytes:
     last_exc = None
-    for url in image_url_candidates_fn(image_url):
+    candidates = list(image_url_candidates_fn(image_url))
+    index = 0
+    while index < len(candidates):
+        url = candidates[index]
+        index += 1
         try:
-            resp = requests.get(url, timeout=30)
-            if not resp.ok or not resp.content:
+            if image_cache is not None:
+                return image_cache.fetch(url, timeout=30, size_policy=size_policy)
+            with requests.get(url, timeout=30, stream=size_policy is not None) as resp:
+                content = read_streamed_body(resp, url, size_policy) if resp.ok else b""
+            if not resp.ok or not content:
                 last_exc = RuntimeError(f"Image HTTP {resp.status_code} for {url}")
                 continue
-            return resp.content
+            return content
+        except ImageTooLarge as exc:
+            # Oversized: try the policy's smaller variant first, then the next (smaller)
+            # candidate, e.g. the original Lyst URL after the upgraded full-size one.
+            last_exc = exc
+            if exc.smaller_url and exc.smaller_url not in candidates:
+                candidates.insert(index, exc.smaller_url)
+            if size_policy is not None and index < len(candidates):
+                size_policy.record_variant()
         except Exception as exc:
             last_exc = exc
     if last_exc:
@@ -137,9 +149,35 @@ def process_image(
     np_module=None,
     edsr_model_path: Optional[Path] = None,
     edsr_model_url: str = "",
+    image_cache: Optional[ImageDownloadCache] = None,
+    render_cache: Optional[RenderedCardCache] = None,
+    size_policy: Optional[ImageSizePolicy] = None,
 ):
-    response_bytes = _fetch_image_bytes(image_url, image_url_candidates_fn=image_url_candidates_fn)
-    img = Image.open(io.BytesIO(response_bytes))
+    response_bytes = _fetch_image_bytes(
+        image_url,
+        image_url_candidates_fn=image_url_candidates_fn,
+        image_cache=image_cache,
+        size_policy=size_policy,
+    )
+    price_text, sale_text = f"{uah_price} UAH", f"-{sale_percentage}%"
+    render_key = None
+    if render_cache is not None:
+        output_format = "PNG" if upscale_images else "JPEG"
+        render_key = rendered_card_key(
+            response_bytes,
+            _CARD_RENDER_VERSION,
+            price_text,
+            sale_text,
+            output_format,
+            upscale_method if upscale_images else "",
+        )
+        cached_card = render_cache.get(render_key)
+        if cached_card is not None:
+            return io.BytesIO(cached_card)
+    if image_cache is not None:
+        img = image_cache.open_image(response_bytes)
+    else:
+        img = Image.open(io.BytesIO(response_bytes))
     # If upscaling is disabled, downscale large sources to keep file size under Telegram limit.
     if not upscale_images:
         max_edge = 1280
@@ -150,6 +188,9 @@ def process_image(
             img = img.resize(new_size, Image.LANCZOS)
     width, height = img.size
     should_upscale = upscale_images and max(width, height) < 720
+    # A LANCZOS fallback card must not be cached under the EDSR render key, or the
+    # degraded card would be served for the whole cache TTL.
+    cacheable = True
     if should_upscale:
         if upscale_method == "edsr":
             try:
@@ -166,13 +207,13 @@ def process_image(
                 width, height = img.size
             except Exception as exc:
                 logger.warning(f"EDSR upscale failed, falling back to LANCZOS: {exc}")
+                cacheable = False
                 width, height = [dim * 2 for dim in img.size]
                 img = img.resize((width, height), Image.LANCZOS)
         else:
             width, height = [dim * 2 for dim in img.size]
             img = img.resize((width, height), Image.LANCZOS)
 
-    price_text, sale_text = f"{uah_price} UAH", f"-{sale_percentage}%"
     padding = max(12, int(width * 0.03))
     text_margin = max(20, int(width * 0.1))
     text_margin = min(text_margin, int(width * 0.14))
@@ -180,23 +221,14 @@ def process_image(
     # Choose base font size and adjust if needed to fit width.
     base_scale = 0.064 if width > height else 0.06
     font_size = max(24, int(width * base_scale))
-    font = load_font(font_size, fonts_dir=fonts_dir, prefer_heavy=False)
-
-    def _fit_font(font_size_value):
-        while font_size_value > 12:
-            local_font = load_font(font_size_value, fonts_dir=fonts_dir, prefer_heavy=False)
-            dummy = Image.new("RGB", (width, width), (255, 255, 255))
-            draw = ImageDraw.Draw(dummy)
-            price_bbox = draw.textbbox((0, 0), price_text, font=local_font)
-            sale_bbox = draw.textbbox((0, 0), sale_text, font=local_font)
-            price_w = price_bbox[2] - price_bbox[0]
-            sale_w = sale_bbox[2] - sale_bbox[0]
-            if max(price_w, sale_w) <= (width - (text_margin * 2)):
-                return local_font
-            font_size_value -= 2
-        return load_font(font_size_value, fonts_dir=fonts_dir, prefer_heavy=False)
-
-    font = _fit_font(font_size)
+    font = fit_font(
+        _font_candidates(fonts_dir, False),
+        (price_text, sale_text),
+        width - (text_margin * 2),
+        max_size=font_size,
+        min_size=12,
+        step=2,
+    )
     ascent, descent = font.getmetrics()
     text_height = ascent + descent
     line_padding = max(2, int(font_size * 0.15))
@@ -252,6 +284,8 @@ def process_image(
         if new_img.mode != "RGB":
             new_img = new_img.convert("RGB")
         new_img.save(img_byte_arr, format="JPEG", quality=85, optimize=True, subsampling=0)
+    if render_cache is not None and render_key is not None and cacheable:
+        render_cache.put(render_key, img_byte_arr.getvalue())
     img_byte_arr.seek(0)
     return img_byte_arr
 
@@ -280,6 +314,82 @@ def encode_jpeg_for_telegram(image: Image.Image) -> Optional[bytes]:
     return None
 
 
+TELEGRAM_PHOTO_MAX_BYTES = 10 * 1024 * 1024
+# Upper bound on JPEG bytes per pixel at quality 98 without chroma subsampling (pure
+# noise measures about 3.2). Images small enough to fit even at this rate are encoded
+# directly without a trial.
+_JPEG_WORST_CASE_BYTES_PER_PIXEL = 3.4
+_JPEG_TRIAL_TILE = 64
+_JPEG_TRIAL_GRID = 6
+# The trial is within a few percent of the real encode, so a predicted size just under
+# the limit is tried at full size. Downscaling concentrates detail and bytes per pixel
+# rise as the image shrinks, so resized targets aim further below the limit.
+_JPEG_FULL_SIZE_MARGIN = 0.97
+_JPEG_TARGET_HEADROOM = 0.9
+
+
+@dataclass(frozen=True)
+class JpegFit:
+    data: bytes
+    size: tuple[int, int]
+    encodes: int
+
+
+def _encode_jpeg_q98(image: Image.Image) -> bytes:
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=98, subsampling=0, optimize=False)
+    return out.getvalue()
+
+
+def _trial_bytes_per_pixel(image: Image.Image) -> float:
+    # A mosaic of full-resolution tiles keeps the real detail density, unlike a
+    # downscaled copy (which smooths noise and hides texture), at a fraction of the cost.
+    tile = _JPEG_TRIAL_TILE
+    grid = _JPEG_TRIAL_GRID
+    width, height = image.size
+    mosaic = Image.new(image.mode, (tile * grid, tile * grid))
+    for row in range(grid):
+        for col in range(grid):
+            left = int((width - tile) * (col + 0.5) / grid) if width > tile else 0
+            top = int((height - tile) * (row + 0.5) / grid) if height > tile else 0
+            mosaic.paste(image.crop((left, top, left + tile, top + tile)), (col * tile, row * tile))
+    return len(_encode_jpeg_q98(mosaic)) / float(mosaic.width * mosaic.height)
+
+
+def fit_jpeg_for_telegram(
+    image: Image.Image,
+    *,
+    max_bytes: int = TELEGRAM_PHOTO_MAX_BYTES,
+    max_encodes: int = 2,
+) -> Optional[JpegFit]:
+    # Quality stays at 98 (see encode_jpeg_for_telegram); only the dimensions are
+    # predicted. Small images are encoded as-is. Larger ones get a cheap trial encode
+    # to estimate bytes per pixel, then are resized straight to the predicted size.
+    # A miss re-predicts from the real encode.
+    width, height = image.size
+    pixels = float(width * height)
+    if pixels * _JPEG_WORST_CASE_BYTES_PER_PIXEL <= max_bytes:
+        bytes_per_pixel = 0.0
+    else:
+        bytes_per_pixel = _trial_bytes_per_pixel(image)
+    encodes = 0
+    while encodes < max_encodes:
+        candidate = image
+        if bytes_per_pixel * pixels > max_bytes * _JPEG_FULL_SIZE_MARGIN:
+            scale = math.sqrt(max_bytes * _JPEG_TARGET_HEADROOM / (bytes_per_pixel * pixels))
+            target = (max(1, int(width * scale)), max(1, int(height * scale)))
+            candidate = image.resize(target, resample=Image.Resampling.LANCZOS)
+        data = _encode_jpeg_q98(candidate)
+        encodes += 1
+        if len(data) <= max_bytes:
+            return JpegFit(data=data, size=candidate.size, encodes=encodes)
+        # Re-predict for the original image from what this encode really cost.
+        bytes_per_pixel = len(data) / float(candidate.width * candidate.height)
+        if candidate is not image:
+            bytes_per_pixel *= 1.1
+    return None
+
+
 def enhance_marketplace_upscale(image: Image.Image) -> Image.Image:
     # Instance tests on real OLX/SHAFA photos showed Lanczos x2 followed by a mild
     # unsharp mask gave the best visual result among CPU-safe options. Keep this
@@ -336,8 +446,8 @@ def upscale_image_bytes_for_telegram_sync(
 
             im_up = im.resize((new_w, new_h), resample=Image.Resampling.LANCZOS)
             im_up = enhance_marketplace_upscale(im_up)
-            data = encode_jpeg_for_telegram(im_up)
-            if data is not None:
+            fitted = fit_jpeg_for_telegram(im_up)
+            if fitted is not None and fits_telegram_photo(*fitted.size):
                 _record_image_analytics(
                     analytics_sink,
                     event="upscaled",
@@ -346,41 +456,14 @@ def upscale_image_bytes_for_telegram_sync(
                     image_url=image_url,
                     input_bytes=len(img_bytes),
                     input_size=(w, h),
-                    output_bytes=len(data),
-                    output_size=im_up.size,
+                    output_bytes=len(fitted.data),
+                    output_size=fitted.size,
                     upscale_factor=factor,
                     method="lanczos_enhanced",
                     fallback_mode="photo_prepared",
+                    reason="downscaled_to_fit" if fitted.size != im_up.size else "",
                 )
-                return data
-
-            trial = im_up
-            for _ in range(6):
-                dw = max(1, int(trial.width * 0.9))
-                dh = max(1, int(trial.height * 0.9))
-                if (dw, dh) == trial.size:
-                    break
-                trial = trial.resize((dw, dh), resample=Image.Resampling.LANCZOS)
-                if not fits_telegram_photo(dw, dh):
-                    continue
-                data = encode_jpeg_for_telegram(trial)
-                if data is not None:
-                    _record_image_analytics(
-                        analytics_sink,
-                        event="upscaled",
-                        source_kind=source_kind,
-                        source_name=source_name,
-                        image_url=image_url,
-                        input_bytes=len(img_bytes),
-                        input_size=(w, h),
-                        output_bytes=len(data),
-                        output_size=trial.size,
-                        upscale_factor=factor,
-                        method="lanczos_enhanced",
-                        fallback_mode="photo_prepared",
-                        reason="downscaled_to_fit",
-                    )
-                    return data
+                return fitted.data
         _record_image_analytics(
             analytics_sink,
             event="upscale_failed",
@@ -411,28 +494,27 @@ def upscale_image_bytes_for_telegram_sync(
         return None
 
 
-async def send_remote_photo_with_fallback(
+@dataclass
+class PreparedPhoto:
+    # Carries one marketplace photo between the download, transform and send steps so
+    # the steps can run as separate pipeline stages with their own concurrency.
+    image_url: Optional[str]
+    raw: Optional[bytes] = None
+    photo_bytes: Optional[bytes] = None
+    # Set when the download already decided the outcome (e.g. image 404 -> retry later).
+    result: Optional[DeliveryResult] = None
+
+
+async def download_remote_photo(
     *,
-    bot,
-    chat_id,
-    caption: str,
     image_url: Optional[str],
     is_valid_image_url: Callable[[Optional[str]], bool],
     download_bytes: Callable[[str], Awaitable[Optional[bytes]]],
-    send_message: Callable[[object, str, str], Awaitable[DeliveryResult]],
-    send_photo_by_bytes: Callable[[object, str, bytes, str], Awaitable[DeliveryResult]],
-    run_cpu_bound_fn: Callable[..., Awaitable[Optional[bytes]]],
     logger,
-    min_upscale_dim: int = 1500,
-    max_dim: int = 5000,
-    upscale_factors: Iterable[float] = (2.0,),
     analytics_sink: Optional[AnalyticsSink] = None,
     source_kind: str = "",
     source_name: str = "",
-) -> DeliveryResult:
-    # OLX and SHAFA ended up with almost identical send flows: download remote image,
-    # optionally upscale it for Telegram, then fall back to plain text on failure.
-    # Keeping that orchestration here avoids the two scrapers drifting again.
+) -> PreparedPhoto:
     if not image_url or not is_valid_image_url(image_url):
         _record_image_analytics(
             analytics_sink,
@@ -443,8 +525,7 @@ async def send_remote_photo_with_fallback(
             fallback_mode="invalid_image",
             reason="invalid_or_missing_url",
         )
-        result = await send_message(bot, chat_id, caption)
-        return result or DeliveryResult(delivered=False, failure_reason="telegram_text_timeout", retry_later=True)
+        return PreparedPhoto(image_url=image_url)
 
     try:
         raw = await download_bytes(image_url)
@@ -462,10 +543,13 @@ async def send_remote_photo_with_fallback(
                 fallback_mode="retry_later",
                 reason=f"image_download_{status}",
             )
-            return DeliveryResult(
-                delivered=False,
-                failure_reason=f"image_download_{status}",
-                retry_later=True,
+            return PreparedPhoto(
+                image_url=image_url,
+                result=DeliveryResult(
+                    delivered=False,
+                    failure_reason=f"image_download_{status}",
+                    retry_later=True,
+                ),
             )
         raise
     if not raw:
@@ -480,31 +564,166 @@ async def send_remote_photo_with_fallback(
             fallback_mode="download_failed",
             reason="download_failed",
         )
-        result = await send_message(bot, chat_id, caption)
-        return result or DeliveryResult(delivered=False, failure_reason="telegram_text_timeout", retry_later=True)
+        return PreparedPhoto(image_url=image_url)
+    return PreparedPhoto(image_url=image_url, raw=raw)
 
-    photo_bytes = await run_cpu_bound_fn(
-        upscale_image_bytes_for_telegram_sync,
-        raw,
-        max_dim=max_dim,
-        min_upscale_dim=min_upscale_dim,
-        upscale_factors=upscale_factors,
-        logger=logger,
-        analytics_sink=analytics_sink,
-        source_kind=source_kind,
-        source_name=source_name,
-        image_url=image_url,
-    )
+
+def _upscale_job_kwargs(
+    prepared: PreparedPhoto,
+    *,
+    logger,
+    min_upscale_dim: int,
+    max_dim: int,
+    upscale_factors: Iterable[float],
+    analytics_sink: Optional[AnalyticsSink],
+    source_kind: str,
+    source_name: str,
+) -> dict:
+    return {
+        "max_dim": max_dim,
+        "min_upscale_dim": min_upscale_dim,
+        "upscale_factors": upscale_factors,
+        "logger": logger,
+        "analytics_sink": analytics_sink,
+        "source_kind": source_kind,
+        "source_name": source_name,
+        "image_url": prepared.image_url,
+    }
+
+
+def _apply_transformed_photo(
+    prepared: PreparedPhoto,
+    photo_bytes: Optional[bytes],
+    *,
+    analytics_sink: Optional[AnalyticsSink],
+    source_kind: str,
+    source_name: str,
+) -> PreparedPhoto:
+    raw = prepared.raw
     photo_bytes = photo_bytes or raw
     _record_image_send_analytics(
         analytics_sink,
         source_kind=source_kind,
         source_name=source_name,
-        image_url=image_url,
+        image_url=prepared.image_url,
         raw=raw,
         photo_bytes=photo_bytes,
         upscaled=photo_bytes is not raw,
     )
+    prepared.photo_bytes = photo_bytes
+    return prepared
+
+
+async def transform_remote_photo(
+    prepared: PreparedPhoto,
+    *,
+    run_cpu_bound_fn: Callable[..., Awaitable[Optional[bytes]]],
+    logger,
+    min_upscale_dim: int = 1500,
+    max_dim: int = 5000,
+    upscale_factors: Iterable[float] = (2.0,),
+    analytics_sink: Optional[AnalyticsSink] = None,
+    source_kind: str = "",
+    source_name: str = "",
+) -> PreparedPhoto:
+    if prepared.result is not None or not prepared.raw:
+        return prepared
+    photo_bytes = await run_cpu_bound_fn(
+        upscale_image_bytes_for_telegram_sync,
+        prepared.raw,
+        **_upscale_job_kwargs(
+            prepared,
+            logger=logger,
+            min_upscale_dim=min_upscale_dim,
+            max_dim=max_dim,
+            upscale_factors=upscale_factors,
+            analytics_sink=analytics_sink,
+            source_kind=source_kind,
+            source_name=source_name,
+        ),
+    )
+    return _apply_transformed_photo(
+        prepared,
+        photo_bytes,
+        analytics_sink=analytics_sink,
+        source_kind=source_kind,
+        source_name=source_name,
+    )
+
+
+async def transform_remote_photos(
+    prepared_photos: list[PreparedPhoto],
+    *,
+    run_cpu_bound_batch_fn: Callable[..., Awaitable[list]],
+    logger,
+    min_upscale_dim: int = 1500,
+    max_dim: int = 5000,
+    upscale_factors: Iterable[float] = (2.0,),
+    analytics_sink: Optional[AnalyticsSink] = None,
+    source_kind: str = "",
+    source_name: str = "",
+) -> list[PreparedPhoto | BaseException]:
+    # Batch form of transform_remote_photo: every photo that needs work goes to the
+    # process pool in one submission. A failed photo yields its exception in place.
+    pending = [prepared for prepared in prepared_photos if prepared.result is None and prepared.raw]
+    if not pending:
+        return list(prepared_photos)
+    jobs = [
+        CpuJob(
+            (prepared.raw,),
+            _upscale_job_kwargs(
+                prepared,
+                logger=logger,
+                min_upscale_dim=min_upscale_dim,
+                max_dim=max_dim,
+                upscale_factors=upscale_factors,
+                analytics_sink=analytics_sink,
+                source_kind=source_kind,
+                source_name=source_name,
+            ),
+        )
+        for prepared in pending
+    ]
+    outputs = await run_cpu_bound_batch_fn(
+        upscale_image_bytes_for_telegram_sync,
+        jobs,
+        batch_size=len(jobs),
+        return_exceptions=True,
+    )
+    transformed: dict[int, PreparedPhoto | BaseException] = {}
+    for prepared, output in zip(pending, outputs):
+        if isinstance(output, BaseException):
+            transformed[id(prepared)] = output
+            continue
+        transformed[id(prepared)] = _apply_transformed_photo(
+            prepared,
+            output,
+            analytics_sink=analytics_sink,
+            source_kind=source_kind,
+            source_name=source_name,
+        )
+    return [transformed.get(id(prepared), prepared) for prepared in prepared_photos]
+
+
+async def send_prepared_photo(
+    *,
+    bot,
+    chat_id,
+    caption: str,
+    prepared: PreparedPhoto,
+    send_message: Callable[[object, str, str], Awaitable[DeliveryResult]],
+    send_photo_by_bytes: Callable[[object, str, bytes, str], Awaitable[DeliveryResult]],
+    logger,
+    analytics_sink: Optional[AnalyticsSink] = None,
+    source_kind: str = "",
+    source_name: str = "",
+) -> DeliveryResult:
+    if prepared.result is not None:
+        return prepared.result
+    photo_bytes = prepared.photo_bytes or prepared.raw
+    if not photo_bytes:
+        result = await send_message(bot, chat_id, caption)
+        return result or DeliveryResult(delivered=False, failure_reason="telegram_text_timeout", retry_later=True)
 
     result = await send_photo_by_bytes(bot, chat_id, photo_bytes, caption)
     if result is None:
@@ -519,8 +738,8 @@ async def send_remote_photo_with_fallback(
         event="text_fallback",
         source_kind=source_kind,
         source_name=source_name,
-        image_url=image_url,
-        input_bytes=len(raw),
+        image_url=prepared.image_url,
+        input_bytes=len(prepared.raw or b""),
         output_bytes=len(photo_bytes),
         fallback_mode="text_fallback",
         reason="telegram_photo_send_failed",
@@ -529,6 +748,58 @@ async def send_remote_photo_with_fallback(
     return result or DeliveryResult(delivered=False, failure_reason="telegram_text_timeout", retry_later=True)
 
 
+async def send_remote_photo_with_fallback(
+    *,
+    bot,
+    chat_id,
+    caption: str,
+    image_url: Optional[str],
+    is_valid_image_url: Callable[[Optional[str]], bool],
+    download_bytes: Callable[[str], Awaitable[Optional[bytes]]],
+    send_message: Callable[[object, str, str], Awaitable[DeliveryResult]],
+    send_photo_by_bytes: Callable[[object, str, bytes, str], Awaitable[DeliveryResult]],
+    run_cpu_bound_fn: Callable[..., Awaitable[Optional[bytes]]],
+    logger,
+    min_upscale_dim: int = 1500,
+    max_dim: int = 5000,
+    upscale_factors: Iterable[float] = (2.0,),
+    analytics_sink: Optional[AnalyticsSink] = None,
+    source_kind: str = "",
+    source_name: str = "",
+) -> DeliveryResult:
+    # OLX and SHAFA ended up with almost identical send flows: download remote image,
+    # optionally upscale it for Telegram, then fall back to plain text on failure.
+    # Keeping that orchestration here avoids the two scrapers drifting again. The
+    # staged marketplace pipeline calls the three steps separately.
+    analytics = {"analytics_sink": analytics_sink, "source_kind": source_kind, "source_name": source_name}
+    prepared = await download_remote_photo(
+        image_url=image_url,
+        is_valid_image_url=is_valid_image_url,
+        download_bytes=download_bytes,
+        logger=logger,
+        **analytics,
+    )
+    prepared = await transform_remote_photo(
+        prepared,
+        run_cpu_bound_fn=run_cpu_bound_fn,
+        logger=logger,
+        min_upscale_dim=min_upscale_dim,
+        max_dim=max_dim,
+        upscale_factors=upscale_factors,
+        **analytics,
+    )
+    return await send_prepared_photo(
+        bot=bot,
+        chat_id=chat_id,
+        caption=caption,
+        prepared=prepared,
+        send_message=send_message,
+        send_photo_by_bytes=send_photo_by_bytes,
+        logger=logger,
+        **analytics,
+    )
+
+
 def _record_image_send_analytics(
     analytics_sink: Optional[AnalyticsSink],
     *,
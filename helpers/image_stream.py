@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import re
+import struct
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from config import IMAGE_DOWNLOAD_MAX_BYTES, IMAGE_DOWNLOAD_MAX_PIXELS
+
+# Enough for every header we parse; JPEGs with large EXIF/ICC blocks before SOF are
+# simply treated as "dimensions unknown" and only the byte cap applies to them.
+SNIFF_LIMIT_BYTES = 64 * 1024
+STREAM_CHUNK_BYTES = 16 * 1024
+
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_OLX_SIZE_RE = re.compile(r";s=(\d+)x(\d+)")
+
+
+@dataclass(frozen=True)
+class ImageHeader:
+    format: str
+    width: int
+    height: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def _sniff_jpeg(data: bytes) -> Optional[ImageHeader]:
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+            return ImageHeader("jpeg", width, height)
+        offset += 2 + length
+    return None
+
+
+def _sniff_webp(data: bytes) -> Optional[ImageHeader]:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30 and data[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", data[26:30])
+        return ImageHeader("webp", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L" and len(data) >= 25 and data[20] == 0x2F:
+        bits = int.from_bytes(data[21:25], "little")
+        return ImageHeader("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return ImageHeader("webp", width, height)
+    return None
+
+
+def sniff_image_header(data: bytes) -> Optional[ImageHeader]:
+    # Format and dimensions from the first bytes of a JPEG, PNG, WebP or GIF; None
+    # when the prefix is too short or the format is not recognised.
+    if data.startswith(b"\xff\xd8"):
+        return _sniff_jpeg(data)
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24 and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return ImageHeader("png", width, height)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _sniff_webp(data)
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width, height = struct.unpack("<HH", data[6:10])
+        return ImageHeader("gif", width, height)
+    return None
+
+
+class ImageTooLarge(Exception):
+    def __init__(self, reason: str, *, header: Optional[ImageHeader] = None, smaller_url: Optional[str] = None) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.header = header
+        self.smaller_url = smaller_url
+
+
+@dataclass
+class DownloadSavings:
+    downloads: int = 0
+    sniffed: int = 0
+    aborted: int = 0
+    smaller_variants: int = 0
+    bytes_downloaded: int = 0
+    bytes_avoided: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+_SAVINGS: dict[str, DownloadSavings] = {}
+_SAVINGS_LOCK = threading.Lock()
+
+
+def _record(source: str, **deltas: int) -> None:
+    with _SAVINGS_LOCK:
+        savings = _SAVINGS.setdefault(source or "unknown", DownloadSavings())
+        for key, value in deltas.items():
+            setattr(savings, key, getattr(savings, key) + value)
+
+
+def download_savings() -> dict[str, dict[str, Any]]:
+    with _SAVINGS_LOCK:
+        return {source: savings.to_dict() for source, savings in _SAVINGS.items()}
+
+
+def report_download_savings(service_health) -> None:
+    savings = download_savings()
+    if savings:
+        service_health.set_state_fields(image_downloads=savings)
+
+
+def olx_smaller_variant(url: str, header: Optional[ImageHeader], max_pixels: int) -> Optional[str]:
+    # OLX's CDN renders any `;s=WIDTHxHEIGHT` transform, so ask for the largest box
+    # within the pixel cap instead of downloading the oversized original.
+    match = _OLX_SIZE_RE.search(url or "")
+    if not match:
+        return None
+    width = header.width if header else int(match.group(1))
+    height = header.height if header else int(match.group(2))
+    if width * height <= max_pixels:
+        return None
+    scale = (max_pixels / float(width * height)) ** 0.5
+    box = f";s={max(1, int(width * scale))}x{max(1, int(height * scale))}"
+    smaller = url[: match.start()] + box + url[match.end() :]
+    return smaller if smaller != url else None
+
+
+class ImageSizePolicy:
+    # Per-source download limits. StreamGuard applies them while the body streams in:
+    # the header is sniffed from the first bytes and an oversized image is abandoned
+    # before the rest of it is transferred.
+    def __init__(
+        self,
+        source: str,
+        *,
+        max_bytes: int = IMAGE_DOWNLOAD_MAX_BYTES,
+        max_pixels: int = IMAGE_DOWNLOAD_MAX_PIXELS,
+        smaller_variant: Optional[Callable[[str, Optional[ImageHeader], int], Optional[str]]] = None,
+    ) -> None:
+        self.source = source
+        self.max_bytes = int(max_bytes)
+        self.max_pixels = int(max_pixels)
+        self.smaller_variant = smaller_variant
+
+    def guard(self, url: str, content_length: Any = None) -> "StreamGuard":
+        return StreamGuard(self, url, content_length)
+
+    def record_variant(self) -> None:
+        _record(self.source, smaller_variants=1)
+
+
+class StreamGuard:
+    def __init__(self, policy: ImageSizePolicy, url: str, content_length: Any) -> None:
+        self.policy = policy
+        self.url = url
+        try:
+            self.content_length: Optional[int] = int(content_length) if content_length is not None else None
+        except (TypeError, ValueError):
+            self.content_length = None
+        self.header: Optional[ImageHeader] = None
+        self._chunks: list[bytes] = []
+        self._received = 0
+        self._sniff_done = False
+        if self.content_length is not None and self.content_length > policy.max_bytes:
+            self._abort("content_length_over_cap")
+
+    def _abort(self, reason: str) -> None:
+        policy = self.policy
+        avoided = max(0, self.content_length - self._received) if self.content_length is not None else 0
+        _record(policy.source, aborted=1, bytes_downloaded=self._received, bytes_avoided=avoided)
+        smaller_url = None
+        if policy.smaller_variant is not None:
+            smaller_url = policy.smaller_variant(self.url, self.header, policy.max_pixels)
+        raise ImageTooLarge(reason, header=self.header, smaller_url=smaller_url)
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self._received += len(chunk)
+        if self._received > self.policy.max_bytes:
+            self._abort("body_over_cap")
+        if not self._sniff_done:
+            prefix = b"".join(self._chunks)[:SNIFF_LIMIT_BYTES]
+            self.header = sniff_image_header(prefix)
+            if self.header is not None or len(prefix) >= SNIFF_LIMIT_BYTES:
+                self._sniff_done = True
+                if self.header is not None:
+                    _record(self.policy.source, sniffed=1)
+                    if self.header.pixels > self.policy.max_pixels:
+                        self._abort("dimensions_over_cap")
+
+    def finish(self) -> bytes:
+        content = b"".join(self._chunks)
+        _record(self.policy.source, downloads=1, bytes_downloaded=len(content))
+        return content
+
+
+def read_streamed_body(response, url: str, size_policy: Optional[ImageSizePolicy]) -> bytes:
+    # requests.Response body, read through the policy's guard when there is one.
+    if size_policy is None:
+        return response.content
+    guard = size_policy.guard(url, response.headers.get("Content-Length"))
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+        guard.feed(chunk)
+    return guard.finish()
@@ -23,8 +23,8 @@ def ensure_edsr_weights(*, model_path: Path, model_url: str, logger):
     )
 
 
-def get_edsr_superres(*, cv2_module, model_path: Path, model_url: str, logger):
-    return image_pipeline_helpers._get_edsr_superres(
+def warm_up_edsr(*, cv2_module, model_path: Path, model_url: str, logger):
+    return image_pipeline_helpers.warm_up_edsr(
         cv2_module=cv2_module,
         model_path=model_path,
         model_url=model_url,
@@ -43,10 +43,12 @@ def upscale_with_edsr(pil_img, *, cv2_module, np_module, model_path: Path, model
     )
 
 
-def fetch_image_bytes(image_url: str, *, image_url_candidates_fn):
+def fetch_image_bytes(image_url: str, *, image_url_candidates_fn, image_cache=None, size_policy=None):
     return image_pipeline_helpers._fetch_image_bytes(
         image_url,
         image_url_candidates_fn=image_url_candidates_fn,
+        image_cache=image_cache,
+        size_policy=size_policy,
     )
 
 
@@ -64,6 +66,9 @@ def process_image(
     np_module,
     edsr_model_path: Path,
     edsr_model_url: str,
+    image_cache=None,
+    render_cache=None,
+    size_policy=None,
 ):
     # This adapter keeps the monolith from reaching into the shared image
     # pipeline directly, which makes later renderer changes cheaper and safer.
@@ -80,4 +85,7 @@ def process_image(
         np_module=np_module,
         edsr_model_path=edsr_model_path,
         edsr_model_url=edsr_model_url,
+        image_cache=image_cache,
+        render_cache=render_cache,
+        size_policy=size_policy,
     )
@@ -269,4 +269,6 @@ class LystCycleRunner:
                 )
             raise
         finally:
+            if hasattr(run_stats, "stop_profiling"):
+                run_stats.stop_profiling()
             hooks.set_active_task(None)
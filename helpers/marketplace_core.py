@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 
 @dataclass
@@ -34,6 +34,15 @@ class DeliveryResult:
     retry_later: bool = False
 
 
+@dataclass(frozen=True)
+class PrefetchedState:
+    # Everything the pipeline needs to know about a source's items before deciding what
+    # to send: stored rows (in input order), duplicate keys already taken, unsubscribes.
+    previous_items: list[Optional[Dict[str, Any]]]
+    duplicate_keys: set[Tuple[str, int]]
+    unsubscribed_ids: set[str]
+
+
 @dataclass(frozen=True)
 class SourceDecision:
     should_process: bool
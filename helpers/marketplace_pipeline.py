@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Protocol, Sequence, TypeVar
 
 from helpers.analytics_events import AnalyticsSink, fingerprint_url, stable_hash
-from helpers.marketplace_core import DeliveryResult, MarketplaceItem, SourceStats, duplicate_key
+from helpers.marketplace_core import DeliveryResult, MarketplaceItem, PrefetchedState, SourceStats, duplicate_key
 from helpers.scraper_unsubscribes import fetch_unsubscribed_ids
 
 ItemT = TypeVar("ItemT", bound=MarketplaceItem)
@@ -24,6 +25,40 @@ class ItemDecision:
     is_new_item: bool = False
 
 
+@dataclass
+class StageMetrics:
+    items: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    max_seconds: float = 0.0
+    # Time workers spent blocked handing results to a full downstream queue.
+    backpressure_seconds: float = 0.0
+
+    def record(self, elapsed: float, *, ok: bool) -> None:
+        self.items += 1
+        if not ok:
+            self.failed += 1
+        self.busy_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+
+    def add(self, other: "StageMetrics") -> None:
+        self.items += other.items
+        self.failed += other.failed
+        self.busy_seconds += other.busy_seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.backpressure_seconds += other.backpressure_seconds
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "failed": self.failed,
+            "avg_ms": round((self.busy_seconds / self.items) * 1000.0, 1) if self.items else 0.0,
+            "max_ms": round(self.max_seconds * 1000.0, 1),
+            "busy_s": round(self.busy_seconds, 3),
+            "backpressure_s": round(self.backpressure_seconds, 3),
+        }
+
+
 @dataclass
 class PipelineStats:
     total_seen: int = 0
@@ -36,6 +71,13 @@ class PipelineStats:
     total_notification_claim_skipped: int = 0
     total_send_candidates: int = 0
     total_send_failed: int = 0
+    stages: dict[str, StageMetrics] = field(default_factory=dict)
+
+    def stage(self, name: str) -> StageMetrics:
+        return self.stages.setdefault(name, StageMetrics())
+
+    def stage_summary(self) -> dict[str, dict[str, Any]]:
+        return {name: metrics.to_dict() for name, metrics in self.stages.items()}
 
     def add(self, other: "PipelineStats") -> None:
         self.total_seen += other.total_seen
@@ -48,6 +90,8 @@ class PipelineStats:
         self.total_notification_claim_skipped += other.total_notification_claim_skipped
         self.total_send_candidates += other.total_send_candidates
         self.total_send_failed += other.total_send_failed
+        for name, metrics in other.stages.items():
+            self.stage(name).add(metrics)
 
 
 class MarketplaceRepository(Protocol[ItemT]):
@@ -76,6 +120,74 @@ class MarketplaceRepository(Protocol[ItemT]):
         ...
 
 
+@dataclass(frozen=True)
+class DeliveryStages(Generic[ItemT]):
+    # Optional staged delivery: each callable is one stage connected to the next by a
+    # bounded queue, so a slow image transform cannot idle downloads and a slow Telegram
+    # send cannot hold CPU work. Payloads are opaque to the pipeline.
+    download: Callable[[ItemT, str], Awaitable[Any]]
+    transform: Callable[[ItemT, Any, str], Awaitable[Any]]
+    send: Callable[[ItemT, str, str, Any], Awaitable[bool | DeliveryResult]]
+    download_concurrency: int = 4
+    transform_concurrency: int = 1
+    send_concurrency: int = 1
+    queue_size: int = 8
+    persist_batch_size: int = 20
+    # Optional batch form of transform: takes [(item, payload), ...] and returns one
+    # payload (or exception) per job. Workers hand it whatever is already queued, up
+    # to transform_batch_size jobs.
+    transform_batch: Optional[Callable[[list[tuple[ItemT, Any]], str], Awaitable[list[Any]]]] = None
+    transform_batch_size: int = 1
+
+
+class SupportsBulkNotificationClaims(Protocol[ItemT]):
+    # Optional repository extension: claim every candidate in one DB transaction and
+    # return the ids that were claimed. Repositories without it fall back to per-item
+    # claim_notification_key calls.
+    async def claim_notification_keys(self, items: list[ItemT], source_name: str) -> set[str]:
+        ...
+
+
+async def claim_notification_keys(
+    repository: MarketplaceRepository[ItemT],
+    items: Sequence[ItemT],
+    source_name: str,
+) -> set[str]:
+    if not items:
+        return set()
+    bulk_claim = getattr(repository, "claim_notification_keys", None)
+    if bulk_claim is not None:
+        return set(await bulk_claim(list(items), source_name))
+    claimed: set[str] = set()
+    for item in items:
+        if await repository.claim_notification_key(item, source_name):
+            claimed.add(item.id)
+    return claimed
+
+
+class SupportsPrefetchState(Protocol[ItemT]):
+    # Optional repository extension: answer the existing-row, duplicate-key and
+    # unsubscribe lookups in one connection/transaction instead of three round trips.
+    async def prefetch_state(self, items: list[ItemT]) -> PrefetchedState:
+        ...
+
+
+async def prefetch_state(
+    repository: MarketplaceRepository[ItemT],
+    items: Sequence[ItemT],
+    source_kind: str,
+) -> PrefetchedState:
+    prefetch = getattr(repository, "prefetch_state", None)
+    if prefetch is not None:
+        return await prefetch(list(items))
+    item_ids = [item.id for item in items]
+    return PrefetchedState(
+        previous_items=await repository.fetch_existing(item_ids),
+        duplicate_keys=await repository.fetch_duplicate_keys(list(items)),
+        unsubscribed_ids=await fetch_unsubscribed_ids(source_kind, item_ids),
+    )
+
+
 class RunDuplicateTracker(Generic[ItemT]):
     def __init__(self) -> None:
         self._seen: set[tuple[str, int]] = set()
@@ -107,6 +219,7 @@ async def process_marketplace_items(
     hydrate_from_previous: Optional[Callable[[ItemT, Optional[Dict[str, Any]]], None]] = None,
     analytics_sink: Optional[AnalyticsSink] = None,
     logger=None,
+    delivery_stages: Optional[DeliveryStages[ItemT]] = None,
 ) -> PipelineStats:
     # This shared pipeline was introduced to make OLX and SHAFA follow the exact same
     # unsubscribe, duplicate, claim, send, and persistence order after item parsing.
@@ -114,11 +227,15 @@ async def process_marketplace_items(
     if not items:
         return stats
 
-    previous_items = await repository.fetch_existing([item.id for item in items])
-    duplicate_keys_in_db = await repository.fetch_duplicate_keys(list(items))
-    unsubscribed_item_ids = await fetch_unsubscribed_ids(source_kind, [item.id for item in items])
+    started = time.perf_counter()
+    state = await prefetch_state(repository, items, source_kind)
+    stats.stage("prefetch").record(time.perf_counter() - started, ok=True)
+    previous_items = state.previous_items
+    duplicate_keys_in_db = state.duplicate_keys
+    unsubscribed_item_ids = state.unsubscribed_ids
 
     persist_only_updates: list[ItemUpdate[ItemT]] = []
+    claim_candidates: list[tuple[ItemT, Optional[Dict[str, Any]], ItemDecision]] = []
     send_candidates: list[tuple[ItemT, Optional[Dict[str, Any]]]] = []
 
     for index, item in enumerate(items):
@@ -171,7 +288,20 @@ async def process_marketplace_items(
         if not decision.send_notification:
             continue
 
-        if not await repository.claim_notification_key(item, source_name):
+        claim_candidates.append((item, previous, decision))
+
+    if persist_only_updates:
+        await repository.persist_items(persist_only_updates, source_name)
+
+    # Claims are taken in one batch after filtering so a page with many new items pays a
+    # single DB transaction before sends start instead of one round trip per item.
+    claimed_ids = await claim_notification_keys(
+        repository,
+        [item for item, _, _ in claim_candidates],
+        source_name,
+    )
+    for item, previous, decision in claim_candidates:
+        if item.id not in claimed_ids:
             stats.total_notification_claim_skipped += 1
             if logger is not None:
                 logger.debug(
@@ -195,66 +325,78 @@ async def process_marketplace_items(
         )
         send_candidates.append((item, previous))
 
-    if persist_only_updates:
-        await repository.persist_items(persist_only_updates, source_name)
-
     if not send_candidates:
         return stats
 
-    def _coerce_delivery_result(value: bool | DeliveryResult) -> DeliveryResult:
-        if isinstance(value, DeliveryResult):
-            return value
-        return DeliveryResult(delivered=bool(value))
-
-    async def _deliver(item: ItemT, previous: Optional[Dict[str, Any]]) -> DeliveryResult:
-        delivery = DeliveryResult(delivered=False)
-        try:
-            delivery = _coerce_delivery_result(await send_item(item, build_message(item, previous, source_name), source_name))
-            if delivery.delivered:
-                await repository.mark_notification_sent(item, source_name, delivery.telegram_message_id)
-                _record_item_analytics(
-                    analytics_sink,
-                    event="sent",
-                    source_kind=source_kind,
-                    source_name=source_name,
-                    item=item,
-                    previous=previous,
-                    delivery=delivery,
-                )
-            else:
-                await repository.release_notification_claim(item, source_name)
-                _record_item_analytics(
-                    analytics_sink,
-                    event="send_failed",
-                    source_kind=source_kind,
-                    source_name=source_name,
-                    item=item,
-                    previous=previous,
-                    delivery=delivery,
-                )
-        except Exception:
+    async def _finish_delivery(item: ItemT, previous: Optional[Dict[str, Any]], delivery: DeliveryResult) -> None:
+        if delivery.delivered:
+            await repository.mark_notification_sent(item, source_name, delivery.telegram_message_id)
+            _record_item_analytics(
+                analytics_sink,
+                event="sent",
+                source_kind=source_kind,
+                source_name=source_name,
+                item=item,
+                previous=previous,
+                delivery=delivery,
+            )
+        else:
             await repository.release_notification_claim(item, source_name)
             _record_item_analytics(
                 analytics_sink,
-                event="send_exception",
+                event="send_failed",
                 source_kind=source_kind,
                 source_name=source_name,
                 item=item,
                 previous=previous,
+                delivery=delivery,
             )
-            raise
-        finally:
-            # Failed sends are intentionally not persisted as normal seen items. Otherwise a
-            # transient Telegram/image problem can make a first-seen item look already known
-            # on the next run and silently suppress the retry.
-            if delivery.delivered:
-                await repository.persist_items([ItemUpdate(item=item, touch_last_sent=True)], source_name)
-        return delivery
 
-    results = await asyncio.gather(
-        *(_deliver(item, previous) for item, previous in send_candidates),
-        return_exceptions=True,
-    )
+    async def _abort_delivery(item: ItemT, previous: Optional[Dict[str, Any]]) -> None:
+        await repository.release_notification_claim(item, source_name)
+        _record_item_analytics(
+            analytics_sink,
+            event="send_exception",
+            source_kind=source_kind,
+            source_name=source_name,
+            item=item,
+            previous=previous,
+        )
+
+    if delivery_stages is not None:
+        results = await _deliver_staged(
+            send_candidates,
+            stages=delivery_stages,
+            stats=stats,
+            source_name=source_name,
+            build_message=build_message,
+            repository=repository,
+            finish_delivery=_finish_delivery,
+            abort_delivery=_abort_delivery,
+            logger=logger,
+        )
+    else:
+        async def _deliver(item: ItemT, previous: Optional[Dict[str, Any]]) -> DeliveryResult:
+            delivery = DeliveryResult(delivered=False)
+            try:
+                delivery = _coerce_delivery_result(await send_item(item, build_message(item, previous, source_name), source_name))
+                await _finish_delivery(item, previous, delivery)
+            except Exception:
+                if not delivery.delivered:
+                    await _abort_delivery(item, previous)
+                raise
+            finally:
+                # Failed sends are intentionally not persisted as normal seen items. Otherwise a
+                # transient Telegram/image problem can make a first-seen item look already known
+                # on the next run and silently suppress the retry.
+                if delivery.delivered:
+                    await repository.persist_items([ItemUpdate(item=item, touch_last_sent=True)], source_name)
+            return delivery
+
+        results = await asyncio.gather(
+            *(_deliver(item, previous) for item, previous in send_candidates),
+            return_exceptions=True,
+        )
     for result in results:
         if isinstance(result, DeliveryResult) and result.delivered:
             stats.total_sent += 1
@@ -263,6 +405,204 @@ async def process_marketplace_items(
     return stats
 
 
+def _coerce_delivery_result(value: bool | DeliveryResult) -> DeliveryResult:
+    if isinstance(value, DeliveryResult):
+        return value
+    return DeliveryResult(delivered=bool(value))
+
+
+_STAGE_DONE = object()
+
+
+async def _deliver_staged(
+    send_candidates: list[tuple[ItemT, Optional[Dict[str, Any]]]],
+    *,
+    stages: DeliveryStages[ItemT],
+    stats: PipelineStats,
+    source_name: str,
+    build_message: Callable[[ItemT, Optional[Dict[str, Any]], str], str],
+    repository: MarketplaceRepository[ItemT],
+    finish_delivery: Callable[[ItemT, Optional[Dict[str, Any]], DeliveryResult], Awaitable[None]],
+    abort_delivery: Callable[[ItemT, Optional[Dict[str, Any]]], Awaitable[None]],
+    logger=None,
+) -> list[Any]:
+    # download -> transform -> send -> persist. Each arrow is a bounded queue; a full queue
+    # makes the upstream stage wait (backpressure) rather than buffering every image.
+    queue_size = max(1, int(stages.queue_size))
+    transform_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    send_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    persist_queue: asyncio.Queue = asyncio.Queue()
+    download_queue: asyncio.Queue = asyncio.Queue()
+    for index, (item, previous) in enumerate(send_candidates):
+        download_queue.put_nowait((index, item, previous, None))
+    results: list[Any] = [None] * len(send_candidates)
+
+    async def _put(queue: asyncio.Queue, job: Any, metrics: StageMetrics) -> None:
+        started = time.perf_counter()
+        await queue.put(job)
+        metrics.backpressure_seconds += time.perf_counter() - started
+
+    async def _fail(index: int, item: ItemT, previous: Optional[Dict[str, Any]], stage_name: str, exc: BaseException) -> None:
+        if logger is not None:
+            logger.warning("Marketplace %s stage failed for %s: %s", stage_name, item.id, exc)
+        results[index] = exc
+        try:
+            await abort_delivery(item, previous)
+        except Exception as abort_exc:
+            results[index] = abort_exc
+
+    async def _download_worker() -> None:
+        metrics = stats.stage("download")
+        while True:
+            try:
+                index, item, previous, _ = download_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                payload = await stages.download(item, source_name)
+            except Exception as exc:
+                metrics.record(time.perf_counter() - started, ok=False)
+                await _fail(index, item, previous, "download", exc)
+                continue
+            metrics.record(time.perf_counter() - started, ok=True)
+            await _put(transform_queue, (index, item, previous, payload), metrics)
+
+    async def _transform_worker() -> None:
+        metrics = stats.stage("transform")
+        while (job := await transform_queue.get()) is not _STAGE_DONE:
+            index, item, previous, payload = job
+            started = time.perf_counter()
+            try:
+                payload = await stages.transform(item, payload, source_name)
+            except Exception as exc:
+                metrics.record(time.perf_counter() - started, ok=False)
+                await _fail(index, item, previous, "transform", exc)
+                continue
+            metrics.record(time.perf_counter() - started, ok=True)
+            await _put(send_queue, (index, item, previous, payload), metrics)
+
+    async def _transform_batch_worker() -> None:
+        metrics = stats.stage("transform")
+        batch_size = max(1, int(stages.transform_batch_size))
+        done = False
+        while not done:
+            job = await transform_queue.get()
+            if job is _STAGE_DONE:
+                return
+            batch = [job]
+            while len(batch) < batch_size:
+                try:
+                    job = transform_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if job is _STAGE_DONE:
+                    done = True
+                    break
+                batch.append(job)
+            started = time.perf_counter()
+            try:
+                payloads = await stages.transform_batch([(item, payload) for _, item, _, payload in batch], source_name)
+            except Exception as exc:
+                payloads = [exc] * len(batch)
+            if len(payloads) != len(batch):
+                # Results cannot be matched back to items, so the whole batch fails and
+                # every claim in it is released.
+                mismatch = RuntimeError(f"transform_batch returned {len(payloads)} results for {len(batch)} items")
+                payloads = [mismatch] * len(batch)
+            elapsed = (time.perf_counter() - started) / len(batch)
+            for (index, item, previous, _), payload in zip(batch, payloads):
+                if isinstance(payload, BaseException):
+                    metrics.record(elapsed, ok=False)
+                    await _fail(index, item, previous, "transform", payload)
+                    continue
+                metrics.record(elapsed, ok=True)
+                await _put(send_queue, (index, item, previous, payload), metrics)
+
+    async def _send_worker() -> None:
+        metrics = stats.stage("send")
+        while (job := await send_queue.get()) is not _STAGE_DONE:
+            index, item, previous, payload = job
+            started = time.perf_counter()
+            try:
+                delivery = _coerce_delivery_result(
+                    await stages.send(item, build_message(item, previous, source_name), source_name, payload)
+                )
+            except Exception as exc:
+                metrics.record(time.perf_counter() - started, ok=False)
+                await _fail(index, item, previous, "send", exc)
+                continue
+            metrics.record(time.perf_counter() - started, ok=delivery.delivered)
+            results[index] = delivery
+            if delivery.delivered:
+                # Queued before the bookkeeping below so a delivered item is persisted (and
+                # not resent next run) even if marking its notification sent fails.
+                persist_queue.put_nowait(item)
+            try:
+                await finish_delivery(item, previous, delivery)
+            except Exception as exc:
+                if not delivery.delivered:
+                    await _fail(index, item, previous, "send", exc)
+                elif logger is not None:
+                    # Keep the claim: the message is in the chat, releasing it would let
+                    # another run send it again.
+                    logger.error("Marketplace delivery bookkeeping failed for %s: %s", item.id, exc)
+
+    async def _persist_worker() -> None:
+        # Delivered items are persisted in batches as they arrive; failed sends are never
+        # persisted so a first-seen item stays retryable on the next run.
+        metrics = stats.stage("persist")
+        batch_size = max(1, int(stages.persist_batch_size))
+        done = False
+        while not done:
+            job = await persist_queue.get()
+            batch: list[ItemT] = []
+            if job is _STAGE_DONE:
+                done = True
+            else:
+                batch.append(job)
+            while len(batch) < batch_size and not done:
+                try:
+                    job = persist_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if job is _STAGE_DONE:
+                    done = True
+                else:
+                    batch.append(job)
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                await repository.persist_items([ItemUpdate(item=item, touch_last_sent=True) for item in batch], source_name)
+                metrics.record(time.perf_counter() - started, ok=True)
+            except Exception as exc:
+                metrics.record(time.perf_counter() - started, ok=False)
+                if logger is not None:
+                    logger.error("Marketplace persist batch failed (%s items): %s", len(batch), exc)
+
+    async def _run_workers(count: int, worker, next_queue: Optional[asyncio.Queue], next_count: int) -> None:
+        await asyncio.gather(*(worker() for _ in range(max(1, int(count)))))
+        if next_queue is not None:
+            for _ in range(next_count):
+                await next_queue.put(_STAGE_DONE)
+
+    transform_workers = max(1, int(stages.transform_concurrency))
+    send_workers = max(1, int(stages.send_concurrency))
+    await asyncio.gather(
+        _run_workers(stages.download_concurrency, _download_worker, transform_queue, transform_workers),
+        _run_workers(
+            transform_workers,
+            _transform_worker if stages.transform_batch is None else _transform_batch_worker,
+            send_queue,
+            send_workers,
+        ),
+        _run_workers(send_workers, _send_worker, persist_queue, 1),
+        _run_workers(1, _persist_worker, None, 0),
+    )
+    return results
+
+
 def _record_item_analytics(
     analytics_sink: Optional[AnalyticsSink],
     *,
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence, Tuple
+
+from helpers.marketplace_core import MarketplaceItem, PrefetchedState, duplicate_key
+
+if TYPE_CHECKING:
+    from helpers.duplicate_index import DuplicateKeyIndex
+
+_CANDIDATES_TABLE = "marketplace_prefetch_candidates"
+
+
+def prefetch_state_in_conn(
+    conn: sqlite3.Connection,
+    items: Sequence[MarketplaceItem],
+    *,
+    source_kind: str,
+    items_table: str,
+    notifications_table: str,
+    existing_columns: Sequence[str],
+    unsubscribe_schema: str,
+    duplicate_index: Optional["DuplicateKeyIndex"] = None,
+) -> PrefetchedState:
+    # One temp table of candidate ids/prices drives the existing-row, duplicate-key and
+    # unsubscribe lookups, so all three read the same snapshot on one connection and no
+    # query depends on the bound-parameter limit. The caller owns the transaction and
+    # must already have the unsubscribe ledger attached as `unsubscribe_schema`.
+    if not items:
+        return PrefetchedState(previous_items=[], duplicate_keys=set(), unsubscribed_ids=set())
+
+    candidate_map: Dict[Tuple[str, int], set[str]] = {}
+    for item in items:
+        key = duplicate_key(item.name, item.price_int)
+        if key is not None:
+            candidate_map.setdefault(key, set()).add(item.id)
+    duplicates: set[Tuple[str, int]] = set()
+    if duplicate_index is not None:
+        # Only keys the cross-run index cannot settle on its own are checked in the DB.
+        duplicates, candidate_map = duplicate_index.split_candidates(candidate_map)
+    checked_prices = {price for _, price in candidate_map}
+    rows: list[tuple[str, Optional[int]]] = []
+    for item in items:
+        price = item.price_int if item.price_int in checked_prices else None
+        rows.append((item.id, price))
+
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {_CANDIDATES_TABLE} (item_id TEXT NOT NULL, price_int INTEGER)")
+    conn.execute(f"DELETE FROM temp.{_CANDIDATES_TABLE}")
+    conn.executemany(f"INSERT INTO temp.{_CANDIDATES_TABLE} (item_id, price_int) VALUES (?, ?)", rows)
+    try:
+        existing_rows = conn.execute(
+            f"SELECT {', '.join(existing_columns)} FROM {items_table} "
+            f"WHERE id IN (SELECT item_id FROM temp.{_CANDIDATES_TABLE})"
+        ).fetchall()
+        existing: Dict[str, Dict[str, Any]] = {str(row["id"]): dict(row) for row in existing_rows}
+
+        db_duplicates: set[Tuple[str, int]] = set()
+        # Keys with any stored row, including rows of the candidate item itself; a filter
+        # hit without one is a true Bloom false positive.
+        stored_keys: set[Tuple[str, int]] = set()
+        if candidate_map:
+            price_filter = f"price_int IN (SELECT price_int FROM temp.{_CANDIDATES_TABLE} WHERE price_int IS NOT NULL)"
+            for row in conn.execute(f"SELECT id, name, price_int FROM {items_table} WHERE {price_filter}"):
+                row_key = duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
+                if row_key is None or row_key not in candidate_map:
+                    continue
+                stored_keys.add(row_key)
+                if str(row["id"]) not in candidate_map[row_key]:
+                    db_duplicates.add(row_key)
+            for row in conn.execute(
+                f"SELECT name, price_int FROM {notifications_table} WHERE {price_filter} AND state IN ('pending', 'sent')"
+            ):
+                row_key = duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
+                if row_key is not None and row_key in candidate_map:
+                    stored_keys.add(row_key)
+                    db_duplicates.add(row_key)
+            if duplicate_index is not None:
+                duplicate_index.record_db_check(
+                    len(candidate_map),
+                    len(db_duplicates),
+                    absent=len(candidate_map) - len(stored_keys),
+                )
+
+        unsubscribed = {
+            str(row[0])
+            for row in conn.execute(
+                f"SELECT item_id FROM {unsubscribe_schema}.unsubscribed_items "
+                f"WHERE source = ? AND item_id IN (SELECT item_id FROM temp.{_CANDIDATES_TABLE})",
+                (source_kind,),
+            )
+        }
+    finally:
+        conn.execute(f"DELETE FROM temp.{_CANDIDATES_TABLE}")
+
+    return PrefetchedState(
+        previous_items=[existing.get(item.id) for item in items],
+        duplicate_keys=duplicates | db_duplicates,
+        unsubscribed_ids=unsubscribed,
+    )
+
+
+def duplicate_keys_since_in_conn(
+    conn: sqlite3.Connection,
+    since: Optional[str],
+    *,
+    items_table: str,
+    notifications_table: str,
+) -> list[Tuple[str, int]]:
+    # Feeds DuplicateKeyIndex.load: every key that can make a new item a duplicate
+    # (stored items plus pending/sent notifications), optionally only recent writes.
+    where_recent = " AND updated_at >= ?" if since is not None else ""
+    params: tuple[str, ...] = (since,) if since is not None else ()
+    keys: list[Tuple[str, int]] = []
+    for query in (
+        f"SELECT name, price_int FROM {items_table} WHERE 1 = 1{where_recent}",
+        f"SELECT name, price_int FROM {notifications_table} WHERE state IN ('pending', 'sent'){where_recent}",
+    ):
+        for row in conn.execute(query, params):
+            key = duplicate_key(str(row[0] or ""), int(row[1] or 0))
+            if key is not None:
+                keys.append(key)
+    return keys
@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import io
 import random
+from dataclasses import dataclass
 from functools import wraps
 from typing import Any, Awaitable, Callable, Iterable, Optional
 
@@ -12,8 +13,18 @@ from telegram.error import RetryAfter, TimedOut
 from telegram.request import HTTPXRequest
 
 from helpers.analytics_events import AnalyticsSink
+from helpers.image_cache import CachedImage, ImageDownloadCache
+from helpers.image_stream import STREAM_CHUNK_BYTES, ImageSizePolicy, ImageTooLarge
 from helpers.marketplace_core import DeliveryResult
-from helpers.image_pipeline import send_remote_photo_with_fallback
+from helpers.telegram_runtime import get_shared_bot
+from helpers.image_pipeline import (
+    PreparedPhoto,
+    download_remote_photo,
+    send_prepared_photo,
+    send_remote_photo_with_fallback,
+    transform_remote_photo,
+    transform_remote_photos,
+)
 from config import (
     MARKET_TELEGRAM_CONNECT_TIMEOUT,
     MARKET_TELEGRAM_MEDIA_WRITE_TIMEOUT,
@@ -51,6 +62,9 @@ def async_retry(max_retries: int = 3, backoff_base: float = 1.0, *, assume_timeo
                         return True
                     if attempt < max_retries - 1:
                         await asyncio.sleep(backoff_base * (attempt + 1))
+                except ImageTooLarge:
+                    # Deterministic for a given URL; the caller picks a smaller variant.
+                    raise
                 except RetryableHttpStatus as exc:
                     if attempt < max_retries - 1:
                         wait_s = exc.wait_s if exc.wait_s > 0 else (backoff_base * (attempt + 1))
@@ -69,13 +83,11 @@ def async_retry(max_retries: int = 3, backoff_base: float = 1.0, *, assume_timeo
     return decorator
 
 
-def build_marketplace_bot(token: str):
-    from telegram import Bot
-
+def build_marketplace_request() -> HTTPXRequest:
     # Marketplace sends can upload many photos in a short burst. The default
     # python-telegram-bot HTTP pool is one connection with very small timeouts,
     # which made concurrent sends look successful after ambiguous timeouts.
-    request = HTTPXRequest(
+    return HTTPXRequest(
         connection_pool_size=MARKET_TELEGRAM_POOL_SIZE,
         connect_timeout=MARKET_TELEGRAM_CONNECT_TIMEOUT,
         read_timeout=MARKET_TELEGRAM_READ_TIMEOUT,
@@ -83,7 +95,10 @@ def build_marketplace_bot(token: str):
         pool_timeout=MARKET_TELEGRAM_POOL_TIMEOUT,
         media_write_timeout=MARKET_TELEGRAM_MEDIA_WRITE_TIMEOUT,
     )
-    return Bot(token=token, request=request)
+
+
+def build_marketplace_bot(token: str):
+    return get_shared_bot(token, request_factory=build_marketplace_request)
 
 
 async def _sleep_after_marketplace_send() -> None:
@@ -142,17 +157,42 @@ def build_image_downloader(
     user_agent: str,
     accept_language: str,
     logger,
+    image_cache: Optional[ImageDownloadCache] = None,
+    size_policy: Optional[ImageSizePolicy] = None,
 ):
+    async def read_body(url: str, response) -> bytes:
+        if size_policy is None:
+            return await response.read()
+        # Stream through the size guard so oversized images are dropped after their
+        # header instead of after the full transfer.
+        guard = size_policy.guard(url, response.headers.get("Content-Length"))
+        try:
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_BYTES):
+                guard.feed(chunk)
+        except ImageTooLarge:
+            response.close()
+            raise
+        return guard.finish()
+
     @async_retry(max_retries=3, backoff_base=1.0)
-    async def download_bytes(url: str, timeout_s: int = 30) -> Optional[bytes]:
+    async def fetch_from_origin(
+        url: str,
+        timeout_s: int,
+        cached: Optional[CachedImage],
+        cache_key: Optional[str] = None,
+    ) -> Optional[bytes]:
         headers = {
             "User-Agent": user_agent,
             "Accept-Language": accept_language,
             "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
         }
+        if cached is not None:
+            headers.update(cached.conditional_headers())
         async with http_semaphore:
             session = get_http_session()
             async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout_s)) as response:
+                if response.status == 304 and cached is not None and image_cache is not None:
+                    return await asyncio.to_thread(image_cache.mark_revalidated, cached)
                 if response.status == 429:
                     retry_after = response.headers.get("Retry-After")
                     wait_s = int(retry_after) if retry_after and retry_after.isdigit() else 15
@@ -163,7 +203,50 @@ def build_image_downloader(
                     logger.warning("Image forbidden (403). Falling back to text-only send.")
                     return None
                 response.raise_for_status()
-                return await response.read()
+                content = await read_body(url, response)
+                if image_cache is not None and content:
+                    if cache_key is None:
+                        await asyncio.to_thread(
+                            image_cache.store,
+                            url,
+                            content,
+                            etag=response.headers.get("ETag", ""),
+                            last_modified=response.headers.get("Last-Modified", ""),
+                        )
+                    else:
+                        # A smaller variant stands in for cache_key; its validators do
+                        # not apply to the original URL.
+                        await asyncio.to_thread(image_cache.store, cache_key, content)
+                return content
+
+    async def fetch_within_caps(url: str, timeout_s: int, cached: Optional[CachedImage]) -> Optional[bytes]:
+        try:
+            return await fetch_from_origin(url, timeout_s, cached)
+        except ImageTooLarge as exc:
+            if not exc.smaller_url:
+                logger.info(f"Image over size caps ({exc.reason}); falling back to text-only send.")
+                return None
+            smaller_url = exc.smaller_url
+        size_policy.record_variant()
+        try:
+            return await fetch_from_origin(smaller_url, timeout_s, None, url)
+        except ImageTooLarge:
+            return None
+
+    async def download_bytes(url: str, timeout_s: int = 30) -> Optional[bytes]:
+        if image_cache is None:
+            return await fetch_within_caps(url, timeout_s, None)
+        # Fresh cache entries skip the network entirely; stale ones are revalidated and
+        # still served if the origin is unreachable after all retries.
+        cached = await asyncio.to_thread(image_cache.lookup, url)
+        if cached is not None and cached.fresh:
+            return cached.content
+        try:
+            return await fetch_within_caps(url, timeout_s, cached)
+        except Exception:
+            if cached is None:
+                raise
+            return await asyncio.to_thread(image_cache.serve_stale, cached)
 
     return download_bytes
 
@@ -211,3 +294,104 @@ def build_media_sender(
         )
 
     return send_photo_with_upscale
+
+
+@dataclass(frozen=True)
+class MediaStages:
+    # The three halves of send_photo_with_upscale, exposed separately so the staged
+    # marketplace pipeline can give download, image transform and Telegram send their
+    # own concurrency instead of one coroutine holding all three resources in turn.
+    download: Callable[..., Awaitable[PreparedPhoto]]
+    transform: Callable[..., Awaitable[PreparedPhoto]]
+    send: Callable[..., Awaitable[DeliveryResult]]
+    # Set when build_media_stages gets a batch runner: several downloaded photos go
+    # to the process pool in one submission.
+    transform_batch: Optional[Callable[..., Awaitable[list]]] = None
+
+
+def build_media_stages(
+    *,
+    is_valid_image_url: Callable[[Optional[str]], bool],
+    download_bytes: Callable[[str], Awaitable[Optional[bytes]]],
+    send_message: Callable[[object, str, str], Awaitable[DeliveryResult]],
+    send_photo_by_bytes: Callable[[object, str, bytes, str], Awaitable[DeliveryResult]],
+    run_cpu_bound_fn: Callable[..., Awaitable[Optional[bytes]]],
+    logger,
+    min_upscale_dim: int = 1500,
+    max_dim: int = 5000,
+    upscale_factors: Iterable[float] = (2.0,),
+    source_kind: str = "",
+    analytics_sink: Optional[AnalyticsSink] = None,
+    transform_semaphore: Optional[asyncio.Semaphore] = None,
+    run_cpu_bound_batch_fn: Optional[Callable[..., Awaitable[list]]] = None,
+) -> MediaStages:
+    async def download(image_url: Optional[str], source_name: str = "") -> PreparedPhoto:
+        return await download_remote_photo(
+            image_url=image_url,
+            is_valid_image_url=is_valid_image_url,
+            download_bytes=download_bytes,
+            logger=logger,
+            analytics_sink=analytics_sink,
+            source_kind=source_kind,
+            source_name=source_name,
+        )
+
+    async def transform(prepared: PreparedPhoto, source_name: str = "") -> PreparedPhoto:
+        async def _transform() -> PreparedPhoto:
+            return await transform_remote_photo(
+                prepared,
+                run_cpu_bound_fn=run_cpu_bound_fn,
+                logger=logger,
+                min_upscale_dim=min_upscale_dim,
+                max_dim=max_dim,
+                upscale_factors=upscale_factors,
+                analytics_sink=analytics_sink,
+                source_kind=source_kind,
+                source_name=source_name,
+            )
+
+        if transform_semaphore is None:
+            return await _transform()
+        async with transform_semaphore:
+            return await _transform()
+
+    async def send(bot, chat_id: str, caption: str, prepared: PreparedPhoto, source_name: str = "") -> DeliveryResult:
+        return await send_prepared_photo(
+            bot=bot,
+            chat_id=chat_id,
+            caption=caption,
+            prepared=prepared,
+            send_message=send_message,
+            send_photo_by_bytes=send_photo_by_bytes,
+            logger=logger,
+            analytics_sink=analytics_sink,
+            source_kind=source_kind,
+            source_name=source_name,
+        )
+
+    async def transform_batch(prepared_photos: list[PreparedPhoto], source_name: str = "") -> list:
+        async def _transform() -> list:
+            return await transform_remote_photos(
+                prepared_photos,
+                run_cpu_bound_batch_fn=run_cpu_bound_batch_fn,
+                logger=logger,
+                min_upscale_dim=min_upscale_dim,
+                max_dim=max_dim,
+                upscale_factors=upscale_factors,
+                analytics_sink=analytics_sink,
+                source_kind=source_kind,
+                source_name=source_name,
+            )
+
+        # One batch is one pool submission, so it holds a single transform permit.
+        if transform_semaphore is None:
+            return await _transform()
+        async with transform_semaphore:
+            return await _transform()
+
+    return MediaStages(
+        download=download,
+        transform=transform,
+        send=send,
+        transform_batch=transform_batch if run_cpu_bound_batch_fn is not None else None,
+    )
@@ -1,12 +1,26 @@
 from __future__ import annotations
 
 import asyncio
+import inspect
+import math
 import os
 import pickle
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Iterable, Optional
 
 _PROCESS_POOL: ProcessPoolExecutor | None = None
+# Buffers at least this large cross the process boundary through shared memory instead
+# of being pickled into the pool's pipe (source photos and rendered JPEGs are MBs).
+SHARED_MEMORY_MIN_BYTES = 256 * 1024
+# Python 3.13 lets a segment opt out of the resource tracker; only then can a worker
+# hand a segment it created to the parent, so results use shared memory only there.
+_SHM_RESULTS = "track" in inspect.signature(shared_memory.SharedMemory).parameters
+# Functions that failed to pickle once. Whether the arguments pickle depends on their
+# values, so calls are pickled once at submission instead of checked in advance.
+_UNPICKLABLE_FUNCS: set[Any] = set()
 
 
 def recommended_process_workers() -> int:
@@ -17,15 +31,228 @@ def recommended_process_workers() -> int:
 def get_process_pool() -> ProcessPoolExecutor:
     global _PROCESS_POOL
     if _PROCESS_POOL is None:
+        # Workers must share the parent's resource tracker, otherwise each one starts its
+        # own and reports the shared-memory segments it attached to as leaked.
+        resource_tracker.ensure_running()
         _PROCESS_POOL = ProcessPoolExecutor(max_workers=recommended_process_workers())
     return _PROCESS_POOL
 
 
-async def run_cpu_bound(func, /, *args, **kwargs):
-    loop = asyncio.get_running_loop()
-    call = partial(func, *args, **kwargs)
+@dataclass(frozen=True)
+class CpuJob:
+    args: tuple = ()
+    kwargs: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class SharedBuffer:
+    name: str
+    size: int
+
+
+def _dumps_call(payload: tuple) -> Optional[bytes]:
+    # Pickled once here rather than by the pool's feeder thread, so a pickling failure
+    # is visible to the caller (and falls back to a thread) instead of failing the job.
+    func = payload[0]
+    try:
+        if func in _UNPICKLABLE_FUNCS:
+            return None
+    except TypeError:
+        pass
     try:
-        pickle.dumps(call)
+        return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
     except Exception:
-        return await asyncio.to_thread(call)
-    return await loop.run_in_executor(get_process_pool(), call)
+        try:
+            pickle.dumps(func)
+        except Exception:
+            try:
+                _UNPICKLABLE_FUNCS.add(func)
+            except TypeError:
+                pass
+        return None
+
+
+def _is_buffer(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def _share(value: Any, min_bytes: int, owned: list[shared_memory.SharedMemory]) -> Any:
+    if min_bytes <= 0 or not _is_buffer(value) or len(value) < min_bytes:
+        return value
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=len(value))
+    except OSError:
+        return value
+    shm.buf[: len(value)] = value
+    owned.append(shm)
+    return SharedBuffer(shm.name, len(value))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if _SHM_RESULTS:
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _read_shared(buffer: SharedBuffer, *, unlink: bool) -> bytes:
+    shm = _attach(buffer.name)
+    try:
+        return bytes(shm.buf[: buffer.size])
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+
+def _export_result(value: Any, min_bytes: int) -> Any:
+    # Worker side: large byte results go back through an untracked segment that the
+    # parent unlinks after reading it.
+    if not _SHM_RESULTS or min_bytes <= 0 or not isinstance(value, bytes) or len(value) < min_bytes:
+        return value
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=len(value), track=False)
+    except OSError:
+        return value
+    shm.buf[: len(value)] = value
+    shm.close()
+    return SharedBuffer(shm.name, len(value))
+
+
+def _import_result(value: Any) -> Any:
+    return _read_shared(value, unlink=True) if isinstance(value, SharedBuffer) else value
+
+
+def _resolve(value: Any) -> Any:
+    return _read_shared(value, unlink=False) if isinstance(value, SharedBuffer) else value
+
+
+def _run_job(func, args: tuple, kwargs: dict[str, Any], min_bytes: int) -> Any:
+    args = tuple(_resolve(arg) for arg in args)
+    kwargs = {key: _resolve(value) for key, value in kwargs.items()}
+    return _export_result(func(*args, **kwargs), min_bytes)
+
+
+def _run_pickled_job(payload: bytes, min_bytes: int) -> Any:
+    func, args, kwargs = pickle.loads(payload)
+    return _run_job(func, args, kwargs, min_bytes)
+
+
+def _run_pickled_batch(payload: bytes, min_bytes: int) -> list[tuple[bool, Any]]:
+    func, jobs = pickle.loads(payload)
+    return _run_batch(func, jobs, min_bytes)
+
+
+def _run_batch(func, jobs: list[tuple[tuple, dict[str, Any]]], min_bytes: int) -> list[tuple[bool, Any]]:
+    # One pool submission runs a whole list of jobs; failures are reported per job so
+    # one bad image does not discard the rest of the batch.
+    outcomes = []
+    for args, kwargs in jobs:
+        try:
+            outcomes.append((True, _run_job(func, args, kwargs, min_bytes)))
+        except Exception as exc:
+            try:
+                pickle.dumps(exc)
+            except Exception:
+                exc = RuntimeError(f"{type(exc).__name__}: {exc}")
+            outcomes.append((False, exc))
+    return outcomes
+
+
+def _discard_batch_results(future: Future) -> None:
+    # The awaiting coroutine was cancelled; free any shared-memory results it will never read.
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    outcomes = result if isinstance(result, list) else [(True, result)]
+    for ok, value in outcomes:
+        if ok and isinstance(value, SharedBuffer):
+            _import_result(value)
+
+
+async def _submit(fn: Callable[..., Any], *args: Any) -> Any:
+    future = get_process_pool().submit(fn, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(_discard_batch_results)
+        raise
+
+
+def _release(owned: list[shared_memory.SharedMemory]) -> None:
+    for shm in owned:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def run_cpu_bound(func, /, *args, **kwargs):
+    owned: list[shared_memory.SharedMemory] = []
+    try:
+        shared_args = tuple(_share(arg, SHARED_MEMORY_MIN_BYTES, owned) for arg in args)
+        shared_kwargs = {key: _share(value, SHARED_MEMORY_MIN_BYTES, owned) for key, value in kwargs.items()}
+        payload = _dumps_call((func, shared_args, shared_kwargs))
+        if payload is None:
+            return await asyncio.to_thread(partial(func, *args, **kwargs))
+        return _import_result(await _submit(_run_pickled_job, payload, SHARED_MEMORY_MIN_BYTES))
+    finally:
+        _release(owned)
+
+
+async def run_cpu_bound_batch(
+    func,
+    jobs: Iterable[CpuJob],
+    *,
+    batch_size: Optional[int] = None,
+    return_exceptions: bool = False,
+    shared_memory_min_bytes: int = SHARED_MEMORY_MIN_BYTES,
+) -> list[Any]:
+    # Runs func over many jobs with one pool submission per batch instead of per job.
+    # By default the jobs are split evenly across the pool's workers. Results keep job
+    # order; with return_exceptions a failed job yields its exception instead of raising.
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    if batch_size is None:
+        batch_size = math.ceil(len(jobs) / recommended_process_workers())
+    batch_size = max(1, int(batch_size))
+    batches = [jobs[start : start + batch_size] for start in range(0, len(jobs), batch_size)]
+
+    owned: list[shared_memory.SharedMemory] = []
+    try:
+        submissions = []
+        for batch in batches:
+            shipped = [
+                (
+                    tuple(_share(arg, shared_memory_min_bytes, owned) for arg in job.args),
+                    {key: _share(value, shared_memory_min_bytes, owned) for key, value in job.kwargs.items()},
+                )
+                for job in batch
+            ]
+            payload = _dumps_call((func, shipped))
+            if payload is None:
+                plain = [(job.args, job.kwargs) for job in batch]
+                submissions.append(asyncio.to_thread(_run_batch, func, plain, 0))
+            else:
+                submissions.append(_submit(_run_pickled_batch, payload, shared_memory_min_bytes))
+        # Wait for every submission before releasing the shared inputs.
+        outcome_lists = await asyncio.gather(*submissions, return_exceptions=True)
+    finally:
+        _release(owned)
+    for outcomes in outcome_lists:
+        if isinstance(outcomes, BaseException):
+            raise outcomes
+
+    results = []
+    first_error: Optional[BaseException] = None
+    for outcomes in outcome_lists:
+        for ok, value in outcomes:
+            if ok:
+                results.append(_import_result(value))
+            else:
+                first_error = first_error or value
+                results.append(value)
+    if first_error is not None and not return_exceptions:
+        raise first_error
+    return results
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Optional
+
+from config import MARKET_CPU_BUDGET, MARKET_NETWORK_BUDGET, MARKET_TELEGRAM_SEND_BUDGET
+from helpers.process_pool import recommended_process_workers
+
+
+class ResourceBudget:
+    # A counted budget shared by every scraper in the process. Busy slot-seconds are
+    # integrated on each acquire/release, so utilisation is the share of capacity that
+    # was held since the budget was created, and wait time shows who queued for it.
+    def __init__(self, name: str, capacity: int, *, clock: Callable[[], float] = time.monotonic) -> None:
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self._clock = clock
+        self._slots = asyncio.Semaphore(self.capacity)
+        self._created = clock()
+        self._changed = self._created
+        self._busy_slot_seconds = 0.0
+        self._saturated_seconds = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.acquisitions: Counter[str] = Counter()
+        self.wait_seconds: Counter[str] = Counter()
+        self.max_wait_seconds = 0.0
+
+    def _advance(self) -> None:
+        now = self._clock()
+        elapsed = now - self._changed
+        self._busy_slot_seconds += self.in_use * elapsed
+        if self.in_use >= self.capacity:
+            self._saturated_seconds += elapsed
+        self._changed = now
+
+    async def acquire(self, owner: str = "") -> None:
+        started = self._clock()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        waited = self._clock() - started
+        self._advance()
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.acquisitions[owner] += 1
+        self.wait_seconds[owner] += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def release(self) -> None:
+        self._advance()
+        self.in_use -= 1
+        self._slots.release()
+
+    def limit(self, owner: str, local_limit: int) -> "GovernedSemaphore":
+        return GovernedSemaphore(self, owner, local_limit)
+
+    def bounded(self, owner: str, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            await self.acquire(owner)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.release()
+
+        return wrapper
+
+    def stats(self) -> dict[str, Any]:
+        self._advance()
+        elapsed = max(self._changed - self._created, 1e-9)
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "peak_in_use": self.peak_in_use,
+            "utilization": round(self._busy_slot_seconds / (self.capacity * elapsed), 4),
+            "saturated_ratio": round(self._saturated_seconds / elapsed, 4),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "acquisitions": dict(self.acquisitions),
+            "wait_seconds": {owner: round(value, 3) for owner, value in self.wait_seconds.items()},
+        }
+
+
+class GovernedSemaphore:
+    # Drop-in for a scraper's own asyncio.Semaphore: the scraper's limit is taken
+    # first, then a slot of the shared budget, so one scraper cannot queue more than
+    # its own limit on the budget and starve the other.
+    def __init__(self, budget: ResourceBudget, owner: str, local_limit: int) -> None:
+        self.budget = budget
+        self.owner = owner
+        self._local = asyncio.Semaphore(max(1, int(local_limit)))
+
+    async def __aenter__(self) -> "GovernedSemaphore":
+        await self._local.acquire()
+        try:
+            await self.budget.acquire(self.owner)
+        except BaseException:
+            self._local.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.budget.release()
+        self._local.release()
+
+
+class ResourceGovernor:
+    # Budgets for the resources OLX and SHAFA compete for when their runs overlap:
+    # outbound HTTP requests, process-pool CPU jobs and Telegram sends.
+    def __init__(self, *, network: int, cpu: int, telegram: int) -> None:
+        self.network = ResourceBudget("network", network)
+        self.cpu = ResourceBudget("cpu", cpu)
+        self.telegram = ResourceBudget("telegram", telegram)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {budget.name: budget.stats() for budget in (self.network, self.cpu, self.telegram)}
+
+
+_GOVERNORS: dict[str, ResourceGovernor] = {}
+_GOVERNORS_LOCK = threading.Lock()
+
+
+def shared_resource_governor(name: str = "market") -> ResourceGovernor:
+    # One governor per name per process; both marketplace scrapers import "market".
+    # The CPU budget defaults to the process pool size, since that is where the
+    # image transforms it guards actually run.
+    with _GOVERNORS_LOCK:
+        governor = _GOVERNORS.get(name)
+        if governor is None:
+            governor = _GOVERNORS[name] = ResourceGovernor(
+                network=MARKET_NETWORK_BUDGET,
+                cpu=MARKET_CPU_BUDGET if MARKET_CPU_BUDGET > 0 else recommended_process_workers(),
+                telegram=MARKET_TELEGRAM_SEND_BUDGET,
+            )
+        return governor
+
+
+def resource_budget_stats() -> dict[str, dict[str, dict[str, Any]]]:
+    with _GOVERNORS_LOCK:
+        governors = dict(_GOVERNORS)
+    return {name: governor.stats() for name, governor in governors.items()}
+
+
+def report_resource_budget_stats(service_health, name: Optional[str] = None) -> None:
+    for governor_name, budgets in resource_budget_stats().items():
+        if name is None or governor_name == name:
+            for budget_name, stats in budgets.items():
+                service_health.record_budget_stats(f"{governor_name}_{budget_name}", stats)
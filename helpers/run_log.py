@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Mapping
+
+from config import SCRAPER_RUNS_RETENTION_DAYS
+from helpers.sqlite_runtime import apply_runtime_pragmas
+
+# Every run summary is indexed here next to the JSONL ledger, so questions like "p95
+# duration of the last 50 OLX runs" are index range scans instead of a full read of the
+# ledger. Raw rows are kept for the retention window; the per-day rollups are kept
+# forever and are what long-term trends read.
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS run_log_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scraper_runs (
+        run_id TEXT PRIMARY KEY,
+        scraper TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT NOT NULL DEFAULT '',
+        outcome TEXT NOT NULL DEFAULT '',
+        duration_seconds REAL NOT NULL DEFAULT 0,
+        items_scraped INTEGER NOT NULL DEFAULT 0,
+        items_sent INTEGER NOT NULL DEFAULT 0,
+        errors_total INTEGER NOT NULL DEFAULT 0,
+        max_rss_mb REAL,
+        cpu_seconds REAL,
+        git_sha TEXT NOT NULL DEFAULT '',
+        summary TEXT NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_scraper_runs_scraper_started ON scraper_runs(scraper, started_at)",
+    """
+    CREATE TABLE IF NOT EXISTS scraper_run_rollups (
+        date TEXT NOT NULL,
+        scraper TEXT NOT NULL,
+        outcome TEXT NOT NULL,
+        runs INTEGER NOT NULL,
+        duration_seconds REAL NOT NULL,
+        max_duration_seconds REAL NOT NULL,
+        items_scraped INTEGER NOT NULL,
+        items_sent INTEGER NOT NULL,
+        errors_total INTEGER NOT NULL,
+        PRIMARY KEY (date, scraper, outcome)
+    ) WITHOUT ROWID
+    """,
+)
+
+_HISTORY_IMPORTED_KEY = "jsonl_history_imported_at"
+_RUN_COLUMNS = (
+    "run_id, scraper, started_at, finished_at, outcome, duration_seconds, items_scraped, "
+    "items_sent, errors_total, max_rss_mb, cpu_seconds, git_sha"
+)
+
+
+def _int_value(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _float_or_none(value: Any) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_row(summary: Mapping[str, Any]) -> tuple | None:
+    run_id = str(summary.get("run_id") or "")
+    started_at = str(summary.get("started_at_utc") or "")
+    if not run_id or not started_at:
+        return None
+    counters = summary.get("counters") if isinstance(summary.get("counters"), dict) else {}
+    fields = summary.get("fields") if isinstance(summary.get("fields"), dict) else {}
+    resources = fields.get("resources") if isinstance(fields.get("resources"), dict) else {}
+    deploy = fields.get("deploy") if isinstance(fields.get("deploy"), dict) else {}
+    cpu_seconds = None
+    if "user_cpu_seconds" in resources or "system_cpu_seconds" in resources:
+        cpu_seconds = (_float_or_none(resources.get("user_cpu_seconds")) or 0.0) + (
+            _float_or_none(resources.get("system_cpu_seconds")) or 0.0
+        )
+    return (
+        run_id,
+        str(summary.get("scraper") or "unknown"),
+        started_at,
+        str(summary.get("finished_at_utc") or ""),
+        str(summary.get("outcome") or "unknown"),
+        _float_or_none(summary.get("duration_seconds")) or 0.0,
+        _int_value(counters.get("items_scraped", counters.get("items_seen", 0))),
+        _int_value(counters.get("items_sent", 0)),
+        _int_value(counters.get("errors_total", 0)),
+        _float_or_none(resources.get("max_rss_mb")),
+        cpu_seconds,
+        str(deploy.get("git_sha") or ""),
+        json.dumps(summary, ensure_ascii=False, sort_keys=True),
+    )
+
+
+def _is_failure(outcome: str) -> bool:
+    # Market scrapers report "error", Lyst reports failed/failed_cloudflare/failed_stalled.
+    return outcome == "error" or outcome.startswith("failed")
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class RunLogStore:
+    def __init__(self, db_path: Path, *, ledger_path: Path | None = None, retention_days: int = 90) -> None:
+        self.db_path = Path(db_path)
+        self._ledger_path = Path(ledger_path) if ledger_path is not None else None
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            apply_runtime_pragmas(conn)
+            try:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                self._import_ledger_history(conn)
+            except BaseException:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record(self, summary: Mapping[str, Any]) -> None:
+        row = _run_row(summary)
+        if row is None:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._insert_runs(conn, [row])
+                self._prune_locked(conn, row[1])
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _insert_runs(self, conn: sqlite3.Connection, rows: Iterable[tuple]) -> None:
+        for row in rows:
+            inserted = conn.execute(
+                f"INSERT OR IGNORE INTO scraper_runs ({_RUN_COLUMNS}, summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            ).rowcount
+            if not inserted:
+                continue
+            _run_id, scraper, started_at, _finished, outcome, duration, items_scraped, items_sent, errors = row[:9]
+            conn.execute(
+                """
+                INSERT INTO scraper_run_rollups
+                    (date, scraper, outcome, runs, duration_seconds, max_duration_seconds, items_scraped, items_sent, errors_total)
+                VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT(date, scraper, outcome) DO UPDATE SET
+                    runs = runs + 1,
+                    duration_seconds = duration_seconds + excluded.duration_seconds,
+                    max_duration_seconds = MAX(max_duration_seconds, excluded.max_duration_seconds),
+                    items_scraped = items_scraped + excluded.items_scraped,
+                    items_sent = items_sent + excluded.items_sent,
+                    errors_total = errors_total + excluded.errors_total
+                """,
+                (started_at[:10], scraper, outcome, duration, duration, items_scraped, items_sent, errors),
+            )
+
+    def _prune_locked(self, conn: sqlite3.Connection, scraper: str, *, now: datetime | None = None) -> int:
+        if self.retention_days <= 0:
+            return 0
+        cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=self.retention_days)).strftime("%Y-%m-%dT%H:%M:%S")
+        return conn.execute(
+            "DELETE FROM scraper_runs WHERE scraper = ? AND started_at < ?", (scraper, cutoff)
+        ).rowcount
+
+    def prune(self, *, now: datetime | None = None) -> int:
+        # Drops raw runs past the retention window; their rollups stay.
+        with self._lock:
+            conn = self._connection()
+            scrapers = [row[0] for row in conn.execute("SELECT DISTINCT scraper FROM scraper_runs").fetchall()]
+            return sum(self._prune_locked(conn, scraper, now=now) for scraper in scrapers)
+
+    def _import_ledger_history(self, conn: sqlite3.Connection) -> None:
+        # One-time backfill from the JSONL ledger (rotated segments first) written before
+        # the index existed.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM run_log_meta WHERE key = ?", (_HISTORY_IMPORTED_KEY,)).fetchone():
+                conn.execute("COMMIT")
+                return
+            if self._ledger_path is not None:
+                for path in reversed(ledger_segments(self._ledger_path)):
+                    self._insert_runs(conn, (row for row in map(_run_row, _read_jsonl(path)) if row is not None))
+            conn.execute("INSERT INTO run_log_meta (key, value) VALUES (?, datetime('now'))", (_HISTORY_IMPORTED_KEY,))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def recent_runs(self, scraper: str, *, limit: int = 50) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {_RUN_COLUMNS} FROM scraper_runs WHERE scraper = ? ORDER BY started_at DESC LIMIT ?",
+                (scraper, limit),
+            ).fetchall()
+        names = [name.strip() for name in _RUN_COLUMNS.split(",")]
+        return [dict(zip(names, row)) for row in rows]
+
+    def run_summary(self, run_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._connection().execute("SELECT summary FROM scraper_runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def duration_stats(self, scraper: str, *, limit: int = 50) -> dict[str, Any]:
+        runs = self.recent_runs(scraper, limit=limit)
+        stats: dict[str, Any] = {"scraper": scraper, "runs": len(runs)}
+        if not runs:
+            return stats
+        durations = [float(run["duration_seconds"]) for run in runs]
+        stats.update(
+            last_started_at=runs[0]["started_at"],
+            last_outcome=runs[0]["outcome"],
+            failures=sum(1 for run in runs if _is_failure(run["outcome"])),
+            mean_duration_seconds=round(sum(durations) / len(durations), 3),
+            p50_duration_seconds=round(_percentile(durations, 0.5), 3),
+            p95_duration_seconds=round(_percentile(durations, 0.95), 3),
+            max_duration_seconds=round(max(durations), 3),
+        )
+        return stats
+
+    def scrapers(self) -> list[str]:
+        with self._lock:
+            rows = self._connection().execute("SELECT DISTINCT scraper FROM scraper_run_rollups ORDER BY scraper").fetchall()
+        return [row[0] for row in rows]
+
+    def daily_rollups(self, *, days: int = 30, end_date: str | None = None, scraper: str | None = None) -> list[dict[str, Any]]:
+        end = end_date or datetime.now(timezone.utc).date().isoformat()
+        start = (datetime.fromisoformat(end) - timedelta(days=max(1, days) - 1)).date().isoformat()
+        query = """
+            SELECT date, scraper, outcome, runs, duration_seconds, max_duration_seconds, items_scraped, items_sent, errors_total
+            FROM scraper_run_rollups WHERE date BETWEEN ? AND ?
+        """
+        params: list[Any] = [start, end]
+        if scraper is not None:
+            query += " AND scraper = ?"
+            params.append(scraper)
+        with self._lock:
+            rows = self._connection().execute(query + " ORDER BY date, scraper, outcome", params).fetchall()
+        return [
+            {
+                "date": date_key,
+                "scraper": name,
+                "outcome": outcome,
+                "runs": runs,
+                "mean_duration_seconds": round(total / runs, 3) if runs else 0.0,
+                "max_duration_seconds": round(longest, 3),
+                "items_scraped": scraped,
+                "items_sent": sent,
+                "errors_total": errors,
+            }
+            for date_key, name, outcome, runs, total, longest, scraped, sent, errors in rows
+        ]
+
+
+def summarize_runs(ledger_path: Path, *, limit: int = 50, days: int = 7) -> dict[str, Any]:
+    # Duration percentiles over each scraper's last `limit` runs plus the daily rollups
+    # of the last `days` days; empty until a run has been recorded.
+    ledger_path = Path(ledger_path)
+    if not ledger_path.with_suffix(".db").exists() and not ledger_path.exists():
+        return {}
+    store = run_log_for(ledger_path)
+    return {
+        "window_runs": limit,
+        "scrapers": {name: store.duration_stats(name, limit=limit) for name in store.scrapers()},
+        "daily": store.daily_rollups(days=days),
+    }
+
+
+def ledger_segments(ledger_path: Path) -> list[Path]:
+    # The live ledger first, then rotated segments from newest (.1) to oldest.
+    ledger_path = Path(ledger_path)
+    segments = [ledger_path] if ledger_path.exists() else []
+    index = 1
+    while True:
+        segment = ledger_path.with_name(f"{ledger_path.name}.{index}")
+        if not segment.exists():
+            return segments
+        segments.append(segment)
+        index += 1
+
+
+@contextmanager
+def _ledger_lock(ledger_path: Path) -> Iterator[None]:
+    # The Lyst and market services append to the same ledger; the lock keeps one
+    # process from rotating it while the other is appending.
+    lock_path = ledger_path.with_name(f"{ledger_path.name}.lock")
+    with lock_path.open("a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def append_to_ledger(ledger_path: Path, line: str, *, max_bytes: int, keep_segments: int) -> None:
+    # Size-bounded JSONL: once the live file reaches max_bytes it becomes .1, older
+    # segments shift up, and anything past keep_segments is deleted.
+    ledger_path = Path(ledger_path)
+    ledger_path.parent.mkdir(parents=True, exist_ok=True)
+    with _ledger_lock(ledger_path):
+        try:
+            size = ledger_path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if max_bytes > 0 and size >= max_bytes:
+            for index in range(keep_segments, 0, -1):
+                segment = ledger_path.with_name(f"{ledger_path.name}.{index}")
+                if not segment.exists():
+                    continue
+                if index >= keep_segments:
+                    segment.unlink()
+                else:
+                    os.replace(segment, ledger_path.with_name(f"{ledger_path.name}.{index + 1}"))
+            if keep_segments > 0:
+                os.replace(ledger_path, ledger_path.with_name(f"{ledger_path.name}.1"))
+            else:
+                ledger_path.unlink()
+        with ledger_path.open("a", encoding="utf-8") as handle:
+            handle.write(line)
+
+
+def _read_jsonl(path: Path) -> Iterable[dict[str, Any]]:
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    yield record
+    except OSError:
+        return
+
+
+_STORES: dict[Path, RunLogStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def run_log_for(ledger_path: Path, *, retention_days: int = SCRAPER_RUNS_RETENTION_DAYS) -> RunLogStore:
+    # The index lives next to its ledger: scraper_runs.jsonl -> scraper_runs.db.
+    db_path = Path(ledger_path).with_suffix(".db")
+    with _STORES_LOCK:
+        store = _STORES.get(db_path)
+        if store is None:
+            store = _STORES[db_path] = RunLogStore(db_path, ledger_path=Path(ledger_path), retention_days=retention_days)
+        return store
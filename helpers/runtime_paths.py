@@ -60,10 +60,16 @@ SHAFA_ITEMS_DB_FILE = runtime_file(RUNTIME_DB_DIR, "shafa_items.db")
 # fashion marketplaces without sharing state or risking cross-bot resend collisions.
 AUTO_RIA_ITEMS_DB_FILE = runtime_file(RUNTIME_DB_DIR, "auto_ria_items.db")
 
+OLX_DUPLICATE_INDEX_FILE = runtime_file(RUNTIME_CACHE_DIR, "olx_duplicate_keys.bloom")
+SHAFA_DUPLICATE_INDEX_FILE = runtime_file(RUNTIME_CACHE_DIR, "shafa_duplicate_keys.bloom")
+IMAGE_CACHE_DIR = RUNTIME_CACHE_DIR / "images"
+
 STATUS_MESSAGE_ID_FILE = runtime_file(RUNTIME_TEXT_DIR, "status_message_id.txt")
 
 LAST_RUNS_JSON_FILE = runtime_file(RUNTIME_JSON_DIR, "last_runs.json")
 SCRAPER_RUNS_JSONL_FILE = runtime_file(RUNTIME_JSON_DIR, "scraper_runs.jsonl")
+# Indexed copy of the ledger kept by helpers.run_log.
+SCRAPER_RUNS_DB_FILE = SCRAPER_RUNS_JSONL_FILE.with_suffix(".db")
 MARKET_OLX_RUN_STATUS_FILE = runtime_file(RUNTIME_STATUS_DIR, "market_olx_run.json")
 MARKET_SHAFA_RUN_STATUS_FILE = runtime_file(RUNTIME_STATUS_DIR, "market_shafa_run.json")
 LYST_RUN_STATUS_FILE = runtime_file(RUNTIME_STATUS_DIR, "lyst_run.json")
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import signal
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import Any, Optional
+
+# Only one profiler can own SIGPROF at a time; a second run starting while one is
+# being profiled goes unprofiled instead of stealing the timer.
+_ACTIVE: Optional["SamplingProfiler"] = None
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{code.co_filename.rsplit('/', 1)[-1]}:{name}"
+
+
+class SamplingProfiler:
+    # Statistical CPU profiler in pure Python: ITIMER_PROF delivers SIGPROF after every
+    # interval_sec of process CPU time and the handler records the interrupted stack of
+    # the main thread (where the scrapers' event loop runs). Work in executor threads
+    # and subprocesses is not attributed. Cost is one stack walk per sample.
+    def __init__(self, *, interval_sec: float = 0.005, max_depth: int = 64) -> None:
+        self.interval_sec = interval_sec
+        self.max_depth = max_depth
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.samples = 0
+        self._previous_handler: Any = None
+        self._started_perf: Optional[float] = None
+        self.duration_seconds = 0.0
+        self.running = False
+
+    def start(self) -> bool:
+        global _ACTIVE
+        if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+            return False
+        with _ACTIVE_LOCK:
+            if _ACTIVE is not None:
+                return False
+            _ACTIVE = self
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval_sec, self.interval_sec)
+        self._started_perf = time.perf_counter()
+        self.running = True
+        return True
+
+    def stop(self) -> None:
+        global _ACTIVE
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        self.duration_seconds = time.perf_counter() - (self._started_perf or time.perf_counter())
+        self.running = False
+        with _ACTIVE_LOCK:
+            if _ACTIVE is self:
+                _ACTIVE = None
+
+    def _sample(self, _signum: int, frame: Optional[FrameType]) -> None:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def collapsed_lines(self) -> list[str]:
+        # Brendan Gregg's collapsed format ("root;child;leaf count"), readable by
+        # flamegraph.pl and speedscope.
+        return [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+
+    def write_collapsed(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(self.collapsed_lines()) + "\n", encoding="utf-8")
+
+    def top_frames(self, limit: int = 15) -> list[dict[str, Any]]:
+        # self: samples where the frame was on top of the stack; total: samples where it
+        # was anywhere on the stack (recursion counted once).
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        samples = self.samples or 1
+        return [
+            {
+                "frame": label,
+                "self_samples": own[label],
+                "self_percent": round(own[label] * 100 / samples, 2),
+                "total_percent": round(total[label] * 100 / samples, 2),
+            }
+            for label, _count in own.most_common(limit)
+        ]
+
+    def summary(self, *, limit: int = 15) -> dict[str, Any]:
+        return {
+            "interval_sec": self.interval_sec,
+            "samples": self.samples,
+            "cpu_seconds_sampled": round(self.samples * self.interval_sec, 3),
+            "duration_seconds": round(self.duration_seconds, 3),
+            "top_frames": self.top_frames(limit),
+        }
@@ -1,7 +1,11 @@
 import asyncio
+import heapq
+import itertools
 import random
 import time
-from dataclasses import dataclass
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
 
 
 @dataclass(slots=True)
@@ -41,46 +45,354 @@ class SchedulerRunAccountant:
         return True
 
 
-def _sleep_interval_with_jitter(base_sec: int, jitter_sec: int) -> int:
+def _jittered_delay(base_sec: float, jitter_sec: float, rng: random.Random) -> float:
     if base_sec <= 0:
-        return 60
+        return 60.0
     if jitter_sec <= 0:
-        return base_sec
-    low = max(1, base_sec - jitter_sec)
-    high = base_sec + jitter_sec
-    return random.randint(low, high)
+        return float(base_sec)
+    return rng.uniform(max(1.0, base_sec - jitter_sec), base_sec + jitter_sec)
 
 
-def _schedule_next_run(min_sec: int, max_sec: int) -> float:
+def _market_interval(min_sec: int, max_sec: int) -> tuple[float, float]:
+    # Market feeds are configured as a [min, max] window; the scheduler takes a base
+    # interval with symmetric jitter, which draws from the same window.
     if min_sec < 1 or max_sec < min_sec:
         min_sec, max_sec = 900, 3600
-    return time.time() + random.randint(min_sec, max_sec)
+    return (min_sec + max_sec) / 2, (max_sec - min_sec) / 2
+
+
+def _oldest_due(due_by_name: dict[str, float], *, now_ts: float) -> str | None:
+    # Among due jobs the oldest due timestamp goes first (name breaks ties), so a job
+    # held back by a busy class runs next instead of being skipped.
+    due_jobs = sorted((due_ts, name) for name, due_ts in due_by_name.items() if now_ts >= due_ts)
+    return due_jobs[0][1] if due_jobs else None
 
 
 def _select_due_market_job(*, now_ts: float, next_olx_ts: float, next_shafa_ts: float) -> str | None:
-    due_jobs = []
-    if now_ts >= next_olx_ts:
-        due_jobs.append(("olx", next_olx_ts))
-    if now_ts >= next_shafa_ts:
-        due_jobs.append(("shafa", next_shafa_ts))
-    if not due_jobs:
-        return None
-    # When both feeds are due, run the older due timestamp first and leave the
-    # other timestamp untouched. That serializes OLX/SHAFA without silently
-    # skipping a delayed run.
-    due_jobs.sort(key=lambda item: (item[1], item[0]))
-    return due_jobs[0][0]
+    return _oldest_due({"olx": next_olx_ts, "shafa": next_shafa_ts}, now_ts=now_ts)
 
 
-async def _sleep_or_wait_for_task(active_task, sleep_for: int) -> None:
-    if active_task is not None:
-        if active_task.done():
-            return
-        done, _ = await asyncio.wait({active_task}, timeout=sleep_for)
-        if done:
-            return
-    else:
-        await asyncio.sleep(sleep_for)
+@dataclass(slots=True)
+class ScheduledJob:
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    job_class: str
+    interval_sec: float
+    jitter_sec: float = 0.0
+    timeout_sec: Optional[float] = None
+    is_enabled: Optional[Callable[[], bool]] = None
+    stall_timeout_sec: Optional[float] = None
+    get_progress_ts: Optional[Callable[[], Optional[float]]] = None
+    on_stall: Optional[Callable[[asyncio.Task], Any]] = None
+    accountant: SchedulerRunAccountant = field(default=None)  # type: ignore[assignment]
+    next_due_ts: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    active_run: Optional[SchedulerRun] = None
+    stall_handled: bool = False
+
+    @property
+    def label(self) -> str:
+        return self.name.upper()
+
+
+class JobScheduler:
+    # Jobs sit in a heap keyed by their next due time and the loop sleeps exactly until
+    # the earliest of: the next due job, a stall-watchdog deadline, a running job
+    # finishing, or a command (run now / cancel) waking it. A due job whose class is at
+    # its concurrency limit, or that is still running, stays due and starts as soon as
+    # a slot frees up. The next run is scheduled when a run starts.
+    def __init__(
+        self,
+        name: str,
+        *,
+        logger,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.name = name
+        self._logger = logger
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._jobs: dict[str, ScheduledJob] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._waiting: dict[str, float] = {}
+        self._class_limits: dict[str, int] = {}
+        self._running_by_class: Counter[str] = Counter()
+        self._wakeup = asyncio.Event()
+        self._sleep_log = SchedulerRunAccountant(name)
+
+    def add_job(
+        self,
+        name: str,
+        run: Callable[[], Awaitable[Any]],
+        *,
+        interval_sec: float,
+        jitter_sec: float = 0.0,
+        job_class: Optional[str] = None,
+        first_run_ts: Optional[float] = None,
+        timeout_sec: Optional[float] = None,
+        is_enabled: Optional[Callable[[], bool]] = None,
+        stall_timeout_sec: Optional[float] = None,
+        get_progress_ts: Optional[Callable[[], Optional[float]]] = None,
+        on_stall: Optional[Callable[[asyncio.Task], Any]] = None,
+    ) -> ScheduledJob:
+        job = ScheduledJob(
+            name=name,
+            run=run,
+            job_class=job_class or name,
+            interval_sec=interval_sec,
+            jitter_sec=jitter_sec,
+            timeout_sec=timeout_sec,
+            is_enabled=is_enabled,
+            stall_timeout_sec=stall_timeout_sec,
+            get_progress_ts=get_progress_ts,
+            on_stall=on_stall,
+            accountant=SchedulerRunAccountant(name),
+        )
+        self._jobs[name] = job
+        self._schedule(job, first_run_ts if first_run_ts is not None else self._clock() + self._next_delay(job))
+        return job
+
+    def set_class_limit(self, job_class: str, max_concurrency: int) -> None:
+        self._class_limits[job_class] = max(1, int(max_concurrency))
+        self._wakeup.set()
+
+    def job(self, name: str) -> Optional[ScheduledJob]:
+        return self._jobs.get(name)
+
+    def reschedule(self, name: str, *, delay_sec: float = 0.0) -> bool:
+        job = self._jobs.get(name)
+        if job is None:
+            return False
+        self._waiting.pop(name, None)
+        self._schedule(job, self._clock() + max(0.0, delay_sec))
+        return True
+
+    def cancel(self, name: str) -> str:
+        # Cancels the run in progress; with nothing running, skips the next run instead.
+        # Either way the job stays scheduled one interval from now.
+        job = self._jobs.get(name)
+        if job is None:
+            return "unknown"
+        self._waiting.pop(name, None)
+        self._schedule(job, self._clock() + self._next_delay(job))
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+            return "cancelled_run"
+        return "skipped_next"
+
+    def jobs_status(self) -> list[dict[str, Any]]:
+        now = self._clock()
+        return [
+            {
+                "name": job.name,
+                "job_class": job.job_class,
+                "state": "running" if job.task is not None else "waiting" if name in self._waiting else "scheduled",
+                "next_run_in_sec": None if job.next_due_ts is None else max(0, int(job.next_due_ts - now)),
+                "last_outcome": job.accountant.last_outcome,
+                "last_duration_sec": job.accountant.last_duration_sec,
+            }
+            for name, job in self._jobs.items()
+        ]
+
+    async def run_forever(self) -> None:
+        _SCHEDULERS[self.name] = self
+        try:
+            while True:
+                try:
+                    await self._tick()
+                except KeyboardInterrupt:
+                    self._logger.info("%s scheduler terminated by user", self.name.capitalize())
+                    break
+                except Exception as exc:
+                    self._logger.error(f"Unexpected error in {self.name} scheduler: {exc}")
+                    await self._sleep(30)
+        finally:
+            if _SCHEDULERS.get(self.name) is self:
+                del _SCHEDULERS[self.name]
+            for job in self._jobs.values():
+                if job.task is not None and not job.task.done():
+                    job.task.cancel()
+
+    async def _tick(self) -> None:
+        self._reap_finished()
+        now = self._clock()
+        await self._check_stalls(now)
+        self._collect_due(now)
+        self._start_waiting(now)
+
+        wake_ts = self._next_wake_ts()
+        waiters = {job.task for job in self._jobs.values() if job.task is not None}
+        # Wake-ups requested while this pass ran are already reflected in wake_ts.
+        self._wakeup.clear()
+        wakeup = asyncio.ensure_future(self._wakeup.wait())
+        waiters.add(wakeup)
+        sleeper = None
+        if wake_ts is not None:
+            delay = max(0.0, wake_ts - self._clock())
+            if self._sleep_log.should_log_sleep(int(delay)):
+                self._logger.info(f"Sleeping for {int(delay)} seconds before next {self.name} check")
+            sleeper = asyncio.ensure_future(self._sleep(delay))
+            waiters.add(sleeper)
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for helper in (wakeup, sleeper):
+                if helper is not None and not helper.done():
+                    helper.cancel()
+
+    def _schedule(self, job: ScheduledJob, due_ts: float) -> None:
+        job.next_due_ts = due_ts
+        heapq.heappush(self._heap, (due_ts, next(self._seq), job.name))
+        self._wakeup.set()
+
+    def _next_delay(self, job: ScheduledJob) -> float:
+        return _jittered_delay(job.interval_sec, job.jitter_sec, self._rng)
+
+    def _collect_due(self, now: float) -> None:
+        while self._heap and self._heap[0][0] <= now:
+            due_ts, _, name = heapq.heappop(self._heap)
+            job = self._jobs.get(name)
+            if job is None or job.next_due_ts != due_ts:
+                continue  # superseded by a reschedule
+            job.next_due_ts = None
+            self._waiting[name] = due_ts
+
+    def _start_waiting(self, now: float) -> None:
+        while True:
+            startable = {
+                name: due_ts
+                for name, due_ts in self._waiting.items()
+                if self._jobs[name].task is None
+                and self._running_by_class[self._jobs[name].job_class] < self._class_limits.get(self._jobs[name].job_class, 1)
+            }
+            name = _oldest_due(startable, now_ts=now)
+            if name is None:
+                return
+            del self._waiting[name]
+            job = self._jobs[name]
+            self._schedule(job, now + self._next_delay(job))
+            if job.is_enabled is not None and not job.is_enabled():
+                self._logger.info("%s scraping disabled", job.name.capitalize())
+                continue
+            self._start(job, now)
+
+    def _start(self, job: ScheduledJob, now: float) -> None:
+        job.active_run = job.accountant.start_run(now_ts=now)
+        job.stall_handled = False
+        self._logger.info("Starting %s scheduler run #%s", job.label, job.active_run.run_id)
+        coro = job.run()
+        if job.timeout_sec:
+            coro = asyncio.wait_for(coro, timeout=job.timeout_sec)
+        job.task = asyncio.create_task(coro, name=f"{job.name}_run_{job.active_run.run_id}")
+        self._running_by_class[job.job_class] += 1
+
+    def _reap_finished(self) -> None:
+        for job in self._jobs.values():
+            task = job.task
+            if task is None or not task.done():
+                continue
+            exc = None
+            if task.cancelled():
+                self._logger.warning("%s task cancelled", job.label)
+                outcome = "cancelled"
+            else:
+                exc = task.exception()
+                if isinstance(exc, asyncio.TimeoutError):
+                    self._logger.error("%s task timed out after %ss", job.label, job.timeout_sec)
+                    outcome = "timeout"
+                elif exc is not None:
+                    self._logger.error("%s task crashed: %s", job.label, exc)
+                    outcome = "failed"
+                else:
+                    outcome = "success"
+            if job.active_run is not None:
+                job.accountant.finish_run(job.active_run, outcome, now_ts=self._clock())
+                self._logger.info(
+                    "Finished %s scheduler run #%s outcome=%s duration=%ss",
+                    job.label,
+                    job.active_run.run_id,
+                    outcome,
+                    job.accountant.last_duration_sec,
+                )
+            job.task = None
+            job.active_run = None
+            self._running_by_class[job.job_class] -= 1
+
+    def _stall_deadline(self, job: ScheduledJob) -> Optional[float]:
+        if job.task is None or job.stall_handled or not job.stall_timeout_sec or job.active_run is None:
+            return None
+        started_ts = job.active_run.started_ts
+        progress_ts = job.get_progress_ts() if job.get_progress_ts is not None else None
+        effective_ts = progress_ts if progress_ts and progress_ts >= started_ts else started_ts
+        return effective_ts + job.stall_timeout_sec
+
+    async def _check_stalls(self, now: float) -> None:
+        for job in self._jobs.values():
+            deadline = self._stall_deadline(job)
+            if deadline is None or now < deadline:
+                continue
+            self._logger.error("%s task stalled; cancelling", job.label.capitalize())
+            job.stall_handled = True
+            if job.on_stall is not None:
+                try:
+                    result = job.on_stall(job.task)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as exc:
+                    self._logger.warning(f"on_{job.name}_stall handler failed: {exc}")
+            job.task.cancel()
+            self._waiting.pop(job.name, None)
+            self._schedule(job, now + self._next_delay(job))
+
+    def _next_wake_ts(self) -> Optional[float]:
+        while self._heap:
+            due_ts, _, name = self._heap[0]
+            job = self._jobs.get(name)
+            if job is not None and job.next_due_ts == due_ts:
+                break
+            heapq.heappop(self._heap)
+        candidates = [self._heap[0][0]] if self._heap else []
+        candidates.extend(deadline for deadline in map(self._stall_deadline, self._jobs.values()) if deadline is not None)
+        return min(candidates) if candidates else None
+
+
+# Running schedulers by name, so bot commands can reach their jobs.
+_SCHEDULERS: dict[str, JobScheduler] = {}
+
+
+def handle_scheduler_command(command: str, args: list[str]) -> Optional[str]:
+    # /jobs lists jobs, /runnow <job> runs one now, /cancel <job> cancels its run in
+    # progress (or skips its next run). Returns the reply, or None for other commands.
+    if command not in ("/jobs", "/runnow", "/cancel"):
+        return None
+    if not _SCHEDULERS:
+        return "No scheduler is running."
+    if command == "/jobs":
+        lines = []
+        for scheduler in _SCHEDULERS.values():
+            for status in scheduler.jobs_status():
+                next_run = "-" if status["next_run_in_sec"] is None else f"in {status['next_run_in_sec']}s"
+                last = status["last_outcome"] or "never"
+                lines.append(f"{status['name']}: {status['state']}, next {next_run}, last {last}")
+        return "\n".join(lines) or "No jobs scheduled."
+    if not args:
+        return f"Usage: {command} <job>"
+    name = args[0].lower()
+    for scheduler in _SCHEDULERS.values():
+        if scheduler.job(name) is None:
+            continue
+        if command == "/runnow":
+            scheduler.reschedule(name)
+            return f"▶️ {name.upper()} run scheduled now."
+        result = scheduler.cancel(name)
+        if result == "cancelled_run":
+            return f"⏹ {name.upper()} run cancelled."
+        return f"⏭ Next {name.upper()} run skipped."
+    return f"Unknown job: {name}"
 
 
 async def run_scheduler(
@@ -103,107 +415,38 @@ async def run_scheduler(
     olx_max_sec=3600,
     shafa_min_sec=900,
     shafa_max_sec=3600,
+    clock=time.time,
+    sleep=asyncio.sleep,
 ):
-    next_olx_ts = _schedule_next_run(olx_min_sec, olx_max_sec)
-    next_shafa_ts = _schedule_next_run(shafa_min_sec, shafa_max_sec)
-    next_lyst_ts = time.time()
-    if not last_olx_run_exists:
-        next_olx_ts = time.time()
-    if not last_shafa_run_exists:
-        next_shafa_ts = time.time()
-
-    olx_task = None
-    shafa_task = None
-    lyst_task = None
-    lyst_task_started_ts = None
-
-    while True:
-        try:
-            now_ts = time.time()
-            if now_ts >= next_olx_ts:
-                if olx_task is None or olx_task.done():
-                    next_olx_ts = _schedule_next_run(olx_min_sec, olx_max_sec)
-                    olx_task = asyncio.create_task(asyncio.wait_for(run_olx(), timeout=olx_timeout_sec))
-            if now_ts >= next_shafa_ts:
-                if shafa_task is None or shafa_task.done():
-                    next_shafa_ts = _schedule_next_run(shafa_min_sec, shafa_max_sec)
-                    shafa_task = asyncio.create_task(asyncio.wait_for(run_shafa(), timeout=shafa_timeout_sec))
-
-            if is_running_lyst() and now_ts >= next_lyst_ts:
-                if lyst_task is None or lyst_task.done():
-                    lyst_task = asyncio.create_task(run_lyst())
-                    lyst_task_started_ts = time.time()
-                    next_lyst_ts = time.time() + _sleep_interval_with_jitter(check_interval_sec, check_jitter_sec)
-            elif not is_running_lyst():
-                logger.info("Lyst scraping disabled (IsRunningLyst=false)")
-
-            if lyst_task is not None and not lyst_task.done():
-                progress_ts = get_lyst_progress_ts()
-                effective_ts = progress_ts
-                if lyst_task_started_ts and (not progress_ts or progress_ts < lyst_task_started_ts):
-                    effective_ts = lyst_task_started_ts
-                if effective_ts and (time.time() - effective_ts) > lyst_stall_timeout_sec:
-                    logger.error("Lyst task stalled; cancelling")
-                    if on_lyst_stall is not None:
-                        try:
-                            result = on_lyst_stall(lyst_task)
-                            if asyncio.iscoroutine(result):
-                                await result
-                        except Exception as exc:
-                            logger.warning(f"on_lyst_stall handler failed: {exc}")
-                    lyst_task.cancel()
-                    next_lyst_ts = time.time() + _sleep_interval_with_jitter(check_interval_sec, check_jitter_sec)
-
-            if lyst_task is not None and lyst_task.done():
-                if lyst_task.cancelled():
-                    logger.warning("Lyst task cancelled")
-                else:
-                    try:
-                        exc = lyst_task.exception()
-                    except asyncio.CancelledError:
-                        exc = None
-                    if exc:
-                        logger.error(f"Lyst task crashed: {exc}")
-                lyst_task = None
-                lyst_task_started_ts = None
-            if olx_task is not None and olx_task.done():
-                if olx_task.cancelled():
-                    logger.warning("OLX task cancelled")
-                else:
-                    try:
-                        exc = olx_task.exception()
-                    except asyncio.CancelledError:
-                        exc = None
-                    if exc:
-                        logger.error(f"OLX task crashed: {exc}")
-                olx_task = None
-            if shafa_task is not None and shafa_task.done():
-                if shafa_task.cancelled():
-                    logger.warning("SHAFA task cancelled")
-                else:
-                    try:
-                        exc = shafa_task.exception()
-                    except asyncio.CancelledError:
-                        exc = None
-                    if exc:
-                        logger.error(f"SHAFA task crashed: {exc}")
-                shafa_task = None
-
-            next_wake = min(next_olx_ts, next_shafa_ts, next_lyst_ts or now_ts)
-            progress_ts = get_lyst_progress_ts()
-            if lyst_task is not None and not lyst_task.done() and progress_ts:
-                next_wake = min(next_wake, progress_ts + lyst_stall_timeout_sec)
-            sleep_for = max(5, int(next_wake - time.time()))
-            logger.info(f"Sleeping for {sleep_for} seconds before next check")
-            await asyncio.sleep(sleep_for)
-        except KeyboardInterrupt:
-            logger.info("Script terminated by user")
-            break
-        except Exception as exc:
-            logger.error(f"An unexpected error occurred in main loop: {exc}")
-            sleep_for = _sleep_interval_with_jitter(check_interval_sec, check_jitter_sec)
-            logger.info(f"Waiting for {sleep_for} seconds before retrying")
-            await asyncio.sleep(sleep_for)
+    # Single-process layout: every feed in one scheduler, each in its own job class so
+    # OLX, SHAFA and Lyst may overlap as they always have here.
+    scheduler = JobScheduler("main", logger=logger, clock=clock, sleep=sleep)
+    now_ts = clock()
+    for name, run, timeout_sec, min_sec, max_sec, last_run_exists in (
+        ("olx", run_olx, olx_timeout_sec, olx_min_sec, olx_max_sec, last_olx_run_exists),
+        ("shafa", run_shafa, shafa_timeout_sec, shafa_min_sec, shafa_max_sec, last_shafa_run_exists),
+    ):
+        interval_sec, jitter_sec = _market_interval(min_sec, max_sec)
+        scheduler.add_job(
+            name,
+            run,
+            interval_sec=interval_sec,
+            jitter_sec=jitter_sec,
+            first_run_ts=None if last_run_exists else now_ts,
+            timeout_sec=timeout_sec,
+        )
+    scheduler.add_job(
+        "lyst",
+        run_lyst,
+        interval_sec=check_interval_sec,
+        jitter_sec=check_jitter_sec,
+        first_run_ts=now_ts,
+        is_enabled=is_running_lyst,
+        stall_timeout_sec=lyst_stall_timeout_sec,
+        get_progress_ts=get_lyst_progress_ts,
+        on_stall=on_lyst_stall,
+    )
+    await scheduler.run_forever()
 
 
 async def run_market_scheduler(
@@ -219,57 +462,30 @@ async def run_market_scheduler(
     olx_max_sec=3600,
     shafa_min_sec=900,
     shafa_max_sec=3600,
+    max_concurrent_runs=1,
+    clock=time.time,
+    sleep=asyncio.sleep,
 ):
-    next_olx_ts = _schedule_next_run(olx_min_sec, olx_max_sec)
-    next_shafa_ts = _schedule_next_run(shafa_min_sec, shafa_max_sec)
-    if not last_olx_run_exists:
-        next_olx_ts = time.time()
-    if not last_shafa_run_exists:
-        next_shafa_ts = time.time()
-
-    active_task = None
-    active_name = None
-
-    while True:
-        try:
-            now_ts = time.time()
-            if active_task is not None and active_task.done():
-                task_label = (active_name or "market").upper()
-                if active_task.cancelled():
-                    logger.warning("%s task cancelled", task_label)
-                else:
-                    try:
-                        exc = active_task.exception()
-                    except asyncio.CancelledError:
-                        exc = None
-                    if exc:
-                        logger.error("%s task crashed: %s", task_label, exc)
-                active_task = None
-                active_name = None
-
-            if active_task is None:
-                due_job = _select_due_market_job(now_ts=now_ts, next_olx_ts=next_olx_ts, next_shafa_ts=next_shafa_ts)
-                if due_job == "olx":
-                    # Reschedule only after the run really starts. If SHAFA is running
-                    # or both feeds are due, delayed work stays due instead of being lost.
-                    next_olx_ts = _schedule_next_run(olx_min_sec, olx_max_sec)
-                    active_task = asyncio.create_task(asyncio.wait_for(run_olx(), timeout=olx_timeout_sec))
-                    active_name = "olx"
-                elif due_job == "shafa":
-                    next_shafa_ts = _schedule_next_run(shafa_min_sec, shafa_max_sec)
-                    active_task = asyncio.create_task(asyncio.wait_for(run_shafa(), timeout=shafa_timeout_sec))
-                    active_name = "shafa"
-
-            next_wake = min(next_olx_ts, next_shafa_ts)
-            sleep_for = max(5, int(next_wake - time.time()))
-            logger.info(f"Sleeping for {sleep_for} seconds before next market check")
-            await _sleep_or_wait_for_task(active_task, sleep_for)
-        except KeyboardInterrupt:
-            logger.info("Market scheduler terminated by user")
-            break
-        except Exception as exc:
-            logger.error(f"Unexpected error in market scheduler: {exc}")
-            await asyncio.sleep(30)
+    # OLX and SHAFA share the "market" job class; with one slot they never overlap and
+    # a feed that comes due during the other's run starts right after it.
+    scheduler = JobScheduler("market", logger=logger, clock=clock, sleep=sleep)
+    scheduler.set_class_limit("market", max_concurrent_runs)
+    now_ts = clock()
+    for name, run, timeout_sec, min_sec, max_sec, last_run_exists in (
+        ("olx", run_olx, olx_timeout_sec, olx_min_sec, olx_max_sec, last_olx_run_exists),
+        ("shafa", run_shafa, shafa_timeout_sec, shafa_min_sec, shafa_max_sec, last_shafa_run_exists),
+    ):
+        interval_sec, jitter_sec = _market_interval(min_sec, max_sec)
+        scheduler.add_job(
+            name,
+            run,
+            interval_sec=interval_sec,
+            jitter_sec=jitter_sec,
+            job_class="market",
+            first_run_ts=None if last_run_exists else now_ts,
+            timeout_sec=timeout_sec,
+        )
+    await scheduler.run_forever()
 
 
 async def run_lyst_scheduler(
@@ -282,78 +498,21 @@ async def run_lyst_scheduler(
     logger,
     on_lyst_stall=None,
     lyst_stall_timeout_sec=1800,
+    clock=time.time,
+    sleep=asyncio.sleep,
 ):
-    next_lyst_ts = time.time()
-    lyst_task = None
-    lyst_task_started_ts = None
-    accountant = SchedulerRunAccountant("lyst")
-    active_run = None
-
-    while True:
-        try:
-            now_ts = time.time()
-            if is_running_lyst() and now_ts >= next_lyst_ts:
-                if lyst_task is None or lyst_task.done():
-                    active_run = accountant.start_run(now_ts=time.time())
-                    logger.info("Starting LYST scheduler run #%s", active_run.run_id)
-                    lyst_task = asyncio.create_task(run_lyst(), name=f"lyst_run_{active_run.run_id}")
-                    lyst_task_started_ts = active_run.started_ts
-                    next_lyst_ts = time.time() + _sleep_interval_with_jitter(check_interval_sec, check_jitter_sec)
-            elif not is_running_lyst():
-                logger.info("Lyst scraping disabled (IsRunningLyst=false)")
-
-            if lyst_task is not None and not lyst_task.done():
-                progress_ts = get_lyst_progress_ts()
-                effective_ts = progress_ts
-                if lyst_task_started_ts and (not progress_ts or progress_ts < lyst_task_started_ts):
-                    effective_ts = lyst_task_started_ts
-                if effective_ts and (time.time() - effective_ts) > lyst_stall_timeout_sec:
-                    logger.error("Lyst task stalled; cancelling")
-                    if on_lyst_stall is not None:
-                        try:
-                            result = on_lyst_stall(lyst_task)
-                            if asyncio.iscoroutine(result):
-                                await result
-                        except Exception as exc:
-                            logger.warning(f"on_lyst_stall handler failed: {exc}")
-                    lyst_task.cancel()
-                    next_lyst_ts = time.time() + _sleep_interval_with_jitter(check_interval_sec, check_jitter_sec)
-
-            if lyst_task is not None and lyst_task.done():
-                exc = None
-                if lyst_task.cancelled():
-                    logger.warning("Lyst task cancelled")
-                else:
-                    try:
-                        exc = lyst_task.exception()
-                    except asyncio.CancelledError:
-                        exc = None
-                    if exc:
-                        logger.error(f"Lyst task crashed: {exc}")
-                outcome = "cancelled" if lyst_task.cancelled() else "failed" if exc else "success"
-                if active_run is not None:
-                    accountant.finish_run(active_run, outcome, now_ts=time.time())
-                    logger.info(
-                        "Finished LYST scheduler run #%s outcome=%s duration=%ss",
-                        active_run.run_id,
-                        outcome,
-                        accountant.last_duration_sec,
-                    )
-                    active_run = None
-                lyst_task = None
-                lyst_task_started_ts = None
-
-            next_wake = next_lyst_ts or now_ts
-            progress_ts = get_lyst_progress_ts()
-            if lyst_task is not None and not lyst_task.done() and progress_ts:
-                next_wake = min(next_wake, progress_ts + lyst_stall_timeout_sec)
-            sleep_for = max(5, int(next_wake - time.time()))
-            if accountant.should_log_sleep(sleep_for):
-                logger.info(f"Sleeping for {sleep_for} seconds before next Lyst check")
-            await asyncio.sleep(sleep_for)
-        except KeyboardInterrupt:
-            logger.info("Lyst scheduler terminated by user")
-            break
-        except Exception as exc:
-            logger.error(f"Unexpected error in Lyst scheduler: {exc}")
-            await asyncio.sleep(_sleep_interval_with_jitter(check_interval_sec, check_jitter_sec))
+    # The stall watchdog is a deadline in the same heap: the loop wakes when the run
+    # has made no progress for lyst_stall_timeout_sec instead of polling for it.
+    scheduler = JobScheduler("lyst", logger=logger, clock=clock, sleep=sleep)
+    scheduler.add_job(
+        "lyst",
+        run_lyst,
+        interval_sec=check_interval_sec,
+        jitter_sec=check_jitter_sec,
+        first_run_ts=clock(),
+        is_enabled=is_running_lyst,
+        stall_timeout_sec=lyst_stall_timeout_sec,
+        get_progress_ts=get_lyst_progress_ts,
+        on_stall=on_lyst_stall,
+    )
+    await scheduler.run_forever()
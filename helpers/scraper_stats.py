@@ -3,19 +3,55 @@ from __future__ import annotations
 import json
 import os
 import platform
+import threading
 import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Callable
 
+from config import (
+    SCRAPER_PROFILE_INTERVAL_SEC,
+    SCRAPER_PROFILE_RUNS,
+    SCRAPER_RUNS_JSONL_MAX_MB,
+    SCRAPER_RUNS_JSONL_SEGMENTS,
+)
 from helpers.analytics_events import AnalyticsSink
+from helpers.run_log import RunLogStore, append_to_ledger, run_log_for
+from helpers.sampling_profiler import SamplingProfiler
+from helpers.service_health import active_loop_profiler
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
 
+# One-shot profiling requests from the /profile bot command, by scraper name ("*" for
+# whichever run starts next).
+_PROFILE_REQUESTS: set[str] = set()
+_PROFILE_REQUESTS_LOCK = threading.Lock()
+
+
+def request_run_profile(scraper: str = "*") -> None:
+    with _PROFILE_REQUESTS_LOCK:
+        _PROFILE_REQUESTS.add((scraper or "*").strip().lower())
+
+
+def profiling_requested(scraper: str, *, configured: str = SCRAPER_PROFILE_RUNS) -> bool:
+    # Configured scrapers are profiled on every run; a bot request is used up by the
+    # first matching run.
+    names = {name.strip().lower() for name in configured.split(",") if name.strip()}
+    scraper = scraper.lower()
+    if "all" in names or scraper in names:
+        return True
+    with _PROFILE_REQUESTS_LOCK:
+        for key in (scraper, "*"):
+            if key in _PROFILE_REQUESTS:
+                _PROFILE_REQUESTS.discard(key)
+                return True
+    return False
+
+
 class RunStatsCollector:
     def __init__(
         self,
@@ -23,17 +59,38 @@ class RunStatsCollector:
         *,
         now_func: Callable[[], str] = utc_now_iso,
         run_id: str | None = None,
+        profile: bool | None = None,
     ) -> None:
         self.scraper = scraper
         self.run_id = run_id or uuid.uuid4().hex
         self._now_func = now_func
         self._started_perf = time.perf_counter()
+        self._started_monotonic = time.monotonic()
         self.started_at_utc = self._now_func()
         self.counters: dict[str, int] = {}
         self.fields: dict[str, Any] = {}
         self.sources: list[dict[str, Any]] = []
         self.errors: list[dict[str, Any]] = []
         self.error_counts: dict[str, int] = {}
+        self._profiler: SamplingProfiler | None = None
+        if profile is None:
+            profile = profiling_requested(scraper)
+        if profile:
+            self.start_profiling()
+
+    def start_profiling(self, *, interval_sec: float = SCRAPER_PROFILE_INTERVAL_SEC) -> bool:
+        profiler = SamplingProfiler(interval_sec=interval_sec)
+        if not profiler.start():
+            self.fields["profile"] = {"skipped": "another run is being profiled or not on the main thread"}
+            return False
+        self._profiler = profiler
+        return True
+
+    def stop_profiling(self) -> None:
+        # Idempotent; runs call it from their finally blocks so a failed run never
+        # leaves the profiling timer armed.
+        if self._profiler is not None:
+            self._profiler.stop()
 
     def inc(self, name: str, amount: int = 1) -> None:
         self.counters[name] = self.counters.get(name, 0) + amount
@@ -123,8 +180,19 @@ class RunStatsCollector:
         snapshot = _process_resource_snapshot()
         snapshot.update({key: value for key, value in fields.items() if value is not None})
         self.fields["resources"] = snapshot
+        self.set_event_loop_profile()
+
+    def set_event_loop_profile(self) -> None:
+        # Loop lag, blocking-callback stacks and the latest task census seen while this
+        # run was in progress, when the service runs the event-loop profiler.
+        profiler = active_loop_profiler()
+        if profiler is not None:
+            self.fields["event_loop"] = profiler.summary(since=self._started_monotonic)
 
     def finish(self, *, outcome: str, finished_at_utc: str | None = None) -> dict[str, Any]:
+        if self._profiler is not None:
+            self.stop_profiling()
+            self.fields["profile"] = self._profiler.summary()
         summary = {
             "schema_version": 2,
             "run_id": self.run_id,
@@ -149,18 +217,37 @@ class RunStatsCollector:
         *,
         suppress_errors: bool = True,
         analytics_sink: AnalyticsSink | None = None,
+        run_log: RunLogStore | None = None,
     ) -> None:
         # JSONL gives future debugging/AI analysis a stable, append-only run ledger
-        # without forcing it to reverse-engineer meaning from human log text.
+        # without forcing it to reverse-engineer meaning from human log text. The ledger
+        # rotates by size; queries go to its SQLite index (helpers.run_log).
         try:
             path.parent.mkdir(parents=True, exist_ok=True)
-            with path.open("a", encoding="utf-8") as handle:
-                handle.write(json.dumps(summary, ensure_ascii=False, sort_keys=True) + "\n")
+            self._write_profile(path, summary)
+            append_to_ledger(
+                path,
+                json.dumps(summary, ensure_ascii=False, sort_keys=True) + "\n",
+                max_bytes=int(SCRAPER_RUNS_JSONL_MAX_MB * 1024 * 1024),
+                keep_segments=SCRAPER_RUNS_JSONL_SEGMENTS,
+            )
+            (run_log or run_log_for(path)).record(summary)
             self._write_analytics(summary, analytics_sink=analytics_sink)
         except Exception:
             if not suppress_errors:
                 raise
 
+    def _write_profile(self, path: Path, summary: dict[str, Any]) -> None:
+        # Collapsed stacks go next to the run ledger; the run record keeps the top
+        # frames and the file name, so runs can be compared across git_sha values.
+        profile = (summary.get("fields") or {}).get("profile")
+        if self._profiler is None or not isinstance(profile, dict) or not self._profiler.samples:
+            return
+        stamp = str(summary.get("started_at_utc") or "").replace(":", "").replace("-", "")
+        profile_path = path.parent / "profiles" / f"{self.scraper}_{stamp}_{self.run_id[:8]}.collapsed"
+        self._profiler.write_collapsed(profile_path)
+        profile["collapsed_file"] = str(profile_path.relative_to(path.parent))
+
     @staticmethod
     def _add_source_efficiency_fields(source: dict[str, Any]) -> None:
         items = _int_value(source.get("items_scraped") or source.get("items_seen"))
@@ -9,8 +9,11 @@ from typing import Any, Iterable, Optional
 from urllib.parse import urlsplit
 
 from helpers.runtime_paths import RUNTIME_DB_DIR, runtime_file
+from helpers.sqlite_runtime import connection_manager_for
 
 UNSUBSCRIBE_DB_FILE = runtime_file(RUNTIME_DB_DIR, "scraper_unsubscribes.db")
+# Schema name used when the unsubscribe ledger is ATTACHed to a scraper connection.
+UNSUBSCRIBE_SCHEMA = "unsubscribes"
 OLX_HOST_PART = "olx.ua"
 SHAFA_HOST_PART = "shafa.ua"
 ITEM_ID_RE = re.compile(r"(\d+)")
@@ -38,26 +41,45 @@ def _connect() -> sqlite3.Connection:
     return conn
 
 
+def _create_schema(conn: sqlite3.Connection, schema: str = "main") -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.unsubscribed_items (
+            source TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            link TEXT NOT NULL,
+            name TEXT NOT NULL,
+            unsubscribed_at TEXT DEFAULT (datetime('now')),
+            PRIMARY KEY (source, item_id)
+        )
+        """
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {schema}.idx_unsubscribed_items_source ON unsubscribed_items(source);"
+    )
+
+
 def _init_sync() -> None:
     with _connect() as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS unsubscribed_items (
-                source TEXT NOT NULL,
-                item_id TEXT NOT NULL,
-                link TEXT NOT NULL,
-                name TEXT NOT NULL,
-                unsubscribed_at TEXT DEFAULT (datetime('now')),
-                PRIMARY KEY (source, item_id)
-            )
-            """
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_unsubscribed_items_source ON unsubscribed_items(source);"
-        )
+        _create_schema(conn)
         conn.commit()
 
 
+def attach_unsubscribe_db(conn: sqlite3.Connection) -> str:
+    # Lets a scraper read the unsubscribe ledger in the same connection/transaction as
+    # its own tables. ATTACH is not allowed inside a transaction, so call this before
+    # BEGIN (or once when a long-lived connection is opened).
+    attached = {str(row[1]) for row in conn.execute("PRAGMA database_list").fetchall()}
+    if UNSUBSCRIBE_SCHEMA not in attached:
+        conn.execute(f"ATTACH DATABASE ? AS {UNSUBSCRIBE_SCHEMA}", (str(UNSUBSCRIBE_DB_FILE),))
+        try:
+            conn.execute(f"PRAGMA {UNSUBSCRIBE_SCHEMA}.journal_mode=WAL;")
+        except Exception:
+            pass
+        _create_schema(conn, UNSUBSCRIBE_SCHEMA)
+    return UNSUBSCRIBE_SCHEMA
+
+
 async def init_unsubscribe_db() -> None:
     await asyncio.to_thread(_init_sync)
 
@@ -141,20 +163,18 @@ def parse_reply_item_identity(reply_message: Any) -> Optional[ReplyItemIdentity]
     return ReplyItemIdentity(source=source, item_id=item_id, link=link, name=name)
 
 
-def _upsert_unsubscribed_item_sync(identity: ReplyItemIdentity) -> None:
-    with _connect() as conn:
-        conn.execute(
-            """
-            INSERT INTO unsubscribed_items (source, item_id, link, name, unsubscribed_at)
-            VALUES (?, ?, ?, ?, datetime('now'))
-            ON CONFLICT(source, item_id) DO UPDATE SET
-                link=excluded.link,
-                name=excluded.name,
-                unsubscribed_at=datetime('now')
-            """,
-            (identity.source, identity.item_id, identity.link, identity.name),
-        )
-        conn.commit()
+def _upsert_unsubscribed_item_in_conn(conn: sqlite3.Connection, identity: ReplyItemIdentity) -> None:
+    conn.execute(
+        """
+        INSERT INTO unsubscribed_items (source, item_id, link, name, unsubscribed_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(source, item_id) DO UPDATE SET
+            link=excluded.link,
+            name=excluded.name,
+            unsubscribed_at=datetime('now')
+        """,
+        (identity.source, identity.item_id, identity.link, identity.name),
+    )
 
 
 async def unsubscribe_from_reply_message(message: Any) -> tuple[bool, str]:
@@ -163,23 +183,24 @@ async def unsubscribe_from_reply_message(message: Any) -> tuple[bool, str]:
     identity = parse_reply_item_identity(reply)
     if identity is None:
         return False, "Reply to an OLX or Shafa item message with /unsubscribe."
-    await asyncio.to_thread(_upsert_unsubscribed_item_sync, identity)
+    await connection_manager_for(UNSUBSCRIBE_DB_FILE).write(_upsert_unsubscribed_item_in_conn, identity)
     source_label = identity.source.upper()
     return True, f"🔕 Unsubscribed from {source_label} item updates forever:\n{identity.name}"
 
 
-def _fetch_unsubscribed_ids_sync(source: str, item_ids: list[str]) -> set[str]:
+def _fetch_unsubscribed_ids_in_conn(conn: sqlite3.Connection, source: str, item_ids: list[str]) -> set[str]:
     if not item_ids:
         return set()
-    with _connect() as conn:
-        placeholders = ",".join("?" * len(item_ids))
-        rows = conn.execute(
-            f"SELECT item_id FROM unsubscribed_items WHERE source = ? AND item_id IN ({placeholders})",
-            [source, *item_ids],
-        ).fetchall()
-        return {str(row["item_id"]) for row in rows}
+    placeholders = ",".join("?" * len(item_ids))
+    rows = conn.execute(
+        f"SELECT item_id FROM unsubscribed_items WHERE source = ? AND item_id IN ({placeholders})",
+        [source, *item_ids],
+    ).fetchall()
+    return {str(row["item_id"]) for row in rows}
 
 
 async def fetch_unsubscribed_ids(source: str, item_ids: list[str]) -> set[str]:
     await init_unsubscribe_db()
-    return await asyncio.to_thread(_fetch_unsubscribed_ids_sync, source, item_ids)
+    if not item_ids:
+        return set()
+    return await connection_manager_for(UNSUBSCRIBE_DB_FILE).read(_fetch_unsubscribed_ids_in_conn, source, item_ids)
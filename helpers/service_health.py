@@ -5,15 +5,25 @@ import json
 import logging
 import os
 import socket
+import sys
 import threading
 import time
+import traceback
+import weakref
+from collections import Counter as TallyCounter, deque
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
 
+from config import (
+    LOOP_LAG_SAMPLE_INTERVAL_SEC,
+    LOOP_SLOW_CALLBACK_SEC,
+    LOOP_TASK_CENSUS_INTERVAL_SEC,
+    SERVICE_HEALTH_WRITE_INTERVAL_SEC,
+)
 from helpers.analytics_events import AnalyticsSink
 from helpers.runtime_paths import service_health_file
 
@@ -58,6 +68,12 @@ class ServiceMetricsConfig:
     metrics_host: str = "127.0.0.1"
     heartbeat_interval_sec: int = 30
     analytics_sink: Optional[AnalyticsSink] = None
+    # Minimum seconds between snapshot writes; 0 writes on every update.
+    snapshot_interval_sec: float = 0.0
+    # Event-loop profiler; a sample interval of 0 leaves it off.
+    loop_lag_sample_interval_sec: float = 0.0
+    loop_slow_callback_sec: float = 1.0
+    task_census_interval_sec: float = 30.0
 
     @classmethod
     def for_service(
@@ -68,6 +84,10 @@ class ServiceMetricsConfig:
         metrics_host: str = "127.0.0.1",
         heartbeat_interval_sec: int = 30,
         analytics_sink: Optional[AnalyticsSink] = None,
+        snapshot_interval_sec: float = SERVICE_HEALTH_WRITE_INTERVAL_SEC,
+        loop_lag_sample_interval_sec: float = LOOP_LAG_SAMPLE_INTERVAL_SEC,
+        loop_slow_callback_sec: float = LOOP_SLOW_CALLBACK_SEC,
+        task_census_interval_sec: float = LOOP_TASK_CENSUS_INTERVAL_SEC,
     ) -> "ServiceMetricsConfig":
         if metrics_port is None:
             metrics_port = DEFAULT_METRICS_PORTS.get(service_name)
@@ -78,12 +98,219 @@ class ServiceMetricsConfig:
             metrics_host=metrics_host,
             heartbeat_interval_sec=heartbeat_interval_sec,
             analytics_sink=analytics_sink,
+            snapshot_interval_sec=snapshot_interval_sec,
+            loop_lag_sample_interval_sec=loop_lag_sample_interval_sec,
+            loop_slow_callback_sec=loop_slow_callback_sec,
+            task_census_interval_sec=task_census_interval_sec,
         )
 
 
+_ACTIVE_LOOP_PROFILER: Optional["EventLoopProfiler"] = None
+
+
+def active_loop_profiler() -> Optional["EventLoopProfiler"]:
+    # The profiler currently sampling this process's event loop, so run records can
+    # attach the loop behaviour seen during the run without threading it through.
+    return _ACTIVE_LOOP_PROFILER
+
+
+def _coroutine_name(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class EventLoopProfiler:
+    # A sampler coroutine sleeps for sample_interval_sec and records how late it woke
+    # up: that drift is time the loop spent running other callbacks. While the loop
+    # is blocked the sampler cannot run, so a watchdog thread notices the missing tick
+    # and captures the loop thread's current stack, i.e. the code doing the blocking.
+    MAX_SAMPLES = 8192
+    MAX_STALLS = 20
+    STACK_FRAMES = 12
+    LAG_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+    def __init__(
+        self,
+        service_name: str,
+        registry: CollectorRegistry,
+        *,
+        sample_interval_sec: float,
+        slow_callback_sec: float,
+        census_interval_sec: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.service_name = service_name
+        self.sample_interval_sec = sample_interval_sec
+        self.slow_callback_sec = slow_callback_sec
+        self.census_interval_sec = census_interval_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._samples: deque[tuple[float, float]] = deque(maxlen=self.MAX_SAMPLES)
+        self._stalls: deque[dict[str, Any]] = deque(maxlen=self.MAX_STALLS)
+        self._open_stall: Optional[dict[str, Any]] = None
+        self._last_tick: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task_first_seen: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+        self._census: dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._lag = Histogram(
+            "grotesk_event_loop_lag_seconds",
+            "How late the event loop ran a scheduled sampler callback",
+            ["service"],
+            registry=registry,
+            buckets=self.LAG_BUCKETS,
+        )
+        self._stall_counter = Counter(
+            "grotesk_event_loop_stalls_total",
+            "Callbacks that blocked the event loop longer than the slow-callback threshold",
+            ["service", "site"],
+            registry=registry,
+        )
+        self._task_count = Gauge(
+            "grotesk_event_loop_tasks",
+            "Live asyncio tasks by coroutine at the latest census",
+            ["service", "coroutine"],
+            registry=registry,
+        )
+        self._task_age = Gauge(
+            "grotesk_event_loop_task_age_seconds",
+            "Age of the longest-running live task by coroutine at the latest census",
+            ["service", "coroutine"],
+            registry=registry,
+        )
+
+    async def run(self) -> None:
+        global _ACTIVE_LOOP_PROFILER
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = self._clock()
+        self._stop.clear()
+        watchdog = threading.Thread(target=self._watch, name=f"{self.service_name}-loop-watchdog", daemon=True)
+        watchdog.start()
+        _ACTIVE_LOOP_PROFILER = self
+        next_census = loop.time()
+        try:
+            while True:
+                if loop.time() >= next_census:
+                    self.take_census()
+                    next_census = loop.time() + self.census_interval_sec
+                expected = loop.time() + self.sample_interval_sec
+                await asyncio.sleep(self.sample_interval_sec)
+                self.record_lag(max(0.0, loop.time() - expected))
+        finally:
+            self._stop.set()
+            if _ACTIVE_LOOP_PROFILER is self:
+                _ACTIVE_LOOP_PROFILER = None
+
+    def record_lag(self, lag_sec: float) -> None:
+        now = self._clock()
+        self._lag.labels(service=self.service_name).observe(lag_sec)
+        with self._lock:
+            self._samples.append((now, lag_sec))
+            self._last_tick = now
+            if self._open_stall is not None:
+                self._open_stall["lag_sec"] = round(lag_sec, 6)
+                self._open_stall = None
+
+    def _watch(self) -> None:
+        poll = max(0.01, min(self.sample_interval_sec, self.slow_callback_sec) / 2)
+        while not self._stop.wait(poll):
+            self.check_stall()
+
+    def check_stall(self) -> None:
+        # Runs on the watchdog thread. One capture per stall: the stack is taken the
+        # first time the loop is found blocked past the threshold.
+        with self._lock:
+            if self._open_stall is not None or self._last_tick is None or self._loop_thread_id is None:
+                return
+            blocked = self._clock() - self._last_tick - self.sample_interval_sec
+            if blocked < self.slow_callback_sec:
+                return
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame)[-self.STACK_FRAMES:] if frame is not None else []
+            site = f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_name}" if frame is not None else "unknown"
+            stall = {
+                "at_utc": utc_now_iso(),
+                "at": self._clock(),
+                "blocked_sec": round(blocked, 6),
+                "lag_sec": None,
+                "site": site,
+                "stack": [line.rstrip() for line in stack],
+            }
+            self._stalls.append(stall)
+            self._open_stall = stall
+        self._stall_counter.labels(service=self.service_name, site=site).inc()
+        LOGGER.warning("Event loop of %s blocked for %.1fs in %s", self.service_name, blocked, site)
+
+    def take_census(self) -> dict[str, Any]:
+        now = self._clock()
+        counts: TallyCounter[str] = TallyCounter()
+        oldest: dict[str, float] = {}
+        longest = []
+        for task in asyncio.all_tasks():
+            if task.done():
+                continue
+            name = _coroutine_name(task)
+            age = now - self._task_first_seen.setdefault(task, now)
+            counts[name] += 1
+            oldest[name] = max(age, oldest.get(name, 0.0))
+            longest.append((age, name, task.get_name()))
+        longest.sort(reverse=True)
+        census = {
+            "at_utc": utc_now_iso(),
+            "tasks_total": sum(counts.values()),
+            "by_coroutine": dict(counts.most_common(20)),
+            # Ages count from the first census that saw the task.
+            "longest_running": [
+                {"coroutine": name, "task": task_name, "age_sec": round(age, 3)} for age, name, task_name in longest[:10]
+            ],
+        }
+        self._task_count.clear()
+        self._task_age.clear()
+        for name, count in counts.items():
+            self._task_count.labels(service=self.service_name, coroutine=name).set(count)
+            self._task_age.labels(service=self.service_name, coroutine=name).set(oldest[name])
+        with self._lock:
+            self._census = census
+        return census
+
+    def summary(self, *, since: Optional[float] = None) -> dict[str, Any]:
+        # since is a value of the profiler clock (time.monotonic); only samples and
+        # stalls from then on are summarised.
+        with self._lock:
+            lags = [lag for at, lag in self._samples if since is None or at >= since]
+            stalls = [
+                {key: value for key, value in stall.items() if key != "at"}
+                for stall in self._stalls
+                if since is None or stall["at"] >= since
+            ]
+            census = dict(self._census)
+        lag_summary: dict[str, Any] = {"samples": len(lags)}
+        if lags:
+            lag_summary.update(
+                mean_sec=round(sum(lags) / len(lags), 6),
+                p95_sec=round(_percentile(lags, 0.95), 6),
+                max_sec=round(max(lags), 6),
+            )
+        return {
+            "sample_interval_sec": self.sample_interval_sec,
+            "slow_callback_sec": self.slow_callback_sec,
+            "lag": lag_summary,
+            "stalls": stalls[-5:],
+            "stalls_total": len(stalls),
+            "tasks": census,
+        }
+
+
 class ServiceHealthReporter:
-    def __init__(self, config: ServiceMetricsConfig) -> None:
+    def __init__(self, config: ServiceMetricsConfig, *, clock: Callable[[], float] = time.monotonic) -> None:
         self._config = config
+        self._clock = clock
         self._lock = threading.Lock()
         self._started_at = utc_now_iso()
         self._last_heartbeat_utc = self._started_at
@@ -95,6 +322,14 @@ class ServiceHealthReporter:
         self._operation_stats: dict[str, dict[str, Any]] = {}
         self._service_state: dict[str, Any] = {}
         self._metrics_started = False
+        # Updates between writes only mark the snapshot dirty; a timer writes it once the
+        # interval has passed. Status changes bypass the interval.
+        self._snapshot_dirty = False
+        self._snapshot_timer: Optional[threading.Timer] = None
+        self._last_snapshot_at: Optional[float] = None
+        self._written_status: Optional[str] = None
+        self._snapshot_writes = 0
+        self._snapshot_coalesced = 0
         self._registry = CollectorRegistry()
         self._service_up = Gauge(
             "grotesk_service_up",
@@ -139,7 +374,52 @@ class ServiceHealthReporter:
             registry=self._registry,
             buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
         )
+        self._cache_hit_rate = Gauge(
+            "grotesk_cache_hit_ratio",
+            "Share of cache lookups served without a full download",
+            ["service", "cache"],
+            registry=self._registry,
+        )
+        self._cache_events = Gauge(
+            "grotesk_cache_events",
+            "Cumulative cache events since process start",
+            ["service", "cache", "event"],
+            registry=self._registry,
+        )
+        self._budget_utilization = Gauge(
+            "grotesk_resource_budget_utilization_ratio",
+            "Share of a shared resource budget's capacity held since process start",
+            ["service", "budget"],
+            registry=self._registry,
+        )
+        self._budget_usage = Gauge(
+            "grotesk_resource_budget",
+            "Shared resource budget state: capacity, in_use, waiting, peak_in_use",
+            ["service", "budget", "stat"],
+            registry=self._registry,
+        )
+        self._budget_wait = Gauge(
+            "grotesk_resource_budget_wait_seconds",
+            "Cumulative time spent waiting for a shared resource budget, by owner",
+            ["service", "budget", "owner"],
+            registry=self._registry,
+        )
+        self._snapshot_fsyncs = Counter(
+            "grotesk_service_health_snapshot_fsyncs_total",
+            "Health snapshot writes, each one fsync of the snapshot file",
+            ["service"],
+            registry=self._registry,
+        )
         self._analytics_sink = config.analytics_sink or AnalyticsSink()
+        self.loop_profiler: Optional[EventLoopProfiler] = None
+        if config.loop_lag_sample_interval_sec > 0:
+            self.loop_profiler = EventLoopProfiler(
+                config.service_name,
+                self._registry,
+                sample_interval_sec=config.loop_lag_sample_interval_sec,
+                slow_callback_sec=config.loop_slow_callback_sec,
+                census_interval_sec=config.task_census_interval_sec,
+            )
 
     @property
     def service_name(self) -> str:
@@ -182,6 +462,7 @@ class ServiceHealthReporter:
         self._service_ready.labels(service=service).set(0)
         self._service_up.labels(service=service).set(0)
         self.heartbeat(note=note or None)
+        self.flush()
 
     def heartbeat(self, *, note: Optional[str] = None) -> None:
         with self._lock:
@@ -199,6 +480,34 @@ class ServiceHealthReporter:
                 self._service_state[key] = value
             self._write_snapshot_locked()
 
+    def record_cache_stats(self, cache_name: str, stats: dict[str, Any]) -> None:
+        # Counters are cumulative for the process, so they are exported as gauges that
+        # are overwritten on every report rather than incremented.
+        service = self._config.service_name
+        with self._lock:
+            for event, value in stats.items():
+                if event == "hit_rate":
+                    self._cache_hit_rate.labels(service=service, cache=cache_name).set(float(value))
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._cache_events.labels(service=service, cache=cache_name, event=event).set(value)
+            caches = dict(self._service_state.get("caches") or {})
+            caches[cache_name] = dict(stats)
+            self._service_state["caches"] = caches
+            self._write_snapshot_locked()
+
+    def record_budget_stats(self, budget_name: str, stats: dict[str, Any]) -> None:
+        service = self._config.service_name
+        with self._lock:
+            self._budget_utilization.labels(service=service, budget=budget_name).set(float(stats.get("utilization") or 0))
+            for stat in ("capacity", "in_use", "waiting", "peak_in_use"):
+                self._budget_usage.labels(service=service, budget=budget_name, stat=stat).set(stats.get(stat) or 0)
+            for owner, seconds in (stats.get("wait_seconds") or {}).items():
+                self._budget_wait.labels(service=service, budget=budget_name, owner=owner or "unknown").set(seconds)
+            budgets = dict(self._service_state.get("resource_budgets") or {})
+            budgets[budget_name] = dict(stats)
+            self._service_state["resource_budgets"] = budgets
+            self._write_snapshot_locked()
+
     def clear_state_fields(self, *keys: str) -> None:
         with self._lock:
             for key in keys:
@@ -283,11 +592,63 @@ class ServiceHealthReporter:
                 LOGGER.warning("Service heartbeat loop failed for %s: %s", self._config.service_name, exc)
                 await asyncio.sleep(5)
 
+    def snapshot_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"fsyncs": self._snapshot_writes, "coalesced": self._snapshot_coalesced}
+
+    def flush(self) -> None:
+        # Writes any pending update now, e.g. on shutdown, and stops the pending timer.
+        with self._lock:
+            self._cancel_snapshot_timer_locked()
+            if self._snapshot_dirty:
+                self._write_snapshot_now_locked()
+
+    async def profile_event_loop(self) -> None:
+        # Runs the event-loop profiler until cancelled; returns at once when disabled.
+        if self.loop_profiler is None:
+            return
+        await self.loop_profiler.run()
+
     def _write_snapshot(self) -> None:
         with self._lock:
-            self._write_snapshot_locked()
+            self._write_snapshot_now_locked()
 
     def _write_snapshot_locked(self) -> None:
+        # Callers hold the lock after every state change; this decides whether the change
+        # is written now or folded into the next write.
+        self._snapshot_dirty = True
+        interval = self._config.snapshot_interval_sec
+        if (
+            interval <= 0
+            or self._last_snapshot_at is None
+            or self._status != self._written_status
+            or self._clock() - self._last_snapshot_at >= interval
+        ):
+            self._write_snapshot_now_locked()
+            return
+        self._snapshot_coalesced += 1
+        if self._snapshot_timer is None:
+            delay = max(0.0, self._last_snapshot_at + interval - self._clock())
+            timer = threading.Timer(delay, self._flush_due_snapshot)
+            timer.daemon = True
+            self._snapshot_timer = timer
+            timer.start()
+
+    def _flush_due_snapshot(self) -> None:
+        with self._lock:
+            self._snapshot_timer = None
+            if self._snapshot_dirty:
+                self._write_snapshot_now_locked()
+
+    def _cancel_snapshot_timer_locked(self) -> None:
+        if self._snapshot_timer is not None:
+            self._snapshot_timer.cancel()
+            self._snapshot_timer = None
+
+    def _write_snapshot_now_locked(self) -> None:
+        self._cancel_snapshot_timer_locked()
+        self._snapshot_writes += 1
+        self._snapshot_fsyncs.labels(service=self._config.service_name).inc()
         payload = {
             "service_name": self._config.service_name,
             "pid": os.getpid(),
@@ -304,8 +665,14 @@ class ServiceHealthReporter:
             "heartbeat_interval_sec": self._config.heartbeat_interval_sec,
             "operation_stats": self._operation_stats,
             "service_state": self._service_state,
+            "snapshot_writes": {"fsyncs": self._snapshot_writes, "coalesced": self._snapshot_coalesced},
         }
+        if self.loop_profiler is not None:
+            payload["event_loop"] = self.loop_profiler.summary(since=time.monotonic() - 300)
         _write_json_atomic(self._config.health_file, payload)
+        self._snapshot_dirty = False
+        self._last_snapshot_at = self._clock()
+        self._written_status = self._status
 
     def _record_operation_analytics(
         self,
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import asyncio
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Iterable
+from typing import Any, Callable, Iterable
 
 from helpers.runtime_paths import OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE, SHOES_DB_FILE
 
@@ -14,13 +20,8 @@ RUNTIME_DB_PRAGMA_STATEMENTS = (
     "PRAGMA cache_size=-20000;",
     "PRAGMA temp_store=MEMORY;",
     "PRAGMA mmap_size=268435456;",
-)
-
-RUNTIME_DB_MAINTENANCE_STATEMENTS = (
-    *RUNTIME_DB_PRAGMA_STATEMENTS,
-    "PRAGMA wal_checkpoint(TRUNCATE);",
-    "PRAGMA optimize;",
-    "ANALYZE;",
+    # A checkpointed WAL is reused in place; this caps what stays on disk afterwards.
+    "PRAGMA journal_size_limit=67108864;",
 )
 
 
@@ -31,30 +32,543 @@ def apply_runtime_pragmas(conn: sqlite3.Connection, *, include_foreign_keys: boo
         conn.execute(stmt)
 
 
-def runtime_db_files() -> tuple[Path, ...]:
-    return (SHOES_DB_FILE, OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE)
+@dataclass
+class WriteActorStats:
+    jobs: int = 0
+    failed_jobs: int = 0
+    transactions: int = 0
+    largest_batch: int = 0
+    statements: int = 0
+    # Time spent in BEGIN IMMEDIATE, i.e. waiting for another connection's write lock.
+    lock_wait_seconds: float = 0.0
+    max_lock_wait_seconds: float = 0.0
 
 
-def run_runtime_db_maintenance(
-    db_files: Iterable[Path] | None = None,
-    *,
-    vacuum: bool = False,
-    retention_callback: Callable[[sqlite3.Connection, Path], None] | None = None,
-) -> None:
-    for db_path in tuple(db_files or runtime_db_files()):
-        if not db_path.exists():
-            continue
-        conn = sqlite3.connect(db_path)
+class SQLiteWriteActor:
+    # A single thread owns the connection and drains queued jobs into one transaction,
+    # so bursts of small writes pay one BEGIN/COMMIT instead of a connect+commit each.
+    # Jobs receive the connection and must not commit themselves; each runs inside its
+    # own SAVEPOINT so one failing job does not roll back the rest of the batch.
+    _STOP = object()
+
+    def __init__(
+        self,
+        db_path: Path | str | Callable[[], Path | str],
+        *,
+        max_batch: int = 256,
+        name: str = "sqlite-writer",
+    ) -> None:
+        self._db_path = db_path
+        self._max_batch = max(1, int(max_batch))
+        self._name = name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self.stats = WriteActorStats()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._closed = False
+        ready: Future = Future()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name=self._name, daemon=True)
+        self._thread.start()
+        # Surface connect/pragma failures at start-up instead of on the first write.
+        ready.result()
+
+    def submit_nowait(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        if self._closed or not self.running:
+            raise RuntimeError(f"{self._name} is not running")
+        future: Future = Future()
+        self._queue.put((future, func, args, kwargs))
+        if not self.running:
+            # The writer died between the check and the put; nothing will drain the queue.
+            self._fail_queued(RuntimeError(f"{self._name} is not running"))
+        return future
+
+    async def submit(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(self.submit_nowait(func, *args, **kwargs))
+
+    def close_sync(self) -> None:
+        if self._thread is None:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.close_sync)
+
+    def _connect(self) -> sqlite3.Connection:
+        db_path = self._db_path() if callable(self._db_path) else self._db_path
+        # Autocommit mode: the actor issues BEGIN/COMMIT itself around each batch.
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        apply_runtime_pragmas(conn)
+        conn.set_trace_callback(self._count_statement)
+        return conn
+
+    def _count_statement(self, _statement: str) -> None:
+        self.stats.statements += 1
+
+    def _run(self, ready: Future) -> None:
+        try:
+            conn = self._connect()
+        except BaseException as exc:
+            ready.set_exception(exc)
+            return
+        ready.set_result(None)
+        batch: list = []
         try:
-            # These DBs are long-lived write-heavy runtime stores. Periodic checkpoint /
-            # optimize / analyze keeps WAL growth and query plans under control without
-            # changing scraper behavior.
-            for stmt in RUNTIME_DB_MAINTENANCE_STATEMENTS:
-                conn.execute(stmt)
-            if retention_callback is not None:
-                retention_callback(conn, db_path)
-            if vacuum:
-                conn.execute("VACUUM;")
-            conn.commit()
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                while len(batch) < self._max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if self._STOP in batch:
+                    stopping = True
+                    batch = [job for job in batch if job is not self._STOP]
+                if batch:
+                    self._run_batch(conn, batch)
+            # Anything queued after the stop marker still gets written before exit.
+            leftovers = []
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not self._STOP:
+                    leftovers.append(job)
+            batch = leftovers
+            if leftovers:
+                self._run_batch(conn, leftovers)
+        except BaseException as exc:
+            # The writer cannot continue; nobody may be left waiting on a future.
+            self._closed = True
+            self._resolve([(job[0], False, exc) for job in batch if job is not self._STOP])
+            self._fail_queued(exc)
         finally:
             conn.close()
+
+    def _fail_queued(self, exc: BaseException) -> None:
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is not self._STOP:
+                self._resolve([(job[0], False, exc)])
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        while batch:
+            batch = self._run_transaction(conn, batch)
+
+    def _run_transaction(self, conn: sqlite3.Connection, batch: list) -> list:
+        # Runs jobs in one transaction and returns the jobs it did not get to: when a job
+        # ends the transaction itself (commits, or an error made SQLite roll back), the
+        # rest of the batch continues in a fresh transaction.
+        lock_started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as exc:
+            self._resolve([(future, False, exc) for future, *_ in batch])
+            return []
+        finally:
+            lock_wait = time.perf_counter() - lock_started
+            self.stats.lock_wait_seconds += lock_wait
+            self.stats.max_lock_wait_seconds = max(self.stats.max_lock_wait_seconds, lock_wait)
+        outcomes: list[tuple[Future, bool, Any]] = []
+        for position, (future, func, args, kwargs) in enumerate(batch):
+            ok, value = True, None
+            try:
+                conn.execute("SAVEPOINT actor_job")
+                try:
+                    value = func(conn, *args, **kwargs)
+                except BaseException as exc:
+                    ok, value = False, exc
+                if not conn.in_transaction:
+                    raise sqlite3.OperationalError("write job ended the actor transaction")
+                if not ok:
+                    conn.execute("ROLLBACK TO actor_job")
+                conn.execute("RELEASE actor_job")
+            except Exception as exc:
+                # Earlier jobs' writes may be committed or rolled back; report them failed
+                # rather than confirm writes that may not exist.
+                if conn.in_transaction:
+                    try:
+                        conn.execute("ROLLBACK")
+                    except Exception:
+                        pass
+                self.stats.transactions += 1
+                outcomes = [(pending, False, exc) for pending, _, _ in outcomes]
+                outcomes.append((future, False, value if not ok else exc))
+                self._resolve(outcomes)
+                return batch[position + 1 :]
+            outcomes.append((future, ok, value))
+        try:
+            conn.execute("COMMIT")
+        except Exception as exc:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            outcomes = [(future, False, exc) for future, _, _ in outcomes]
+        self.stats.transactions += 1
+        self.stats.largest_batch = max(self.stats.largest_batch, len(outcomes))
+        # Futures resolve only after COMMIT so callers never act on writes that could
+        # still be rolled back (for example a notification claim).
+        self._resolve(outcomes)
+        return []
+
+    def _resolve(self, outcomes: list[tuple[Future, bool, Any]]) -> None:
+        for future, ok, value in outcomes:
+            if future.done():
+                continue
+            self.stats.jobs += 1
+            if ok:
+                future.set_result(value)
+            else:
+                self.stats.failed_jobs += 1
+                future.set_exception(value)
+
+
+class SQLiteConnectionManager:
+    # Shared access to one database file for the whole process: writes go to a single
+    # SQLiteWriteActor (one thread, batched transactions), reads run on a connection
+    # owned by the calling thread, opened and given the runtime pragmas once and then
+    # reused. With WAL, readers never wait on the writer, so a run's asyncio.to_thread
+    # workers each keep one warm connection instead of connecting on every call.
+    def __init__(self, db_path: Path | str, *, max_batch: int = 256) -> None:
+        self.db_path = Path(db_path)
+        self._max_batch = max_batch
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer: SQLiteWriteActor | None = None
+        self._readers: list[tuple[sqlite3.Connection, list[int]]] = []
+        self._reads = 0
+        self._read_seconds = 0.0
+        self._write_queue_wait_seconds = 0.0
+        self._max_write_queue_wait_seconds = 0.0
+
+    def reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            apply_runtime_pragmas(conn)
+            # Counted per connection, so the owning thread never contends on a lock.
+            statements = [0]
+            conn.set_trace_callback(lambda _statement: statements.__setitem__(0, statements[0] + 1))
+            with self._lock:
+                self._readers.append((conn, statements))
+            self._local.conn = conn
+        return conn
+
+    def read_sync(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        conn = self.reader()
+        started = time.perf_counter()
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            # A transaction left open would pin its WAL snapshot and hold back checkpoints.
+            if conn.in_transaction:
+                conn.rollback()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._reads += 1
+                self._read_seconds += elapsed
+
+    async def read(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.to_thread(self.read_sync, func, *args, **kwargs)
+
+    def _writer_actor(self) -> SQLiteWriteActor:
+        with self._lock:
+            if self._writer is None:
+                self._writer = SQLiteWriteActor(
+                    self.db_path, max_batch=self._max_batch, name=f"sqlite-writer-{self.db_path.stem}"
+                )
+            if not self._writer.running:
+                self._writer.start()
+            return self._writer
+
+    def _timed_job(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        enqueued = time.perf_counter()
+
+        def job(conn: sqlite3.Connection, *args: Any, **kwargs: Any) -> Any:
+            # Runs on the writer thread, the only one updating these two fields.
+            waited = time.perf_counter() - enqueued
+            self._write_queue_wait_seconds += waited
+            self._max_write_queue_wait_seconds = max(self._max_write_queue_wait_seconds, waited)
+            return func(conn, *args, **kwargs)
+
+        return job
+
+    def write_sync(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        # Same contract as SQLiteWriteActor jobs: func gets the writer connection inside
+        # an open transaction and must not commit. Blocks until the batch commits.
+        return self._writer_actor().submit_nowait(self._timed_job(func), *args, **kwargs).result()
+
+    async def write(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        return await self._writer_actor().submit(self._timed_job(func), *args, **kwargs)
+
+    @property
+    def writer_stats(self) -> WriteActorStats:
+        return self._writer.stats if self._writer is not None else WriteActorStats()
+
+    def stats(self) -> dict[str, Any]:
+        writer = self.writer_stats
+        with self._lock:
+            return {
+                "reader_connections": len(self._readers),
+                "reads": self._reads,
+                "read_seconds": round(self._read_seconds, 6),
+                "read_statements": sum(statements[0] for _, statements in self._readers),
+                "write_jobs": writer.jobs,
+                "failed_write_jobs": writer.failed_jobs,
+                "write_transactions": writer.transactions,
+                "largest_write_batch": writer.largest_batch,
+                "write_statements": writer.statements,
+                "write_queue_wait_seconds": round(self._write_queue_wait_seconds, 6),
+                "max_write_queue_wait_seconds": round(self._max_write_queue_wait_seconds, 6),
+                "lock_wait_seconds": round(writer.lock_wait_seconds, 6),
+                "max_lock_wait_seconds": round(writer.max_lock_wait_seconds, 6),
+            }
+
+    def close_sync(self) -> None:
+        # For shutdown and tests: a thread that reads again afterwards opens a new connection.
+        with self._lock:
+            writer, self._writer = self._writer, None
+            readers, self._readers = self._readers, []
+        if writer is not None:
+            writer.close_sync()
+        for conn, _ in readers:
+            conn.close()
+        self._local = threading.local()
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.close_sync)
+
+
+class DirectSQLiteAccess:
+    # read_sync/write_sync over one short-lived connection, with the same job contract as
+    # SQLiteConnectionManager (write jobs get an open transaction and must not commit).
+    # For processes that do not own a file's writer, e.g. Lyst maintenance on shoes.db,
+    # whose writes go through LystStorage: no writer thread is started for the file.
+    # The connection opens on first use and is closed by close().
+    def __init__(self, db_path: Path | str) -> None:
+        self.db_path = Path(db_path)
+        self._conn: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=30)
+            apply_runtime_pragmas(self._conn)
+        return self._conn
+
+    def read_sync(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        conn = self._connection()
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def write_sync(self, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, *args, **kwargs)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        return result
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_MANAGERS: dict[Path, SQLiteConnectionManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+
+def connection_manager_for(db_path: Path | str) -> SQLiteConnectionManager:
+    # Keyed by the path at call time, so modules that repoint their DB_FILE (tests,
+    # migrations) get a manager for the new file.
+    key = Path(db_path)
+    with _MANAGERS_LOCK:
+        manager = _MANAGERS.get(key)
+        if manager is None:
+            manager = _MANAGERS[key] = SQLiteConnectionManager(key)
+        return manager
+
+
+def sqlite_manager_stats() -> dict[str, dict[str, Any]]:
+    with _MANAGERS_LOCK:
+        managers = dict(_MANAGERS)
+    return {path.name: manager.stats() for path, manager in managers.items()}
+
+
+def report_sqlite_stats(service_health) -> None:
+    stats = sqlite_manager_stats()
+    if stats:
+        service_health.set_state_fields(sqlite=stats)
+
+
+def close_connection_managers() -> None:
+    with _MANAGERS_LOCK:
+        managers = list(_MANAGERS.values())
+        _MANAGERS.clear()
+    for manager in managers:
+        manager.close_sync()
+
+
+def runtime_db_files() -> tuple[Path, ...]:
+    return (SHOES_DB_FILE, OLX_ITEMS_DB_FILE, SHAFA_ITEMS_DB_FILE)
+
+
+@dataclass(frozen=True)
+class RetentionRule:
+    table: str
+    column: str
+    days: int
+
+
+_MAINTENANCE_LOCKS: dict[Path, threading.Lock] = {}
+_MAINTENANCE_LOCKS_LOCK = threading.Lock()
+
+
+def _maintenance_lock(db_path: Path) -> threading.Lock:
+    with _MAINTENANCE_LOCKS_LOCK:
+        return _MAINTENANCE_LOCKS.setdefault(db_path, threading.Lock())
+
+
+def _delete_expired_batch(conn: sqlite3.Connection, rule: RetentionRule, batch_rows: int) -> int:
+    cursor = conn.execute(
+        f"DELETE FROM {rule.table} WHERE rowid IN "
+        f"(SELECT rowid FROM {rule.table} WHERE {rule.column} < datetime('now', ?) LIMIT ?)",
+        (f"-{rule.days} days", batch_rows),
+    )
+    return cursor.rowcount
+
+
+def _incremental_vacuum_chunk(conn: sqlite3.Connection, pages: int) -> int:
+    # The pragma frees pages only as its result rows are stepped, hence fetchall().
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return int(conn.execute("PRAGMA freelist_count").fetchone()[0])
+
+
+def _optimize(conn: sqlite3.Connection, analysis_limit: int) -> None:
+    conn.execute(f"PRAGMA analysis_limit={int(analysis_limit)}")
+    conn.execute("PRAGMA optimize")
+
+
+def _auto_vacuum_mode(db_path: Path, *, migrate: bool) -> int:
+    # Read on a fresh connection: an open connection caches the mode from when it was
+    # opened and would keep reporting NONE after a migration.
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        mode = int(conn.execute("PRAGMA auto_vacuum").fetchone()[0])
+        if mode == 0 and migrate:
+            # auto_vacuum can only be switched on an existing file by a full VACUUM. This
+            # is the one blocking step and runs once per file, only when DB_VACUUM opts in.
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            mode = int(conn.execute("PRAGMA auto_vacuum").fetchone()[0])
+        return mode
+    finally:
+        conn.close()
+
+
+def run_incremental_db_maintenance(
+    db_path: Path | str,
+    *,
+    retention: Iterable[RetentionRule] = (),
+    migrate_auto_vacuum: bool = False,
+    step_budget_sec: float = 0.5,
+    batch_rows: int = 500,
+    checkpoint_wal_bytes: int = 16 * 1024 * 1024,
+    vacuum_pages: int = 256,
+    analysis_limit: int = 400,
+    db: SQLiteConnectionManager | DirectSQLiteAccess | None = None,
+    clock: Callable[[], float] = time.perf_counter,
+) -> dict[str, Any] | None:
+    # One online pass over a runtime DB. Deletes and vacuum chunks are small write jobs
+    # on the file's shared writer, so scraper writes queued meanwhile go in between;
+    # each step stops once step_budget_sec is spent and the next pass picks up the rest.
+    # The checkpoint is PASSIVE (never waits on readers or the writer). db defaults to
+    # the file's connection manager. Returns None if another pass on the same file is
+    # still running.
+    db_path = Path(db_path)
+    if not db_path.exists():
+        return {"skipped": "missing"}
+    lock = _maintenance_lock(db_path)
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        manager = db if db is not None else connection_manager_for(db_path)
+        report: dict[str, Any] = {}
+
+        retention_report = {}
+        for rule in retention:
+            if rule.days <= 0:
+                continue
+            deadline = clock() + step_budget_sec
+            deleted = batches = 0
+            while True:
+                removed = manager.write_sync(_delete_expired_batch, rule, batch_rows)
+                deleted += removed
+                batches += 1
+                if removed < batch_rows or clock() >= deadline:
+                    break
+            retention_report[rule.table] = {"deleted": deleted, "batches": batches, "complete": removed < batch_rows}
+        report["retention"] = retention_report
+
+        auto_vacuum = _auto_vacuum_mode(db_path, migrate=migrate_auto_vacuum)
+        report["auto_vacuum"] = auto_vacuum
+        if auto_vacuum == 2:
+            deadline = clock() + step_budget_sec
+            chunks = 0
+            while True:
+                free_pages = manager.write_sync(_incremental_vacuum_chunk, vacuum_pages)
+                chunks += 1
+                if free_pages == 0 or clock() >= deadline:
+                    break
+            report["incremental_vacuum"] = {"chunks": chunks, "free_pages": free_pages}
+        else:
+            report["incremental_vacuum"] = {"skipped": "auto_vacuum is not INCREMENTAL"}
+
+        wal_path = db_path.with_name(db_path.name + "-wal")
+        wal_bytes = wal_path.stat().st_size if wal_path.exists() else 0
+        if wal_bytes >= checkpoint_wal_bytes:
+            busy, log_frames, checkpointed = manager.read_sync(
+                lambda conn: tuple(conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone())
+            )
+            report["checkpoint"] = {
+                "wal_bytes": wal_bytes,
+                "busy": busy,
+                "log_frames": log_frames,
+                "checkpointed_frames": checkpointed,
+            }
+        else:
+            report["checkpoint"] = {"wal_bytes": wal_bytes, "skipped": "below threshold"}
+
+        # analysis_limit makes any ANALYZE that optimize decides to run sample at most
+        # that many rows per index, so it stays cheap on large tables.
+        started = clock()
+        manager.write_sync(_optimize, analysis_limit)
+        report["optimize_seconds"] = round(clock() - started, 3)
+        return report
+    finally:
+        lock.release()
@@ -2,15 +2,231 @@ from __future__ import annotations
 
 import asyncio
 import hashlib
+import heapq
 import io
+import itertools
 import re
 import time
 import uuid
-from collections import deque
-from typing import Callable, Optional
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import Awaitable, Callable, Hashable, Optional
 
 from telegram import Bot
 from telegram.error import RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
+
+from config import TELEGRAM_POOL_SIZE
+from helpers.scheduler import handle_scheduler_command
+from helpers.scraper_stats import request_run_profile
+
+# One Bot per token for the whole process. Each Bot owns an HTTPX client, so building
+# one per send paid a fresh TLS handshake every message; shared bots keep their
+# connections warm. The first caller's request settings win for a token, so services
+# create their bots at startup (see initialize_shared_bots).
+_SHARED_BOTS: dict[str, Bot] = {}
+
+
+def get_shared_bot(token: str, *, request_factory: Optional[Callable[[], HTTPXRequest]] = None) -> Bot:
+    token = (token or "").strip().strip("'\"")
+    bot = _SHARED_BOTS.get(token)
+    if bot is None:
+        request = request_factory() if request_factory is not None else HTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE)
+        bot = _SHARED_BOTS[token] = Bot(token=token, request=request)
+    return bot
+
+
+async def initialize_shared_bots(*tokens: str | None, logger=None) -> None:
+    # Opens the connection pools and resolves the bot identity before the first send.
+    for token in unique_bot_tokens(*tokens):
+        try:
+            await get_shared_bot(token).initialize()
+        except Exception as exc:
+            if logger is not None:
+                logger.warning(f"Telegram bot pre-initialisation failed: {exc}")
+
+
+async def shutdown_shared_bots(*, logger=None) -> None:
+    bots = list(_SHARED_BOTS.values())
+    _SHARED_BOTS.clear()
+    for bot in bots:
+        try:
+            await bot.shutdown()
+        except Exception as exc:
+            if logger is not None:
+                logger.warning(f"Telegram bot shutdown failed: {exc}")
+
+
+def retry_after_seconds(exc: RetryAfter) -> float:
+    retry_after = exc.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def is_group_chat(chat_id) -> bool:
+    # Groups, supergroups and channels have negative ids (or an @username); Telegram
+    # limits those to about 20 messages a minute instead of one a second.
+    if isinstance(chat_id, str) and chat_id.strip().startswith("@"):
+        return True
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        return False
+
+
+class TokenBucket:
+    # `rate` tokens per second, at most `capacity` banked. delay() only peeks so a
+    # caller can check several buckets and take from all of them without awaiting.
+    def __init__(self, rate: float, capacity: float = 1.0, *, clock: Callable[[], float] = time.monotonic):
+        self.rate = max(float(rate), 1e-9)
+        self.capacity = max(1.0, float(capacity))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def delay(self) -> float:
+        self._refill()
+        return 0.0 if self._tokens >= 1.0 else (1.0 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self._tokens -= 1.0
+
+
+class TelegramSendScheduler:
+    # Dispatches sends in parallel across chats while keeping Telegram's flood limits:
+    # one global bucket (~30 msg/s per bot) plus a bucket per chat (~1 msg/s private,
+    # ~20 msg/min groups). Each chat has its own FIFO lane, so order within a chat is
+    # kept; a RetryAfter pauses only that chat's lane and the job is retried first.
+    def __init__(
+        self,
+        *,
+        global_rate: float = 25.0,
+        global_burst: float = 5.0,
+        chat_rate: float = 1.0,
+        group_rate_per_min: float = 20.0,
+        max_parallel: int = 4,
+        clock: Callable[[], float] = time.monotonic,
+        logger=None,
+    ):
+        self._clock = clock
+        self._logger = logger
+        self._global = TokenBucket(global_rate, global_burst, clock=clock)
+        self._chat_rate = float(chat_rate)
+        self._group_rate = float(group_rate_per_min) / 60.0
+        self._slots = asyncio.Semaphore(max(1, int(max_parallel)))
+        self._lanes: dict[Hashable, deque] = {}
+        self._lane_tasks: dict[Hashable, asyncio.Task] = {}
+        self._chat_buckets: dict[Hashable, TokenBucket] = {}
+        self._paused_until: dict[Hashable, float] = {}
+        self.sent = 0
+        self.failed = 0
+        self.retry_after_pauses = 0
+
+    def submit(self, chat_id, job: Callable[[], Awaitable[object]]) -> None:
+        lane = self._lanes.setdefault(chat_id, deque())
+        lane.append(job)
+        if chat_id not in self._lane_tasks:
+            self._lane_tasks[chat_id] = asyncio.create_task(self._drain_lane(chat_id), name=f"tg_send_lane:{chat_id}")
+
+    async def join(self) -> None:
+        while self._lane_tasks:
+            await asyncio.gather(*list(self._lane_tasks.values()), return_exceptions=True)
+
+    def queued(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def stats(self) -> dict:
+        now = self._clock()
+        return {
+            "lanes": len(self._lanes),
+            "queued": self.queued(),
+            "paused_chats": sum(1 for until in self._paused_until.values() if until > now),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retry_after_pauses": self.retry_after_pauses,
+        }
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = self._group_rate if is_group_chat(chat_id) else self._chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, 1.0, clock=self._clock)
+        return bucket
+
+    async def _wait_turn(self, chat_id) -> None:
+        chat_bucket = self._chat_bucket(chat_id)
+        while True:
+            paused = self._paused_until.get(chat_id, 0.0) - self._clock()
+            wait = max(paused, chat_bucket.delay(), self._global.delay())
+            if wait <= 0:
+                self._paused_until.pop(chat_id, None)
+                chat_bucket.take()
+                self._global.take()
+                return
+            await asyncio.sleep(wait)
+
+    async def _drain_lane(self, chat_id) -> None:
+        lane = self._lanes[chat_id]
+        try:
+            while lane:
+                await self._wait_turn(chat_id)
+                job = lane.popleft()
+                try:
+                    async with self._slots:
+                        await job()
+                    self.sent += 1
+                except RetryAfter as exc:
+                    delay = retry_after_seconds(exc)
+                    self.retry_after_pauses += 1
+                    self._paused_until[chat_id] = self._clock() + delay
+                    lane.appendleft(job)
+                    if self._logger is not None:
+                        self._logger.warning(f"Rate limited in chat {chat_id}. Pausing it for {delay} seconds")
+                except Exception as exc:
+                    self.failed += 1
+                    if self._logger is not None:
+                        self._logger.error(f"Telegram send job for chat {chat_id} failed: {exc}")
+        finally:
+            self._lane_tasks.pop(chat_id, None)
+            if not lane:
+                self._lanes.pop(chat_id, None)
+
+
+class ExpiringSet:
+    # Keys expire `ttl_sec` after they were last added. Entries are kept in insertion
+    # order and re-adding moves a key to the end, so expired keys are always at the
+    # front and pruning only touches what actually expires.
+    def __init__(self, ttl_sec: float):
+        self._ttl_sec = ttl_sec
+        self._added_at: OrderedDict[str, float] = OrderedDict()
+
+    def add(self, key: str, now_ts: float) -> None:
+        self._added_at[key] = now_ts
+        self._added_at.move_to_end(key)
+
+    def prune(self, now_ts: float) -> None:
+        while self._added_at:
+            key, added_at = next(iter(self._added_at.items()))
+            if now_ts - added_at <= self._ttl_sec:
+                return
+            self._added_at.popitem(last=False)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._added_at
+
+    def __len__(self) -> int:
+        return len(self._added_at)
+
+
+def _is_finished(meta) -> bool:
+    return bool(meta.get("sent") or meta.get("gave_up"))
 
 
 class TelegramMessageQueue:
@@ -22,36 +238,55 @@ class TelegramMessageQueue:
         pending_ttl_sec: int = 6 * 3600,
         pending_max_entries: int = 5000,
         dedupe_window_sec: int = 1800,
+        scheduler: Optional[TelegramSendScheduler] = None,
+        retry_base_sec: float = 2.0,
+        retry_max_delay_sec: float = 600.0,
+        retry_max_attempts: int = 10,
+        logger=None,
     ):
         self.queue = asyncio.Queue()
+        self._logger = logger
         self.bot_token = bot_token
         self.pending_messages = {}
-        self.recent_sent = {}
+        self.recent_sent = ExpiringSet(dedupe_window_sec)
         self._pending_ttl_sec = pending_ttl_sec
         self._pending_max_entries = pending_max_entries
-        self._dedupe_window_sec = dedupe_window_sec
         self._send_func = send_func
+        self.scheduler = scheduler or TelegramSendScheduler()
+        # Failed sends wait in a heap ordered by due time instead of going back to the
+        # end of the queue, so a flapping send backs off without churning the head.
+        self._retry_base_sec = retry_base_sec
+        self._retry_max_delay_sec = retry_max_delay_sec
+        self._retry_max_attempts = retry_max_attempts
+        self._retry_heap: list[tuple[float, int, tuple]] = []
+        self._retry_seq = itertools.count()
+        self._retry_wakeup = asyncio.Event()
+        self._attempts: dict[str, int] = {}
+        # Unsent message ids in arrival order; the first one is the oldest.
+        self._unsent: OrderedDict[str, float] = OrderedDict()
+        self.retries_scheduled = 0
+        self.retries_dropped = 0
+        self.deduped = 0
 
     def _fingerprint(self, chat_id, message, image_url, uah_price, sale_percentage):
         payload = f"{chat_id}|{message}|{image_url or ''}|{uah_price or ''}|{sale_percentage or ''}"
         return hashlib.sha1(payload.encode("utf-8", errors="ignore")).hexdigest()
 
-    def _prune_recent(self, now_ts):
-        expired = [k for k, ts in self.recent_sent.items() if now_ts - ts > self._dedupe_window_sec]
-        for k in expired:
-            self.recent_sent.pop(k, None)
-
-    def _set_pending_status(self, message_id, sent, now_ts=None):
+    def _set_pending_status(self, message_id, sent, now_ts=None, *, gave_up=False):
         self.pending_messages[message_id] = {
             "sent": bool(sent),
+            "gave_up": bool(gave_up),
             "updated_at": now_ts if now_ts is not None else time.time(),
         }
+        if sent or gave_up:
+            self._unsent.pop(message_id, None)
+            self._attempts.pop(message_id, None)
 
     def _prune_pending_messages(self, now_ts):
         expired = [
             message_id
             for message_id, meta in self.pending_messages.items()
-            if meta.get("sent") and (now_ts - float(meta.get("updated_at", now_ts))) > self._pending_ttl_sec
+            if _is_finished(meta) and (now_ts - float(meta.get("updated_at", now_ts))) > self._pending_ttl_sec
         ]
         for message_id in expired:
             self.pending_messages.pop(message_id, None)
@@ -60,7 +295,7 @@ class TelegramMessageQueue:
             return
         ordered = sorted(
             self.pending_messages.items(),
-            key=lambda item: (0 if item[1].get("sent") else 1, float(item[1].get("updated_at", 0.0))),
+            key=lambda item: (0 if _is_finished(item[1]) else 1, float(item[1].get("updated_at", 0.0))),
         )
         for message_id, _ in ordered[:overflow]:
             self.pending_messages.pop(message_id, None)
@@ -68,34 +303,81 @@ class TelegramMessageQueue:
     async def add_message(self, chat_id, message, image_url=None, uah_price=None, sale_percentage=None):
         message_id = str(uuid.uuid4())
         self._set_pending_status(message_id, False)
+        self._unsent[message_id] = time.time()
         await self.queue.put((message_id, chat_id, message, image_url, uah_price, sale_percentage))
         return message_id
 
+    def _retry_delay(self, attempt: int) -> float:
+        return min(self._retry_max_delay_sec, self._retry_base_sec * (2 ** (attempt - 1)))
+
+    def _schedule_retry(self, item) -> None:
+        message_id = item[0]
+        attempt = self._attempts.get(message_id, 0) + 1
+        if attempt >= self._retry_max_attempts:
+            # Finished as given up, so it is neither counted as pending nor resent.
+            self.retries_dropped += 1
+            self._set_pending_status(message_id, False, gave_up=True)
+            if self._logger is not None:
+                self._logger.warning(
+                    f"Telegram message {message_id} to chat {item[1]} dropped after {attempt} failed attempts"
+                )
+            return
+        self._attempts[message_id] = attempt
+        self.retries_scheduled += 1
+        heapq.heappush(self._retry_heap, (time.monotonic() + self._retry_delay(attempt), next(self._retry_seq), item))
+        self._retry_wakeup.set()
+
+    def _submit(self, item) -> None:
+        self.scheduler.submit(item[1], lambda item=item: self._deliver(item))
+
     async def process_queue(self):
+        # Messages are handed to the send scheduler, which paces them per chat and
+        # globally; due retries are released from the heap between arrivals.
         while True:
-            message_id, chat_id, message, image_url, uah_price, sale_percentage = await self.queue.get()
-            now_ts = time.time()
-            fingerprint = self._fingerprint(chat_id, message, image_url, uah_price, sale_percentage)
-            self._prune_recent(now_ts)
-            self._prune_pending_messages(now_ts)
-            if fingerprint in self.recent_sent:
-                self._set_pending_status(message_id, True, now_ts)
-                await asyncio.sleep(1)
-                continue
-            success = await self._send_func(
-                self.bot_token,
-                chat_id,
-                message,
-                image_url,
-                uah_price,
-                sale_percentage,
-            )
-            self._set_pending_status(message_id, success, now_ts)
-            if success:
-                self.recent_sent[fingerprint] = time.time()
-            else:
-                await self.queue.put((message_id, chat_id, message, image_url, uah_price, sale_percentage))
-            await asyncio.sleep(1)
+            now = time.monotonic()
+            while self._retry_heap and self._retry_heap[0][0] <= now:
+                self._submit(heapq.heappop(self._retry_heap)[2])
+            timeout = self._retry_heap[0][0] - now if self._retry_heap else None
+            self._retry_wakeup.clear()
+            get_task = asyncio.ensure_future(self.queue.get())
+            wakeup_task = asyncio.ensure_future(self._retry_wakeup.wait())
+            try:
+                await asyncio.wait({get_task, wakeup_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                wakeup_task.cancel()
+                if not get_task.done():
+                    get_task.cancel()
+            if get_task.done() and not get_task.cancelled():
+                self._submit(get_task.result())
+
+    async def _deliver(self, item):
+        message_id, chat_id, message, image_url, uah_price, sale_percentage = item
+        now_ts = time.time()
+        fingerprint = self._fingerprint(chat_id, message, image_url, uah_price, sale_percentage)
+        self.recent_sent.prune(now_ts)
+        self._prune_pending_messages(now_ts)
+        if fingerprint in self.recent_sent:
+            self.deduped += 1
+            self._set_pending_status(message_id, True, now_ts)
+            return
+        # RetryAfter propagates to the scheduler, which pauses this chat and retries.
+        success = await self._send_func(
+            self.bot_token,
+            chat_id,
+            message,
+            image_url,
+            uah_price,
+            sale_percentage,
+        )
+        self._set_pending_status(message_id, success, now_ts)
+        if success:
+            self.recent_sent.add(fingerprint, time.time())
+        else:
+            self._schedule_retry(item)
+
+    def is_message_given_up(self, message_id):
+        meta = self.pending_messages.get(message_id)
+        return bool(meta and meta.get("gave_up"))
 
     def is_message_sent(self, message_id):
         meta = self.pending_messages.get(message_id)
@@ -104,8 +386,18 @@ class TelegramMessageQueue:
         return bool(meta.get("sent"))
 
     def stats(self):
-        pending = sum(1 for meta in self.pending_messages.values() if not meta.get("sent"))
-        return {"queue_size": self.queue.qsize(), "pending": pending}
+        pending = sum(1 for meta in self.pending_messages.values() if not _is_finished(meta))
+        oldest_age = time.time() - next(iter(self._unsent.values())) if self._unsent else 0.0
+        return {
+            "queue_size": self.queue.qsize() + self.scheduler.queued(),
+            "pending": pending,
+            "retry_waiting": len(self._retry_heap),
+            "retries_scheduled": self.retries_scheduled,
+            "retries_dropped": self.retries_dropped,
+            "deduped": self.deduped,
+            "oldest_unsent_age_sec": round(max(0.0, oldest_age), 3),
+            "scheduler": self.scheduler.stats(),
+        }
 
 
 async def send_telegram_message(
@@ -121,7 +413,7 @@ async def send_telegram_message(
     upgrade_image_url_func: Optional[Callable[[str | None], str | None]] = None,
     logger,
 ):
-    bot = Bot(token=bot_token)
+    bot = get_shared_bot(bot_token)
     for attempt in range(max_retries):
         try:
             if image_url and image_url.startswith(("http://", "https://")):
@@ -136,9 +428,10 @@ async def send_telegram_message(
             else:
                 await bot.send_message(chat_id=chat_id, text=message, parse_mode="HTML")
             return True
-        except RetryAfter as e:
-            logger.warning(f"Rate limited. Sleeping for {e.retry_after} seconds")
-            await asyncio.sleep(e.retry_after)
+        except RetryAfter:
+            # The send scheduler pauses only this chat and retries the message; sleeping
+            # here would hold a send slot the other chats could use.
+            raise
         except TimedOut:
             logger.warning(f"Request timed out on attempt {attempt + 1}")
             logger.warning("Assuming Telegram delivered message despite timeout to avoid duplicates")
@@ -217,6 +510,8 @@ async def command_listener(
     allow_log_commands: bool = True,
     allow_add_commands: bool = True,
     allow_unsubscribe_commands: bool = True,
+    allow_profile_commands: bool = True,
+    allow_scheduler_commands: bool = True,
     logger,
 ):
     if not bot_token:
@@ -226,7 +521,7 @@ async def command_listener(
         logger.warning("Command listener disabled: no allowed chat IDs configured.")
         return
 
-    bot = Bot(token=bot_token)
+    bot = get_shared_bot(bot_token)
     offset = None
     logger.info("Command listener started.")
 
@@ -282,6 +577,17 @@ async def command_listener(
                         continue
                     _, response = await unsubscribe_item_func(message)
                     await bot.send_message(chat_id=chat_id, text=response)
+                elif allow_profile_commands and command == "/profile":
+                    # "/profile olx" profiles the next OLX run; a bare /profile the next run of any scraper.
+                    parts = raw_text.split()
+                    scraper = parts[1].lower() if len(parts) > 1 else "*"
+                    request_run_profile(scraper)
+                    target = "the next run" if scraper == "*" else f"the next {scraper.upper()} run"
+                    await bot.send_message(chat_id=chat_id, text=f"🔬 CPU profile armed for {target}.")
+                elif allow_scheduler_commands and command in ("/jobs", "/runnow", "/cancel"):
+                    # Reaches the schedulers running in this process: /jobs, /runnow olx, /cancel lyst.
+                    reply = handle_scheduler_command(command, [part.lower() for part in raw_text.split()[1:]])
+                    await bot.send_message(chat_id=chat_id, text=reply)
         except asyncio.CancelledError:
             raise
         except Exception as exc:
@@ -26,13 +26,18 @@ from config import (
     MARKET_IMAGE_UPSCALE_MIN_DIM,
     MARKET_IMAGE_UPSCALE_MAX_DIM,
     MARKET_IMAGE_UPSCALE_FACTORS,
+    MARKET_DUPLICATE_INDEX_CAPACITY,
+    MARKET_PIPELINE_PERSIST_BATCH_SIZE,
+    MARKET_PIPELINE_TRANSFORM_BATCH_SIZE,
+    MARKET_PIPELINE_QUEUE_SIZE,
 )
 from config_olx_urls import OLX_URLS
-from helpers.analytics_events import AnalyticsSink
+from helpers.analytics_events import AggregatingAnalyticsSink
 from helpers.dynamic_sources import load_dynamic_urls, merge_sources
 from helpers.marketplace_core import (
     DeliveryResult,
     MarketplaceItem,
+    PrefetchedState,
     SourceStats,
     duplicate_key,
     finished_source_decision,
@@ -40,6 +45,7 @@ from helpers.marketplace_core import (
     notification_storage_key,
 )
 from helpers.marketplace_pipeline import (
+    DeliveryStages,
     ItemDecision,
     ItemUpdate,
     MarketplaceRepository,
@@ -53,14 +59,25 @@ from helpers.marketplace_sender import (
     build_image_downloader,
     build_marketplace_bot,
     build_media_sender,
+    build_media_stages,
     build_message_sender,
     build_photo_sender,
 )
-from helpers.process_pool import run_cpu_bound
-from helpers.scraper_unsubscribes import fetch_unsubscribed_ids
-from helpers.runtime_paths import OLX_ITEMS_DB_FILE, SCRAPER_RUNS_JSONL_FILE
+from helpers.process_pool import run_cpu_bound, run_cpu_bound_batch
+from helpers.resource_governor import shared_resource_governor
+from helpers.image_cache import shared_image_cache
+from helpers.image_stream import ImageSizePolicy, olx_smaller_variant
+from helpers.duplicate_index import DuplicateKeyIndex, load_duplicate_index, save_duplicate_index
+from helpers.marketplace_prefetch import duplicate_keys_since_in_conn, prefetch_state_in_conn
+from helpers.scraper_unsubscribes import UNSUBSCRIBE_SCHEMA, attach_unsubscribe_db, fetch_unsubscribed_ids
+from helpers.runtime_paths import OLX_DUPLICATE_INDEX_FILE, OLX_ITEMS_DB_FILE, SCRAPER_RUNS_JSONL_FILE
 from helpers.scraper_stats import RunStatsCollector, utc_now_iso
-from helpers.sqlite_runtime import RUNTIME_DB_PRAGMA_STATEMENTS, apply_runtime_pragmas
+from helpers.sqlite_runtime import (
+    RUNTIME_DB_PRAGMA_STATEMENTS,
+    SQLiteConnectionManager,
+    apply_runtime_pragmas,
+    connection_manager_for,
+)
 try:
     import lxml  # noqa: F401
     _LXML_AVAILABLE = True
@@ -70,12 +87,14 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 BASE_OLX = "https://www.olx.ua"
-_HTTP_HTML_SEMAPHORE = asyncio.Semaphore(OLX_HTTP_HTML_CONCURRENCY)
-_HTTP_IMAGE_SEMAPHORE = asyncio.Semaphore(OLX_HTTP_IMAGE_CONCURRENCY)
-_SEND_SEMAPHORE = asyncio.Semaphore(OLX_SEND_CONCURRENCY)
-_UPSCALE_SEMAPHORE = asyncio.Semaphore(OLX_UPSCALE_CONCURRENCY)
+# Per-scraper limits, each also drawing on the market budgets shared with SHAFA.
+_GOVERNOR = shared_resource_governor("market")
+_HTTP_HTML_SEMAPHORE = _GOVERNOR.network.limit("olx", OLX_HTTP_HTML_CONCURRENCY)
+_HTTP_IMAGE_SEMAPHORE = _GOVERNOR.network.limit("olx", OLX_HTTP_IMAGE_CONCURRENCY)
+_SEND_SEMAPHORE = _GOVERNOR.telegram.limit("olx", OLX_SEND_CONCURRENCY)
+_UPSCALE_SEMAPHORE = _GOVERNOR.cpu.limit("olx", OLX_UPSCALE_CONCURRENCY)
 _http_session: Optional[aiohttp.ClientSession] = None
-_ANALYTICS_SINK = AnalyticsSink()
+_ANALYTICS_SINK = AggregatingAnalyticsSink()
 MIN_PRICE_DIFF = 50
 MIN_PRICE_DIFF_PERCENT = 20.0
 NOTIFICATION_CLAIM_STALE_MINUTES = 120
@@ -561,10 +580,27 @@ _download_bytes = build_image_downloader(
     user_agent=RUN_USER_AGENT,
     accept_language=RUN_ACCEPT_LANGUAGE,
     logger=logger,
+    # OLX and SHAFA share one "market" image cache; stats surface in service health.
+    image_cache=shared_image_cache("market"),
+    # Oversized originals are swapped for a `;s=WxH` CDN variant within the pixel cap.
+    size_policy=ImageSizePolicy("olx", smaller_variant=olx_smaller_variant),
 )
 _send_photo_by_bytes = build_photo_sender(send_semaphore=_SEND_SEMAPHORE)
 # Keep image fallback policy centralized so transport fixes apply to both marketplace feeds.
 send_photo_with_upscale = build_media_sender(
+    is_valid_image_url=_is_valid_image_url,
+    download_bytes=_download_bytes,
+    send_message=send_message,
+    send_photo_by_bytes=_send_photo_by_bytes,
+    run_cpu_bound_fn=_GOVERNOR.cpu.bounded("olx", run_cpu_bound),
+    logger=logger,
+    min_upscale_dim=MARKET_IMAGE_UPSCALE_MIN_DIM,
+    max_dim=MARKET_IMAGE_UPSCALE_MAX_DIM,
+    upscale_factors=MARKET_IMAGE_UPSCALE_FACTORS,
+    source_kind="olx",
+    analytics_sink=_ANALYTICS_SINK,
+)
+media_stages = build_media_stages(
     is_valid_image_url=_is_valid_image_url,
     download_bytes=_download_bytes,
     send_message=send_message,
@@ -576,9 +612,18 @@ send_photo_with_upscale = build_media_sender(
     upscale_factors=MARKET_IMAGE_UPSCALE_FACTORS,
     source_kind="olx",
     analytics_sink=_ANALYTICS_SINK,
+    transform_semaphore=_UPSCALE_SEMAPHORE,
+    run_cpu_bound_batch_fn=run_cpu_bound_batch,
 )
 
 DB_FILE = OLX_ITEMS_DB_FILE
+# Cross-run duplicate-key memory, loaded by the first run in this process and saved
+# after every run.
+DUPLICATE_INDEX: Optional[DuplicateKeyIndex] = (
+    DuplicateKeyIndex(OLX_DUPLICATE_INDEX_FILE, capacity=MARKET_DUPLICATE_INDEX_CAPACITY)
+    if MARKET_DUPLICATE_INDEX_CAPACITY > 0
+    else None
+)
 
 def _apply_pragmas(conn: sqlite3.Connection):
     """Apply SQLite pragmas for better performance."""
@@ -652,191 +697,279 @@ async def db_init():
     await asyncio.to_thread(_db_init_sync)
 
 
+def _db() -> SQLiteConnectionManager:
+    # Resolved per call so tests and migrations that repoint DB_FILE get its manager.
+    return connection_manager_for(DB_FILE)
+
+
+def _db_get_item_in_conn(conn: sqlite3.Connection, item_id: str) -> Optional[Dict[str, Any]]:
+    cur = conn.execute("SELECT id, name, link, price_text, price_int, state, size, source, created_at, updated_at, last_sent_at FROM olx_items WHERE id = ?", (item_id,))
+    return dict(row) if (row := cur.fetchone()) else None
+
+
 def _db_get_item_sync(item_id: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, Any]]:
     """Get item from database."""
-    close_conn = conn is None
-    if close_conn:
-        conn = _db_connect()
-    try:
-        cur = conn.execute("SELECT id, name, link, price_text, price_int, state, size, source, created_at, updated_at, last_sent_at FROM olx_items WHERE id = ?", (item_id,))
-        return dict(row) if (row := cur.fetchone()) else None
-    finally:
-        if close_conn:
-            conn.close()
+    if conn is not None:
+        return _db_get_item_in_conn(conn, item_id)
+    return _db().read_sync(_db_get_item_in_conn, item_id)
 
 async def db_get_item(item_id: str) -> Optional[Dict[str, Any]]:
     """Async wrapper for getting item from database."""
-    return await asyncio.to_thread(_db_get_item_sync, item_id, None)
+    return await _db().read(_db_get_item_in_conn, item_id)
+
+def _db_upsert_item_in_conn(conn: sqlite3.Connection, item: OlxItem, source_name: str, touch_last_sent: bool) -> None:
+    conn.execute("""
+        INSERT INTO olx_items (id, name, link, price_text, price_int, state, size, source, created_at, updated_at, last_sent_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), CASE WHEN ? THEN datetime('now') ELSE NULL END)
+        ON CONFLICT(id) DO UPDATE SET
+            name=excluded.name, link=excluded.link, price_text=excluded.price_text, price_int=excluded.price_int,
+            state=excluded.state, size=excluded.size, source=excluded.source, updated_at=datetime('now'),
+            last_sent_at=CASE WHEN ? THEN datetime('now') ELSE last_sent_at END
+        """, (item.id, item.name, item.link, item.price_text, item.price_int, item.state, item.size, source_name, 1 if touch_last_sent else 0, 1 if touch_last_sent else 0))
+
+
+def _db_upsert_items_in_conn(conn: sqlite3.Connection, items: List[Tuple[OlxItem, bool]], source_name: str) -> None:
+    for item, touch_last_sent in items:
+        _db_upsert_item_in_conn(conn, item, source_name, touch_last_sent)
+
 
 def _db_upsert_item_sync(item: OlxItem, source_name: str, touch_last_sent: bool, conn: Optional[sqlite3.Connection] = None):
     """Upsert item to database."""
-    close_conn = conn is None
-    if close_conn:
-        conn = _db_connect()
-    try:
-        conn.execute("""
-            INSERT INTO olx_items (id, name, link, price_text, price_int, state, size, source, created_at, updated_at, last_sent_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), CASE WHEN ? THEN datetime('now') ELSE NULL END)
-            ON CONFLICT(id) DO UPDATE SET
-                name=excluded.name, link=excluded.link, price_text=excluded.price_text, price_int=excluded.price_int,
-                state=excluded.state, size=excluded.size, source=excluded.source, updated_at=datetime('now'),
-                last_sent_at=CASE WHEN ? THEN datetime('now') ELSE last_sent_at END
-            """, (item.id, item.name, item.link, item.price_text, item.price_int, item.state, item.size, source_name, 1 if touch_last_sent else 0, 1 if touch_last_sent else 0))
+    if conn is not None:
+        _db_upsert_item_in_conn(conn, item, source_name, touch_last_sent)
         conn.commit()
-    finally:
-        if close_conn:
-            conn.close()
+        return
+    _db().write_sync(_db_upsert_item_in_conn, item, source_name, touch_last_sent)
 
 async def db_upsert_item(item: OlxItem, source_name: str, touch_last_sent: bool):
     """Async wrapper for upserting item to database."""
-    await asyncio.to_thread(_db_upsert_item_sync, item, source_name, touch_last_sent, None)
+    await _db().write(_db_upsert_item_in_conn, item, source_name, touch_last_sent)
 
 
 def _notification_storage_key(key: Tuple[str, int]) -> str:
     return notification_storage_key(key)
 
 
-def _db_claim_notification_key_sync(item: OlxItem, source_name: str) -> bool:
+def _db_claim_notification_key_in_conn(conn: sqlite3.Connection, item: OlxItem, source_name: str) -> bool:
+    # Runs as a writer job, so the check and the claim share one write transaction.
     key = _duplicate_key(item.name, item.price_int)
     if key is None:
         return True
 
     storage_key = _notification_storage_key(key)
-    conn = _db_connect()
-    try:
-        conn.execute("BEGIN IMMEDIATE")
-        row = conn.execute(
-            """
-            SELECT state,
-                   CASE
-                       WHEN claimed_at IS NULL OR claimed_at <= datetime('now', ?)
-                       THEN 1 ELSE 0
-                   END AS is_stale
-            FROM olx_notifications
-            WHERE notification_key = ?
-            """,
-            (f"-{NOTIFICATION_CLAIM_STALE_MINUTES} minutes", storage_key),
-        ).fetchone()
-        if row is not None:
-            if row["state"] == "sent":
-                conn.commit()
-                return False
-            if row["state"] == "pending" and not bool(row["is_stale"]):
-                conn.commit()
-                return False
-        conn.execute(
-            """
-            INSERT INTO olx_notifications (
-                notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, 'pending', datetime('now'), NULL, NULL, datetime('now'))
-            ON CONFLICT(notification_key) DO UPDATE SET
-                item_id=excluded.item_id,
-                name=excluded.name,
-                price_int=excluded.price_int,
-                source=excluded.source,
-                state='pending',
-                claimed_at=datetime('now'),
-                sent_at=NULL,
-                telegram_message_id=NULL,
-                updated_at=datetime('now')
-            """,
-            (storage_key, item.id, item.name, item.price_int, source_name),
+    row = conn.execute(
+        """
+        SELECT state,
+               CASE
+                   WHEN claimed_at IS NULL OR claimed_at <= datetime('now', ?)
+                   THEN 1 ELSE 0
+               END AS is_stale
+        FROM olx_notifications
+        WHERE notification_key = ?
+        """,
+        (f"-{NOTIFICATION_CLAIM_STALE_MINUTES} minutes", storage_key),
+    ).fetchone()
+    if row is not None:
+        if row["state"] == "sent":
+            return False
+        if row["state"] == "pending" and not bool(row["is_stale"]):
+            return False
+    conn.execute(
+        """
+        INSERT INTO olx_notifications (
+            notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
         )
-        conn.commit()
+        VALUES (?, ?, ?, ?, ?, 'pending', datetime('now'), NULL, NULL, datetime('now'))
+        ON CONFLICT(notification_key) DO UPDATE SET
+            item_id=excluded.item_id,
+            name=excluded.name,
+            price_int=excluded.price_int,
+            source=excluded.source,
+            state='pending',
+            claimed_at=datetime('now'),
+            sent_at=NULL,
+            telegram_message_id=NULL,
+            updated_at=datetime('now')
+        """,
+        (storage_key, item.id, item.name, item.price_int, source_name),
+    )
+    return True
+
+
+def _db_claim_notification_key_sync(item: OlxItem, source_name: str) -> bool:
+    if _duplicate_key(item.name, item.price_int) is None:
         return True
-    finally:
-        conn.close()
+    return _db().write_sync(_db_claim_notification_key_in_conn, item, source_name)
 
 
 async def db_claim_notification_key(item: OlxItem, source_name: str) -> bool:
-    return await asyncio.to_thread(_db_claim_notification_key_sync, item, source_name)
+    if _duplicate_key(item.name, item.price_int) is None:
+        return True
+    return await _db().write(_db_claim_notification_key_in_conn, item, source_name)
+
+_CLAIM_NOTIFICATION_RETURNING_SQL = """
+    INSERT INTO olx_notifications (
+        notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, 'pending', datetime('now'), NULL, NULL, datetime('now'))
+    ON CONFLICT(notification_key) DO UPDATE SET
+        item_id=excluded.item_id,
+        name=excluded.name,
+        price_int=excluded.price_int,
+        source=excluded.source,
+        state='pending',
+        claimed_at=datetime('now'),
+        sent_at=NULL,
+        telegram_message_id=NULL,
+        updated_at=datetime('now')
+    WHERE olx_notifications.state <> 'sent'
+      AND NOT (olx_notifications.state = 'pending' AND olx_notifications.claimed_at > datetime('now', ?))
+    RETURNING notification_key
+"""
+
+
+def _db_claim_notification_keys_in_conn(conn: sqlite3.Connection, items: List[OlxItem], source_name: str) -> set[str]:
+    """Claim many notification keys in one transaction; returns the claimed item ids."""
+    claimed: set[str] = set()
+    stale_cutoff = f"-{NOTIFICATION_CLAIM_STALE_MINUTES} minutes"
+    for item in items:
+        key = _duplicate_key(item.name, item.price_int)
+        if key is None:
+            claimed.add(item.id)
+            continue
+        # The conditional upsert only returns a row when the claim was taken, so a
+        # second item with the same key in this batch sees the fresh pending row.
+        row = conn.execute(
+            _CLAIM_NOTIFICATION_RETURNING_SQL,
+            (_notification_storage_key(key), item.id, item.name, item.price_int, source_name, stale_cutoff),
+        ).fetchone()
+        if row is not None:
+            claimed.add(item.id)
+    return claimed
 
 
-def _db_mark_notification_sent_sync(item: OlxItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
+def _db_claim_notification_keys_sync(items: List[OlxItem], source_name: str) -> set[str]:
+    if not any(_duplicate_key(item.name, item.price_int) for item in items):
+        return {item.id for item in items}
+    return _db().write_sync(_db_claim_notification_keys_in_conn, items, source_name)
+
+
+async def db_claim_notification_keys(items: List[OlxItem], source_name: str) -> set[str]:
+    if not any(_duplicate_key(item.name, item.price_int) for item in items):
+        return {item.id for item in items}
+    return await _db().write(_db_claim_notification_keys_in_conn, items, source_name)
+
+
+def _db_mark_notification_sent_in_conn(
+    conn: sqlite3.Connection,
+    item: OlxItem,
+    source_name: str,
+    telegram_message_id: Optional[int] = None,
+) -> None:
     key = _duplicate_key(item.name, item.price_int)
     if key is None:
         return
     storage_key = _notification_storage_key(key)
-    with _db_connect() as conn:
-        conn.execute(
-            """
-            INSERT INTO olx_notifications (
-                notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, 'sent', datetime('now'), datetime('now'), ?, datetime('now'))
-            ON CONFLICT(notification_key) DO UPDATE SET
-                item_id=excluded.item_id,
-                name=excluded.name,
-                price_int=excluded.price_int,
-                source=excluded.source,
-                state='sent',
-                sent_at=datetime('now'),
-                telegram_message_id=excluded.telegram_message_id,
-                updated_at=datetime('now')
-            """,
-            (storage_key, item.id, item.name, item.price_int, source_name, telegram_message_id),
+    conn.execute(
+        """
+        INSERT INTO olx_notifications (
+            notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
         )
-        conn.commit()
+        VALUES (?, ?, ?, ?, ?, 'sent', datetime('now'), datetime('now'), ?, datetime('now'))
+        ON CONFLICT(notification_key) DO UPDATE SET
+            item_id=excluded.item_id,
+            name=excluded.name,
+            price_int=excluded.price_int,
+            source=excluded.source,
+            state='sent',
+            sent_at=datetime('now'),
+            telegram_message_id=excluded.telegram_message_id,
+            updated_at=datetime('now')
+        """,
+        (storage_key, item.id, item.name, item.price_int, source_name, telegram_message_id),
+    )
+
+
+def _db_mark_notification_sent_sync(item: OlxItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
+    if _duplicate_key(item.name, item.price_int) is None:
+        return
+    _db().write_sync(_db_mark_notification_sent_in_conn, item, source_name, telegram_message_id)
 
 
 async def db_mark_notification_sent(item: OlxItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
-    await asyncio.to_thread(_db_mark_notification_sent_sync, item, source_name, telegram_message_id)
+    if _duplicate_key(item.name, item.price_int) is None:
+        return
+    await _db().write(_db_mark_notification_sent_in_conn, item, source_name, telegram_message_id)
 
 
-def _db_release_notification_claim_sync(item: OlxItem, source_name: str) -> None:
+def _db_release_notification_claim_in_conn(conn: sqlite3.Connection, item: OlxItem, source_name: str) -> None:
     key = _duplicate_key(item.name, item.price_int)
     if key is None:
         return
     storage_key = _notification_storage_key(key)
-    with _db_connect() as conn:
-        conn.execute(
-            """
-            UPDATE olx_notifications
-            SET item_id = ?,
-                name = ?,
-                price_int = ?,
-                source = ?,
-                state = 'failed',
-                telegram_message_id = NULL,
-                updated_at = datetime('now')
-            WHERE notification_key = ?
-            """,
-            (item.id, item.name, item.price_int, source_name, storage_key),
-        )
-        conn.commit()
+    conn.execute(
+        """
+        UPDATE olx_notifications
+        SET item_id = ?,
+            name = ?,
+            price_int = ?,
+            source = ?,
+            state = 'failed',
+            telegram_message_id = NULL,
+            updated_at = datetime('now')
+        WHERE notification_key = ?
+        """,
+        (item.id, item.name, item.price_int, source_name, storage_key),
+    )
+
+
+def _db_release_notification_claim_sync(item: OlxItem, source_name: str) -> None:
+    if _duplicate_key(item.name, item.price_int) is None:
+        return
+    _db().write_sync(_db_release_notification_claim_in_conn, item, source_name)
 
 
 async def db_release_notification_claim(item: OlxItem, source_name: str) -> None:
-    await asyncio.to_thread(_db_release_notification_claim_sync, item, source_name)
+    if _duplicate_key(item.name, item.price_int) is None:
+        return
+    await _db().write(_db_release_notification_claim_in_conn, item, source_name)
+
+
+_EXISTING_ITEM_COLUMNS = (
+    "id", "name", "link", "price_text", "price_int", "state", "size", "source",
+    "created_at", "updated_at", "last_sent_at",
+)
+
+
+def _db_fetch_existing_in_conn(conn: sqlite3.Connection, item_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Fetch existing items with one batch query."""
+    if not item_ids:
+        return []
+    # Batch query using IN clause - much faster than N individual queries
+    placeholders = ','.join('?' * len(item_ids))
+    query = f"SELECT {', '.join(_EXISTING_ITEM_COLUMNS)} FROM olx_items WHERE id IN ({placeholders})"
+    rows = conn.execute(query, item_ids).fetchall()
+
+    # Build lookup dict for O(1) access
+    items_dict = {row['id']: dict(row) for row in rows}
+
+    # Return results in same order as input item_ids (preserving None for missing items)
+    return [items_dict.get(item_id) for item_id in item_ids]
 
 
 def _db_fetch_existing_sync(item_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
-    """Fetch existing items using a single shared connection with batch query."""
     if not item_ids:
         return []
-    
-    conn = _db_connect()
-    try:
-        # Batch query using IN clause - much faster than N individual queries
-        placeholders = ','.join('?' * len(item_ids))
-        query = f"SELECT id, name, link, price_text, price_int, state, size, source, created_at, updated_at, last_sent_at FROM olx_items WHERE id IN ({placeholders})"
-        rows = conn.execute(query, item_ids).fetchall()
-        
-        # Build lookup dict for O(1) access
-        items_dict = {row['id']: dict(row) for row in rows}
-        
-        # Return results in same order as input item_ids (preserving None for missing items)
-        return [items_dict.get(item_id) for item_id in item_ids]
-    finally:
-        conn.close()
+    return _db().read_sync(_db_fetch_existing_in_conn, item_ids)
 
 async def db_fetch_existing(item_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
     """Async wrapper for fetching existing items from the database."""
-    return await asyncio.to_thread(_db_fetch_existing_sync, item_ids)
+    if not item_ids:
+        return []
+    return await _db().read(_db_fetch_existing_in_conn, item_ids)
 
 
-def _db_fetch_duplicate_keys_sync(items: List[OlxItem]) -> set[Tuple[str, int]]:
+def _db_fetch_duplicate_keys_in_conn(conn: sqlite3.Connection, items: List[OlxItem]) -> set[Tuple[str, int]]:
     candidate_map: Dict[Tuple[str, int], set[str]] = {}
     for item in items:
         if key := _duplicate_key(item.name, item.price_int):
@@ -844,76 +977,142 @@ def _db_fetch_duplicate_keys_sync(items: List[OlxItem]) -> set[Tuple[str, int]]:
     if not candidate_map:
         return set()
 
-    conn = _db_connect()
+    prices = sorted({price for _, price in candidate_map})
+    placeholders = ",".join("?" * len(prices))
+    query = f"SELECT id, name, price_int FROM olx_items WHERE price_int IN ({placeholders})"
+    rows = conn.execute(query, prices).fetchall()
+    notification_query = f"""
+        SELECT notification_key, name, price_int
+        FROM olx_notifications
+        WHERE price_int IN ({placeholders}) AND state IN ('pending', 'sent')
+    """
+    notification_rows = conn.execute(notification_query, prices).fetchall()
+    duplicates: set[Tuple[str, int]] = set()
+    for row in rows:
+        row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
+        if row_key is None or row_key not in candidate_map:
+            continue
+        if str(row["id"]) not in candidate_map[row_key]:
+            duplicates.add(row_key)
+    for row in notification_rows:
+        row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
+        if row_key is not None and row_key in candidate_map:
+            duplicates.add(row_key)
+    return duplicates
+
+
+def _db_fetch_duplicate_keys_sync(items: List[OlxItem]) -> set[Tuple[str, int]]:
+    if not any(_duplicate_key(item.name, item.price_int) for item in items):
+        return set()
+    return _db().read_sync(_db_fetch_duplicate_keys_in_conn, items)
+
+
+async def db_fetch_duplicate_keys(items: List[OlxItem]) -> set[Tuple[str, int]]:
+    if not any(_duplicate_key(item.name, item.price_int) for item in items):
+        return set()
+    return await _db().read(_db_fetch_duplicate_keys_in_conn, items)
+
+
+def _db_prefetch_state_in_conn(
+    conn: sqlite3.Connection,
+    items: List[OlxItem],
+    duplicate_index: Optional[DuplicateKeyIndex] = None,
+) -> PrefetchedState:
+    attach_unsubscribe_db(conn)
+    # One read transaction so existing rows, duplicate keys and unsubscribes come
+    # from the same snapshot; the temp candidate rows are discarded on rollback.
+    conn.execute("BEGIN")
     try:
-        prices = sorted({price for _, price in candidate_map})
-        placeholders = ",".join("?" * len(prices))
-        query = f"SELECT id, name, price_int FROM olx_items WHERE price_int IN ({placeholders})"
-        rows = conn.execute(query, prices).fetchall()
-        notification_query = f"""
-            SELECT notification_key, name, price_int
-            FROM olx_notifications
-            WHERE price_int IN ({placeholders}) AND state IN ('pending', 'sent')
-        """
-        notification_rows = conn.execute(notification_query, prices).fetchall()
-        duplicates: set[Tuple[str, int]] = set()
-        for row in rows:
-            row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
-            if row_key is None or row_key not in candidate_map:
-                continue
-            if str(row["id"]) not in candidate_map[row_key]:
-                duplicates.add(row_key)
-        for row in notification_rows:
-            row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
-            if row_key is not None and row_key in candidate_map:
-                duplicates.add(row_key)
-        return duplicates
+        return prefetch_state_in_conn(
+            conn,
+            items,
+            source_kind="olx",
+            items_table="olx_items",
+            notifications_table="olx_notifications",
+            existing_columns=_EXISTING_ITEM_COLUMNS,
+            unsubscribe_schema=UNSUBSCRIBE_SCHEMA,
+            duplicate_index=duplicate_index,
+        )
     finally:
-        conn.close()
+        conn.rollback()
 
 
-async def db_fetch_duplicate_keys(items: List[OlxItem]) -> set[Tuple[str, int]]:
-    return await asyncio.to_thread(_db_fetch_duplicate_keys_sync, items)
+def _db_prefetch_state_sync(items: List[OlxItem], duplicate_index: Optional[DuplicateKeyIndex] = None) -> PrefetchedState:
+    return _db().read_sync(_db_prefetch_state_in_conn, items, duplicate_index)
+
+
+async def db_prefetch_state(items: List[OlxItem], duplicate_index: Optional[DuplicateKeyIndex] = None) -> PrefetchedState:
+    return await _db().read(_db_prefetch_state_in_conn, items, duplicate_index)
+
+
+def _db_duplicate_keys_since_sync(since: Optional[str]) -> List[Tuple[str, int]]:
+    return _db().read_sync(
+        duplicate_keys_since_in_conn, since, items_table="olx_items", notifications_table="olx_notifications"
+    )
+
+
+def _db_get_source_stats_in_conn(conn: sqlite3.Connection, url: str) -> Dict[str, int]:
+    row = conn.execute("SELECT no_items_streak, cycle_count FROM olx_sources WHERE url = ?", (url,)).fetchone()
+    if row:
+        return {"streak": row[0], "cycle_count": row[1]}
+    return {"streak": 0, "cycle_count": 0}
 
 
 def _db_get_source_stats_sync(url: str) -> Dict[str, int]:
-    with _db_connect() as conn:
-        cur = conn.execute("SELECT no_items_streak, cycle_count FROM olx_sources WHERE url = ?", (url,))
-        row = cur.fetchone()
-        if row:
-            return {"streak": row[0], "cycle_count": row[1]}
-        return {"streak": 0, "cycle_count": 0}
+    return _db().read_sync(_db_get_source_stats_in_conn, url)
 
 async def db_get_source_stats(url: str) -> Dict[str, int]:
-    return await asyncio.to_thread(_db_get_source_stats_sync, url)
+    return await _db().read(_db_get_source_stats_in_conn, url)
+
+def _db_update_source_stats_in_conn(conn: sqlite3.Connection, url: str, streak: int, cycle_count: int) -> None:
+    conn.execute("""
+        INSERT INTO olx_sources (url, no_items_streak, cycle_count, last_checked_at)
+        VALUES (?, ?, ?, datetime('now'))
+        ON CONFLICT(url) DO UPDATE SET
+            no_items_streak=excluded.no_items_streak,
+            cycle_count=excluded.cycle_count,
+            last_checked_at=datetime('now')
+    """, (url, streak, cycle_count))
+
 
 def _db_update_source_stats_sync(url: str, streak: int, cycle_count: int):
-    with _db_connect() as conn:
-        conn.execute("""
-            INSERT INTO olx_sources (url, no_items_streak, cycle_count, last_checked_at)
-            VALUES (?, ?, ?, datetime('now'))
-            ON CONFLICT(url) DO UPDATE SET
-                no_items_streak=excluded.no_items_streak,
-                cycle_count=excluded.cycle_count,
-                last_checked_at=datetime('now')
-        """, (url, streak, cycle_count))
-        conn.commit()
+    _db().write_sync(_db_update_source_stats_in_conn, url, streak, cycle_count)
 
 async def db_update_source_stats(url: str, streak: int, cycle_count: int):
-    await asyncio.to_thread(_db_update_source_stats_sync, url, streak, cycle_count)
+    await _db().write(_db_update_source_stats_in_conn, url, streak, cycle_count)
 
 
 class OlxRepository(MarketplaceRepository[OlxItem]):
     # The repository contract keeps OLX storage separate while letting the shared pipeline
     # drive persistence and idempotency in the same order as SHAFA.
+    def __init__(self, *, duplicate_index: Optional[DuplicateKeyIndex] = None) -> None:
+        self._duplicate_index = duplicate_index
+
+    def _remember(self, item: OlxItem, *, stored: bool) -> None:
+        if self._duplicate_index is not None:
+            self._duplicate_index.add(_duplicate_key(item.name, item.price_int), item.id if stored else None)
+
     async def fetch_existing(self, item_ids: list[str]) -> list[Optional[Dict[str, Any]]]:
         return await db_fetch_existing(item_ids)
 
     async def fetch_duplicate_keys(self, items: list[OlxItem]) -> set[Tuple[str, int]]:
         return await db_fetch_duplicate_keys(items)
 
+    async def prefetch_state(self, items: list[OlxItem]) -> PrefetchedState:
+        return await db_prefetch_state(items, self._duplicate_index)
+
     async def claim_notification_key(self, item: OlxItem, source_name: str) -> bool:
-        return await db_claim_notification_key(item, source_name)
+        claimed = await db_claim_notification_key(item, source_name)
+        if claimed:
+            self._remember(item, stored=False)
+        return claimed
+
+    async def claim_notification_keys(self, items: list[OlxItem], source_name: str) -> set[str]:
+        claimed = await db_claim_notification_keys(items, source_name)
+        for item in items:
+            if item.id in claimed:
+                self._remember(item, stored=False)
+        return claimed
 
     async def mark_notification_sent(self, item: OlxItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
         await db_mark_notification_sent(item, source_name, telegram_message_id)
@@ -922,8 +1121,11 @@ class OlxRepository(MarketplaceRepository[OlxItem]):
         await db_release_notification_claim(item, source_name)
 
     async def persist_items(self, updates: list[ItemUpdate[OlxItem]], source_name: str) -> None:
+        if not updates:
+            return
+        await _db().write(_db_upsert_items_in_conn, [(update.item, update.touch_last_sent) for update in updates], source_name)
         for update in updates:
-            await db_upsert_item(update.item, source_name, update.touch_last_sent)
+            self._remember(update.item, stored=True)
 
     async def get_source_stats(self, url: str) -> SourceStats:
         stats = await db_get_source_stats(url)
@@ -967,7 +1169,9 @@ async def _legacy_run_olx_scraper():
         _add_error(f"DB init failed: {e}")
         return "; ".join(dict.fromkeys(errors))
 
-    bot = Bot(token=token)
+    # Process-wide bot: it outlives this run and is shut down by the service
+    # (telegram_runtime.shutdown_shared_bots), never by the scraper.
+    bot = build_marketplace_bot(token)
     db_conn = None
     db_lock = asyncio.Lock()
     run_seen_duplicate_keys: set[Tuple[str, int]] = set()
@@ -1190,14 +1394,6 @@ async def _legacy_run_olx_scraper():
             except Exception:
                 pass
             _http_session = None
-        try:
-            await bot.shutdown()
-        except Exception:
-            pass
-        try:
-            await bot.close()
-        except Exception:
-            pass
 
 
 async def run_olx_scraper():
@@ -1225,27 +1421,33 @@ async def run_olx_scraper():
         _add_error(f"DB init failed: {exc}")
         return "; ".join(dict.fromkeys(errors))
 
+    # Process-wide bot: it outlives this run and is shut down by the service
+    # (telegram_runtime.shutdown_shared_bots), never by the scraper.
     bot = build_marketplace_bot(token)
     # The adapter still owns OLX fetch/parse quirks, but post-parse decisions now flow
     # through the shared marketplace pipeline for parity with SHAFA.
-    repository = OlxRepository()
+    duplicate_index = await load_duplicate_index(DUPLICATE_INDEX, _db_duplicate_keys_since_sync, logger=logger)
+    repository = OlxRepository(duplicate_index=duplicate_index)
     duplicate_tracker = RunDuplicateTracker[OlxItem]()
     total_scraped = 0
     total_without_images = 0
     pipeline_totals = PipelineStats()
 
-    async def _send_item(item: OlxItem, text: str, source_name: str) -> DeliveryResult:
+    async def _resolve_image_url(item: OlxItem) -> Optional[str]:
         nonlocal total_without_images
+        image_url = item.first_image_url
+        if not image_url:
+            image_url = await fetch_first_image_best(item.link)
+            if image_url:
+                item.first_image_url = image_url
+        if not image_url:
+            logger.warning("No image available for item %s", item.id)
+            total_without_images += 1
+        return image_url
+
+    async def _guard_send(item: OlxItem, send_coro) -> DeliveryResult:
         try:
-            image_url = item.first_image_url
-            if not image_url:
-                image_url = await fetch_first_image_best(item.link)
-                if image_url:
-                    item.first_image_url = image_url
-            if not image_url:
-                logger.warning("No image available for item %s", item.id)
-                total_without_images += 1
-            delivery = await send_photo_with_upscale(bot, default_chat, text, image_url, source_name=source_name)
+            delivery = await send_coro
             await asyncio.sleep(0.2)
             return delivery
         except RetryAfter as exc:
@@ -1260,6 +1462,41 @@ async def run_olx_scraper():
             _add_error(f"Send item error: {exc}")
         return DeliveryResult(delivered=False, failure_reason="send_exception", retry_later=True)
 
+    async def _send_item(item: OlxItem, text: str, source_name: str) -> DeliveryResult:
+        async def _send() -> DeliveryResult:
+            image_url = await _resolve_image_url(item)
+            return await send_photo_with_upscale(bot, default_chat, text, image_url, source_name=source_name)
+
+        return await _guard_send(item, _send())
+
+    async def _download_image(item: OlxItem, source_name: str):
+        try:
+            return await media_stages.download(await _resolve_image_url(item), source_name=source_name)
+        except Exception as exc:
+            logger.error("Failed to send item %s: %s", item.id, exc)
+            _add_error(f"Send item error: {exc}")
+            raise
+
+    async def _send_prepared(item: OlxItem, text: str, source_name: str, prepared) -> DeliveryResult:
+        return await _guard_send(item, media_stages.send(bot, default_chat, text, prepared, source_name=source_name))
+
+    # Detail-page image lookups and downloads run at image-HTTP concurrency while the
+    # upscale and Telegram stages keep their own (deliberately small) limits.
+    delivery_stages = DeliveryStages[OlxItem](
+        download=_download_image,
+        transform=lambda item, prepared, source_name: media_stages.transform(prepared, source_name=source_name),
+        transform_batch=lambda jobs, source_name: media_stages.transform_batch(
+            [prepared for _, prepared in jobs], source_name=source_name
+        ),
+        transform_batch_size=MARKET_PIPELINE_TRANSFORM_BATCH_SIZE,
+        send=_send_prepared,
+        download_concurrency=OLX_HTTP_IMAGE_CONCURRENCY,
+        transform_concurrency=OLX_UPSCALE_CONCURRENCY,
+        send_concurrency=OLX_SEND_CONCURRENCY,
+        queue_size=MARKET_PIPELINE_QUEUE_SIZE,
+        persist_batch_size=MARKET_PIPELINE_PERSIST_BATCH_SIZE,
+    )
+
     async def _process_entry(entry: Dict[str, Any]) -> None:
         nonlocal total_scraped
         url = entry.get("url")
@@ -1319,6 +1556,7 @@ async def run_olx_scraper():
                 send_item=_send_item,
                 analytics_sink=_ANALYTICS_SINK,
                 logger=logger,
+                delivery_stages=delivery_stages,
             )
             pipeline_totals.add(pipeline_stats)
             run_stats.inc("sources_with_items")
@@ -1424,6 +1662,9 @@ async def run_olx_scraper():
             "total_send_failed",
         ):
             run_stats.set_field(field, getattr(pipeline_totals, field))
+        run_stats.set_field("pipeline_stages", pipeline_totals.stage_summary())
+        if duplicate_index is not None:
+            run_stats.set_field("duplicate_index", duplicate_index.stats.to_dict())
         run_stats.set_coverage(
             expected=len(sources),
             attempted=run_stats.counters.get("sources_attempted", 0),
@@ -1465,20 +1706,14 @@ async def run_olx_scraper():
         return ""
     finally:
         global _http_session
+        run_stats.stop_profiling()
         if _http_session is not None and not _http_session.closed:
             try:
                 await _http_session.close()
             except Exception:
                 pass
             _http_session = None
-        try:
-            await bot.shutdown()
-        except Exception:
-            pass
-        try:
-            await bot.close()
-        except Exception:
-            pass
+        await save_duplicate_index(duplicate_index, logger=logger)
 
 
 
@@ -4,7 +4,7 @@ import json
 import sqlite3
 from pathlib import Path
 
-from helpers.sqlite_runtime import apply_runtime_pragmas
+from helpers.sqlite_runtime import apply_runtime_pragmas, connection_manager_for
 from second_brain_bot.models import ActionRecord, NoteRecord, RelationRecord, SearchResult
 
 
@@ -20,6 +20,10 @@ class SecondBrainIndex:
         apply_runtime_pragmas(conn)
         return conn
 
+    def _reader(self) -> sqlite3.Connection:
+        # The calling thread's pooled connection; writes go through the shared writer.
+        return connection_manager_for(self.db_path).reader()
+
     def _init_db(self) -> None:
         with self._connect() as conn:
             conn.execute(
@@ -70,7 +74,7 @@ class SecondBrainIndex:
             )
 
     def upsert_note(self, note: NoteRecord) -> None:
-        with self._connect() as conn:
+        def _write(conn: sqlite3.Connection) -> None:
             conn.execute(
                 """
                 INSERT INTO notes (
@@ -105,8 +109,10 @@ class SecondBrainIndex:
                 (note.note_id, note.title, " ".join(note.tags), " ".join(note.entities), note.body),
             )
 
+        connection_manager_for(self.db_path).write_sync(_write)
+
     def get_note(self, note_id: str) -> SearchResult | None:
-        with self._connect() as conn:
+        with self._reader() as conn:
             row = conn.execute("SELECT * FROM notes WHERE note_id = ?", (note_id,)).fetchone()
         if row is None:
             return None
@@ -117,7 +123,7 @@ class SecondBrainIndex:
         if not query:
             return []
         fts_query = _fts_query(query)
-        with self._connect() as conn:
+        with self._reader() as conn:
             rows = conn.execute(
                 """
                 SELECT notes.*
@@ -160,7 +166,7 @@ class SecondBrainIndex:
         return ordered[: int(limit)]
 
     def recent_notes(self, *, limit: int = 10, status: str | None = None) -> list[SearchResult]:
-        with self._connect() as conn:
+        with self._reader() as conn:
             if status:
                 rows = conn.execute(
                     "SELECT * FROM notes WHERE status = ? ORDER BY created_at DESC LIMIT ?",
@@ -171,7 +177,7 @@ class SecondBrainIndex:
         return [self._row_to_result(row) for row in rows]
 
     def stale_inbox(self, *, limit: int = 20) -> list[SearchResult]:
-        with self._connect() as conn:
+        with self._reader() as conn:
             rows = conn.execute(
                 "SELECT * FROM notes WHERE status IN ('Incubating', 'needs_manual_review') ORDER BY created_at ASC LIMIT ?",
                 (int(limit),),
@@ -179,7 +185,7 @@ class SecondBrainIndex:
         return [self._row_to_result(row) for row in rows]
 
     def upsert_relation(self, relation: RelationRecord) -> None:
-        with self._connect() as conn:
+        def _write(conn: sqlite3.Connection) -> None:
             conn.execute(
                 """
                 INSERT INTO relations(source_note_id, target_note_id, target_title, reason, confidence)
@@ -198,8 +204,10 @@ class SecondBrainIndex:
                 ),
             )
 
+        connection_manager_for(self.db_path).write_sync(_write)
+
     def relations_for(self, note_id: str) -> list[RelationRecord]:
-        with self._connect() as conn:
+        with self._reader() as conn:
             rows = conn.execute(
                 "SELECT * FROM relations WHERE source_note_id = ? ORDER BY confidence DESC",
                 (note_id,),
@@ -216,7 +224,7 @@ class SecondBrainIndex:
         ]
 
     def upsert_actions_for_note(self, note_id: str, actions: list[ActionRecord]) -> None:
-        with self._connect() as conn:
+        def _write(conn: sqlite3.Connection) -> None:
             conn.execute("DELETE FROM actions WHERE note_id = ?", (note_id,))
             for action in actions:
                 conn.execute(
@@ -239,9 +247,11 @@ class SecondBrainIndex:
                     ),
                 )
 
+        connection_manager_for(self.db_path).write_sync(_write)
+
     def search_actions(self, query: str = "", *, limit: int = 10, status: str = "open") -> list[ActionRecord]:
         terms = [part.strip().lower() for part in (query or "").split() if len(part.strip()) >= 3][:8]
-        with self._connect() as conn:
+        with self._reader() as conn:
             if terms and not _looks_generic_task_query(query):
                 clauses = []
                 params: list[object] = []
@@ -297,7 +307,7 @@ class SecondBrainIndex:
             )
             params.extend([like, like, like, like])
         params.extend([exclude_note_id, exclude_note_id, int(limit)])
-        with self._connect() as conn:
+        with self._reader() as conn:
             rows = conn.execute(
                 f"""
                 SELECT *
@@ -316,7 +326,7 @@ class SecondBrainIndex:
         if not note_ids:
             return []
         placeholders = ",".join("?" for _ in note_ids)
-        with self._connect() as conn:
+        with self._reader() as conn:
             rows = conn.execute(
                 f"""
                 SELECT DISTINCT notes.*
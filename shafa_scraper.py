@@ -22,13 +22,18 @@ from config import (
     MARKET_IMAGE_UPSCALE_MIN_DIM,
     MARKET_IMAGE_UPSCALE_MAX_DIM,
     MARKET_IMAGE_UPSCALE_FACTORS,
+    MARKET_DUPLICATE_INDEX_CAPACITY,
+    MARKET_PIPELINE_PERSIST_BATCH_SIZE,
+    MARKET_PIPELINE_TRANSFORM_BATCH_SIZE,
+    MARKET_PIPELINE_QUEUE_SIZE,
 )
 from config_shafa_urls import SHAFA_URLS
-from helpers.analytics_events import AnalyticsSink
+from helpers.analytics_events import AggregatingAnalyticsSink
 from helpers.dynamic_sources import load_dynamic_urls, merge_sources
 from helpers.marketplace_core import (
     DeliveryResult,
     MarketplaceItem,
+    PrefetchedState,
     SourceStats,
     duplicate_key,
     finished_source_decision,
@@ -36,6 +41,7 @@ from helpers.marketplace_core import (
     notification_storage_key,
 )
 from helpers.marketplace_pipeline import (
+    DeliveryStages,
     ItemDecision,
     ItemUpdate,
     MarketplaceRepository,
@@ -50,14 +56,21 @@ from helpers.marketplace_sender import (
     build_image_downloader,
     build_marketplace_bot,
     build_media_sender,
+    build_media_stages,
     build_message_sender,
     build_photo_sender,
 )
-from helpers.process_pool import run_cpu_bound
-from helpers.scraper_unsubscribes import fetch_unsubscribed_ids
-from helpers.runtime_paths import SCRAPER_RUNS_JSONL_FILE, SHAFA_ITEMS_DB_FILE
+from helpers.process_pool import run_cpu_bound, run_cpu_bound_batch
+from helpers.resource_governor import shared_resource_governor
+from helpers.image_cache import shared_image_cache
+from helpers.image_stream import ImageSizePolicy
+from helpers.duplicate_index import DuplicateKeyIndex, load_duplicate_index, save_duplicate_index
+from helpers.marketplace_prefetch import duplicate_keys_since_in_conn, prefetch_state_in_conn
+from helpers.scraper_unsubscribes import UNSUBSCRIBE_SCHEMA, attach_unsubscribe_db, fetch_unsubscribed_ids
+from helpers.runtime_paths import SCRAPER_RUNS_JSONL_FILE, SHAFA_DUPLICATE_INDEX_FILE, SHAFA_ITEMS_DB_FILE
 from helpers.scraper_stats import RunStatsCollector, utc_now_iso
-from helpers.sqlite_runtime import apply_runtime_pragmas
+from helpers.sqlite_runtime import SQLiteConnectionManager, apply_runtime_pragmas, connection_manager_for
+from helpers.telegram_runtime import shutdown_shared_bots
 
 try:
     from playwright.async_api import async_playwright
@@ -80,11 +93,13 @@ if not PLAYWRIGHT_AVAILABLE:
     logger.warning("Playwright is not installed. Run: pip install playwright && playwright install chromium")
 
 BASE_SHAFA = "https://shafa.ua"
-_ANALYTICS_SINK = AnalyticsSink()
+_ANALYTICS_SINK = AggregatingAnalyticsSink()
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124 Safari/537.36"
-_HTTP_SEMAPHORE = asyncio.Semaphore(SHAFA_HTTP_CONCURRENCY)
-_SEND_SEMAPHORE = asyncio.Semaphore(SHAFA_SEND_CONCURRENCY)
-_UPSCALE_SEMAPHORE = asyncio.Semaphore(SHAFA_UPSCALE_CONCURRENCY)
+# Per-scraper limits, each also drawing on the market budgets shared with OLX.
+_GOVERNOR = shared_resource_governor("market")
+_HTTP_SEMAPHORE = _GOVERNOR.network.limit("shafa", SHAFA_HTTP_CONCURRENCY)
+_SEND_SEMAPHORE = _GOVERNOR.telegram.limit("shafa", SHAFA_SEND_CONCURRENCY)
+_UPSCALE_SEMAPHORE = _GOVERNOR.cpu.limit("shafa", SHAFA_UPSCALE_CONCURRENCY)
 _PLAYWRIGHT_SEMAPHORE = asyncio.Semaphore(SHAFA_PLAYWRIGHT_CONCURRENCY)  # Limit concurrent browser instances
 _http_session: Optional[aiohttp.ClientSession] = None
 _playwright_runtime: Optional[PlaywrightRuntimeManager] = None
@@ -497,10 +512,25 @@ _download_bytes = build_image_downloader(
     user_agent=RUN_USER_AGENT,
     accept_language=RUN_ACCEPT_LANGUAGE,
     logger=logger,
+    image_cache=shared_image_cache("market"),
+    size_policy=ImageSizePolicy("shafa"),
 )
 _send_photo_by_bytes = build_photo_sender(send_semaphore=_SEND_SEMAPHORE)
 # Use the shared sender so SHAFA and OLX keep identical image fallback and timeout rules.
 send_photo_with_upscale = build_media_sender(
+    is_valid_image_url=_is_valid_image_url,
+    download_bytes=_download_bytes,
+    send_message=send_message,
+    send_photo_by_bytes=_send_photo_by_bytes,
+    run_cpu_bound_fn=_GOVERNOR.cpu.bounded("shafa", run_cpu_bound),
+    logger=logger,
+    min_upscale_dim=MARKET_IMAGE_UPSCALE_MIN_DIM,
+    max_dim=MARKET_IMAGE_UPSCALE_MAX_DIM,
+    upscale_factors=MARKET_IMAGE_UPSCALE_FACTORS,
+    source_kind="shafa",
+    analytics_sink=_ANALYTICS_SINK,
+)
+media_stages = build_media_stages(
     is_valid_image_url=_is_valid_image_url,
     download_bytes=_download_bytes,
     send_message=send_message,
@@ -512,9 +542,18 @@ send_photo_with_upscale = build_media_sender(
     upscale_factors=MARKET_IMAGE_UPSCALE_FACTORS,
     source_kind="shafa",
     analytics_sink=_ANALYTICS_SINK,
+    transform_semaphore=_UPSCALE_SEMAPHORE,
+    run_cpu_bound_batch_fn=run_cpu_bound_batch,
 )
 
 DB_FILE = SHAFA_ITEMS_DB_FILE
+# Cross-run duplicate-key memory, loaded by the first run in this process and saved
+# after every run.
+DUPLICATE_INDEX: Optional[DuplicateKeyIndex] = (
+    DuplicateKeyIndex(SHAFA_DUPLICATE_INDEX_FILE, capacity=MARKET_DUPLICATE_INDEX_CAPACITY)
+    if MARKET_DUPLICATE_INDEX_CAPACITY > 0
+    else None
+)
 
 def _apply_pragmas(conn: sqlite3.Connection):
     try:
@@ -528,6 +567,11 @@ def _db_connect() -> sqlite3.Connection:
     _apply_pragmas(conn)
     return conn
 
+def _db() -> SQLiteConnectionManager:
+    # Resolved per call so tests and migrations that repoint DB_FILE get its manager.
+    return connection_manager_for(DB_FILE)
+
+
 def _db_init_sync():
     with _db_connect() as conn:
         conn.execute("""
@@ -579,153 +623,224 @@ def _db_init_sync():
         conn.execute("CREATE INDEX IF NOT EXISTS idx_shafa_notifications_price_state ON shafa_notifications(price_int, state);")
         conn.commit()
 
+def _db_upsert_items_in_conn(conn: sqlite3.Connection, items: List[Tuple[ShafaItem, bool]], source_name: str) -> None:
+    conn.executemany("""
+        INSERT INTO shafa_items (id, name, link, price_text, price_int, brand, size, source, first_image_url, created_at, updated_at, last_sent_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), CASE WHEN ? THEN datetime('now') ELSE NULL END)
+        ON CONFLICT(id) DO UPDATE SET
+            name=excluded.name, link=excluded.link, price_text=excluded.price_text, price_int=excluded.price_int,
+            brand=excluded.brand, size=excluded.size, source=excluded.source, updated_at=datetime('now'),
+            first_image_url=CASE
+                WHEN excluded.first_image_url IS NOT NULL AND excluded.first_image_url <> '' THEN excluded.first_image_url
+                ELSE shafa_items.first_image_url
+            END,
+            last_sent_at=CASE WHEN ? THEN datetime('now') ELSE last_sent_at END
+        """, [
+            (item.id, item.name, item.link, item.price_text, item.price_int, item.brand, item.size, source_name, item.first_image_url,
+             1 if touch_last_sent else 0, 1 if touch_last_sent else 0)
+            for item, touch_last_sent in items
+        ])
+
+
 def _db_upsert_items_sync(items: List[Tuple[ShafaItem, bool]], source_name: str):
     if not items:
         return
-    with _db_connect() as conn:
-        conn.executemany("""
-            INSERT INTO shafa_items (id, name, link, price_text, price_int, brand, size, source, first_image_url, created_at, updated_at, last_sent_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'), CASE WHEN ? THEN datetime('now') ELSE NULL END)
-            ON CONFLICT(id) DO UPDATE SET
-                name=excluded.name, link=excluded.link, price_text=excluded.price_text, price_int=excluded.price_int,
-                brand=excluded.brand, size=excluded.size, source=excluded.source, updated_at=datetime('now'),
-                first_image_url=CASE
-                    WHEN excluded.first_image_url IS NOT NULL AND excluded.first_image_url <> '' THEN excluded.first_image_url
-                    ELSE shafa_items.first_image_url
-                END,
-                last_sent_at=CASE WHEN ? THEN datetime('now') ELSE last_sent_at END
-            """, [
-                (item.id, item.name, item.link, item.price_text, item.price_int, item.brand, item.size, source_name, item.first_image_url,
-                 1 if touch_last_sent else 0, 1 if touch_last_sent else 0)
-                for item, touch_last_sent in items
-            ])
-        conn.commit()
+    _db().write_sync(_db_upsert_items_in_conn, items, source_name)
 
 
 def _notification_storage_key(key: Tuple[str, int]) -> str:
     return f"{key[0]}\x1f{key[1]}"
 
 
-def _db_claim_notification_key_sync(item: ShafaItem, source_name: str) -> bool:
+def _db_claim_notification_key_in_conn(conn: sqlite3.Connection, item: ShafaItem, source_name: str) -> bool:
+    # Callers must already hold a write transaction (BEGIN IMMEDIATE) so the check and
+    # the claim cannot interleave with another writer.
     key = _duplicate_key(item.name, item.price_int)
     if key is None:
         return True
 
     storage_key = _notification_storage_key(key)
-    conn = _db_connect()
-    try:
-        conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+        """
+        SELECT state,
+               CASE
+                   WHEN claimed_at IS NULL OR claimed_at <= datetime('now', ?)
+                   THEN 1 ELSE 0
+               END AS is_stale
+        FROM shafa_notifications
+        WHERE notification_key = ?
+        """,
+        (f"-{NOTIFICATION_CLAIM_STALE_MINUTES} minutes", storage_key),
+    ).fetchone()
+    if row is not None:
+        if row["state"] == "sent":
+            return False
+        if row["state"] == "pending" and not bool(row["is_stale"]):
+            return False
+    conn.execute(
+        """
+        INSERT INTO shafa_notifications (
+            notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
+        )
+        VALUES (?, ?, ?, ?, ?, 'pending', datetime('now'), NULL, NULL, datetime('now'))
+        ON CONFLICT(notification_key) DO UPDATE SET
+            item_id=excluded.item_id,
+            name=excluded.name,
+            price_int=excluded.price_int,
+            source=excluded.source,
+            state='pending',
+            claimed_at=datetime('now'),
+            sent_at=NULL,
+            telegram_message_id=NULL,
+            updated_at=datetime('now')
+        """,
+        (storage_key, item.id, item.name, item.price_int, source_name),
+    )
+    return True
+
+
+def _db_claim_notification_key_sync(item: ShafaItem, source_name: str) -> bool:
+    if _duplicate_key(item.name, item.price_int) is None:
+        return True
+    return _db().write_sync(_db_claim_notification_key_in_conn, item, source_name)
+
+
+_CLAIM_NOTIFICATION_RETURNING_SQL = """
+    INSERT INTO shafa_notifications (
+        notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, 'pending', datetime('now'), NULL, NULL, datetime('now'))
+    ON CONFLICT(notification_key) DO UPDATE SET
+        item_id=excluded.item_id,
+        name=excluded.name,
+        price_int=excluded.price_int,
+        source=excluded.source,
+        state='pending',
+        claimed_at=datetime('now'),
+        sent_at=NULL,
+        telegram_message_id=NULL,
+        updated_at=datetime('now')
+    WHERE shafa_notifications.state <> 'sent'
+      AND NOT (shafa_notifications.state = 'pending' AND shafa_notifications.claimed_at > datetime('now', ?))
+    RETURNING notification_key
+"""
+
+
+def _db_claim_notification_keys_in_conn(conn: sqlite3.Connection, items: List[ShafaItem], source_name: str) -> set[str]:
+    # Same precondition as the single-key claim: the caller holds the write transaction.
+    claimed: set[str] = set()
+    stale_cutoff = f"-{NOTIFICATION_CLAIM_STALE_MINUTES} minutes"
+    for item in items:
+        key = _duplicate_key(item.name, item.price_int)
+        if key is None:
+            claimed.add(item.id)
+            continue
+        # The conditional upsert only returns a row when the claim was taken, so a
+        # second item with the same key in this batch sees the fresh pending row.
         row = conn.execute(
-            """
-            SELECT state,
-                   CASE
-                       WHEN claimed_at IS NULL OR claimed_at <= datetime('now', ?)
-                       THEN 1 ELSE 0
-                   END AS is_stale
-            FROM shafa_notifications
-            WHERE notification_key = ?
-            """,
-            (f"-{NOTIFICATION_CLAIM_STALE_MINUTES} minutes", storage_key),
+            _CLAIM_NOTIFICATION_RETURNING_SQL,
+            (_notification_storage_key(key), item.id, item.name, item.price_int, source_name, stale_cutoff),
         ).fetchone()
         if row is not None:
-            if row["state"] == "sent":
-                conn.commit()
-                return False
-            if row["state"] == "pending" and not bool(row["is_stale"]):
-                conn.commit()
-                return False
-        conn.execute(
-            """
-            INSERT INTO shafa_notifications (
-                notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, 'pending', datetime('now'), NULL, NULL, datetime('now'))
-            ON CONFLICT(notification_key) DO UPDATE SET
-                item_id=excluded.item_id,
-                name=excluded.name,
-                price_int=excluded.price_int,
-                source=excluded.source,
-                state='pending',
-                claimed_at=datetime('now'),
-                sent_at=NULL,
-                telegram_message_id=NULL,
-                updated_at=datetime('now')
-            """,
-            (storage_key, item.id, item.name, item.price_int, source_name),
-        )
-        conn.commit()
-        return True
-    finally:
-        conn.close()
+            claimed.add(item.id)
+    return claimed
 
 
-def _db_mark_notification_sent_sync(item: ShafaItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
+def _db_claim_notification_keys_sync(items: List[ShafaItem], source_name: str) -> set[str]:
+    if not any(_duplicate_key(item.name, item.price_int) for item in items):
+        return {item.id for item in items}
+    return _db().write_sync(_db_claim_notification_keys_in_conn, items, source_name)
+
+
+def _db_mark_notification_sent_in_conn(
+    conn: sqlite3.Connection,
+    item: ShafaItem,
+    source_name: str,
+    telegram_message_id: Optional[int] = None,
+) -> None:
     key = _duplicate_key(item.name, item.price_int)
     if key is None:
         return
     storage_key = _notification_storage_key(key)
-    with _db_connect() as conn:
-        conn.execute(
-            """
-            INSERT INTO shafa_notifications (
-                notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, 'sent', datetime('now'), datetime('now'), ?, datetime('now'))
-            ON CONFLICT(notification_key) DO UPDATE SET
-                item_id=excluded.item_id,
-                name=excluded.name,
-                price_int=excluded.price_int,
-                source=excluded.source,
-                state='sent',
-                sent_at=datetime('now'),
-                telegram_message_id=excluded.telegram_message_id,
-                updated_at=datetime('now')
-            """,
-            (storage_key, item.id, item.name, item.price_int, source_name, telegram_message_id),
+    conn.execute(
+        """
+        INSERT INTO shafa_notifications (
+            notification_key, item_id, name, price_int, source, state, claimed_at, sent_at, telegram_message_id, updated_at
         )
-        conn.commit()
+        VALUES (?, ?, ?, ?, ?, 'sent', datetime('now'), datetime('now'), ?, datetime('now'))
+        ON CONFLICT(notification_key) DO UPDATE SET
+            item_id=excluded.item_id,
+            name=excluded.name,
+            price_int=excluded.price_int,
+            source=excluded.source,
+            state='sent',
+            sent_at=datetime('now'),
+            telegram_message_id=excluded.telegram_message_id,
+            updated_at=datetime('now')
+        """,
+        (storage_key, item.id, item.name, item.price_int, source_name, telegram_message_id),
+    )
 
 
-def _db_release_notification_claim_sync(item: ShafaItem, source_name: str) -> None:
+def _db_mark_notification_sent_sync(item: ShafaItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
+    if _duplicate_key(item.name, item.price_int) is None:
+        return
+    _db().write_sync(_db_mark_notification_sent_in_conn, item, source_name, telegram_message_id)
+
+
+def _db_release_notification_claim_in_conn(conn: sqlite3.Connection, item: ShafaItem, source_name: str) -> None:
     key = _duplicate_key(item.name, item.price_int)
     if key is None:
         return
     storage_key = _notification_storage_key(key)
-    with _db_connect() as conn:
-        conn.execute(
-            """
-            UPDATE shafa_notifications
-            SET item_id = ?,
-                name = ?,
-                price_int = ?,
-                source = ?,
-                state = 'failed',
-                telegram_message_id = NULL,
-                updated_at = datetime('now')
-            WHERE notification_key = ?
-            """,
-            (item.id, item.name, item.price_int, source_name, storage_key),
-        )
-        conn.commit()
+    conn.execute(
+        """
+        UPDATE shafa_notifications
+        SET item_id = ?,
+            name = ?,
+            price_int = ?,
+            source = ?,
+            state = 'failed',
+            telegram_message_id = NULL,
+            updated_at = datetime('now')
+        WHERE notification_key = ?
+        """,
+        (item.id, item.name, item.price_int, source_name, storage_key),
+    )
+
+
+def _db_release_notification_claim_sync(item: ShafaItem, source_name: str) -> None:
+    if _duplicate_key(item.name, item.price_int) is None:
+        return
+    _db().write_sync(_db_release_notification_claim_in_conn, item, source_name)
+
+
+_EXISTING_ITEM_COLUMNS = (
+    "id", "name", "link", "price_text", "price_int", "brand", "size", "source",
+    "first_image_url", "created_at", "updated_at", "last_sent_at",
+)
+
+
+def _db_fetch_existing_in_conn(conn: sqlite3.Connection, item_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    if not item_ids:
+        return []
+    # Batch query using IN clause - much faster than N individual queries
+    placeholders = ','.join('?' * len(item_ids))
+    query = f"SELECT {', '.join(_EXISTING_ITEM_COLUMNS)} FROM shafa_items WHERE id IN ({placeholders})"
+    rows = conn.execute(query, item_ids).fetchall()
+    # Build lookup dict for O(1) access
+    items_dict = {row['id']: dict(row) for row in rows}
+    # Return results in same order as input item_ids (preserving None for missing items)
+    return [items_dict.get(item_id) for item_id in item_ids]
+
 
 def _db_fetch_existing_sync(item_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
     if not item_ids:
         return []
-    conn = _db_connect()
-    try:
-        # Batch query using IN clause - much faster than N individual queries
-        placeholders = ','.join('?' * len(item_ids))
-        query = f"SELECT id, name, link, price_text, price_int, brand, size, source, first_image_url, created_at, updated_at, last_sent_at FROM shafa_items WHERE id IN ({placeholders})"
-        rows = conn.execute(query, item_ids).fetchall()
-        # Build lookup dict for O(1) access
-        items_dict = {row['id']: dict(row) for row in rows}
-        # Return results in same order as input item_ids (preserving None for missing items)
-        return [items_dict.get(item_id) for item_id in item_ids]
-    finally:
-        conn.close()
+    return _db().read_sync(_db_fetch_existing_in_conn, item_ids)
 
 
-def _db_fetch_duplicate_keys_sync(items: List[ShafaItem]) -> set[Tuple[str, int]]:
+def _db_fetch_duplicate_keys_in_conn(conn: sqlite3.Connection, items: List[ShafaItem]) -> set[Tuple[str, int]]:
     candidate_map: Dict[Tuple[str, int], set[str]] = {}
     for item in items:
         if key := _duplicate_key(item.name, item.price_int):
@@ -733,88 +848,164 @@ def _db_fetch_duplicate_keys_sync(items: List[ShafaItem]) -> set[Tuple[str, int]
     if not candidate_map:
         return set()
 
-    conn = _db_connect()
+    prices = sorted({price for _, price in candidate_map})
+    placeholders = ",".join("?" * len(prices))
+    query = f"SELECT id, name, price_int FROM shafa_items WHERE price_int IN ({placeholders})"
+    rows = conn.execute(query, prices).fetchall()
+    notification_query = f"""
+        SELECT notification_key, name, price_int
+        FROM shafa_notifications
+        WHERE price_int IN ({placeholders}) AND state IN ('pending', 'sent')
+    """
+    notification_rows = conn.execute(notification_query, prices).fetchall()
+    duplicates: set[Tuple[str, int]] = set()
+    for row in rows:
+        row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
+        if row_key is None or row_key not in candidate_map:
+            continue
+        if str(row["id"]) not in candidate_map[row_key]:
+            duplicates.add(row_key)
+    for row in notification_rows:
+        row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
+        if row_key is not None and row_key in candidate_map:
+            duplicates.add(row_key)
+    return duplicates
+
+
+def _db_fetch_duplicate_keys_sync(items: List[ShafaItem]) -> set[Tuple[str, int]]:
+    if not any(_duplicate_key(item.name, item.price_int) for item in items):
+        return set()
+    return _db().read_sync(_db_fetch_duplicate_keys_in_conn, items)
+
+
+def _db_prefetch_state_in_conn(
+    conn: sqlite3.Connection,
+    items: List[ShafaItem],
+    duplicate_index: Optional[DuplicateKeyIndex] = None,
+) -> PrefetchedState:
+    attach_unsubscribe_db(conn)
+    # One read transaction so existing rows, duplicate keys and unsubscribes come
+    # from the same snapshot; the temp candidate rows are discarded on rollback.
+    conn.execute("BEGIN")
     try:
-        prices = sorted({price for _, price in candidate_map})
-        placeholders = ",".join("?" * len(prices))
-        query = f"SELECT id, name, price_int FROM shafa_items WHERE price_int IN ({placeholders})"
-        rows = conn.execute(query, prices).fetchall()
-        notification_query = f"""
-            SELECT notification_key, name, price_int
-            FROM shafa_notifications
-            WHERE price_int IN ({placeholders}) AND state IN ('pending', 'sent')
-        """
-        notification_rows = conn.execute(notification_query, prices).fetchall()
-        duplicates: set[Tuple[str, int]] = set()
-        for row in rows:
-            row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
-            if row_key is None or row_key not in candidate_map:
-                continue
-            if str(row["id"]) not in candidate_map[row_key]:
-                duplicates.add(row_key)
-        for row in notification_rows:
-            row_key = _duplicate_key(str(row["name"] or ""), int(row["price_int"] or 0))
-            if row_key is not None and row_key in candidate_map:
-                duplicates.add(row_key)
-        return duplicates
+        return prefetch_state_in_conn(
+            conn,
+            items,
+            source_kind="shafa",
+            items_table="shafa_items",
+            notifications_table="shafa_notifications",
+            existing_columns=_EXISTING_ITEM_COLUMNS,
+            unsubscribe_schema=UNSUBSCRIBE_SCHEMA,
+            duplicate_index=duplicate_index,
+        )
     finally:
-        conn.close()
+        conn.rollback()
+
+
+def _db_prefetch_state_sync(items: List[ShafaItem], duplicate_index: Optional[DuplicateKeyIndex] = None) -> PrefetchedState:
+    return _db().read_sync(_db_prefetch_state_in_conn, items, duplicate_index)
+
+
+def _db_duplicate_keys_since_sync(since: Optional[str]) -> List[Tuple[str, int]]:
+    return _db().read_sync(
+        duplicate_keys_since_in_conn, since, items_table="shafa_items", notifications_table="shafa_notifications"
+    )
+
+
+def _db_get_source_stats_in_conn(conn: sqlite3.Connection, url: str) -> Dict[str, int]:
+    row = conn.execute("SELECT no_items_streak, cycle_count FROM shafa_sources WHERE url = ?", (url,)).fetchone()
+    if row:
+        return {"streak": row[0], "cycle_count": row[1]}
+    return {"streak": 0, "cycle_count": 0}
+
 
 def _db_get_source_stats_sync(url: str) -> Dict[str, int]:
-    with _db_connect() as conn:
-        cur = conn.execute("SELECT no_items_streak, cycle_count FROM shafa_sources WHERE url = ?", (url,))
-        row = cur.fetchone()
-        if row:
-            return {"streak": row[0], "cycle_count": row[1]}
-        return {"streak": 0, "cycle_count": 0}
+    return _db().read_sync(_db_get_source_stats_in_conn, url)
+
+
+def _db_update_source_stats_in_conn(conn: sqlite3.Connection, url: str, streak: int, cycle_count: int) -> None:
+    conn.execute("""
+        INSERT INTO shafa_sources (url, no_items_streak, cycle_count, last_checked_at)
+        VALUES (?, ?, ?, datetime('now'))
+        ON CONFLICT(url) DO UPDATE SET
+            no_items_streak=excluded.no_items_streak,
+            cycle_count=excluded.cycle_count,
+            last_checked_at=datetime('now')
+    """, (url, streak, cycle_count))
+
 
 def _db_update_source_stats_sync(url: str, streak: int, cycle_count: int):
-    with _db_connect() as conn:
-        conn.execute("""
-            INSERT INTO shafa_sources (url, no_items_streak, cycle_count, last_checked_at)
-            VALUES (?, ?, ?, datetime('now'))
-            ON CONFLICT(url) DO UPDATE SET
-                no_items_streak=excluded.no_items_streak,
-                cycle_count=excluded.cycle_count,
-                last_checked_at=datetime('now')
-        """, (url, streak, cycle_count))
-        conn.commit()
+    _db().write_sync(_db_update_source_stats_in_conn, url, streak, cycle_count)
 
 
 async def db_get_source_stats(url: str) -> Dict[str, int]:
-    return await asyncio.to_thread(_db_get_source_stats_sync, url)
+    return await _db().read(_db_get_source_stats_in_conn, url)
 
 
 async def db_update_source_stats(url: str, streak: int, cycle_count: int) -> None:
-    await asyncio.to_thread(_db_update_source_stats_sync, url, streak, cycle_count)
+    await _db().write(_db_update_source_stats_in_conn, url, streak, cycle_count)
 
 
 class ShafaRepository(MarketplaceRepository[ShafaItem]):
     # SHAFA still uses its own DB, but the shared repository interface forces it to honor
     # the same persistence and notification semantics as the OLX adapter.
+    def __init__(self, *, duplicate_index: Optional[DuplicateKeyIndex] = None) -> None:
+        self._duplicate_index = duplicate_index
+
+    def _remember(self, item: ShafaItem, *, stored: bool) -> None:
+        if self._duplicate_index is not None:
+            self._duplicate_index.add(_duplicate_key(item.name, item.price_int), item.id if stored else None)
+
+    def _remember_claims(self, items: list[ShafaItem], claimed: set[str]) -> set[str]:
+        for item in items:
+            if item.id in claimed:
+                self._remember(item, stored=False)
+        return claimed
+
+    def _remember_stored(self, updates: list[ItemUpdate[ShafaItem]]) -> None:
+        for update in updates:
+            self._remember(update.item, stored=True)
+
     async def fetch_existing(self, item_ids: list[str]) -> list[Optional[Dict[str, Any]]]:
-        return await asyncio.to_thread(_db_fetch_existing_sync, item_ids)
+        if not item_ids:
+            return []
+        return await _db().read(_db_fetch_existing_in_conn, item_ids)
 
     async def fetch_duplicate_keys(self, items: list[ShafaItem]) -> set[Tuple[str, int]]:
-        return await asyncio.to_thread(_db_fetch_duplicate_keys_sync, items)
+        return await _db().read(_db_fetch_duplicate_keys_in_conn, items)
+
+    async def prefetch_state(self, items: list[ShafaItem]) -> PrefetchedState:
+        # Stays off the writer: its BEGIN IMMEDIATE would also write-lock the attached
+        # unsubscribe ledger, and a WAL read transaction never waits on the writer.
+        return await _db().read(_db_prefetch_state_in_conn, items, self._duplicate_index)
 
     async def claim_notification_key(self, item: ShafaItem, source_name: str) -> bool:
-        return await asyncio.to_thread(_db_claim_notification_key_sync, item, source_name)
+        claimed = await _db().write(_db_claim_notification_key_in_conn, item, source_name)
+        if claimed:
+            self._remember(item, stored=False)
+        return claimed
+
+    async def claim_notification_keys(self, items: list[ShafaItem], source_name: str) -> set[str]:
+        if not items:
+            return set()
+        claimed = await _db().write(_db_claim_notification_keys_in_conn, items, source_name)
+        return self._remember_claims(items, claimed)
 
     async def mark_notification_sent(self, item: ShafaItem, source_name: str, telegram_message_id: Optional[int] = None) -> None:
-        await asyncio.to_thread(_db_mark_notification_sent_sync, item, source_name, telegram_message_id)
+        await _db().write(_db_mark_notification_sent_in_conn, item, source_name, telegram_message_id)
 
     async def release_notification_claim(self, item: ShafaItem, source_name: str) -> None:
-        await asyncio.to_thread(_db_release_notification_claim_sync, item, source_name)
+        await _db().write(_db_release_notification_claim_in_conn, item, source_name)
 
     async def persist_items(self, updates: list[ItemUpdate[ShafaItem]], source_name: str) -> None:
         if not updates:
             return
-        await asyncio.to_thread(
-            _db_upsert_items_sync,
+        await _db().write(
+            _db_upsert_items_in_conn,
             [(update.item, update.touch_last_sent) for update in updates],
             source_name,
         )
+        self._remember_stored(updates)
 
     async def get_source_stats(self, url: str) -> SourceStats:
         stats = await db_get_source_stats(url)
@@ -879,6 +1070,9 @@ async def run_shafa_scraper():
 
     try:
         await asyncio.to_thread(_db_init_sync)
+        duplicate_index = await load_duplicate_index(DUPLICATE_INDEX, _db_duplicate_keys_since_sync, logger=logger)
+        # Writes go through the per-file writer shared with every other user of the DB.
+        repository = ShafaRepository(duplicate_index=duplicate_index)
         logger.info("Database ready")
     except Exception as exc:
         logger.error("Database init failed: %s", exc)
@@ -901,20 +1095,14 @@ async def run_shafa_scraper():
         _add_error(f"Playwright error: {exc}")
         return "; ".join(dict.fromkeys(errors))
 
+    # Process-wide bot: it outlives this run and is shut down by the service
+    # (telegram_runtime.shutdown_shared_bots), never by the scraper.
     bot = build_marketplace_bot(token)
-    repository = ShafaRepository()
     duplicate_tracker = RunDuplicateTracker[ShafaItem]()
 
-    async def _send_item(item: ShafaItem, text: str, source_name: str) -> DeliveryResult:
+    async def _guard_send(send_coro) -> DeliveryResult:
         try:
-            delivery = await send_photo_with_upscale(
-                bot,
-                default_chat,
-                text,
-                item.first_image_url,
-                source_name=source_name,
-            )
-            return delivery
+            return await send_coro
         except RetryAfter as exc:
             logger.warning("Telegram rate limit hit; waiting %ss", exc.retry_after)
         except TimedOut:
@@ -926,6 +1114,43 @@ async def run_shafa_scraper():
             _add_error(f"Send failed: {exc}")
         return DeliveryResult(delivered=False, failure_reason="send_exception", retry_later=True)
 
+    async def _send_item(item: ShafaItem, text: str, source_name: str) -> DeliveryResult:
+        return await _guard_send(
+            send_photo_with_upscale(
+                bot,
+                default_chat,
+                text,
+                item.first_image_url,
+                source_name=source_name,
+            )
+        )
+
+    async def _send_prepared(item: ShafaItem, text: str, source_name: str, prepared) -> DeliveryResult:
+        return await _guard_send(media_stages.send(bot, default_chat, text, prepared, source_name=source_name))
+
+    async def _download_image(item: ShafaItem, source_name: str):
+        try:
+            return await media_stages.download(item.first_image_url, source_name=source_name)
+        except Exception as exc:
+            logger.error("Image download failed: %s", exc)
+            _add_error(f"Send failed: {exc}")
+            raise
+
+    delivery_stages = DeliveryStages[ShafaItem](
+        download=_download_image,
+        transform=lambda item, prepared, source_name: media_stages.transform(prepared, source_name=source_name),
+        transform_batch=lambda jobs, source_name: media_stages.transform_batch(
+            [prepared for _, prepared in jobs], source_name=source_name
+        ),
+        transform_batch_size=MARKET_PIPELINE_TRANSFORM_BATCH_SIZE,
+        send=_send_prepared,
+        download_concurrency=SHAFA_HTTP_CONCURRENCY,
+        transform_concurrency=SHAFA_UPSCALE_CONCURRENCY,
+        send_concurrency=SHAFA_SEND_CONCURRENCY,
+        queue_size=MARKET_PIPELINE_QUEUE_SIZE,
+        persist_batch_size=MARKET_PIPELINE_PERSIST_BATCH_SIZE,
+    )
+
     async def _process_entry(entry: Dict[str, Any]) -> None:
         nonlocal total_scraped, total_new, total_sent
         url = entry.get("url")
@@ -979,6 +1204,7 @@ async def run_shafa_scraper():
                 hydrate_from_previous=_hydrate_shafa_item,
                 analytics_sink=_ANALYTICS_SINK,
                 logger=logger,
+                delivery_stages=delivery_stages,
             )
             total_new += pipeline_stats.total_new
             total_sent += pipeline_stats.total_sent
@@ -1056,6 +1282,9 @@ async def run_shafa_scraper():
             "total_send_failed",
         ):
             run_stats.set_field(field, getattr(pipeline_totals, field))
+        run_stats.set_field("pipeline_stages", pipeline_totals.stage_summary())
+        if duplicate_index is not None:
+            run_stats.set_field("duplicate_index", duplicate_index.stats.to_dict())
         run_stats.set_coverage(
             expected=len(sources),
             attempted=run_stats.counters.get("sources_attempted", 0),
@@ -1087,6 +1316,7 @@ async def run_shafa_scraper():
         if total_scraped > 0:
             logger.info("Success rate: %.1f%%", (total_sent / total_scraped * 100))
     finally:
+        run_stats.stop_profiling()
         if _playwright_runtime is not None:
             try:
                 await _playwright_runtime.close()
@@ -1099,14 +1329,7 @@ async def run_shafa_scraper():
                 _http_session = None
             except Exception:
                 pass
-        try:
-            await bot.shutdown()
-        except Exception:
-            pass
-        try:
-            await bot.close()
-        except Exception:
-            pass
+        await save_duplicate_index(duplicate_index, logger=logger)
         logger.info("Resources cleaned up")
         await asyncio.sleep(0.5)
     if errors:
@@ -1121,6 +1344,13 @@ async def run_shafa_scraper():
         return summary
     return ""
 
+async def _main() -> None:
+    try:
+        await run_shafa_scraper()
+    finally:
+        await shutdown_shared_bots(logger=logger)
+
+
 if __name__ == "__main__":
-    asyncio.run(run_shafa_scraper())
+    asyncio.run(_main())
 
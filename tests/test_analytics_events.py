@@ -1,9 +1,15 @@
 ﻿import json
 import tempfile
+import signal
+import threading
+import time
 import unittest
 from pathlib import Path
+from unittest import mock
 
+from helpers import analytics_events
 from helpers.analytics_events import (
+    AggregatingAnalyticsSink,
     AnalyticsSink,
     fingerprint_url,
     sanitize_payload,
@@ -55,6 +61,89 @@ class AnalyticsEventsTests(unittest.TestCase):
             self.assertEqual(bucket["dimensions"], {"source_kind": "olx", "source_name": "Riri"})
             self.assertEqual(bucket["counters"], {"items": 10, "runs": 2, "sent": 2})
 
+    def test_aggregating_sink_writes_the_same_files_on_flush(self):
+        def record(sink):
+            for n in range(3):
+                sink.append_event("marketplace.item", {"n": n, "chat_id": 7})
+                sink.add_daily_counters(
+                    "marketplace.items",
+                    dimensions={"source_kind": "olx", "event": "sent" if n else "new"},
+                    counters={"items": 1},
+                )
+
+        with tempfile.TemporaryDirectory() as plain_dir, tempfile.TemporaryDirectory() as buffered_dir:
+            now = lambda: "2026-05-04T10:11:12Z"
+            # Both layouts start from the same on-disk counters, which the flush must keep.
+            for root in (plain_dir, buffered_dir):
+                AnalyticsSink(Path(root), now_func=now).add_daily_counters(
+                    "marketplace.items", dimensions={"source_kind": "olx", "event": "sent"}, counters={"items": 5}
+                )
+            record(AnalyticsSink(Path(plain_dir), now_func=now))
+            sink = AggregatingAnalyticsSink(Path(buffered_dir), now_func=now, flush_interval_sec=0, flush_on_exit=False)
+            record(sink)
+
+            self.assertFalse((Path(buffered_dir) / "events").exists())
+            sink.flush()
+            sink.flush()
+
+            self.assertEqual(sink.flushes, 1)
+            for relative in ("events/2026-05-04.marketplace_item.jsonl", "daily/2026-05-04.marketplace_items.json"):
+                self.assertEqual(
+                    (Path(buffered_dir) / relative).read_text(encoding="utf-8"),
+                    (Path(plain_dir) / relative).read_text(encoding="utf-8"),
+                )
+
+    def test_aggregating_sink_flushes_when_buffer_is_full(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = AggregatingAnalyticsSink(
+                Path(tmp), now_func=lambda: "2026-05-04T10:11:12Z", flush_interval_sec=0, max_buffered_events=2, flush_on_exit=False
+            )
+
+            path = sink.append_event("s", {"n": 1})
+            self.assertFalse(path.exists())
+            sink.append_event("s", {"n": 2})
+
+            self.assertEqual(len(path.read_text(encoding="utf-8").splitlines()), 2)
+
+    def test_aggregating_sink_flushes_on_timer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = AggregatingAnalyticsSink(
+                Path(tmp), now_func=lambda: "2026-05-04T10:11:12Z", flush_interval_sec=0.05, flush_on_exit=False
+            )
+            try:
+                path = sink.add_daily_counters("d", counters={"runs": 1})
+                for _ in range(100):
+                    if path.exists():
+                        break
+                    time.sleep(0.01)
+            finally:
+                sink.close()
+
+            self.assertEqual(json.loads(path.read_text(encoding="utf-8"))["groups"]["total"]["counters"], {"runs": 1})
+
+    def test_sigterm_flush_waits_for_a_store_lock_held_by_the_interrupted_thread(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = AggregatingAnalyticsSink(
+                Path(tmp), now_func=lambda: "2026-05-04T10:11:12Z", flush_interval_sec=0, flush_on_exit=False
+            )
+            path = sink.append_event("s", {"n": 1})
+            killed = threading.Event()
+            previous_handler = signal.getsignal(signal.SIGTERM)
+            with mock.patch.object(analytics_events, "_EXIT_FLUSH_SINKS", {sink}), mock.patch.object(
+                analytics_events.os, "kill", side_effect=lambda *_args: killed.set()
+            ):
+                try:
+                    # SIGTERM lands while this thread is inside AnalyticsStore.record().
+                    with sink.store._lock:
+                        analytics_events._flush_and_reraise_signal(signal.SIGTERM, None)
+                        self.assertFalse(killed.wait(0.1))
+                    self.assertTrue(killed.wait(5))
+                finally:
+                    signal.signal(signal.SIGTERM, previous_handler)
+                    sink.store.close()
+
+            self.assertEqual(len(path.read_text(encoding="utf-8").splitlines()), 1)
+
     def test_fingerprint_url_removes_query_and_keeps_host(self):
         data = fingerprint_url("https://example.com/path/item?token=secret")
 
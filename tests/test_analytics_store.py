@@ -0,0 +1,66 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers.analytics_events import AggregatingAnalyticsSink, AnalyticsSink
+from helpers.analytics_store import AnalyticsStore
+from helpers.analytics_summary import build_analytics_range_summary
+
+
+def _write_daily(root: Path, date_key: str, domain: str, groups: dict) -> None:
+    (root / "daily").mkdir(parents=True, exist_ok=True)
+    (root / "daily" / f"{date_key}.{domain}.json").write_text(
+        json.dumps({"date": date_key, "domain": domain, "groups": groups}), encoding="utf-8"
+    )
+
+
+class AnalyticsStoreTests(unittest.TestCase):
+    def test_json_history_is_imported_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            _write_daily(root, "2026-05-03", "scraper_runs", {"scraper=olx": {"dimensions": {"scraper": "olx"}, "counters": {"runs": 2}}})
+            (root / "events").mkdir()
+            (root / "events" / "2026-05-03.scraper_run.jsonl").write_text(
+                json.dumps({"ts_utc": "2026-05-03T10:00:00Z", "stream": "scraper_run", "scraper": "olx"}) + "\n{broken\n",
+                encoding="utf-8",
+            )
+
+            for _ in range(2):
+                store = AnalyticsStore(root / "analytics.db", history_dir=root)
+                summary = store.summarize(1)
+                store.close()
+
+            self.assertEqual(summary["end_date"], "2026-05-03")
+            self.assertEqual(summary["domains"]["scraper_runs"]["groups"]["scraper=olx"]["counters"], {"runs": 2})
+            self.assertEqual(summary["events"]["scraper_run"], {"total": 1, "by_source": {"olx": 1}})
+
+    def test_range_summaries_add_up_days_from_both_sinks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            days = ["2026-04-20", "2026-05-05", "2026-05-07"]
+            for day in days:
+                plain = AnalyticsSink(root, now_func=lambda day=day: f"{day}T12:00:00Z")
+                plain.add_daily_counters("marketplace_items", dimensions={"source_kind": "olx", "source_name": "Riri"}, counters={"items": 1})
+                buffered = AggregatingAnalyticsSink(
+                    root, now_func=lambda day=day: f"{day}T12:00:00Z", flush_interval_sec=0, flush_on_exit=False
+                )
+                buffered.append_event("marketplace_item", {"source_kind": "olx", "source_name": "Riri"})
+                buffered.add_daily_counters("marketplace_items", dimensions={"source_kind": "olx", "source_name": "Riri"}, counters={"items": 2})
+                buffered.flush()
+
+            ranges = build_analytics_range_summary(root)["ranges"]
+
+            group = "source_kind=olx|source_name=Riri"
+            self.assertEqual(ranges["1d"]["start_date"], "2026-05-07")
+            self.assertEqual(ranges["1d"]["domains"]["marketplace_items"]["groups"][group]["counters"], {"items": 3})
+            self.assertEqual(ranges["7d"]["domains"]["marketplace_items"]["groups"][group]["counters"], {"items": 6})
+            self.assertEqual(ranges["30d"]["domains"]["marketplace_items"]["groups"][group]["counters"], {"items": 9})
+            self.assertEqual(ranges["30d"]["events"]["marketplace_item"]["by_source"], {"olx|Riri": 3})
+            # The JSON ledger is still written alongside the store.
+            daily = json.loads((root / "daily" / "2026-05-07.marketplace_items.json").read_text(encoding="utf-8"))
+            self.assertEqual(daily["groups"][group]["counters"], {"items": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,7 @@ import unittest
 import unittest.mock
 from pathlib import Path
 
+from helpers import telegram_runtime
 from helpers.analytics_events import AnalyticsSink
 from helpers.auto_ria.runtime import AutoRiaBotRuntime
 from helpers.auto_ria.parsing import (
@@ -178,6 +179,13 @@ class FakeAutoRiaSoldStorage:
 
 
 class AutoRiaRuntimeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        # AutoRiaBotRuntime registers its bot in the process-wide registry; keep these
+        # test bots out of it so other tests see the registry they expect.
+        patcher = unittest.mock.patch.dict(telegram_runtime._SHARED_BOTS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_runtime_normalizes_configured_search_urls_to_large_first_page(self) -> None:
         runtime = AutoRiaBotRuntime(
             bot_token="123:abc",
@@ -0,0 +1,114 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers.duplicate_index import BloomFilter, DuplicateKeyIndex
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_added_tokens_are_always_found(self) -> None:
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        tokens = [f"item-{index}".encode() for index in range(1000)]
+        for token in tokens:
+            bloom.add(token)
+
+        self.assertTrue(all(token in bloom for token in tokens))
+        false_hits = sum(f"other-{index}".encode() in bloom for index in range(5000))
+        self.assertLess(false_hits, 150)
+
+    def test_re_adding_a_token_does_not_grow_count(self) -> None:
+        bloom = BloomFilter.for_capacity(100, 0.01)
+        bloom.add(b"same")
+        bloom.add(b"same")
+
+        self.assertEqual(bloom.count, 1)
+
+
+class DuplicateKeyIndexTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp_dir.name) / "keys.bloom"
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def test_first_load_rebuilds_from_every_stored_key(self) -> None:
+        calls = []
+
+        def _keys_since(since):
+            calls.append(since)
+            return [("jacket", 100), ("boots", 200)]
+
+        index = DuplicateKeyIndex(self.path, capacity=1000)
+        index.load(_keys_since)
+
+        self.assertEqual(calls, [None])
+        self.assertTrue(index.stats.rebuilt)
+        self.assertTrue(index.might_contain(("jacket", 100)))
+        self.assertTrue(index.might_contain(("boots", 200)))
+
+    def test_saved_filter_is_reloaded_and_only_caught_up(self) -> None:
+        index = DuplicateKeyIndex(self.path, capacity=1000)
+        index.load(lambda since: [("jacket", 100)])
+        index.add(("scarf", 300), "s1")
+        index.save()
+
+        calls = []
+
+        def _keys_since(since):
+            calls.append(since)
+            return [("hat", 400)]
+
+        reloaded = DuplicateKeyIndex(self.path, capacity=1000)
+        reloaded.load(_keys_since)
+
+        self.assertEqual(len(calls), 1)
+        self.assertIsNotNone(calls[0])
+        self.assertFalse(reloaded.stats.rebuilt)
+        for key in (("jacket", 100), ("scarf", 300), ("hat", 400)):
+            self.assertTrue(reloaded.might_contain(key))
+
+    def test_capacity_change_forces_rebuild(self) -> None:
+        index = DuplicateKeyIndex(self.path, capacity=1000)
+        index.load(lambda since: [("jacket", 100)])
+        index.save()
+
+        calls = []
+        resized = DuplicateKeyIndex(self.path, capacity=5000)
+        resized.load(lambda since: calls.append(since) or [])
+
+        self.assertEqual(calls, [None])
+        self.assertTrue(resized.stats.rebuilt)
+
+    def test_split_candidates_settles_unseen_and_recent_keys_without_db(self) -> None:
+        index = DuplicateKeyIndex(self.path, capacity=1000)
+        index.load(lambda since: [("old", 100)])
+        index.add(("recent", 200), "holder")
+
+        confirmed, to_check = index.split_candidates(
+            {
+                ("never", 50): {"a"},
+                ("recent", 200): {"b"},
+                ("old", 100): {"c"},
+            }
+        )
+
+        self.assertEqual(confirmed, {("recent", 200)})
+        self.assertEqual(to_check, {("old", 100): {"c"}})
+        self.assertEqual(index.stats.filter_negatives, 1)
+        self.assertEqual(index.stats.recent_hits, 1)
+
+    def test_recent_entry_moves_with_the_item_and_ignores_the_item_itself(self) -> None:
+        index = DuplicateKeyIndex(self.path, capacity=1000)
+        index.load(lambda since: [])
+        index.add(("coat", 100), "item")
+        index.add(("coat", 150), "item")
+
+        confirmed, to_check = index.split_candidates({("coat", 100): {"other"}, ("coat", 150): {"item"}})
+
+        self.assertEqual(confirmed, set())
+        self.assertEqual(set(to_check), {("coat", 100), ("coat", 150)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import random
+import unittest
+
+from PIL import Image
+
+from helpers.edsr_worker import EdsrWorker, _upsample_tiled
+
+
+def _noise_image(size) -> Image.Image:
+    return Image.frombytes("RGB", size, random.Random(5).randbytes(size[0] * size[1] * 3))
+
+
+def _nearest_x2(image: Image.Image) -> Image.Image:
+    return image.resize((image.width * 2, image.height * 2), Image.NEAREST)
+
+
+class TiledUpsampleTests(unittest.TestCase):
+    def test_tiles_reassemble_to_the_untiled_result(self) -> None:
+        image = _noise_image((150, 90))
+
+        tiled, tiles = _upsample_tiled(image, _nearest_x2, 64)
+
+        self.assertEqual(tiles, 6)
+        self.assertEqual(tiled.tobytes(), _nearest_x2(image).tobytes())
+
+    def test_small_images_are_not_tiled(self) -> None:
+        _, tiles = _upsample_tiled(_noise_image((40, 30)), _nearest_x2, 64)
+
+        self.assertEqual(tiles, 1)
+
+
+class EdsrWorkerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.worker = EdsrWorker(None, backend="lanczos", threads=1, tile_size=64, batch_size=4)
+        self.addCleanup(self.worker.close)
+
+    def test_worker_upscales_and_tracks_caller_metrics(self) -> None:
+        result = self.worker.upscale(_noise_image((100, 80)), caller="lyst", deadline_s=60)
+        self.worker.upscale(_noise_image((30, 20)), caller="olx", deadline_s=60)
+
+        self.assertEqual(result.size, (200, 160))
+        stats = self.worker.stats.to_dict()
+        self.assertEqual(stats["images"], 2)
+        self.assertEqual(stats["tiles"], 5)
+        self.assertEqual(stats["callers"]["lyst"]["completed"], 1)
+        self.assertEqual(stats["callers"]["olx"]["completed"], 1)
+
+    def test_cold_start_does_not_count_against_the_deadline(self) -> None:
+        result = self.worker.upscale(_noise_image((20, 20)), caller="lyst", deadline_s=0.5)
+
+        self.assertEqual(result.size, (40, 40))
+        self.assertEqual(self.worker.stats.callers["lyst"].timeouts, 0)
+
+    def test_expired_requests_time_out_for_fallback(self) -> None:
+        self.worker.start()
+
+        with self.assertRaises(TimeoutError):
+            self.worker.upscale(_noise_image((50, 50)), caller="shafa", deadline_s=0.0)
+
+        self.assertEqual(self.worker.stats.callers["shafa"].timeouts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from PIL import Image, ImageDraw
+
+from helpers import font_registry
+from helpers.image_pipeline import _font_candidates, load_font
+
+
+class FontRegistryTests(unittest.TestCase):
+    def setUp(self) -> None:
+        font_registry.clear_font_caches()
+        self.candidates = _font_candidates(None, False)
+
+    def test_fonts_are_loaded_once_per_candidates_and_size(self) -> None:
+        self.assertIs(load_font(30), load_font(30))
+        self.assertIsNot(load_font(30), load_font(32))
+
+    def test_missing_candidates_fall_back_to_default(self) -> None:
+        font = font_registry.get_font(["/nonexistent/font.ttf"], 20)
+
+        self.assertIsNotNone(font)
+        self.assertIn("/nonexistent/font.ttf", font_registry._MISSING_FONT_FILES)
+
+    def test_text_bbox_matches_image_draw(self) -> None:
+        font = font_registry.get_font(self.candidates, 40)
+        draw = ImageDraw.Draw(Image.new("RGB", (10, 10)))
+
+        for anchor in (None, "lm", "mm"):
+            expected = draw.textbbox((15, 25), "1234 UAH", font=font, anchor=anchor)
+            self.assertEqual(font_registry.text_bbox(font, "1234 UAH", anchor=anchor, xy=(15, 25)), expected)
+
+    def test_fit_font_matches_linear_search(self) -> None:
+        texts = ("12345 UAH", "-35%")
+        for max_width in (40, 120, 250, 1000):
+            size = 60
+            while size > 12:
+                font = font_registry.get_font(self.candidates, size)
+                if max(font_registry.text_width(font, text) for text in texts) <= max_width:
+                    break
+                size -= 2
+            fitted = font_registry.fit_font(self.candidates, texts, max_width, max_size=60, min_size=12, step=2)
+
+            self.assertIs(fitted, font_registry.get_font(self.candidates, size))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 
 import GroteskBotStatus as bot_status
+from helpers.run_log import RunLogStore
 
 
 class GroteskBotStatusTests(unittest.TestCase):
@@ -23,6 +24,7 @@ class GroteskBotStatusTests(unittest.TestCase):
         self._orig_lyst_run_had_errors = bot_status.LYST_RUN_HAD_ERRORS
         self._orig_lyst_run_notes = list(bot_status.LYST_RUN_NOTES)
         self._orig_lyst_started_cycle = bot_status._LYST_RUN_STARTED_THIS_CYCLE
+        self._orig_runs_ledger = bot_status.SCRAPER_RUNS_LEDGER
 
     def tearDown(self) -> None:
         bot_status.LAST_RUNS_FILE = self._orig_last_runs
@@ -38,6 +40,7 @@ class GroteskBotStatusTests(unittest.TestCase):
         bot_status.LYST_RUN_HAD_ERRORS = self._orig_lyst_run_had_errors
         bot_status.LYST_RUN_NOTES = self._orig_lyst_run_notes
         bot_status._LYST_RUN_STARTED_THIS_CYCLE = self._orig_lyst_started_cycle
+        bot_status.SCRAPER_RUNS_LEDGER = self._orig_runs_ledger
 
     def _configure_temp_status_paths(self, tmp_dir: str) -> None:
         root = Path(tmp_dir)
@@ -47,6 +50,7 @@ class GroteskBotStatusTests(unittest.TestCase):
             "shafa": root / "market_shafa_run.json",
             "lyst": root / "lyst_run.json",
         }
+        bot_status.SCRAPER_RUNS_LEDGER = root / "scraper_runs.jsonl"
 
     def test_write_and_read_service_statuses(self) -> None:
         with tempfile.TemporaryDirectory() as tmp_dir:
@@ -102,6 +106,26 @@ class GroteskBotStatusTests(unittest.TestCase):
             self.assertIn("Last SHAFA run:", text)
             self.assertIn("Last LYST run:", text)
             self.assertIn("(quiet)", text)
+            self.assertNotIn("p95 of last", text)
+
+    def test_format_status_text_shows_run_duration_p95(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self._configure_temp_status_paths(tmp_dir)
+            store = RunLogStore(bot_status.SCRAPER_RUNS_LEDGER.with_suffix(".db"), retention_days=0)
+            for index, duration in enumerate((60, 90, 130)):
+                store.record(
+                    {
+                        "run_id": f"olx-{index}",
+                        "scraper": "olx",
+                        "started_at_utc": f"2026-05-04T10:0{index}:00Z",
+                        "outcome": "success",
+                        "duration_seconds": duration,
+                    }
+                )
+            store.close()
+
+            text = bot_status._format_status_text(time.time() - 120)
+            self.assertIn("p95 of last 50 runs: OLX 2m 10s", text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,280 @@
+import asyncio
+import io
+import json
+import logging
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+from helpers import image_pipeline
+from helpers.image_cache import ImageDownloadCache, RenderedCardCache, normalize_image_url, rendered_card_key
+from helpers.marketplace_sender import build_image_downloader
+from helpers.service_health import ServiceHealthReporter, ServiceMetricsConfig
+
+
+class _FakeResponse:
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.status = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.ok = 200 <= status_code < 400
+
+    async def read(self):
+        return self.content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+
+class _FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, headers=None, timeout=None, **_kwargs):
+        self.calls.append((url, dict(headers or {})))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _png_bytes(color, size=(4, 4)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageDownloadCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self._tmp_dir.name) / "images"
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def _cache(self, **kwargs) -> ImageDownloadCache:
+        cache = ImageDownloadCache(self.directory, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_normalized_url_ignores_case_fragment_and_query_order(self) -> None:
+        self.assertEqual(
+            normalize_image_url("HTTPS://CDN.Example.com/a.jpg?w=2&h=1#top"),
+            normalize_image_url("https://cdn.example.com/a.jpg?h=1&w=2"),
+        )
+
+    def test_fresh_entry_is_served_without_a_request(self) -> None:
+        cache = self._cache()
+        session = _FakeSession(_FakeResponse(200, b"image-bytes", {"ETag": '"v1"'}))
+        cache._local.session = session
+
+        self.assertEqual(cache.fetch("https://cdn.example.com/a.jpg"), b"image-bytes")
+        self.assertEqual(cache.fetch("https://CDN.example.com/a.jpg#x"), b"image-bytes")
+
+        self.assertEqual(len(session.calls), 1)
+        self.assertEqual(cache.stats.misses, 1)
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.to_dict()["hit_rate"], 0.5)
+
+    def test_stale_entry_is_revalidated_and_served_stale_on_error(self) -> None:
+        cache = self._cache(fresh_for_s=0)
+        session = _FakeSession(
+            _FakeResponse(200, b"image-bytes", {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+            _FakeResponse(304),
+            OSError("connection reset"),
+        )
+        cache._local.session = session
+        url = "https://cdn.example.com/a.jpg"
+
+        cache.fetch(url)
+        time.sleep(0.01)
+        self.assertEqual(cache.fetch(url), b"image-bytes")
+        self.assertEqual(cache.fetch(url), b"image-bytes")
+
+        self.assertEqual(session.calls[1][1]["If-None-Match"], '"v1"')
+        self.assertEqual(session.calls[1][1]["If-Modified-Since"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertEqual(cache.stats.revalidated, 1)
+        self.assertEqual(cache.stats.stale_served, 1)
+
+    def test_stale_entry_is_served_on_5xx_but_not_on_404(self) -> None:
+        cache = self._cache(fresh_for_s=0)
+        session = _FakeSession(_FakeResponse(200, b"image-bytes"), _FakeResponse(503), _FakeResponse(404))
+        cache._local.session = session
+        url = "https://cdn.example.com/a.jpg"
+
+        cache.fetch(url)
+        self.assertEqual(cache.fetch(url), b"image-bytes")
+        with self.assertRaises(RuntimeError):
+            cache.fetch(url)
+        self.assertEqual(cache.stats.stale_served, 1)
+
+    def test_identical_content_is_stored_once_and_lru_is_evicted(self) -> None:
+        cache = self._cache(max_bytes=25)
+        cache.store("https://a.example.com/1.jpg", b"x" * 10)
+        cache.store("https://b.example.com/1.jpg", b"x" * 10)
+        self.assertEqual(len(list((self.directory / "blobs").rglob("*.bin"))), 1)
+
+        cache.store("https://c.example.com/2.jpg", b"y" * 10)
+        cache.lookup("https://a.example.com/1.jpg")
+        cache.store("https://d.example.com/3.jpg", b"z" * 10)
+
+        self.assertIsNone(cache.lookup("https://c.example.com/2.jpg"))
+        self.assertIsNotNone(cache.lookup("https://a.example.com/1.jpg"))
+        self.assertIsNotNone(cache.lookup("https://b.example.com/1.jpg"))
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_decoded_images_are_reused_as_independent_copies(self) -> None:
+        cache = self._cache()
+        content = _png_bytes("red")
+
+        first = cache.open_image(content)
+        first.putpixel((0, 0), (0, 0, 255))
+        second = cache.open_image(content)
+
+        self.assertEqual(second.getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(cache.stats.decoded_hits, 1)
+
+    def test_stats_are_exported_through_service_health(self) -> None:
+        health_file = Path(self._tmp_dir.name) / "service.json"
+        reporter = ServiceHealthReporter(
+            ServiceMetricsConfig(service_name="test", health_file=health_file, metrics_port=None)
+        )
+        cache = self._cache()
+        cache.store("https://a.example.com/1.jpg", b"x")
+        cache.lookup("https://a.example.com/1.jpg")
+
+        reporter.record_cache_stats("images_test", cache.stats.to_dict())
+
+        snapshot = json.loads(health_file.read_text(encoding="utf-8"))
+        self.assertEqual(snapshot["service_state"]["caches"]["images_test"]["hits"], 1)
+
+
+class RenderedCardCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self._tmp_dir.name) / "cards"
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def test_key_depends_on_source_bytes_and_overlay_parameters(self) -> None:
+        base = rendered_card_key(b"img", "100 UAH", "-20%", "JPEG")
+        self.assertEqual(base, rendered_card_key(b"img", "100 UAH", "-20%", "JPEG"))
+        self.assertNotEqual(base, rendered_card_key(b"img", "100 UAH", "-25%", "JPEG"))
+        self.assertNotEqual(base, rendered_card_key(b"img", "100 UAH", "-20%", "PNG"))
+        self.assertNotEqual(base, rendered_card_key(b"other", "100 UAH", "-20%", "JPEG"))
+
+    def test_expired_and_over_budget_cards_are_dropped(self) -> None:
+        cache = RenderedCardCache(self.directory, max_bytes=25, ttl_s=3600)
+        self.addCleanup(cache.close)
+        cache.put("a", b"x" * 10)
+        cache.put("b", b"y" * 10)
+        self.assertEqual(cache.get("a"), b"x" * 10)
+        cache.put("c", b"z" * 10)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats.evictions, 1)
+
+        cache.ttl_s = 0
+        time.sleep(0.01)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats.expired, 1)
+
+    def test_process_image_reuses_the_rendered_card(self) -> None:
+        download_cache = ImageDownloadCache(Path(self._tmp_dir.name) / "images")
+        self.addCleanup(download_cache.close)
+        download_cache.store("https://cdn.example.com/a.png", _png_bytes("red", (300, 300)))
+        render_cache = RenderedCardCache(self.directory)
+        self.addCleanup(render_cache.close)
+
+        def _render(price):
+            return image_pipeline.process_image(
+                "https://cdn.example.com/a.png",
+                price,
+                30,
+                upscale_images=False,
+                upscale_method="lanczos",
+                image_url_candidates_fn=lambda url: [url],
+                logger=None,
+                image_cache=download_cache,
+                render_cache=render_cache,
+            ).getvalue()
+
+        first = _render(1000)
+        self.assertEqual(_render(1000), first)
+        self.assertNotEqual(_render(1200), first)
+        self.assertEqual(render_cache.stats.hits, 1)
+        self.assertEqual(render_cache.stats.misses, 2)
+
+    def test_lanczos_fallback_card_is_not_cached_under_the_edsr_key(self) -> None:
+        download_cache = ImageDownloadCache(Path(self._tmp_dir.name) / "images")
+        self.addCleanup(download_cache.close)
+        download_cache.store("https://cdn.example.com/a.png", _png_bytes("red", (300, 300)))
+        render_cache = RenderedCardCache(self.directory)
+        self.addCleanup(render_cache.close)
+
+        for _ in range(2):
+            image_pipeline.process_image(
+                "https://cdn.example.com/a.png",
+                1000,
+                30,
+                upscale_images=True,
+                upscale_method="edsr",
+                image_url_candidates_fn=lambda url: [url],
+                logger=logging.getLogger("test_image_cache"),
+                edsr_model_path=None,
+                image_cache=download_cache,
+                render_cache=render_cache,
+            )
+
+        self.assertEqual(render_cache.stats.hits, 0)
+        self.assertEqual(render_cache.stats.misses, 2)
+
+
+class CachedImageDownloaderTests(unittest.IsolatedAsyncioTestCase):
+    async def test_downloader_revalidates_stale_entries(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ImageDownloadCache(Path(tmp_dir), fresh_for_s=0)
+            self.addCleanup(cache.close)
+            session = _FakeSession(_FakeResponse(200, b"image-bytes", {"ETag": '"v1"'}), _FakeResponse(304))
+            download = build_image_downloader(
+                http_semaphore=asyncio.Semaphore(1),
+                get_http_session=lambda: session,
+                user_agent="test",
+                accept_language="en",
+                logger=None,
+                image_cache=cache,
+            )
+
+            self.assertEqual(await download("https://cdn.example.com/a.jpg"), b"image-bytes")
+            await asyncio.sleep(0.01)
+            self.assertEqual(await download("https://cdn.example.com/a.jpg"), b"image-bytes")
+
+            self.assertEqual(session.calls[1][1]["If-None-Match"], '"v1"')
+            self.assertEqual(cache.stats.revalidated, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import asyncio
+import io
+import unittest
+
+from PIL import Image
+
+from helpers import image_stream
+from helpers.image_pipeline import _fetch_image_bytes
+from helpers.image_stream import (
+    ImageHeader,
+    ImageSizePolicy,
+    ImageTooLarge,
+    olx_smaller_variant,
+    sniff_image_header,
+)
+from helpers.marketplace_sender import build_image_downloader
+
+
+def _encoded(size, fmt, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (90, 120, 150)).save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+class _StreamContent:
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        self.chunks_read = 0
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            self.chunks_read += 1
+            yield self.body[start : start + size]
+
+
+class _StreamingResponse:
+    def __init__(self, body: bytes, headers=None) -> None:
+        self.status = 200
+        self.headers = headers or {}
+        self.content = _StreamContent(body)
+        self.closed = False
+
+    def raise_for_status(self):
+        return None
+
+    def close(self):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+
+class _Session:
+    def __init__(self, responses) -> None:
+        self.responses = dict(responses)
+        self.urls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.urls.append(url)
+        return self.responses[url]
+
+
+class ImageHeaderSniffTests(unittest.TestCase):
+    def test_sniffs_dimensions_from_common_formats(self) -> None:
+        cases = [
+            ("JPEG", {"quality": 90}, "jpeg"),
+            ("JPEG", {"quality": 90, "progressive": True}, "jpeg"),
+            ("PNG", {}, "png"),
+            ("WEBP", {"quality": 80}, "webp"),
+            ("WEBP", {"lossless": True}, "webp"),
+            ("GIF", {}, "gif"),
+        ]
+        for fmt, kwargs, expected in cases:
+            data = _encoded((321, 123), fmt, **kwargs)
+            self.assertEqual(sniff_image_header(data[:64]) or sniff_image_header(data), ImageHeader(expected, 321, 123))
+
+    def test_truncated_or_unknown_prefix_returns_none(self) -> None:
+        self.assertIsNone(sniff_image_header(b"\x89PNG\r\n\x1a\n"))
+        self.assertIsNone(sniff_image_header(b"<html>not an image</html>"))
+
+
+class StreamGuardTests(unittest.TestCase):
+    def setUp(self) -> None:
+        image_stream._SAVINGS.clear()
+
+    def test_guard_aborts_on_dimensions_before_full_body(self) -> None:
+        data = _encoded((400, 300), "PNG")
+        guard = ImageSizePolicy("test", max_pixels=100 * 100).guard("https://x/a.png", len(data) + 10_000)
+
+        with self.assertRaises(ImageTooLarge) as ctx:
+            guard.feed(data[:64])
+
+        self.assertEqual(ctx.exception.reason, "dimensions_over_cap")
+        savings = image_stream.download_savings()["test"]
+        self.assertEqual(savings["aborted"], 1)
+        self.assertEqual(savings["bytes_downloaded"], 64)
+        self.assertEqual(savings["bytes_avoided"], len(data) + 10_000 - 64)
+
+    def test_content_length_over_cap_aborts_immediately(self) -> None:
+        with self.assertRaises(ImageTooLarge) as ctx:
+            ImageSizePolicy("test", max_bytes=1000).guard("https://x/a.jpg", "5000")
+
+        self.assertEqual(ctx.exception.reason, "content_length_over_cap")
+
+    def test_guard_passes_small_images_through(self) -> None:
+        data = _encoded((40, 30), "JPEG")
+        guard = ImageSizePolicy("test").guard("https://x/a.jpg", len(data))
+        for start in range(0, len(data), 100):
+            guard.feed(data[start : start + 100])
+
+        self.assertEqual(guard.finish(), data)
+        self.assertEqual(image_stream.download_savings()["test"]["sniffed"], 1)
+
+    def test_olx_smaller_variant_fits_pixel_cap(self) -> None:
+        url = "https://ireland.apollo.olx.ua/v1/files/abc-UA/image;s=4000x3000"
+
+        smaller = olx_smaller_variant(url, ImageHeader("jpeg", 4000, 3000), 1200 * 900)
+
+        self.assertEqual(smaller, "https://ireland.apollo.olx.ua/v1/files/abc-UA/image;s=1200x900")
+        self.assertIsNone(olx_smaller_variant("https://cdn.example.com/a.jpg", None, 100))
+
+
+class StreamedDownloaderTests(unittest.IsolatedAsyncioTestCase):
+    async def test_downloader_switches_to_smaller_variant(self) -> None:
+        image_stream._SAVINGS.clear()
+        big = _encoded((2000, 1500), "PNG")
+        small = _encoded((200, 150), "PNG")
+        original = "https://ireland.apollo.olx.ua/v1/files/abc-UA/image;s=2000x1500"
+        variant = "https://ireland.apollo.olx.ua/v1/files/abc-UA/image;s=200x150"
+        big_response = _StreamingResponse(big + b"\x00" * 200_000)
+        session = _Session({original: big_response, variant: _StreamingResponse(small)})
+        download = build_image_downloader(
+            http_semaphore=asyncio.Semaphore(1),
+            get_http_session=lambda: session,
+            user_agent="test",
+            accept_language="en",
+            logger=None,
+            size_policy=ImageSizePolicy("olx", max_pixels=200 * 150, smaller_variant=olx_smaller_variant),
+        )
+
+        self.assertEqual(await download(original), small)
+        self.assertEqual(session.urls, [original, variant])
+        self.assertEqual(big_response.content.chunks_read, 1)
+        self.assertTrue(big_response.closed)
+        savings = image_stream.download_savings()["olx"]
+        self.assertEqual((savings["aborted"], savings["smaller_variants"], savings["downloads"]), (1, 1, 1))
+
+
+class LystCandidateFallbackTests(unittest.TestCase):
+    def test_oversized_candidate_falls_through_to_next(self) -> None:
+        image_stream._SAVINGS.clear()
+        big = _encoded((3000, 3000), "PNG")
+        small = _encoded((300, 300), "PNG")
+        bodies = {"https://cdn.lyst.com/full.png": big, "https://cdn.lyst.com/small.png": small}
+
+        class _Cache:
+            def fetch(self, url, *, timeout, size_policy):
+                guard = size_policy.guard(url)
+                guard.feed(bodies[url])
+                return guard.finish()
+
+        content = _fetch_image_bytes(
+            "https://cdn.lyst.com/small.png",
+            image_url_candidates_fn=lambda _url: list(bodies),
+            image_cache=_Cache(),
+            size_policy=ImageSizePolicy("lyst", max_pixels=1000 * 1000),
+        )
+
+        self.assertEqual(content, small)
+        self.assertEqual(image_stream.download_savings()["lyst"]["smaller_variants"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
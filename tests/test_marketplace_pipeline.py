@@ -8,6 +8,7 @@ from helpers.analytics_events import AnalyticsSink
 from helpers.marketplace_core import MarketplaceItem
 from helpers.marketplace_pipeline import (
     DeliveryResult,
+    DeliveryStages,
     ItemDecision,
     ItemUpdate,
     RunDuplicateTracker,
@@ -55,6 +56,29 @@ class DummyRepository:
         raise NotImplementedError
 
 
+class BatchRecordingRepository(DummyRepository):
+    def __init__(self) -> None:
+        super().__init__()
+        self.persist_calls = []
+
+    async def persist_items(self, updates, source_name):
+        self.persist_calls.append([update.item.id for update in updates])
+        await super().persist_items(updates, source_name)
+
+
+class BulkClaimRepository(DummyRepository):
+    def __init__(self) -> None:
+        super().__init__()
+        self.bulk_claim_calls = []
+
+    async def claim_notification_key(self, item, source_name):
+        raise AssertionError("bulk-capable repositories must not be claimed per item")
+
+    async def claim_notification_keys(self, items, source_name):
+        self.bulk_claim_calls.append([item.id for item in items])
+        return {item.id for item in items if self.claim_results.get(item.id, True)}
+
+
 class MarketplacePipelineTests(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self) -> None:
         self.original_fetch_unsubscribed_ids = marketplace_pipeline.fetch_unsubscribed_ids
@@ -280,3 +304,232 @@ class MarketplacePipelineTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(stats.total_send_failed, 2)
         self.assertEqual(stats.total_sent, 0)
         self.assertEqual(stats.total_new, 1)
+
+    async def test_process_marketplace_items_claims_in_one_bulk_call_when_supported(self) -> None:
+        repository = BulkClaimRepository()
+        repository.claim_results = {"b": False}
+        duplicate_tracker = RunDuplicateTracker[DummyItem]()
+        items = [
+            DummyItem(id=item_id, name=f"Item {item_id}", link="https://example.com", price_text="100 грн", price_int=100)
+            for item_id in ("a", "b", "c")
+        ]
+
+        async def _send_item(item, text, source_name):
+            return True
+
+        stats = await process_marketplace_items(
+            source_kind="olx",
+            source_name="OLX",
+            items=items,
+            repository=repository,
+            duplicate_tracker=duplicate_tracker,
+            decide_item=lambda current, previous: ItemDecision(send_notification=True, is_new_item=True),
+            build_message=lambda current, previous, source_name: "message",
+            send_item=_send_item,
+        )
+
+        self.assertEqual(repository.bulk_claim_calls, [["a", "b", "c"]])
+        self.assertEqual(stats.total_notification_claim_skipped, 1)
+        self.assertEqual(stats.total_sent, 2)
+        self.assertEqual(sorted(item_id for item_id, _, _ in repository.marked_sent), ["a", "c"])
+
+    async def _run_staged(self, repository, items, stages, analytics_sink=None):
+        return await process_marketplace_items(
+            source_kind="olx",
+            source_name="OLX",
+            items=items,
+            repository=repository,
+            duplicate_tracker=RunDuplicateTracker[DummyItem](),
+            decide_item=lambda current, previous: ItemDecision(send_notification=True, is_new_item=True),
+            build_message=lambda current, previous, source_name: f"msg:{current.id}",
+            send_item=None,
+            analytics_sink=analytics_sink,
+            delivery_stages=stages,
+        )
+
+    async def test_staged_delivery_sends_every_item_and_persists_in_batches(self) -> None:
+        repository = BatchRecordingRepository()
+        items = [
+            DummyItem(id=str(index), name=f"Item {index}", link="https://example.com", price_text="100 грн", price_int=100)
+            for index in range(7)
+        ]
+        sent = []
+
+        async def _download(item, source_name):
+            return f"raw:{item.id}"
+
+        async def _transform(item, payload, source_name):
+            return payload.replace("raw", "jpeg")
+
+        async def _send(item, text, source_name, payload):
+            sent.append((item.id, text, payload))
+            return DeliveryResult(delivered=True, telegram_message_id=int(item.id))
+
+        stages = DeliveryStages[DummyItem](
+            download=_download,
+            transform=_transform,
+            send=_send,
+            download_concurrency=3,
+            queue_size=2,
+            persist_batch_size=4,
+        )
+        stats = await self._run_staged(repository, items, stages)
+
+        self.assertEqual(stats.total_sent, 7)
+        self.assertEqual(sorted(sent), sorted((str(i), f"msg:{i}", f"jpeg:{i}") for i in range(7)))
+        self.assertEqual(sorted(item_id for item_id, _, _ in repository.marked_sent), [str(i) for i in range(7)])
+        self.assertEqual(sorted(sum(repository.persist_calls, [])), [str(i) for i in range(7)])
+        self.assertTrue(all(len(batch) <= 4 for batch in repository.persist_calls))
+        self.assertLess(len(repository.persist_calls), 7)
+        summary = stats.stage_summary()
+        self.assertEqual(summary["download"]["items"], 7)
+        self.assertEqual(summary["send"]["items"], 7)
+        self.assertEqual(summary["persist"]["items"], len(repository.persist_calls))
+
+    async def test_staged_delivery_batches_queued_transforms(self) -> None:
+        repository = BatchRecordingRepository()
+        items = [
+            DummyItem(id=str(index), name=f"Item {index}", link="https://example.com", price_text="100 грн", price_int=100)
+            for index in range(7)
+        ]
+        batches = []
+        sent = []
+
+        async def _download(item, source_name):
+            return f"raw:{item.id}"
+
+        async def _transform(item, payload, source_name):
+            raise AssertionError("batch-capable stages must not transform per item")
+
+        async def _transform_batch(jobs, source_name):
+            batches.append([item.id for item, _ in jobs])
+            return [RuntimeError("bad image") if item.id == "3" else payload.replace("raw", "jpeg") for item, payload in jobs]
+
+        async def _send(item, text, source_name, payload):
+            sent.append((item.id, payload))
+            return True
+
+        stages = DeliveryStages[DummyItem](
+            download=_download,
+            transform=_transform,
+            send=_send,
+            download_concurrency=7,
+            queue_size=8,
+            transform_batch=_transform_batch,
+            transform_batch_size=3,
+        )
+        stats = await self._run_staged(repository, items, stages)
+
+        self.assertEqual(sorted(sum(batches, [])), [str(i) for i in range(7)])
+        self.assertTrue(all(len(batch) <= 3 for batch in batches))
+        self.assertLess(len(batches), 7)
+        self.assertEqual(sorted(sent), sorted((str(i), f"jpeg:{i}") for i in range(7) if i != 3))
+        self.assertEqual(stats.stage_summary()["transform"]["failed"], 1)
+        self.assertEqual(repository.released, [("3", "OLX")])
+
+    async def test_staged_delivery_releases_claims_for_failed_stages_and_skips_persist(self) -> None:
+        repository = BatchRecordingRepository()
+        items = [
+            DummyItem(id=item_id, name=item_id, link="https://example.com", price_text="100 грн", price_int=100)
+            for item_id in ("ok", "bad_download", "bad_send", "not_delivered")
+        ]
+
+        async def _download(item, source_name):
+            if item.id == "bad_download":
+                raise RuntimeError("download failed")
+            return item.id
+
+        async def _transform(item, payload, source_name):
+            return payload
+
+        async def _send(item, text, source_name, payload):
+            if item.id == "bad_send":
+                raise RuntimeError("send failed")
+            return item.id != "not_delivered"
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sink = AnalyticsSink(Path(tmp_dir), now_func=lambda: "2026-05-04T12:00:00Z")
+            stats = await self._run_staged(
+                repository,
+                items,
+                DeliveryStages[DummyItem](download=_download, transform=_transform, send=_send),
+                analytics_sink=sink,
+            )
+            event_path = Path(tmp_dir) / "events" / "2026-05-04.marketplace_item.jsonl"
+            events = [json.loads(line)["event"] for line in event_path.read_text(encoding="utf-8").splitlines()]
+
+        self.assertEqual(stats.total_sent, 1)
+        self.assertEqual(stats.total_send_failed, 3)
+        self.assertEqual(repository.persisted, [("ok", True, "OLX")])
+        self.assertEqual(sorted(item_id for item_id, _ in repository.released), ["bad_download", "bad_send", "not_delivered"])
+        self.assertEqual(events.count("send_exception"), 2)
+        self.assertEqual(events.count("send_failed"), 1)
+        self.assertEqual(stats.stage_summary()["download"]["failed"], 1)
+
+    async def test_staged_delivery_persists_delivered_item_when_marking_sent_fails(self) -> None:
+        class FailingMarkRepository(BatchRecordingRepository):
+            async def mark_notification_sent(self, item, source_name, telegram_message_id=None):
+                raise RuntimeError("database is locked")
+
+        repository = FailingMarkRepository()
+        items = [DummyItem(id="1", name="Item", link="https://example.com", price_text="100 грн", price_int=100)]
+
+        async def _passthrough(item, payload, source_name):
+            return payload
+
+        async def _download(item, source_name):
+            return item.id
+
+        async def _send(item, text, source_name, payload):
+            return DeliveryResult(delivered=True, telegram_message_id=1)
+
+        stats = await self._run_staged(
+            repository,
+            items,
+            DeliveryStages[DummyItem](download=_download, transform=_passthrough, send=_send),
+        )
+
+        self.assertEqual(stats.total_sent, 1)
+        self.assertEqual(repository.persisted, [("1", True, "OLX")])
+        self.assertEqual(repository.released, [])
+
+    async def test_staged_delivery_fails_whole_batch_when_transform_drops_results(self) -> None:
+        repository = BatchRecordingRepository()
+        items = [
+            DummyItem(id=str(index), name=f"Item {index}", link="https://example.com", price_text="100 грн", price_int=100)
+            for index in range(3)
+        ]
+        sent = []
+
+        async def _download(item, source_name):
+            return item.id
+
+        async def _transform(item, payload, source_name):
+            raise AssertionError("batch-capable stages must not transform per item")
+
+        async def _transform_batch(jobs, source_name):
+            return [payload for _, payload in jobs][:-1]
+
+        async def _send(item, text, source_name, payload):
+            sent.append(item.id)
+            return True
+
+        stats = await self._run_staged(
+            repository,
+            items,
+            DeliveryStages[DummyItem](
+                download=_download,
+                transform=_transform,
+                send=_send,
+                download_concurrency=3,
+                queue_size=4,
+                transform_batch=_transform_batch,
+                transform_batch_size=3,
+            ),
+        )
+
+        self.assertEqual(sent, [])
+        self.assertEqual(stats.total_send_failed, 3)
+        self.assertEqual(stats.stage_summary()["transform"]["failed"], 3)
+        self.assertEqual(sorted(item_id for item_id, _ in repository.released), ["0", "1", "2"])
+        self.assertEqual(repository.persisted, [])
@@ -0,0 +1,210 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import olx_scraper
+import shafa_scraper
+from helpers import scraper_unsubscribes
+from helpers.duplicate_index import DuplicateKeyIndex
+from helpers.marketplace_pipeline import ItemUpdate
+
+
+class _NotificationClaimContract:
+    # Shared contract for every MarketplaceRepository that stores a notification ledger.
+    # Subclasses provide the scraper module, item factory and repository factory.
+    scraper_module = None
+    notifications_table = ""
+    source_kind = ""
+
+    def make_item(self, item_id: str, name: str, price_int: int):
+        raise NotImplementedError
+
+    def make_repository(self, **kwargs):
+        raise NotImplementedError
+
+    async def asyncSetUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._original_db = self.scraper_module.DB_FILE
+        self._original_unsubscribe_db = scraper_unsubscribes.UNSUBSCRIBE_DB_FILE
+        self.scraper_module.DB_FILE = Path(self._tmp_dir.name) / "items.db"
+        scraper_unsubscribes.UNSUBSCRIBE_DB_FILE = Path(self._tmp_dir.name) / "unsubscribes.db"
+        self.scraper_module._db_init_sync()
+        self.repository = self.make_repository()
+        if hasattr(self.repository, "start"):
+            self.repository.start()
+
+    async def asyncTearDown(self) -> None:
+        if hasattr(self.repository, "close"):
+            await self.repository.close()
+        self.scraper_module.DB_FILE = self._original_db
+        scraper_unsubscribes.UNSUBSCRIBE_DB_FILE = self._original_unsubscribe_db
+        self._tmp_dir.cleanup()
+
+    def _set_claimed_at(self, item, modifier: str) -> None:
+        conn = sqlite3.connect(self.scraper_module.DB_FILE)
+        try:
+            conn.execute(
+                f"UPDATE {self.notifications_table} SET claimed_at = datetime('now', ?) WHERE item_id = ?",
+                (modifier, item.id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def test_bulk_claim_takes_new_keys_once(self) -> None:
+        first = self.make_item("a", "Jacket", 1000)
+        second = self.make_item("b", "Boots", 2000)
+
+        self.assertEqual(await self.repository.claim_notification_keys([first, second], "SRC"), {"a", "b"})
+        self.assertEqual(await self.repository.claim_notification_keys([first, second], "SRC"), set())
+        self.assertFalse(await self.repository.claim_notification_key(first, "SRC"))
+
+    async def test_bulk_claim_rejects_second_item_with_same_key_in_batch(self) -> None:
+        first = self.make_item("a", "Jacket", 1000)
+        same_key = self.make_item("b", "  jacket ", 1000)
+
+        self.assertEqual(await self.repository.claim_notification_keys([first, same_key], "SRC"), {"a"})
+
+    async def test_bulk_claim_skips_sent_and_fresh_pending_but_reclaims_stale_and_failed(self) -> None:
+        sent = self.make_item("sent", "Sent", 1000)
+        pending = self.make_item("pending", "Pending", 1000)
+        stale = self.make_item("stale", "Stale", 1000)
+        failed = self.make_item("failed", "Failed", 1000)
+        await self.repository.mark_notification_sent(sent, "SRC", 1)
+        self.assertEqual(
+            await self.repository.claim_notification_keys([pending, stale, failed], "SRC"),
+            {"pending", "stale", "failed"},
+        )
+        self._set_claimed_at(stale, "-1 day")
+        await self.repository.release_notification_claim(failed, "SRC")
+
+        claimed = await self.repository.claim_notification_keys([sent, pending, stale, failed], "SRC")
+
+        self.assertEqual(claimed, {"stale", "failed"})
+
+    async def test_items_without_duplicate_key_are_always_claimed(self) -> None:
+        no_price = self.make_item("free", "Freebie", 0)
+
+        self.assertEqual(await self.repository.claim_notification_keys([no_price], "SRC"), {"free"})
+        self.assertEqual(await self.repository.claim_notification_keys([no_price], "SRC"), {"free"})
+
+    async def test_bulk_and_single_claims_share_the_same_ledger(self) -> None:
+        single = self.make_item("single", "Single", 1000)
+        bulk = self.make_item("bulk", "Bulk", 1000)
+
+        self.assertTrue(await self.repository.claim_notification_key(single, "SRC"))
+        self.assertEqual(await self.repository.claim_notification_keys([single, bulk], "SRC"), {"bulk"})
+        self.assertFalse(await self.repository.claim_notification_key(bulk, "SRC"))
+
+    async def test_prefetch_state_matches_separate_lookups(self) -> None:
+        stored = self.make_item("stored", "Stored", 1000)
+        await self.repository.persist_items([ItemUpdate(item=stored, touch_last_sent=False)], "SRC")
+        claimed = self.make_item("claimed", "Claimed", 2000)
+        await self.repository.claim_notification_key(claimed, "SRC")
+        scraper_unsubscribes._init_sync()
+        conn = sqlite3.connect(scraper_unsubscribes.UNSUBSCRIBE_DB_FILE)
+        try:
+            conn.execute(
+                "INSERT INTO unsubscribed_items (source, item_id, link, name) VALUES (?, 'muted', '', '')",
+                (self.source_kind,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        items = [
+            self.make_item("stored", "Stored again", 1500),
+            self.make_item("copy", " stored ", 1000),
+            self.make_item("again", "Claimed", 2000),
+            self.make_item("muted", "Muted", 3000),
+            self.make_item("fresh", "Fresh", 0),
+        ]
+
+        state = await self.repository.prefetch_state(items)
+
+        self.assertEqual(state.previous_items, await self.repository.fetch_existing([item.id for item in items]))
+        self.assertEqual(state.previous_items[0]["id"], "stored")
+        self.assertEqual(state.duplicate_keys, await self.repository.fetch_duplicate_keys(items))
+        self.assertEqual(state.duplicate_keys, {("stored", 1000), ("claimed", 2000)})
+        self.assertEqual(state.unsubscribed_ids, {"muted"})
+
+    async def test_prefetch_state_with_duplicate_index_matches_db_only_answer(self) -> None:
+        await self.repository.persist_items(
+            [
+                ItemUpdate(item=self.make_item("stored", "Stored", 1000), touch_last_sent=False),
+                ItemUpdate(item=self.make_item("solo", "Solo", 5000), touch_last_sent=False),
+            ],
+            "SRC",
+        )
+        await self.repository.claim_notification_key(self.make_item("claimed", "Claimed", 2000), "SRC")
+        index = DuplicateKeyIndex(Path(self._tmp_dir.name) / "keys.bloom", capacity=1000)
+        index.load(self.scraper_module._db_duplicate_keys_since_sync)
+        indexed = self.make_repository(duplicate_index=index)
+        if hasattr(indexed, "start"):
+            indexed.start()
+        try:
+            await indexed.persist_items(
+                [ItemUpdate(item=self.make_item("recent", "Recent", 3000), touch_last_sent=False)],
+                "SRC",
+            )
+            items = [
+                self.make_item("copy", " stored ", 1000),
+                self.make_item("again", "Claimed", 2000),
+                self.make_item("recent-copy", "recent", 3000),
+                self.make_item("fresh", "Fresh", 4000),
+                # Re-seen under its own id: a true filter hit, but not a duplicate.
+                self.make_item("solo", "Solo", 5000),
+            ]
+
+            state = await indexed.prefetch_state(items)
+            plain = await self.repository.prefetch_state(items)
+        finally:
+            if hasattr(indexed, "close"):
+                await indexed.close()
+
+        self.assertEqual(state, plain)
+        self.assertEqual(index.stats.filter_negatives, 1)
+        self.assertEqual(index.stats.recent_hits, 1)
+        self.assertEqual(index.stats.db_checks, 3)
+        self.assertEqual(index.stats.db_confirmed, 2)
+        self.assertEqual(index.stats.to_dict()["false_positives"], 0)
+
+
+class OlxRepositoryContractTests(_NotificationClaimContract, unittest.IsolatedAsyncioTestCase):
+    scraper_module = olx_scraper
+    notifications_table = "olx_notifications"
+    source_kind = "olx"
+
+    def make_item(self, item_id: str, name: str, price_int: int):
+        return olx_scraper.OlxItem(
+            id=item_id,
+            name=name,
+            link=f"https://www.olx.ua/d/uk/obyavlenie/{item_id}.html",
+            price_text=f"{price_int} грн",
+            price_int=price_int,
+        )
+
+    def make_repository(self, **kwargs):
+        return olx_scraper.OlxRepository(**kwargs)
+
+
+class ShafaRepositoryContractTests(_NotificationClaimContract, unittest.IsolatedAsyncioTestCase):
+    scraper_module = shafa_scraper
+    notifications_table = "shafa_notifications"
+    source_kind = "shafa"
+
+    def make_item(self, item_id: str, name: str, price_int: int):
+        return shafa_scraper.ShafaItem(
+            id=item_id,
+            name=name,
+            link=f"https://shafa.ua/uk/men/clothes/{item_id}",
+            price_text=f"{price_int} грн",
+            price_int=price_int,
+        )
+
+    def make_repository(self, **kwargs):
+        return shafa_scraper.ShafaRepository(**kwargs)
+
+
+if __name__ == "__main__":
+    unittest.main()
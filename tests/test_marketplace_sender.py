@@ -1,5 +1,10 @@
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
+import olx_scraper
+from helpers import telegram_runtime
 from helpers.marketplace_core import DeliveryResult
 from helpers.marketplace_sender import RetryableHttpStatus
 from helpers.image_pipeline import send_remote_photo_with_fallback
@@ -40,3 +45,45 @@ class MarketplaceSenderTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.failure_reason, "image_download_404")
         self.assertTrue(result.retry_later)
         self.assertEqual(calls, {"message": 0, "photo": 0})
+
+
+class _LifecycleBot:
+    # Mimics telegram.Bot after shutdown(): its HTTPX client is gone and every send fails.
+    def __init__(self) -> None:
+        self.shutdown_calls = 0
+        self.sent = []
+
+    async def shutdown(self) -> None:
+        self.shutdown_calls += 1
+
+    async def close(self) -> None:
+        self.shutdown_calls += 1
+
+    async def send_message(self, chat_id, text):
+        if self.shutdown_calls:
+            raise RuntimeError("This HTTPXRequest is not initialized!")
+        self.sent.append((chat_id, text))
+
+
+class SharedBotLifecycleTests(unittest.IsolatedAsyncioTestCase):
+    async def test_consecutive_scraper_runs_keep_the_shared_bot_usable(self) -> None:
+        token = "777:olx-lifecycle"
+        bot = _LifecycleBot()
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(telegram_runtime._SHARED_BOTS, {token: bot}), mock.patch.multiple(
+            olx_scraper,
+            TELEGRAM_OLX_BOT_TOKEN=token,
+            DANYLO_DEFAULT_CHAT_ID="1",
+            DB_FILE=Path(tmp) / "olx_items.db",
+            DUPLICATE_INDEX=None,
+            OLX_URLS=[],
+            SCRAPER_RUNS_JSONL_FILE=Path(tmp) / "runs.jsonl",
+            load_dynamic_urls=lambda _kind: [],
+        ):
+            for run in range(2):
+                self.assertEqual(await olx_scraper.run_olx_scraper(), "")
+                # The command listener and an overlapping SHAFA run send through the same bot.
+                await telegram_runtime.get_shared_bot(token).send_message("1", f"after run {run}")
+            olx_scraper._db().close_sync()
+
+        self.assertEqual(bot.shutdown_calls, 0)
+        self.assertEqual(bot.sent, [("1", "after run 0"), ("1", "after run 1")])
@@ -3,6 +3,7 @@ import json
 import tempfile
 from pathlib import Path
 import asyncio
+import random
 import unittest
 from unittest.mock import patch
 
@@ -10,7 +11,12 @@ from PIL import Image
 from bs4 import BeautifulSoup
 
 from helpers.analytics_events import AnalyticsSink
-from helpers.image_pipeline import encode_jpeg_for_telegram, send_remote_photo_with_fallback, upscale_image_bytes_for_telegram_sync
+from helpers.image_pipeline import (
+    encode_jpeg_for_telegram,
+    fit_jpeg_for_telegram,
+    send_remote_photo_with_fallback,
+    upscale_image_bytes_for_telegram_sync,
+)
 from olx_scraper import _extract_first_image_from_card, _next_chunk_pause, _source_chunks, fetch_first_image_best
 
 
@@ -168,6 +174,24 @@ class MarketplaceImageUpscaleTests(unittest.TestCase):
         self.assertIsNone(result)
         self.assertEqual(qualities, [98])
 
+    def test_jpeg_fit_downscales_noisy_images_in_at_most_two_encodes(self):
+        noisy = Image.frombytes("RGB", (800, 600), bytes(random.Random(3).randbytes(800 * 600 * 3)))
+        max_bytes = 300_000
+
+        fitted = fit_jpeg_for_telegram(noisy, max_bytes=max_bytes)
+
+        self.assertIsNotNone(fitted)
+        self.assertLessEqual(len(fitted.data), max_bytes)
+        self.assertLessEqual(fitted.encodes, 2)
+        self.assertLess(fitted.size[0], 800)
+        self.assertAlmostEqual(fitted.size[0] / fitted.size[1], 800 / 600, places=1)
+
+    def test_jpeg_fit_keeps_small_images_at_full_size_with_one_encode(self):
+        fitted = fit_jpeg_for_telegram(Image.new("RGB", (640, 480), (10, 20, 30)))
+
+        self.assertEqual(fitted.size, (640, 480))
+        self.assertEqual(fitted.encodes, 1)
+
 
 class OlxImageSelectionTests(unittest.TestCase):
     DETAIL_HTML = """
@@ -1,13 +1,29 @@
 import asyncio
+import os
 import unittest
 
-from helpers.process_pool import recommended_process_workers, run_cpu_bound
+from helpers import process_pool
+from helpers.process_pool import CpuJob, recommended_process_workers, run_cpu_bound, run_cpu_bound_batch
 
 
 def _multiply(a: int, b: int) -> int:
     return a * b
 
 
+def _reverse(raw: bytes, *, suffix: bytes = b"") -> bytes:
+    return raw[::-1] + suffix
+
+
+def _lookup(mapping: dict, key: str):
+    return mapping[key]
+
+
+def _fail_on_three(value: int) -> int:
+    if value == 3:
+        raise ValueError("three")
+    return value * 10
+
+
 class ProcessPoolTests(unittest.TestCase):
     def test_recommended_workers_is_positive(self) -> None:
         self.assertGreaterEqual(recommended_process_workers(), 1)
@@ -20,6 +36,40 @@ class ProcessPoolTests(unittest.TestCase):
         result = asyncio.run(run_cpu_bound(lambda value: value + 1, 41))
         self.assertEqual(result, 42)
 
+    def test_large_buffers_round_trip_through_shared_memory(self) -> None:
+        raw = os.urandom(process_pool.SHARED_MEMORY_MIN_BYTES + 1)
+
+        result = asyncio.run(run_cpu_bound(_reverse, raw, suffix=b"!"))
+
+        self.assertEqual(result, raw[::-1] + b"!")
+
+    def test_unpicklable_argument_values_fall_back_to_threads(self) -> None:
+        self.assertEqual(asyncio.run(run_cpu_bound(_lookup, {"a": 1}, "a")), 1)
+        # Same argument types as above, but this dict holds a lambda.
+        self.assertEqual(asyncio.run(run_cpu_bound(_lookup, {"a": lambda: 2}, "a"))(), 2)
+        self.assertNotIn(_lookup, process_pool._UNPICKLABLE_FUNCS)
+
+    def test_batch_keeps_job_order_across_submissions(self) -> None:
+        raw = os.urandom(process_pool.SHARED_MEMORY_MIN_BYTES)
+        jobs = [CpuJob((raw[index:],), {"suffix": bytes([index])}) for index in range(7)]
+
+        results = asyncio.run(run_cpu_bound_batch(_reverse, jobs, batch_size=3))
+
+        self.assertEqual(results, [raw[index:][::-1] + bytes([index]) for index in range(7)])
+
+    def test_batch_reports_failures_per_job(self) -> None:
+        jobs = [CpuJob((value,)) for value in range(5)]
+
+        results = asyncio.run(run_cpu_bound_batch(_fail_on_three, jobs, return_exceptions=True))
+        self.assertEqual(results[:3] + results[4:], [0, 10, 20, 40])
+        self.assertIsInstance(results[3], ValueError)
+        with self.assertRaises(ValueError):
+            asyncio.run(run_cpu_bound_batch(_fail_on_three, jobs))
+
+    def test_batch_falls_back_to_threads_for_unpicklable_callables(self) -> None:
+        results = asyncio.run(run_cpu_bound_batch(lambda value: value + 1, [CpuJob((1,)), CpuJob((2,))]))
+        self.assertEqual(results, [2, 3])
+
 
 if __name__ == "__main__":
     unittest.main()
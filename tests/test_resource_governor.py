@@ -0,0 +1,120 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers.resource_governor import ResourceBudget, ResourceGovernor
+from helpers.service_health import ServiceHealthReporter, ServiceMetricsConfig
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResourceBudgetTests(unittest.TestCase):
+    def test_shared_budget_caps_combined_concurrency_across_scrapers(self):
+        async def run_test():
+            budget = ResourceBudget("network", 3)
+            olx = budget.limit("olx", 3)
+            shafa = budget.limit("shafa", 3)
+            active = 0
+            peak = 0
+
+            async def request(semaphore):
+                nonlocal active, peak
+                async with semaphore:
+                    active += 1
+                    peak = max(peak, active)
+                    await asyncio.sleep(0.01)
+                    active -= 1
+
+            await asyncio.gather(*(request(olx) for _ in range(5)), *(request(shafa) for _ in range(5)))
+            return peak, budget.stats()
+
+        peak, stats = asyncio.run(run_test())
+
+        self.assertEqual(peak, 3)
+        self.assertEqual(stats["peak_in_use"], 3)
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["acquisitions"], {"olx": 5, "shafa": 5})
+
+    def test_local_limit_keeps_one_scraper_from_taking_the_whole_budget(self):
+        async def run_test():
+            budget = ResourceBudget("cpu", 4)
+            olx = budget.limit("olx", 1)
+            release = asyncio.Event()
+
+            async def transform():
+                async with olx:
+                    await release.wait()
+
+            tasks = [asyncio.create_task(transform()) for _ in range(3)]
+            await asyncio.sleep(0)
+            in_use = budget.in_use
+            release.set()
+            await asyncio.gather(*tasks)
+            return in_use
+
+        self.assertEqual(asyncio.run(run_test()), 1)
+
+    def test_utilization_integrates_held_slots_over_time(self):
+        async def run_test():
+            clock = FakeClock()
+            budget = ResourceBudget("telegram", 2, clock=clock)
+            await budget.acquire("olx")
+            clock.now = 10.0
+            await budget.acquire("shafa")
+            clock.now = 15.0
+            budget.release()
+            budget.release()
+            clock.now = 20.0
+            return budget.stats()
+
+        stats = asyncio.run(run_test())
+
+        # 10s at 1/2 slots, 5s at 2/2, 5s idle: 20 slot-seconds of 40.
+        self.assertEqual(stats["utilization"], 0.5)
+        self.assertEqual(stats["saturated_ratio"], 0.25)
+
+    def test_bounded_wraps_a_coroutine_function_in_the_budget(self):
+        async def run_test():
+            budget = ResourceBudget("cpu", 1)
+            seen = []
+
+            async def transform(value):
+                seen.append(budget.in_use)
+                return value * 2
+
+            result = await budget.bounded("shafa", transform)(21)
+            return result, seen, budget.in_use, budget.acquisitions["shafa"]
+
+        self.assertEqual(asyncio.run(run_test()), (42, [1], 0, 1))
+
+
+class BudgetReportingTests(unittest.TestCase):
+    def test_budget_stats_land_in_health_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            health_file = Path(tmp) / "service.json"
+            reporter = ServiceHealthReporter(
+                ServiceMetricsConfig(service_name="test-service", health_file=health_file, metrics_port=None)
+            )
+            reporter.start()
+            governor = ResourceGovernor(network=4, cpu=2, telegram=1)
+            for name, stats in governor.stats().items():
+                reporter.record_budget_stats(f"market_{name}", stats)
+            reporter.flush()
+
+            snapshot = json.loads(health_file.read_text(encoding="utf-8"))
+
+        budgets = snapshot["service_state"]["resource_budgets"]
+        self.assertEqual(sorted(budgets), ["market_cpu", "market_network", "market_telegram"])
+        self.assertEqual(budgets["market_network"]["capacity"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
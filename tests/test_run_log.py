@@ -0,0 +1,104 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+from helpers.run_log import RunLogStore, append_to_ledger, ledger_segments, run_log_for, summarize_runs
+from helpers.scraper_stats import RunStatsCollector
+
+
+def _summary(run_id: str, scraper: str, started_at: str, duration: float, *, outcome: str = "success") -> dict:
+    return {
+        "run_id": run_id,
+        "scraper": scraper,
+        "started_at_utc": started_at,
+        "finished_at_utc": started_at,
+        "outcome": outcome,
+        "duration_seconds": duration,
+        "counters": {"items_scraped": 10, "items_sent": 1},
+        "fields": {"resources": {"max_rss_mb": 120.5, "user_cpu_seconds": 3.0, "system_cpu_seconds": 0.5}},
+    }
+
+
+class RunLogStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmpdir.name)
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def test_duration_stats_cover_the_latest_runs_per_scraper(self) -> None:
+        store = RunLogStore(self.root / "runs.db", retention_days=0)
+        for minute in range(60):
+            store.record(_summary(f"olx-{minute}", "olx", f"2026-05-04T10:{minute:02d}:00Z", float(minute + 1)))
+        store.record(_summary("olx-failed", "olx", "2026-05-04T11:00:00Z", 500.0, outcome="error"))
+        store.record(_summary("shafa-1", "shafa", "2026-05-04T10:00:00Z", 7.0))
+        store.record(_summary("olx-failed", "olx", "2026-05-04T11:00:00Z", 500.0, outcome="error"))
+
+        stats = store.duration_stats("olx", limit=50)
+        self.assertEqual(stats["runs"], 50)
+        self.assertEqual(stats["last_outcome"], "error")
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["p50_duration_seconds"], 37.0)
+        self.assertEqual(stats["p95_duration_seconds"], 59.0)
+        self.assertEqual(stats["max_duration_seconds"], 500.0)
+        recent = store.recent_runs("olx", limit=1)[0]
+        self.assertEqual((recent["run_id"], recent["cpu_seconds"], recent["max_rss_mb"]), ("olx-failed", 3.5, 120.5))
+        self.assertEqual(store.run_summary("shafa-1")["duration_seconds"], 7.0)
+        self.assertEqual(store.scrapers(), ["olx", "shafa"])
+
+    def test_retention_drops_raw_runs_but_keeps_rollups(self) -> None:
+        store = RunLogStore(self.root / "runs.db", retention_days=0)
+        store.record(_summary("old", "olx", "2026-01-01T10:00:00Z", 10.0))
+        store.record(_summary("old-2", "olx", "2026-01-01T12:00:00Z", 30.0))
+        store.retention_days = 30
+
+        deleted = store.prune(now=datetime(2026, 5, 4, tzinfo=timezone.utc))
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(store.recent_runs("olx"), [])
+        rollup = store.daily_rollups(days=1, end_date="2026-01-01", scraper="olx")
+        self.assertEqual(len(rollup), 1)
+        self.assertEqual(
+            (rollup[0]["runs"], rollup[0]["mean_duration_seconds"], rollup[0]["max_duration_seconds"]),
+            (2, 20.0, 30.0),
+        )
+
+    def test_ledger_rotates_by_size_and_index_imports_its_history(self) -> None:
+        ledger = self.root / "scraper_runs.jsonl"
+        for index in range(6):
+            line = json.dumps(_summary(f"run-{index}", "lyst", f"2026-05-04T10:0{index}:00Z", 5.0)) + "\n"
+            append_to_ledger(ledger, line, max_bytes=1, keep_segments=3)
+
+        segments = ledger_segments(ledger)
+        self.assertEqual([path.name for path in segments], [
+            "scraper_runs.jsonl",
+            "scraper_runs.jsonl.1",
+            "scraper_runs.jsonl.2",
+            "scraper_runs.jsonl.3",
+        ])
+        self.assertEqual(json.loads(segments[0].read_text(encoding="utf-8"))["run_id"], "run-5")
+
+        store = run_log_for(ledger, retention_days=0)
+        self.assertEqual([run["run_id"] for run in store.recent_runs("lyst")], ["run-5", "run-4", "run-3", "run-2"])
+
+    def test_collector_writes_ledger_and_index(self) -> None:
+        ledger = self.root / "scraper_runs.jsonl"
+        times = iter(["2026-05-04T10:00:00Z", "2026-05-04T10:01:00Z"])
+        collector = RunStatsCollector("olx", run_id="run-collector", now_func=lambda: next(times))
+        store = RunLogStore(self.root / "index.db", retention_days=0)
+
+        collector.write_jsonl(ledger, collector.finish(outcome="success"), run_log=store, suppress_errors=False)
+
+        self.assertEqual(len(ledger.read_text(encoding="utf-8").splitlines()), 1)
+        self.assertEqual(store.duration_stats("olx")["runs"], 1)
+
+    def test_summarize_runs_is_empty_without_a_ledger(self) -> None:
+        self.assertEqual(summarize_runs(self.root / "missing.jsonl"), {})
+        self.assertFalse((self.root / "missing.db").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
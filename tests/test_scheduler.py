@@ -0,0 +1,259 @@
+import asyncio
+import heapq
+import itertools
+import unittest
+from unittest.mock import Mock
+
+from helpers.scheduler import JobScheduler, handle_scheduler_command, run_lyst_scheduler, run_market_scheduler
+
+
+class VirtualClock:
+    # Stands in for time.time/asyncio.sleep: sleepers wake only when advance() moves
+    # the clock past their deadline, so tests see exactly how long the scheduler sleeps.
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + delay, next(self._seq), future))
+        await future
+
+    async def settle(self):
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+    async def advance(self, seconds):
+        target = self.now + seconds
+        await self.settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            wake_ts, _, future = heapq.heappop(self._sleepers)
+            self.now = max(self.now, wake_ts)
+            if not future.done():
+                future.set_result(None)
+            await self.settle()
+        self.now = target
+        await self.settle()
+
+
+async def _stop(task):
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+class JobSchedulerTests(unittest.TestCase):
+    def test_market_scheduler_sleeps_exactly_until_next_due_feed(self):
+        async def run_test():
+            clock = VirtualClock()
+            started = []
+
+            async def run_olx():
+                started.append(("olx", clock.now))
+
+            async def run_shafa():
+                started.append(("shafa", clock.now))
+
+            task = asyncio.create_task(
+                run_market_scheduler(
+                    run_olx=run_olx,
+                    run_shafa=run_shafa,
+                    logger=Mock(),
+                    last_olx_run_exists=True,
+                    last_shafa_run_exists=True,
+                    olx_min_sec=600,
+                    olx_max_sec=600,
+                    shafa_min_sec=900,
+                    shafa_max_sec=900,
+                    clock=clock.time,
+                    sleep=clock.sleep,
+                )
+            )
+            await clock.settle()
+            first_sleep = clock.sleeps[-1]
+            await clock.advance(600)
+            after_olx_sleep = clock.sleeps[-1]
+            await clock.advance(300)
+            await _stop(task)
+            return first_sleep, after_olx_sleep, started
+
+        first_sleep, after_olx_sleep, started = asyncio.run(run_test())
+
+        self.assertEqual(first_sleep, 600)
+        self.assertEqual(after_olx_sleep, 300)
+        self.assertEqual(started, [("olx", 1600), ("shafa", 1900)])
+
+    def test_market_class_limit_runs_due_feeds_one_after_another(self):
+        async def run_test():
+            clock = VirtualClock()
+            olx_release = asyncio.Event()
+            started = []
+
+            async def run_olx():
+                started.append("olx")
+                await olx_release.wait()
+
+            async def run_shafa():
+                started.append("shafa")
+
+            task = asyncio.create_task(
+                run_market_scheduler(
+                    run_olx=run_olx,
+                    run_shafa=run_shafa,
+                    logger=Mock(),
+                    last_olx_run_exists=False,
+                    last_shafa_run_exists=False,
+                    clock=clock.time,
+                    sleep=clock.sleep,
+                )
+            )
+            await clock.settle()
+            while_olx_runs = list(started)
+            olx_release.set()
+            await clock.settle()
+            await _stop(task)
+            return while_olx_runs, started
+
+        while_olx_runs, started = asyncio.run(run_test())
+
+        self.assertEqual(while_olx_runs, ["olx"])
+        self.assertEqual(started, ["olx", "shafa"])
+
+    def test_commands_run_a_job_now_and_cancel_its_run(self):
+        async def run_test():
+            clock = VirtualClock()
+            release = asyncio.Event()
+            runs = []
+
+            async def run_report():
+                runs.append(clock.now)
+                await release.wait()
+
+            scheduler = JobScheduler("reports", logger=Mock(), clock=clock.time, sleep=clock.sleep)
+            job = scheduler.add_job("report", run_report, interval_sec=3600)
+            task = asyncio.create_task(scheduler.run_forever())
+            await clock.settle()
+            before = list(runs)
+            run_reply = handle_scheduler_command("/runnow", ["report"])
+            await clock.settle()
+            jobs_reply = handle_scheduler_command("/jobs", [])
+            cancel_reply = handle_scheduler_command("/cancel", ["report"])
+            await clock.settle()
+            outcome = job.accountant.last_outcome
+            next_run_in = scheduler.jobs_status()[0]["next_run_in_sec"]
+            await _stop(task)
+            return before, runs, run_reply, jobs_reply, cancel_reply, outcome, next_run_in
+
+        before, runs, run_reply, jobs_reply, cancel_reply, outcome, next_run_in = asyncio.run(run_test())
+
+        self.assertEqual(before, [])
+        self.assertEqual(runs, [1000])
+        self.assertIn("REPORT run scheduled now", run_reply)
+        self.assertIn("report: running", jobs_reply)
+        self.assertIn("REPORT run cancelled", cancel_reply)
+        self.assertEqual(outcome, "cancelled")
+        self.assertEqual(next_run_in, 3600)
+
+    def test_cancel_without_a_running_job_skips_the_next_run(self):
+        async def run_test():
+            clock = VirtualClock()
+            runs = []
+
+            async def run_report():
+                runs.append(clock.now)
+
+            scheduler = JobScheduler("reports", logger=Mock(), clock=clock.time, sleep=clock.sleep)
+            scheduler.add_job("report", run_report, interval_sec=600, first_run_ts=1100)
+            task = asyncio.create_task(scheduler.run_forever())
+            await clock.settle()
+            result = scheduler.cancel("report")
+            await clock.advance(100)
+            skipped = list(runs)
+            await clock.advance(500)
+            await _stop(task)
+            return result, skipped, runs
+
+        result, skipped, runs = asyncio.run(run_test())
+
+        self.assertEqual(result, "skipped_next")
+        self.assertEqual(skipped, [])
+        self.assertEqual(runs, [1600])
+
+    def test_lyst_stall_watchdog_wakes_at_deadline_and_cancels_run(self):
+        async def run_test():
+            clock = VirtualClock()
+            stalled = []
+            finished = asyncio.Event()
+
+            async def run_lyst():
+                try:
+                    await asyncio.Event().wait()
+                finally:
+                    finished.set()
+
+            task = asyncio.create_task(
+                run_lyst_scheduler(
+                    run_lyst=run_lyst,
+                    is_running_lyst=lambda: True,
+                    get_lyst_progress_ts=lambda: None,
+                    check_interval_sec=3600,
+                    check_jitter_sec=0,
+                    logger=Mock(),
+                    on_lyst_stall=lambda lyst_task: stalled.append(clock.now),
+                    lyst_stall_timeout_sec=100,
+                    clock=clock.time,
+                    sleep=clock.sleep,
+                )
+            )
+            await clock.settle()
+            first_sleep = clock.sleeps[-1]
+            await clock.advance(100)
+            await _stop(task)
+            return first_sleep, stalled, finished.is_set()
+
+        first_sleep, stalled, finished = asyncio.run(run_test())
+
+        self.assertEqual(first_sleep, 100)
+        self.assertEqual(stalled, [1100])
+        self.assertTrue(finished)
+
+    def test_disabled_job_is_skipped_and_rescheduled(self):
+        async def run_test():
+            clock = VirtualClock()
+            runs = []
+            logger = Mock()
+
+            async def run_lyst():
+                runs.append(clock.now)
+
+            task = asyncio.create_task(
+                run_lyst_scheduler(
+                    run_lyst=run_lyst,
+                    is_running_lyst=lambda: False,
+                    get_lyst_progress_ts=lambda: None,
+                    check_interval_sec=60,
+                    check_jitter_sec=0,
+                    logger=logger,
+                    clock=clock.time,
+                    sleep=clock.sleep,
+                )
+            )
+            await clock.settle()
+            await clock.advance(60)
+            await _stop(task)
+            return runs, clock.sleeps, logger
+
+        runs, sleeps, logger = asyncio.run(run_test())
+
+        self.assertEqual(runs, [])
+        self.assertEqual(sleeps[:2], [60, 60])
+        logger.info.assert_any_call("%s scraping disabled", "Lyst")
+
+
+if __name__ == "__main__":
+    unittest.main()
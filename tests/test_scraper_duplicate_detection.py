@@ -193,3 +193,47 @@ class ShafaDuplicateDetectionTests(unittest.TestCase):
         result = __import__("asyncio").run(_send())
         self.assertIsNone(result)
         self.assertEqual(calls["count"], 3)
+
+
+class ShafaRepositoryWriterTests(unittest.IsolatedAsyncioTestCase):
+    async def test_repository_writes_are_visible_to_sync_helpers(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            original_db = shafa_scraper.DB_FILE
+            repository = shafa_scraper.ShafaRepository()
+            try:
+                shafa_scraper.DB_FILE = Path(tmp_dir) / "shafa_items.db"
+                shafa_scraper._db_init_sync()
+                item = shafa_scraper.ShafaItem(
+                    id="shafa-1",
+                    name="Nike Air Max",
+                    link="https://example.com/1",
+                    price_text="5000 грн",
+                    price_int=5000,
+                )
+
+                self.assertTrue(await repository.claim_notification_key(item, "SHAFA"))
+                self.assertFalse(await repository.claim_notification_key(item, "SHAFA"))
+                await repository.mark_notification_sent(item, "SHAFA", telegram_message_id=777)
+                await repository.persist_items([shafa_scraper.ItemUpdate(item=item, touch_last_sent=True)], "SHAFA")
+                await repository.update_source_stats("https://shafa.ua/src", 3, 1)
+
+                existing = await repository.fetch_existing(["shafa-1", "missing"])
+                self.assertEqual(existing[0]["price_int"], 5000)
+                self.assertIsNotNone(existing[0]["last_sent_at"])
+                self.assertIsNone(existing[1])
+                stats = await repository.get_source_stats("https://shafa.ua/src")
+                self.assertEqual((stats.streak, stats.cycle_count), (3, 1))
+
+                # The sync helpers must observe exactly what the shared writer committed.
+                candidate = shafa_scraper.ShafaItem(
+                    id="shafa-2",
+                    name="nike  air max",
+                    link="https://example.com/2",
+                    price_text="5000 грн",
+                    price_int=5000,
+                )
+                self.assertIn(("nike air max", 5000), shafa_scraper._db_fetch_duplicate_keys_sync([candidate]))
+                self.assertFalse(shafa_scraper._db_claim_notification_key_sync(candidate, "SHAFA"))
+            finally:
+                await shafa_scraper._db().close()
+                shafa_scraper.DB_FILE = original_db
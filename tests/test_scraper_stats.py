@@ -1,10 +1,19 @@
 import json
 import tempfile
+import time
 import unittest
 from pathlib import Path
 
 from helpers.analytics_events import AnalyticsSink
-from helpers.scraper_stats import RunStatsCollector
+from helpers.scraper_stats import RunStatsCollector, profiling_requested, request_run_profile
+
+
+def _burn_cpu(seconds: float) -> int:
+    deadline = time.process_time() + seconds
+    total = 0
+    while time.process_time() < deadline:
+        total += sum(range(200))
+    return total
 
 
 class RunStatsCollectorTests(unittest.TestCase):
@@ -94,3 +103,42 @@ class RunStatsCollectorTests(unittest.TestCase):
         self.assertEqual(summary["fields"]["coverage"]["completed_percent"], 70.0)
         self.assertEqual(summary["fields"]["notification_funnel"]["sent_per_1000_seen"], 10.0)
         self.assertEqual(summary["sources"][0]["sent_per_1000_items"], 10.0)
+
+
+class RunProfilingTests(unittest.TestCase):
+    def test_profiled_run_writes_collapsed_stacks_and_top_frames(self):
+        times = iter(["2026-05-04T10:00:00Z", "2026-05-04T10:01:00Z"])
+        collector = RunStatsCollector("olx", run_id="abcdef123456", now_func=lambda: next(times), profile=True)
+        _burn_cpu(0.3)
+        summary = collector.finish(outcome="success")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = Path(tmp_dir) / "runs.jsonl"
+            sink = AnalyticsSink(Path(tmp_dir) / "analytics")
+            collector.write_jsonl(output_path, summary, analytics_sink=sink)
+
+            record = json.loads(output_path.read_text(encoding="utf-8"))
+            profile = record["fields"]["profile"]
+            self.assertEqual(profile["collapsed_file"], "profiles/olx_20260504T100000Z_abcdef12.collapsed")
+            collapsed = (Path(tmp_dir) / profile["collapsed_file"]).read_text(encoding="utf-8").splitlines()
+
+        self.assertGreater(profile["samples"], 10)
+        self.assertTrue(any("test_scraper_stats.py:_burn_cpu" in line for line in collapsed))
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed))
+        burn = next(frame for frame in profile["top_frames"] if frame["frame"] == "test_scraper_stats.py:_burn_cpu")
+        self.assertGreater(burn["self_percent"], 50)
+
+    def test_bot_request_profiles_one_matching_run(self):
+        request_run_profile("shafa")
+
+        self.assertFalse(profiling_requested("olx", configured=""))
+        self.assertTrue(profiling_requested("shafa", configured=""))
+        self.assertFalse(profiling_requested("shafa", configured=""))
+        self.assertTrue(profiling_requested("lyst", configured="olx,lyst"))
+        self.assertTrue(profiling_requested("shafa", configured="all"))
+
+    def test_unprofiled_run_has_no_profile(self):
+        collector = RunStatsCollector("olx", profile=False)
+        collector.stop_profiling()
+
+        self.assertNotIn("profile", collector.finish(outcome="success")["fields"])
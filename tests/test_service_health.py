@@ -1,10 +1,24 @@
+import asyncio
+import contextlib
 import json
 import tempfile
+import time
 import unittest
 from pathlib import Path
 
+from prometheus_client import CollectorRegistry
+
 from helpers.analytics_events import AnalyticsSink
-from helpers.service_health import ServiceHealthReporter, ServiceMetricsConfig
+from helpers.scraper_stats import RunStatsCollector
+from helpers.service_health import EventLoopProfiler, ServiceHealthReporter, ServiceMetricsConfig
+
+
+def _block_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def _idle() -> None:
+    await asyncio.sleep(60)
 
 
 class ServiceHealthReporterTests(unittest.TestCase):
@@ -81,5 +95,126 @@ class ServiceHealthReporterTests(unittest.TestCase):
         self.assertEqual(daily["groups"]["operation=exchange_rate_check|outcome=failure|service=test-service"]["counters"]["failures"], 1)
 
 
+class DebouncedSnapshotTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.health_file = Path(self._tmpdir.name) / "service.json"
+        self.now = 1000.0
+        self.reporter = ServiceHealthReporter(
+            ServiceMetricsConfig(
+                service_name="test-service",
+                health_file=self.health_file,
+                metrics_port=None,
+                snapshot_interval_sec=3600,
+            ),
+            clock=lambda: self.now,
+        )
+
+    def tearDown(self) -> None:
+        self.reporter.flush()
+        self._tmpdir.cleanup()
+
+    def _read_snapshot(self) -> dict:
+        return json.loads(self.health_file.read_text(encoding="utf-8"))
+
+    def test_updates_within_interval_are_coalesced(self) -> None:
+        self.reporter.start()
+        self.reporter.mark_ready("booted")
+        for n in range(50):
+            self.reporter.set_state_fields(progress=n)
+
+        self.assertEqual(self.reporter.snapshot_stats(), {"fsyncs": 2, "coalesced": 50})
+        self.assertNotIn("progress", self._read_snapshot()["service_state"])
+
+        self.now += 3600
+        self.reporter.set_state_fields(progress=50)
+
+        self.assertEqual(self._read_snapshot()["service_state"]["progress"], 50)
+        self.assertEqual(self.reporter.snapshot_stats()["fsyncs"], 3)
+
+    def test_status_change_and_shutdown_write_immediately(self) -> None:
+        self.reporter.start()
+        self.reporter.mark_ready("booted")
+        self.reporter.record_success("job")
+        self.reporter.record_failure("job", "boom")
+
+        self.assertEqual(self._read_snapshot()["status"], "degraded")
+        self.assertEqual(self.reporter.snapshot_stats()["fsyncs"], 3)
+
+        self.reporter.set_state_fields(queue=4)
+        self.reporter.mark_stopping("bye")
+
+        snapshot = self._read_snapshot()
+        self.assertEqual(snapshot["status"], "stopping")
+        self.assertEqual(snapshot["service_state"]["queue"], 4)
+        self.assertEqual(snapshot["snapshot_writes"]["fsyncs"], 4)
+
+    def test_pending_update_is_written_by_timer(self) -> None:
+        reporter = ServiceHealthReporter(
+            ServiceMetricsConfig(
+                service_name="test-service",
+                health_file=self.health_file,
+                metrics_port=None,
+                snapshot_interval_sec=0.2,
+            )
+        )
+        reporter.start()
+        reporter.set_state_fields(progress=1)
+        self.assertNotIn("progress", self._read_snapshot()["service_state"])
+
+        deadline = time.monotonic() + 5
+        while "progress" not in self._read_snapshot()["service_state"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self._read_snapshot()["service_state"]["progress"], 1)
+        self.assertEqual(reporter.snapshot_stats(), {"fsyncs": 2, "coalesced": 1})
+
+
+class EventLoopProfilerTests(unittest.IsolatedAsyncioTestCase):
+    def _profiler(self) -> EventLoopProfiler:
+        return EventLoopProfiler(
+            "test-service",
+            CollectorRegistry(),
+            sample_interval_sec=0.01,
+            slow_callback_sec=0.1,
+            census_interval_sec=60,
+        )
+
+    async def test_blocking_callback_is_captured_with_its_stack(self) -> None:
+        profiler = self._profiler()
+        run_stats = RunStatsCollector("lyst")
+        task = asyncio.create_task(profiler.run())
+        await asyncio.sleep(0.05)
+        _block_loop(0.4)
+        await asyncio.sleep(0.05)
+        run_stats.set_resource_snapshot()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+        summary = run_stats.fields["event_loop"]
+        self.assertEqual(summary["stalls_total"], 1)
+        stall = summary["stalls"][0]
+        self.assertEqual(stall["site"], "test_service_health.py:_block_loop")
+        self.assertTrue(any("_block_loop" in line for line in stall["stack"]))
+        self.assertGreaterEqual(stall["lag_sec"], 0.3)
+        self.assertGreaterEqual(summary["lag"]["max_sec"], 0.3)
+
+    async def test_census_counts_tasks_by_coroutine(self) -> None:
+        profiler = self._profiler()
+        idle = [asyncio.create_task(_idle()) for _ in range(3)]
+        await asyncio.sleep(0)
+        try:
+            census = profiler.take_census()
+        finally:
+            for task in idle:
+                task.cancel()
+            await asyncio.gather(*idle, return_exceptions=True)
+
+        self.assertEqual(census["by_coroutine"]["_idle"], 3)
+        self.assertIn("_idle", {entry["coroutine"] for entry in census["longest_running"]})
+        self.assertEqual(profiler.summary()["tasks"]["by_coroutine"]["_idle"], 3)
+
+
 if __name__ == "__main__":
     unittest.main()
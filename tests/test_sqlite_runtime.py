@@ -0,0 +1,336 @@
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from helpers import sqlite_runtime
+from helpers.sqlite_runtime import (
+    DirectSQLiteAccess,
+    RetentionRule,
+    SQLiteConnectionManager,
+    SQLiteWriteActor,
+    close_connection_managers,
+    connection_manager_for,
+    run_incremental_db_maintenance,
+)
+
+
+def _create_table(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+
+def _insert(conn: sqlite3.Connection, key: str, value: int) -> int:
+    conn.execute("INSERT INTO kv (key, value) VALUES (?, ?)", (key, value))
+    return value
+
+
+def _count(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0])
+
+
+def _count_items(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0])
+
+
+def _rollback(conn: sqlite3.Connection) -> None:
+    conn.execute("ROLLBACK")
+
+
+def _interrupt(conn: sqlite3.Connection) -> None:
+    raise KeyboardInterrupt
+
+
+class SQLiteWriteActorTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self._tmp_dir.name) / "actor.db"
+        self.actor = SQLiteWriteActor(self.db_path, max_batch=64)
+        self.actor.start()
+        await self.actor.submit(_create_table)
+
+    async def asyncTearDown(self) -> None:
+        await self.actor.close()
+        self._tmp_dir.cleanup()
+
+    async def test_concurrent_jobs_are_coalesced_into_fewer_transactions(self) -> None:
+        # Hold the writer so the 200 jobs are all queued before it drains them; otherwise
+        # a busy host can hand the writer each job as soon as it is submitted.
+        started, release = threading.Event(), threading.Event()
+        blocker = self.actor.submit_nowait(lambda conn: started.set() or release.wait(5))
+        started.wait(5)
+        transactions_before = self.actor.stats.transactions
+        pending = [asyncio.ensure_future(self.actor.submit(_insert, f"k{i}", i)) for i in range(200)]
+        await asyncio.sleep(0)
+        release.set()
+        blocker.result(5)
+        results = await asyncio.gather(*pending)
+
+        self.assertEqual(results, list(range(200)))
+        self.assertEqual(await self.actor.submit(_count), 200)
+        self.assertLess(self.actor.stats.transactions - transactions_before, 200)
+        self.assertGreater(self.actor.stats.largest_batch, 1)
+
+    async def test_failed_job_does_not_roll_back_its_batch_neighbours(self) -> None:
+        await self.actor.submit(_insert, "dup", 1)
+        results = await asyncio.gather(
+            self.actor.submit(_insert, "a", 1),
+            self.actor.submit(_insert, "dup", 2),
+            self.actor.submit(_insert, "b", 3),
+            return_exceptions=True,
+        )
+
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], sqlite3.IntegrityError)
+        self.assertEqual(results[2], 3)
+        self.assertEqual(await self.actor.submit(_count), 3)
+
+    async def test_job_that_ends_the_transaction_fails_its_batch_without_killing_the_writer(self) -> None:
+        started, release = threading.Event(), threading.Event()
+        blocker = self.actor.submit_nowait(lambda conn: started.set() or release.wait(5))
+        started.wait(5)
+        futures = [
+            self.actor.submit_nowait(_insert, "before", 1),
+            self.actor.submit_nowait(_rollback),
+            self.actor.submit_nowait(_insert, "after", 2),
+            self.actor.submit_nowait(_interrupt),
+            self.actor.submit_nowait(_insert, "last", 3),
+        ]
+        release.set()
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures), return_exceptions=True)
+
+        self.assertTrue(await asyncio.wrap_future(blocker))
+        self.assertIsInstance(results[0], sqlite3.OperationalError)
+        self.assertIsInstance(results[1], sqlite3.OperationalError)
+        self.assertEqual(results[2], 2)
+        self.assertIsInstance(results[3], KeyboardInterrupt)
+        self.assertEqual(results[4], 3)
+        self.assertTrue(self.actor.running)
+        self.assertEqual(await self.actor.submit(_count), 2)
+
+    async def test_close_flushes_queued_writes_and_rejects_new_ones(self) -> None:
+        pending = [self.actor.submit_nowait(_insert, f"q{i}", i) for i in range(10)]
+        await self.actor.close()
+
+        self.assertTrue(all(future.done() for future in pending))
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(_count(conn), 10)
+        finally:
+            conn.close()
+        with self.assertRaises(RuntimeError):
+            self.actor.submit_nowait(_count)
+
+
+class SQLiteConnectionManagerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.manager = SQLiteConnectionManager(Path(self._tmp_dir.name) / "managed.db")
+        self.manager.write_sync(_create_table)
+
+    def tearDown(self) -> None:
+        self.manager.close_sync()
+        self._tmp_dir.cleanup()
+
+    def test_each_thread_reuses_one_reader_connection(self) -> None:
+        seen: dict[str, set[int]] = {}
+
+        def reads(name: str) -> None:
+            for _ in range(20):
+                self.manager.read_sync(_count)
+                seen.setdefault(name, set()).add(id(self.manager.reader()))
+
+        threads = [threading.Thread(target=reads, args=(f"t{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([len(ids) for ids in seen.values()], [1, 1, 1, 1])
+        stats = self.manager.stats()
+        self.assertEqual(stats["reader_connections"], 4)
+        self.assertEqual(stats["reads"], 80)
+        self.assertGreaterEqual(stats["read_statements"], 80)
+
+    def test_read_leaves_no_transaction_open(self) -> None:
+        self.manager.write_sync(_insert, "a", 1)
+
+        self.manager.read_sync(lambda conn: conn.execute("BEGIN") and _count(conn))
+
+        self.assertFalse(self.manager.reader().in_transaction)
+
+    def test_concurrent_readers_and_writers_see_every_commit(self) -> None:
+        # Reader threads poll while worker threads and an event loop write through the
+        # shared writer; nothing may hit "database is locked" and every row must land.
+        stop = threading.Event()
+        reader_errors: list[BaseException] = []
+        regressions: list[tuple[int, int]] = []
+
+        def poll() -> None:
+            last = 0
+            try:
+                while not stop.is_set():
+                    count = self.manager.read_sync(_count)
+                    if count < last:
+                        regressions.append((last, count))
+                    last = count
+            except BaseException as exc:  # pragma: no cover - reported by the assertion below
+                reader_errors.append(exc)
+
+        def write_from_thread(prefix: str) -> None:
+            for i in range(50):
+                self.manager.write_sync(_insert, f"{prefix}{i}", i)
+
+        async def write_from_loop() -> None:
+            await asyncio.gather(*(self.manager.write(_insert, f"async{i}", i) for i in range(100)))
+
+        readers = [threading.Thread(target=poll) for _ in range(4)]
+        writers = [threading.Thread(target=write_from_thread, args=(f"thread{n}-",)) for n in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        asyncio.run(write_from_loop())
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(reader_errors, [])
+        self.assertEqual(self.manager.read_sync(_count), 300)
+        self.assertEqual(regressions, [])
+        stats = self.manager.stats()
+        self.assertEqual(stats["write_jobs"], 301)
+        self.assertEqual(stats["failed_write_jobs"], 0)
+        self.assertLessEqual(stats["write_transactions"], 301)
+        self.assertGreaterEqual(stats["write_statements"], 300)
+        self.assertGreaterEqual(stats["max_lock_wait_seconds"], 0.0)
+        self.assertLessEqual(stats["max_write_queue_wait_seconds"], stats["write_queue_wait_seconds"])
+
+
+class StepClock:
+    # Every reading advances by one second, so a 2.5s step budget allows three batches.
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        self.now += 1.0
+        return self.now
+
+
+class IncrementalMaintenanceTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self._tmp_dir.name) / "items.db"
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, payload TEXT, updated_at TEXT NOT NULL)")
+            conn.executemany(
+                "INSERT INTO items (payload, updated_at) VALUES (?, datetime('now', ?))",
+                [("x" * 200, "-40 days")] * 1000 + [("y" * 200, "-1 days")] * 100,
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def tearDown(self) -> None:
+        close_connection_managers()
+        self._tmp_dir.cleanup()
+
+    def _count(self) -> int:
+        return connection_manager_for(self.db_path).read_sync(_count_items)
+
+    def test_retention_deletes_in_batches_within_the_step_budget(self) -> None:
+        rule = RetentionRule("items", "updated_at", 30)
+
+        first = run_incremental_db_maintenance(
+            self.db_path, retention=[rule], batch_rows=100, step_budget_sec=2.5, clock=StepClock()
+        )
+        remaining_after_first = self._count()
+        second = run_incremental_db_maintenance(self.db_path, retention=[rule], batch_rows=100)
+
+        self.assertEqual(first["retention"]["items"], {"deleted": 300, "batches": 3, "complete": False})
+        self.assertEqual(remaining_after_first, 800)
+        self.assertEqual(second["retention"]["items"]["deleted"], 700)
+        self.assertTrue(second["retention"]["items"]["complete"])
+        self.assertEqual(self._count(), 100)
+
+    def test_auto_vacuum_migration_then_incremental_vacuum_frees_pages(self) -> None:
+        migrated = run_incremental_db_maintenance(self.db_path, migrate_auto_vacuum=True)
+        report = run_incremental_db_maintenance(
+            self.db_path, retention=[RetentionRule("items", "updated_at", 30)], vacuum_pages=8
+        )
+        conn = sqlite3.connect(self.db_path)
+        try:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        finally:
+            conn.close()
+
+        self.assertEqual(migrated["auto_vacuum"], 2)
+        self.assertEqual(report["retention"]["items"]["deleted"], 1000)
+        self.assertGreater(report["incremental_vacuum"]["chunks"], 1)
+        self.assertEqual(report["incremental_vacuum"]["free_pages"], 0)
+        self.assertEqual(free_pages, 0)
+
+    def test_vacuum_is_skipped_without_incremental_auto_vacuum(self) -> None:
+        report = run_incremental_db_maintenance(self.db_path)
+
+        self.assertEqual(report["auto_vacuum"], 0)
+        self.assertIn("skipped", report["incremental_vacuum"])
+
+    def test_checkpoint_runs_only_once_the_wal_reaches_the_threshold(self) -> None:
+        skipped = run_incremental_db_maintenance(self.db_path, checkpoint_wal_bytes=1 << 40)
+        connection_manager_for(self.db_path).write_sync(
+            lambda conn: conn.execute("UPDATE items SET payload = payload || 'z'")
+        )
+        checkpointed = run_incremental_db_maintenance(self.db_path, checkpoint_wal_bytes=1)
+
+        self.assertEqual(skipped["checkpoint"]["skipped"], "below threshold")
+        self.assertEqual(checkpointed["checkpoint"]["busy"], 0)
+        self.assertGreater(checkpointed["checkpoint"]["checkpointed_frames"], 0)
+
+    def test_overlapping_pass_on_the_same_file_is_skipped(self) -> None:
+        started, release = threading.Event(), threading.Event()
+        manager = connection_manager_for(self.db_path)
+        blocker = manager._writer_actor().submit_nowait(lambda conn: started.set() or release.wait(5))
+        started.wait(5)
+        results = []
+        first = threading.Thread(
+            target=lambda: results.append(
+                run_incremental_db_maintenance(self.db_path, retention=[RetentionRule("items", "updated_at", 30)])
+            )
+        )
+        first.start()
+        time.sleep(0.05)
+        overlapping = run_incremental_db_maintenance(self.db_path)
+        release.set()
+        blocker.result(5)
+        first.join(5)
+
+        self.assertIsNone(overlapping)
+        self.assertEqual(results[0]["retention"]["items"]["deleted"], 1000)
+
+    def test_direct_access_runs_a_pass_without_starting_a_manager_writer(self) -> None:
+        db = DirectSQLiteAccess(self.db_path)
+        try:
+            report = run_incremental_db_maintenance(
+                self.db_path, db=db, retention=[RetentionRule("items", "updated_at", 30)], checkpoint_wal_bytes=1
+            )
+        finally:
+            db.close()
+
+        self.assertEqual(report["retention"]["items"]["deleted"], 1000)
+        self.assertIn("checkpointed_frames", report["checkpoint"])
+        self.assertNotIn(self.db_path, sqlite_runtime._MANAGERS)
+        self.assertEqual(self._count(), 100)
+
+    def test_missing_file_is_skipped(self) -> None:
+        self.assertEqual(
+            run_incremental_db_maintenance(Path(self._tmp_dir.name) / "missing.db"), {"skipped": "missing"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
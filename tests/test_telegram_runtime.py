@@ -1,6 +1,13 @@
+import asyncio
+import time
 import unittest
+from collections import defaultdict
+from unittest import mock
+
+from telegram.error import RetryAfter
 
 from helpers import telegram_runtime
+from helpers.telegram_runtime import ExpiringSet, TelegramMessageQueue, TelegramSendScheduler, TokenBucket
 
 
 class TelegramRuntimeTests(unittest.TestCase):
@@ -17,6 +24,220 @@ class TelegramRuntimeTests(unittest.TestCase):
             ["token-a", "token-b"],
         )
 
+    def test_token_bucket_peeks_without_consuming(self) -> None:
+        now = [0.0]
+        bucket = TokenBucket(2.0, 1.0, clock=lambda: now[0])
+
+        self.assertEqual(bucket.delay(), 0.0)
+        self.assertEqual(bucket.delay(), 0.0)
+        bucket.take()
+        self.assertAlmostEqual(bucket.delay(), 0.5)
+        now[0] = 0.5
+        self.assertEqual(bucket.delay(), 0.0)
+
+    def test_expiring_set_prunes_only_expired_prefix(self) -> None:
+        seen = ExpiringSet(10)
+        seen.add("a", 0)
+        seen.add("b", 5)
+        seen.add("a", 8)
+
+        seen.prune(16)
+
+        self.assertNotIn("b", seen)
+        self.assertIn("a", seen)
+        self.assertEqual(len(seen), 1)
+
+    def test_group_chats_are_detected(self) -> None:
+        self.assertTrue(telegram_runtime.is_group_chat(-1001234))
+        self.assertTrue(telegram_runtime.is_group_chat("@channel"))
+        self.assertFalse(telegram_runtime.is_group_chat("42"))
+
+
+class SharedBotRegistryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        # Start from an empty registry whatever earlier tests left behind; the original
+        # contents come back when the patch stops.
+        patcher = mock.patch.dict(telegram_runtime._SHARED_BOTS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await telegram_runtime.shutdown_shared_bots()
+
+    async def test_one_bot_per_token_until_shutdown(self) -> None:
+        factory_calls = []
+
+        def request_factory():
+            factory_calls.append(1)
+            return telegram_runtime.HTTPXRequest(connection_pool_size=2)
+
+        first = telegram_runtime.get_shared_bot("123:abc", request_factory=request_factory)
+
+        self.assertIs(telegram_runtime.get_shared_bot("'123:abc' "), first)
+        self.assertIsNot(telegram_runtime.get_shared_bot("456:def"), first)
+        self.assertEqual(len(factory_calls), 1)
+        await telegram_runtime.shutdown_shared_bots()
+        self.assertIsNot(telegram_runtime.get_shared_bot("123:abc"), first)
+
+
+class _RateLimitedBot:
+    # Fake Bot API that enforces a global and a per-chat send rate the way Telegram
+    # does: a send that comes too early is rejected with RetryAfter.
+    def __init__(self, *, global_rate: float, chat_rate: float, global_burst: int) -> None:
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.global_burst = global_burst
+        self.sent = defaultdict(list)
+        self.all_sends = []
+        self.violations = 0
+        self.forced_retry_after = {}
+
+    async def send_message(self, chat_id, text):
+        now = time.monotonic()
+        forced = self.forced_retry_after.pop(chat_id, None)
+        if forced is not None:
+            raise RetryAfter(forced)
+        previous = self.sent[chat_id]
+        recent = [ts for ts in self.all_sends if now - ts < 1.0]
+        # 10% tolerance for timer jitter.
+        if (previous and now - previous[-1] < 0.9 / self.chat_rate) or len(recent) >= self.global_rate + self.global_burst:
+            self.violations += 1
+            raise RetryAfter(1)
+        await asyncio.sleep(0.005)
+        previous.append(now)
+        self.all_sends.append(now)
+        return True
+
+
+class TelegramSendSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def _run(self, bot, messages, **scheduler_kwargs):
+        scheduler = TelegramSendScheduler(**scheduler_kwargs)
+        for chat_id, text in messages:
+            scheduler.submit(chat_id, lambda chat_id=chat_id, text=text: bot.send_message(chat_id, text))
+        started = time.monotonic()
+        await asyncio.wait_for(scheduler.join(), timeout=10)
+        return scheduler, time.monotonic() - started
+
+    async def test_parallel_chats_stay_within_global_and_per_chat_limits(self) -> None:
+        bot = _RateLimitedBot(global_rate=100, chat_rate=20, global_burst=5)
+        messages = [(chat, f"m{n}") for n in range(5) for chat in range(10)]
+
+        scheduler, elapsed = await self._run(
+            bot, messages, global_rate=100, global_burst=5, chat_rate=20, max_parallel=8
+        )
+
+        self.assertEqual(bot.violations, 0)
+        self.assertEqual(scheduler.sent, 50)
+        self.assertEqual(sum(len(ts) for ts in bot.sent.values()), 50)
+        # 50 messages at 100/s globally; one consumer with a fixed gap would need 2.5s.
+        self.assertLess(elapsed, 1.5)
+
+    async def test_messages_keep_order_within_a_chat(self) -> None:
+        order = []
+
+        async def send(text):
+            order.append(text)
+
+        scheduler = TelegramSendScheduler(global_rate=1000, chat_rate=1000)
+        for n in range(5):
+            scheduler.submit(7, lambda n=n: send(n))
+        await scheduler.join()
+
+        self.assertEqual(order, [0, 1, 2, 3, 4])
+
+    async def test_retry_after_pauses_only_the_affected_chat(self) -> None:
+        bot = _RateLimitedBot(global_rate=100, chat_rate=20, global_burst=5)
+        bot.forced_retry_after[1] = 0.3
+        messages = [(1, "a0"), (1, "a1")] + [(2, f"b{n}") for n in range(4)]
+
+        scheduler, _ = await self._run(bot, messages, global_rate=100, global_burst=5, chat_rate=20)
+
+        self.assertEqual(scheduler.retry_after_pauses, 1)
+        self.assertEqual(len(bot.sent[1]), 2)
+        self.assertEqual(len(bot.sent[2]), 4)
+        # Chat 2 finished while chat 1 was still paused.
+        self.assertLess(bot.sent[2][-1], bot.sent[1][0])
+        self.assertGreaterEqual(bot.sent[1][0] - bot.sent[2][0], 0.25)
+
+
+class TelegramMessageQueueTests(unittest.IsolatedAsyncioTestCase):
+    async def test_queue_dedupes_and_retries_failed_sends_through_scheduler(self) -> None:
+        attempts = []
+
+        async def send_func(_token, chat_id, message, *_args):
+            attempts.append((chat_id, message))
+            return len(attempts) != 1
+
+        queue = TelegramMessageQueue(
+            "token",
+            send_func=send_func,
+            scheduler=TelegramSendScheduler(global_rate=1000, chat_rate=1000),
+            retry_base_sec=0.01,
+        )
+        first = await queue.add_message(1, "hello")
+        duplicate = await queue.add_message(1, "hello")
+        worker = asyncio.create_task(queue.process_queue())
+        try:
+            for _ in range(100):
+                if queue.is_message_sent(first) and queue.is_message_sent(duplicate):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            worker.cancel()
+
+        self.assertTrue(queue.is_message_sent(first))
+        self.assertTrue(queue.is_message_sent(duplicate))
+        # First attempt failed, the duplicate went out, and the retry was then deduped.
+        self.assertEqual(attempts, [(1, "hello"), (1, "hello")])
+        stats = queue.stats()
+        self.assertEqual((stats["retries_scheduled"], stats["deduped"], stats["retry_waiting"]), (1, 1, 0))
+        self.assertEqual(stats["oldest_unsent_age_sec"], 0.0)
+
+    async def test_failing_send_backs_off_without_blocking_other_messages(self) -> None:
+        attempts = []
+        logger = mock.Mock()
+
+        async def send_func(_token, chat_id, message, *_args):
+            attempts.append((time.monotonic(), message))
+            return message != "flaky"
+
+        queue = TelegramMessageQueue(
+            "token",
+            send_func=send_func,
+            scheduler=TelegramSendScheduler(global_rate=1000, chat_rate=1000),
+            retry_base_sec=0.05,
+            retry_max_attempts=3,
+            logger=logger,
+        )
+        flaky_id = await queue.add_message(1, "flaky")
+        ok = await queue.add_message(1, "ok")
+        worker = asyncio.create_task(queue.process_queue())
+        try:
+            for _ in range(100):
+                if queue.stats()["retries_dropped"]:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            worker.cancel()
+
+        flaky = [ts for ts, message in attempts if message == "flaky"]
+        self.assertEqual([message for _, message in attempts][:2], ["flaky", "ok"])
+        self.assertTrue(queue.is_message_sent(ok))
+        self.assertEqual(len(flaky), 3)
+        # Exponential backoff: 0.05s, then 0.1s.
+        self.assertGreaterEqual(flaky[1] - flaky[0], 0.045)
+        self.assertGreaterEqual(flaky[2] - flaky[1], 0.095)
+        stats = queue.stats()
+        self.assertEqual((stats["retries_scheduled"], stats["retries_dropped"]), (2, 1))
+        # The dropped message is finished as given up, not left pending for a resend.
+        self.assertTrue(queue.is_message_given_up(flaky_id))
+        self.assertFalse(queue.is_message_sent(flaky_id))
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["oldest_unsent_age_sec"], 0.0)
+        logger.warning.assert_called_once()
+        self.assertIn(flaky_id, logger.warning.call_args[0][0])
+        self.assertIn("chat 1", logger.warning.call_args[0][0])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -4,6 +4,8 @@ from typing import Dict, List, Tuple
 
 from PIL import Image, ImageDraw, ImageFont
 
+from helpers.font_registry import get_font, text_bbox
+
 MINUTES_PER_DAY = 24 * 60
 
 FONT_DIR = Path(__file__).resolve().parents[1] / "fonts"
@@ -32,21 +34,16 @@ def duration_text(start: int, end: int) -> str:
 
 
 def load_font(path: Path, size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
-    try_paths = [path]
     windows_fonts = Path("C:/Windows/Fonts")
-    try_paths.extend(
+    return get_font(
         [
+            path,
             windows_fonts / "arial.ttf",
             windows_fonts / "segoeui.ttf",
             windows_fonts / "times.ttf",
-        ]
+        ],
+        size,
     )
-    for candidate in try_paths:
-        try:
-            return ImageFont.truetype(str(candidate), size)
-        except Exception:
-            continue
-    return ImageFont.load_default()
 
 
 def render_schedule_image(
@@ -86,7 +83,7 @@ def render_schedule_image(
     margin_bottom += extra
 
     left_header_text = "Підчерга"
-    left_header_width = draw.textbbox((0, 0), left_header_text, font=header_font)[2]
+    left_header_width = text_bbox(header_font, left_header_text)[2]
     left_col_width = max(140, left_header_width + 30)
 
     right_start = margin_left + left_col_width + 20
@@ -144,7 +141,7 @@ def render_schedule_image(
 
         # Row label
         label_x = margin_left + 25
-        label_bbox = draw.textbbox((0, 0), group, font=row_font)
+        label_bbox = text_bbox(row_font, group)
         label_h = label_bbox[3] - label_bbox[1]
         label_y = row_top + (row_height - label_h) // 2
         draw.text((label_x, label_y), group, fill=(255, 255, 255), font=row_font)
@@ -177,26 +174,26 @@ def render_schedule_image(
             content_width = box_width - text_pad_x * 2
 
             time_font = box_time_font
-            time_bbox = draw.textbbox((0, 0), time_text, font=time_font)
+            time_bbox = text_bbox(time_font, time_text)
             time_w = time_bbox[2] - time_bbox[0]
             time_h = time_bbox[3] - time_bbox[1]
             if time_w > content_width:
                 scale = content_width / max(1, time_w)
                 new_size = max(min_time_size, int(time_font.size * scale))
                 time_font = load_font(FONT_BOLD, new_size)
-                time_bbox = draw.textbbox((0, 0), time_text, font=time_font)
+                time_bbox = text_bbox(time_font, time_text)
                 time_w = time_bbox[2] - time_bbox[0]
                 time_h = time_bbox[3] - time_bbox[1]
 
             dur_font = box_dur_font
-            dur_bbox = draw.textbbox((0, 0), dur_text, font=dur_font)
+            dur_bbox = text_bbox(dur_font, dur_text)
             dur_w = dur_bbox[2] - dur_bbox[0]
             dur_h = dur_bbox[3] - dur_bbox[1]
             if dur_w > content_width:
                 scale = content_width / max(1, dur_w)
                 new_size = max(min_dur_size, int(dur_font.size * scale))
                 dur_font = load_font(FONT_BOLD, new_size)
-                dur_bbox = draw.textbbox((0, 0), dur_text, font=dur_font)
+                dur_bbox = text_bbox(dur_font, dur_text)
                 dur_w = dur_bbox[2] - dur_bbox[0]
                 dur_h = dur_bbox[3] - dur_bbox[1]
 
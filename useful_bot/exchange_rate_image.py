@@ -22,6 +22,7 @@ from zoneinfo import ZoneInfo
 
 from PIL import Image, ImageDraw, ImageFilter, ImageFont
 
+from helpers.font_registry import text_bbox
 from helpers.image_pipeline import load_font
 from helpers.runtime_paths import PROJECT_ROOT
 
@@ -331,7 +332,7 @@ def _draw_delta(
     value_str = f"{abs(delta):.2f}"
 
     # measure text so we can centre the [▲ value] group
-    bbox = draw.textbbox((0, 0), value_str, font=font, anchor="lm")
+    bbox = text_bbox(font, value_str, anchor="lm")
     tw = bbox[2] - bbox[0]
     th = bbox[3] - bbox[1]
 
@@ -497,7 +498,7 @@ def _draw_stats_row(
         text = f"{val:.2f}"
         color = TEXT_SECONDARY if label == "avg" else STAT_MUTED
         draw.text((px, y), text, font=font, fill=color, anchor="mm")
-        bbox = draw.textbbox((px, y), text, font=font, anchor="mm")
+        bbox = text_bbox(font, text, anchor="mm", xy=(px, y))
         bottom_y = max(bottom_y, bbox[3])
 
     line_y = bottom_y + _px(11)